@@ -10,6 +10,7 @@
 #include "visclibs/boxeslib.h"
 #include "visclibs/utilities.h"
 #include "visclibs/array_utils.h"
+#include "gui/preferences.h"
 
 #if PY_MAJOR_VERSION >= 3
     #define MOD_ERROR_VAL NULL
@@ -29,6 +30,7 @@
 
 static PyObject* calculateBonds(PyObject*, PyObject*);
 static PyObject* calculateDisplacementVectors(PyObject*, PyObject*);
+static int visitBonds(int, int *, double *, int *, int, double *, double *, double *, int *, struct Boxes *, int *, double *);
 
 
 /*******************************************************************************
@@ -56,6 +58,85 @@ MOD_INIT(bonds)
     return MOD_SUCCESS_VAL(mod);
 }
 
+/*******************************************************************************
+ ** Visit the bonds of the given visible atom (only to atoms with a higher
+ ** index, so each bond is found once). If bonds is NULL the bonds are only
+ ** counted, otherwise the visible index of the other atom and half the bond
+ ** vector are also stored. Returns the number of bonds.
+ *******************************************************************************/
+static int visitBonds(int i, int *visibleAtoms, double *pos, int *specie, int NSpecies, double *bondMinArray,
+        double *bondMaxArray, double *cellDims, int *PBC, struct Boxes *boxes, int *bonds, double *bondVectors)
+{
+    int j, k, index, speca, count;
+    int boxIndex, boxNebList[27], boxNebListSize;
+    
+    
+    index = visibleAtoms[i];
+    speca = specie[index];
+    
+    /* get box index of this atom (cannot fail, the visible atoms were boxed) */
+    boxIndex = boxIndexOfAtom(pos[3*index], pos[3*index+1], pos[3*index+2], boxes);
+    
+    /* find neighbouring boxes */
+    boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+    
+    /* loop over box neighbourhood */
+    count = 0;
+    for (j = 0; j < boxNebListSize; j++)
+    {
+        boxIndex = boxNebList[j];
+        
+        for (k = boxes->boxStart[boxIndex]; k < boxes->boxStart[boxIndex + 1]; k++)
+        {
+            int visIndex, index2, specb;
+            double sep2, sep;
+            
+            visIndex = boxes->boxAtoms[k];
+            index2 = visibleAtoms[visIndex];
+            
+            if (index >= index2) continue;
+            
+            specb = specie[index2];
+            
+            if (bondMinArray[speca*NSpecies+specb] == 0.0 && bondMaxArray[speca*NSpecies+specb] == 0.0)
+                continue;
+            
+            /* atomic separation */
+            sep2 = atomicSeparation2(pos[3*index], pos[3*index+1], pos[3*index+2], 
+                                     pos[3*index2], pos[3*index2+1], pos[3*index2+2], 
+                                     cellDims[0], cellDims[1], cellDims[2], 
+                                     PBC[0], PBC[1], PBC[2]);
+            
+            sep = sqrt(sep2);
+            
+            /* check if these atoms are bonded */
+            if (sep >= bondMinArray[speca*NSpecies+specb] && sep <= bondMaxArray[speca*NSpecies+specb])
+            {
+                if (bonds != NULL)
+                {
+                    double sepVec[3];
+                    
+                    bonds[count] = visIndex;
+                    
+                    /* separation vector */
+                    atomSeparationVector(sepVec, pos[3*index], pos[3*index+1], pos[3*index+2], 
+                                         pos[3*index2], pos[3*index2+1], pos[3*index2+2], 
+                                         cellDims[0], cellDims[1], cellDims[2], 
+                                         PBC[0], PBC[1], PBC[2]);
+                    
+                    bondVectors[3*count] = sepVec[0] / 2.0;
+                    bondVectors[3*count+1] = sepVec[1] / 2.0;
+                    bondVectors[3*count+2] = sepVec[2] / 2.0;
+                }
+                
+                count++;
+            }
+        }
+    }
+    
+    return count;
+}
+
 /*******************************************************************************
  * Calculate bonds
  *******************************************************************************/
@@ -76,11 +157,9 @@ calculateBonds(PyObject *self, PyObject *args)
     PyArrayObject *cellDimsIn=NULL;
     PyArrayObject *bondVectorArrayIn=NULL;
     
-    int i, j, k, index, index2, visIndex;
-    int speca, specb, count, boxstat;
-    int boxIndex, boxNebList[27];
-    double *visiblePos, sep2, sep;
-    double sepVec[3];
+    int i, j, count, boxstat, errorFlag, *bondStart;
+    long total;
+    double *visiblePos;
     struct Boxes *boxes;
     
     
@@ -144,6 +223,7 @@ calculateBonds(PyObject *self, PyObject *args)
         return NULL;
     }
     
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisible; i++)
     {
         int index = visibleAtoms[i];
@@ -165,79 +245,58 @@ calculateBonds(PyObject *self, PyObject *args)
     free(visiblePos);
     if (boxstat) return NULL;
     
-    /* loop over visible atoms */
+    /* offset of the bonds of each visible atom */
+    bondStart = malloc((NVisible + 1) * sizeof(int));
+    if (bondStart == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate bondStart");
+        freeBoxes(boxes);
+        return NULL;
+    }
+    
+    /* first pass: count the bonds of each visible atom */
+    errorFlag = 0;
+    #pragma omp parallel for schedule(guided) num_threads(prefs_numThreads) reduction(|:errorFlag)
+    for (i = 0; i < NVisible; i++)
+    {
+        NBondsArray[i] = visitBonds(i, visibleAtoms, pos, specie, NSpecies, bondMinArray, bondMaxArray, cellDims, PBC, boxes,
+                                    NULL, NULL);
+        if (NBondsArray[i] >= maxBondsPerAtom - 1) errorFlag = 1;
+    }
+    
+    /* convert counts to offsets (bonds are stored in order of the visible atoms) */
+    bondStart[0] = 0;
+    total = 0;
+    for (i = 0; i < NVisible && !errorFlag; i++)
+    {
+        total += NBondsArray[i];
+        if (total > PyArray_DIM(bondArrayIn, 0)) errorFlag = 1;
+        bondStart[i + 1] = (int) total;
+    }
+    if (errorFlag)
+    {
+        printf("ERROR: maxBondsPerAtom exceeded\n");
+        free(bondStart);
+        freeBoxes(boxes);
+        return Py_BuildValue("i", 1);
+    }
+    
+    /* second pass: store the bonds (each atom writes to its own range) */
+    #pragma omp parallel for schedule(guided) num_threads(prefs_numThreads)
+    for (i = 0; i < NVisible; i++)
+        visitBonds(i, visibleAtoms, pos, specie, NSpecies, bondMinArray, bondMaxArray, cellDims, PBC, boxes,
+                   &bondArray[bondStart[i]], &bondVectorArray[3*bondStart[i]]);
+    
+    /* count bonds between each pair of species */
     count = 0;
     for (i = 0; i < NVisible; i++)
     {
-        int boxNebListSize;
+        int speca = specie[visibleAtoms[i]];
         
-        index = visibleAtoms[i];
-        
-        speca = specie[index];
-        
-        /* get box index of this atom */
-        boxIndex = boxIndexOfAtom(pos[3*index], pos[3*index+1], pos[3*index+2], boxes);
-        if (boxIndex < 0)
-        {
-            freeBoxes(boxes);
-            return NULL;
-        }
-        
-        /* find neighbouring boxes */
-        boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
-        
-        /* loop over box neighbourhood */
-        for (j = 0; j < boxNebListSize; j++)
+        for (j = 0; j < NBondsArray[i]; j++)
         {
-            boxIndex = boxNebList[j];
-            
-            for (k = 0; k < boxes->boxNAtoms[boxIndex]; k++)
-            {
-                visIndex = boxes->boxAtoms[boxIndex][k];
-                index2 = visibleAtoms[visIndex];
-                
-                if (index >= index2) continue;
-                
-                specb = specie[index2];
-                
-                if (bondMinArray[speca*NSpecies+specb] == 0.0 && bondMaxArray[speca*NSpecies+specb] == 0.0)
-                    continue;
-                
-                /* atomic separation */
-                sep2 = atomicSeparation2(pos[3*index], pos[3*index+1], pos[3*index+2], 
-                                         pos[3*index2], pos[3*index2+1], pos[3*index2+2], 
-                                         cellDims[0], cellDims[1], cellDims[2], 
-                                         PBC[0], PBC[1], PBC[2]);
-                
-                sep = sqrt(sep2);
-                
-                /* check if these atoms are bonded */
-                if (sep >= bondMinArray[speca*NSpecies+specb] && sep <= bondMaxArray[speca*NSpecies+specb])
-                {
-                    if (NBondsArray[i] + 1 == maxBondsPerAtom)
-                    {
-                        printf("ERROR: maxBondsPerAtom exceeded\n");
-                        return Py_BuildValue("i", 1);
-                    }
-                    
-                    bondArray[count] = visIndex;
-                    NBondsArray[i]++;
-                    
-                    /* separation vector */
-                    atomSeparationVector(sepVec, pos[3*index], pos[3*index+1], pos[3*index+2], 
-                                         pos[3*index2], pos[3*index2+1], pos[3*index2+2], 
-                                         cellDims[0], cellDims[1], cellDims[2], 
-                                         PBC[0], PBC[1], PBC[2]);
-                    
-                    bondVectorArray[3*count] = sepVec[0] / 2.0;
-                    bondVectorArray[3*count+1] = sepVec[1] / 2.0;
-                    bondVectorArray[3*count+2] = sepVec[2] / 2.0;
-                    
-                    bondSpecieCounter[speca*NSpecies+specb]++;
-                    
-                    count++;
-                }
-            }
+            int specb = specie[visibleAtoms[bondArray[count++]]];
+            bondSpecieCounter[speca*NSpecies+specb]++;
         }
     }
     
@@ -246,6 +305,7 @@ calculateBonds(PyObject *self, PyObject *args)
 #endif
     
     /* free */
+    free(bondStart);
     freeBoxes(boxes);
     
     return Py_BuildValue("i", 0);
@@ -296,6 +356,7 @@ calculateDisplacementVectors(PyObject *self, PyObject *args)
     
     /* main loop */
     numBonds = 0;
+    #pragma omp parallel for num_threads(prefs_numThreads) reduction(+:numBonds)
     for (i = 0; i < NVisible; i++)
     {
         int i3 = 3 * i;
@@ -8,8 +8,10 @@
 #include <numpy/arrayobject.h>
 #include <math.h>
 #include "visclibs/boxeslib.h"
+#include "visclibs/neb_list.h"
 #include "visclibs/utilities.h"
 #include "visclibs/array_utils.h"
+#include "gui/preferences.h"
 
 #if PY_MAJOR_VERSION >= 3
     #define MOD_ERROR_VAL NULL
@@ -29,7 +31,6 @@
 
 static PyObject* findClusters(PyObject*, PyObject *);
 static PyObject* prepareClusterToDrawHulls(PyObject*, PyObject*);
-static int findNeighbours(int, int, int, int *, double *, double, struct Boxes *, double *, int *);
 static int findNeighboursUnapplyPBC(int, int, int, int, int *, double *, double, double *, int *, int *);
 static void setAppliedPBCs(int *, int *);
 
@@ -66,30 +67,33 @@ static PyObject*
 findClusters(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, *clusterArray, *PBC, minClusterSize, maxClusterSize, *results, NScalars, NVectors;
-    double *pos, neighbourRad, *cellDims, *fullScalars;
+    double *pos, neighbourRad, *cellDims;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *posIn=NULL;
     PyArrayObject *clusterArrayIn=NULL;
     PyArrayObject *cellDimsIn=NULL;
     PyArrayObject *PBCIn=NULL;
     PyArrayObject *resultsIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
-    
-    int i, j, index, NClusters, numInCluster;
-    int maxNumInCluster, boxstat;
-    double nebRad2, approxBoxWidth;
-    double *visiblePos;
-    struct Boxes *boxes;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
+    PyArrayObject *nebStartIn=NULL;
+    PyArrayObject *nebIndexIn=NULL;
+    
+    int i, NClusters, numInCluster;
+    int *nebStart, *nebIndex, *stack;
+    double nebRad2;
+    struct NeighbourList *nebList;
     int *NAtomsCluster, clusterIndex;
     int *NAtomsClusterNew;
-    int NVisible, count;
+    int NVisible, count, status;
+    char *keep;
     
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!O!dO!O!iiO!iO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &PyArray_Type, &clusterArrayIn,
+    if (!PyArg_ParseTuple(args, "O!O!O!dO!O!iiO!iOiOO!O!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &PyArray_Type, &clusterArrayIn,
             &neighbourRad, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, &minClusterSize, &maxClusterSize, &PyArray_Type, &resultsIn,
-			&NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, &PyArray_Type, &fullVectors))
+			&NScalars, &fullScalars, &NVectors, &fullVectors, &PyArray_Type, &nebStartIn,
+            &PyArray_Type, &nebIndexIn))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -108,127 +112,123 @@ findClusters(PyObject *self, PyObject *args)
     if (not_intVector(PBCIn)) return NULL;
     PBC = pyvector_to_Cptr_int(PBCIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
     
     if (not_intVector(resultsIn)) return NULL;
     results = pyvector_to_Cptr_int(resultsIn);
     
-    if (not_doubleVector(fullVectors)) return NULL;
-    
-    /* construct visible pos array */
-    visiblePos = malloc(3 * NVisibleIn * sizeof(double));
-    if (visiblePos == NULL)
-    {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate visiblePos");
-        return NULL;
-    }
     
-    for (i = 0; i < NVisibleIn; i++)
-    {
-        int index = visibleAtoms[i];
-        int ind3 = 3 * index;
-        int i3 = 3 * i;
-        visiblePos[i3    ] = pos[ind3    ];
-        visiblePos[i3 + 1] = pos[ind3 + 1];
-        visiblePos[i3 + 2] = pos[ind3 + 2];
-    }
+    if (not_intVector(nebStartIn)) return NULL;
+    nebStart = pyvector_to_Cptr_int(nebStartIn);
     
-    /* box visible atoms */
-    approxBoxWidth = neighbourRad;
-    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
-    if (boxes == NULL)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-    boxstat = putAtomsInBoxes(NVisibleIn, visiblePos, boxes);
-    if (boxstat)
-    {
-        free(visiblePos);
-        return NULL;
-    }
+    if (not_intVector(nebIndexIn)) return NULL;
+    nebIndex = pyvector_to_Cptr_int(nebIndexIn);
     
     nebRad2 = neighbourRad * neighbourRad;
     
+    /* neighbour list of the visible atoms (built in parallel), from the shared
+     * neighbour list if one was passed, otherwise by boxing the visible atoms */
+    if (PyArray_DIM(nebStartIn, 0) > 0)
+        nebList = constructNeighbourListFromCSR(NVisibleIn, visibleAtoms, (int) PyArray_DIM(nebStartIn, 0) - 1, nebStart, nebIndex,
+                                                pos, cellDims, PBC, nebRad2);
+    else
+        nebList = constructVisibleNeighbourList(NVisibleIn, visibleAtoms, pos, cellDims, PBC, neighbourRad);
+    if (nebList == NULL) return NULL;
+    
     /* initialise clusters array */
     for (i = 0; i < NVisibleIn; i++) clusterArray[i] = -1;
     
-    /* allocate NAtomsCluster */
+    /* allocate NAtomsCluster and the stack for the cluster search */
     NAtomsCluster = calloc(NVisibleIn, sizeof(int));
-    if (NAtomsCluster == NULL)
+    stack = malloc(NVisibleIn * sizeof(int));
+    if (NAtomsCluster == NULL || stack == NULL)
     {
         PyErr_SetString(PyExc_MemoryError, "Could not allocate NAtomsCluster");
-        freeBoxes(boxes);
-        free(visiblePos);
+        free(NAtomsCluster);
+        free(stack);
+        freeNeighbourList(nebList, NVisibleIn);
         return NULL;
     }
     
-    /* loop over atoms */
-    maxNumInCluster = -9999;
+    /* loop over atoms; clusters are numbered in order of their first atom */
     NClusters = 0;
     for (i=0; i<NVisibleIn; i++)
     {
         /* skip atom if already allocated */
         if (clusterArray[i] == -1)
         {
+            int stackSize;
+            
             clusterArray[i] = NClusters;
             numInCluster = 1;
             
-            /* recursive search for cluster atoms */
-            numInCluster = findNeighbours(i, clusterArray[i], numInCluster, clusterArray, visiblePos, nebRad2, boxes, cellDims, PBC);
-            if (numInCluster < 0)
+            /* search for cluster atoms */
+            stack[0] = i;
+            stackSize = 1;
+            while (stackSize > 0)
             {
-                free(NAtomsCluster);
-                freeBoxes(boxes);
-                free(visiblePos);
+                int k, atom = stack[--stackSize];
+                
+                for (k = 0; k < nebList[atom].neighbourCount; k++)
+                {
+                    int index2 = nebList[atom].neighbour[k];
+                    
+                    if (clusterArray[index2] == -1)
+                    {
+                        clusterArray[index2] = NClusters;
+                        numInCluster++;
+                        stack[stackSize++] = index2;
+                    }
+                }
             }
-            maxNumInCluster = (numInCluster > maxNumInCluster) ? numInCluster : maxNumInCluster;
             NAtomsCluster[NClusters++] = numInCluster;
         }
     }
     
-    free(visiblePos);
+    free(stack);
+    freeNeighbourList(nebList, NVisibleIn);
     
     NAtomsClusterNew = calloc(NClusters, sizeof(int));
-    if (NAtomsClusterNew == NULL)
+    keep = malloc(NVisibleIn * sizeof(char));
+    if (NAtomsClusterNew == NULL || keep == NULL)
     {
         PyErr_SetString(PyExc_MemoryError, "Could not allocate NAtomsClusterNew");
+        free(NAtomsClusterNew);
+        free(keep);
         free(NAtomsCluster);
-        freeBoxes(boxes);
         return NULL;
     }
     
-    /* loop over visible atoms to see if their cluster has more than the min number */
-    NVisible = 0;
+    /* check if the cluster of each visible atom has more than the min number */
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisibleIn; i++)
     {
-        clusterIndex = clusterArray[i];
-        index = visibleAtoms[i];
-        
-        numInCluster = NAtomsCluster[clusterIndex];
-        if (numInCluster < minClusterSize) continue;
-        if (maxClusterSize >= minClusterSize && numInCluster > maxClusterSize) continue;
-        
-        visibleAtoms[NVisible] = index;
-        clusterArray[NVisible] = clusterIndex;
-        NAtomsClusterNew[clusterIndex]++;
-        
-        /* handle full scalars array */
-        for (j = 0; j < NScalars; j++)
-            fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
+        int clusterSize = NAtomsCluster[clusterArray[i]];
         
-        for (j = 0; j < NVectors; j++)
+        keep[i] = 1;
+        if (clusterSize < minClusterSize) keep[i] = 0;
+        if (maxClusterSize >= minClusterSize && clusterSize > maxClusterSize) keep[i] = 0;
+    }
+    
+    /* update the clusters array */
+    NVisible = 0;
+    for (i=0; i<NVisibleIn; i++)
+    {
+        if (keep[i])
         {
-            int addr = NVisibleIn * j;
-            int addr1 = addr + NVisible;
-            int addr2 = addr + i;
-            DIND2(fullVectors, addr1, 0) = DIND2(fullVectors, addr2, 0);
-            DIND2(fullVectors, addr1, 1) = DIND2(fullVectors, addr2, 1);
-            DIND2(fullVectors, addr1, 2) = DIND2(fullVectors, addr2, 2);
+            clusterIndex = clusterArray[i];
+            clusterArray[NVisible++] = clusterIndex;
+            NAtomsClusterNew[clusterIndex]++;
         }
-        
-        NVisible++;
+    }
+    
+    /* update visible atoms and the full scalars/vectors arrays */
+    status = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    free(keep);
+    if (status < 0)
+    {
+        free(NAtomsClusterNew);
+        free(NAtomsCluster);
+        return NULL;
     }
     
     /* how many clusters now */
@@ -241,64 +241,11 @@ findClusters(PyObject *self, PyObject *args)
     
     free(NAtomsClusterNew);
     free(NAtomsCluster);
-    freeBoxes(boxes);
     
     return Py_BuildValue("i", 0);
 }
 
 
-/*******************************************************************************
- * recursive search for neighbouring defects
- *******************************************************************************/
-static int findNeighbours(int index, int clusterID, int numInCluster, int* atomCluster, double *pos, double maxSep2, 
-                          struct Boxes *boxes, double *cellDims, int *PBC)
-{
-    int i, j, index2, boxNebListSize;
-    int boxIndex, boxNebList[27];
-    double sep2;
-    
-    
-    /* box of primary atom */
-    boxIndex = boxIndexOfAtom(pos[3*index], pos[3*index+1], pos[3*index+2], boxes);
-    if (boxIndex < 0) return -1;
-    
-    /* find neighbouring boxes */
-    boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
-    
-    /* loop over neighbouring boxes */
-    for (i = 0; i < boxNebListSize; i++)
-    {
-        boxIndex = boxNebList[i];
-        
-        for (j=0; j<boxes->boxNAtoms[boxIndex]; j++)
-        {
-            index2 = boxes->boxAtoms[boxIndex][j];
-            
-            /* skip itself or if already searched */
-            if ((index == index2) || (atomCluster[index2] != -1))
-                continue;
-            
-            /* calculate separation */
-            sep2 = atomicSeparation2(pos[3*index], pos[3*index+1], pos[3*index+2], pos[3*index2], pos[3*index2+1], pos[3*index2+2], 
-                                    cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
-            
-            /* check if neighbours */
-            if (sep2 < maxSep2)
-            {
-                atomCluster[index2] = clusterID;
-                numInCluster++;
-                
-                /* search for neighbours to this new cluster atom */
-                numInCluster = findNeighbours(index2, clusterID, numInCluster, atomCluster, pos, maxSep2, boxes, cellDims, PBC);
-                if (numInCluster < 0) return -1;
-            }
-        }
-    }
-    
-    return numInCluster;
-}
-
-
 /*******************************************************************************
  * Prepare cluster to draw hulls (ie unapply PBCs)
  *******************************************************************************/
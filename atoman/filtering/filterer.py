@@ -14,10 +14,13 @@ import logging
 import numpy as np
 import six
 from six.moves import zip
+from six.moves import range
 
 from .filters import _filtering as filtering_c
 from ..system.atoms import elements
 from . import voronoi
+from . import neighbours
+from . import resultCache
 from .filters import base
 from . import filters
 from . import atomStructure
@@ -30,6 +33,24 @@ class Filterer(object):
     
     Applies the selected filters in order.
     
+    If `deferredCompaction` is True (the default) the scalars and vectors are
+    kept at the full length of the lattice while the filters are applied and
+    only the visible atoms array is compacted by each filter. The scalars and
+    vectors are compacted to the visible atoms once, after the last filter.
+    Otherwise the scalars and vectors are passed to every filter as lists of
+    arrays, which the filters compact in place.
+    
+    The state after each filter is stored in an LRU cache, limited to
+    `resultCacheMemory` bytes (zero disables the cache). When a list is run
+    again the longest prefix of the list whose inputs and settings have not
+    changed is restored from the cache and only the remaining filters are
+    applied.
+    
+    If `incremental` is True (the default) the states after the filters of
+    the most recent run are also kept outside of the cache, so re-running a
+    list after changing one of its filters always resumes from the first
+    changed filter (even if the cache is disabled or has discarded them).
+    
     """
     # known atom structure types
     knownStructures = atomStructure.knownStructures
@@ -61,12 +82,32 @@ class Filterer(object):
         "Slice",
     ]
     
-    def __init__(self, voronoiOptions):
+    # default memory cap of the result cache (bytes)
+    defaultResultCacheMemory = 512 * 1024 * 1024
+    
+    def __init__(self, voronoiOptions, deferredCompaction=True, resultCacheMemory=None, incremental=True):
         self.logger = logging.getLogger(__name__)
         self.voronoiOptions = voronoiOptions
+        self.deferredCompaction = deferredCompaction
+        self.incremental = incremental
+        self.lastRunStages = []
         self._driftCompensation = False
+        self.neighbourList = neighbours.NeighbourListCache()
+        if resultCacheMemory is None:
+            resultCacheMemory = self.defaultResultCacheMemory
+        self.resultCache = resultCache.FilterResultCache(resultCacheMemory)
         self.reset()
     
+    def setResultCacheMemory(self, resultCacheMemory):
+        """Set the memory cap of the result cache (bytes)."""
+        self.logger.debug("Setting result cache memory cap: %d bytes", resultCacheMemory)
+        self.resultCache.setMaxMemory(resultCacheMemory)
+    
+    def clearResultCache(self):
+        """Discard the cached filter results."""
+        self.resultCache.clear()
+        self.lastRunStages = []
+    
     def toggleDriftCompensation(self, driftCompensation):
         """Toggle the drift setting."""
         self._driftCompensation = driftCompensation
@@ -138,6 +179,10 @@ class Filterer(object):
         self.currentFilters = currentFilters
         self.currentSettings = currentSettings
         
+        # scalars/vectors stay full length until all filters have been applied
+        deferredCompaction = self.deferredCompaction and not defectFilterSelected
+        self.logger.debug("Deferred compaction of scalars/vectors: %s", deferredCompaction)
+        
         # set up visible atoms or defect arrays
         if not defectFilterSelected:
             self.logger.debug("Setting all atoms visible initially")
@@ -148,13 +193,21 @@ class Filterer(object):
             self.logger.debug("Adding initial scalars from inputState")
             for scalarsName, scalars in six.iteritems(inputState.scalarsDict):
                 self.logger.debug("  Adding '%s' scalars", scalarsName)
-                self.latticeScalarsDict[scalarsName] = copy.deepcopy(scalars)
+                if deferredCompaction:
+                    # not modified by the filters; copied when compacted
+                    self.latticeScalarsDict[scalarsName] = scalars
+                else:
+                    self.latticeScalarsDict[scalarsName] = copy.deepcopy(scalars)
             
             # set initial vectors
             self.logger.debug("Adding initial vectors from inputState")
             for vectorsName, vectors in six.iteritems(inputState.vectorsDict):
                 self.logger.debug("  Adding '%s' vectors", vectorsName)
-                self.vectorsDict[vectorsName] = vectors
+                if deferredCompaction:
+                    self.vectorsDict[vectorsName] = vectors
+                else:
+                    # compacted in place by the filters
+                    self.vectorsDict[vectorsName] = copy.deepcopy(vectors)
         
         else:
             # initialise defect arrays
@@ -170,9 +223,9 @@ class Filterer(object):
                                                refState.cellDims, inputState.PBC, self.driftVector)
             self.logger.info("Calculated drift vector: (%f, %f, %f)" % tuple(self.driftVector))
         
-        # run filters
-        applyFiltersTime = time.time()
-        for filterName, filterSettings in zip(currentFilters, currentSettings):
+        # create the filter objects
+        filterObjects = []
+        for filterName in currentFilters:
             # determine the name of filter module to be loaded
             if filterName.startswith("Scalar: "):
                 moduleName = "genericScalarFilter"
@@ -191,12 +244,25 @@ class Filterer(object):
             filterObject = getattr(filterModule, filterObjectName, None)
             if filterObject is None:
                 self.logger.error("Could not locate filter object for: '%s'", filterName)
-            
             else:
-                self.logger.info("Running filter: '%s'", filterName)
-                
-                # filter
                 filterObject = filterObject(filterName)
+            filterObjects.append(filterObject)
+        
+        # restore the longest unchanged prefix of the list from the cache
+        stageKeys = self.makeStageKeys(currentFilters, currentSettings, inputState, refState, deferredCompaction)
+        firstStage = self.restoreCachedStages(stageKeys, deferredCompaction)
+        
+        # build the neighbour list shared between filters, for the largest cut-off required
+        self.prepareNeighbourList(filterObjects[firstStage:], currentSettings[firstStage:], inputState)
+        
+        # run filters
+        applyFiltersTime = time.time()
+        for stage in range(firstStage, len(currentFilters)):
+            filterName = currentFilters[stage]
+            filterObject = filterObjects[stage]
+            filterSettings = currentSettings[stage]
+            if filterObject is not None:
+                self.logger.info("Running filter: '%s'", filterName)
                 
                 # construct filter input object
                 filterInput = base.FilterInput()
@@ -205,8 +271,9 @@ class Filterer(object):
                 filterInput.refState = refState
                 filterInput.voronoiOptions = self.voronoiOptions
                 filterInput.bondDict = elements.bondDict
-                filterInput.NScalars, filterInput.fullScalars = self.makeFullScalarsArray()
-                filterInput.NVectors, filterInput.fullVectors = self.makeFullVectorsArray()
+                if not deferredCompaction:
+                    filterInput.NScalars, filterInput.fullScalars = self.makeFullScalarsArray()
+                    filterInput.NVectors, filterInput.fullVectors = self.makeFullVectorsArray()
                 filterInput.voronoiAtoms = self.voronoiAtoms
                 filterInput.voronoiDefects = self.voronoiDefects
                 filterInput.driftCompensation = self._driftCompensation
@@ -217,6 +284,7 @@ class Filterer(object):
                 filterInput.antisites = self.antisites
                 filterInput.onAntisites = self.onAntisites
                 filterInput.defectFilterSelected = defectFilterSelected
+                filterInput.neighbourList = self.neighbourList
                 
                 # run the filter
                 result = filterObject.apply(filterInput, filterSettings)
@@ -237,12 +305,20 @@ class Filterer(object):
                 if result.hasSpaghettiAtoms():
                     self.spaghettiAtoms = result.getSpaghettiAtoms()
                 
-                # full vectors/scalars
-                self.storeFullScalarsArray(len(self.visibleAtoms), filterInput.NScalars, filterInput.fullScalars)
-                self.storeFullVectorsArray(len(self.visibleAtoms), filterInput.NVectors, filterInput.fullVectors)
+                if deferredCompaction:
+                    # new scalars (stored at full length)
+                    self.storeFullLengthScalars(inputState.NAtoms, result.getScalars())
                 
-                # new scalars
-                self.scalarsDict.update(result.getScalars())
+                else:
+                    # full vectors/scalars
+                    self.storeFullScalarsArray(len(self.visibleAtoms), filterInput.NScalars, filterInput.fullScalars)
+                    self.storeFullVectorsArray(len(self.visibleAtoms), filterInput.NVectors, filterInput.fullVectors)
+                    
+                    # new scalars
+                    self.scalarsDict.update(result.getScalars())
+            
+            # store the state after this filter
+            self.storeStageResult(stage, stageKeys[stage], deferredCompaction)
             
             if defectFilterSelected:
                 nint = len(self.interstitials)
@@ -254,6 +330,14 @@ class Filterer(object):
             else:
                 self.logger.info("%d visible atoms", len(self.visibleAtoms))
         
+        # compact the scalars/vectors to the visible atoms
+        if deferredCompaction:
+            self.compactFullLengthArrays()
+        
+        # the Voronoi tessellation of the input lattice, if already calculated (by any filter list)
+        if not self.voronoiAtoms.isCalculated():
+            self.voronoiAtoms.fetchCached(inputState)
+        
         # species counts here
         if len(self.visibleAtoms):
             self.visibleSpecieCount = _rendering.countVisibleBySpecie(self.visibleAtoms, len(inputState.specieList),
@@ -283,6 +367,120 @@ class Filterer(object):
         runFiltersTime = time.time() - runFiltersTime
         self.logger.debug("Apply list total time: %f s", runFiltersTime)
     
+    def makeStageKeys(self, currentFilters, currentSettings, inputState, refState, deferredCompaction):
+        """
+        Return the result cache keys of the filter stages. The key of a stage
+        depends on the inputs and options that affect the filters and on the
+        names and settings of the filters up to and including that stage.
+        
+        """
+        voronoiKey = tuple(getattr(self.voronoiOptions, name, None) for name in ("dispersion", "useRadii",
+                                                                                  "faceAreaThreshold", "outputToFile",
+                                                                                  "outputFilename", "outputNeighbours"))
+        globalKey = (resultCache.latticeKey(inputState), resultCache.latticeKey(refState), self._driftCompensation,
+                     voronoiKey, base.makeHashable(elements.bondDict), deferredCompaction)
+        
+        stageKeys = []
+        filtersKey = ()
+        for filterName, filterSettings in zip(currentFilters, currentSettings):
+            filtersKey += ((filterName, filterSettings.getCacheKey()),)
+            stageKeys.append((globalKey, filtersKey))
+        
+        return stageKeys
+    
+    def storeStageResult(self, stage, key, deferredCompaction):
+        """
+        Store the current state, after the given stage, in the result cache
+        and the states of the current run. Arrays that are modified in place
+        by the filters are copied.
+        
+        """
+        del self.lastRunStages[stage:]
+        if self.resultCache.maxMemory <= 0 and not self.incremental:
+            return
+        
+        state = {}
+        memory = 0
+        for name in ("visibleAtoms", "interstitials", "vacancies", "antisites", "onAntisites", "splitInterstitials",
+                     "spaghettiAtoms"):
+            array = getattr(self, name).copy()
+            state[name] = array
+            memory += array.nbytes
+        
+        # full length scalars/vectors are not modified in place
+        for name in ("scalarsDict", "latticeScalarsDict", "vectorsDict"):
+            arrayDict = getattr(self, name)
+            if deferredCompaction:
+                state[name] = dict(arrayDict)
+            else:
+                state[name] = dict((arrayName, array.copy()) for arrayName, array in six.iteritems(arrayDict))
+            memory += resultCache.estimateMemory(arrayDict)
+        
+        state["clusterList"] = list(self.clusterList)
+        state["bubbleList"] = list(self.bubbleList)
+        state["structureCounterDicts"] = copy.deepcopy(self.structureCounterDicts)
+        memory += resultCache.estimateMemory(self.clusterList) + resultCache.estimateMemory(self.bubbleList)
+        
+        result = resultCache.StageResult(state, memory)
+        if self.resultCache.maxMemory > 0:
+            self.resultCache.put(key, result)
+        if self.incremental:
+            self.lastRunStages.append((key, result))
+    
+    def restoreCachedStages(self, stageKeys, deferredCompaction):
+        """
+        Restore the state after the last stage of the longest prefix of the
+        filter list that is unchanged since the last run or is in the result
+        cache. Returns the index of the first stage that must be applied.
+        
+        """
+        # number of stages that are unchanged since the last run
+        numUnchanged = 0
+        for key, (lastKey, _) in zip(stageKeys, self.lastRunStages):
+            if key != lastKey:
+                break
+            numUnchanged += 1
+        del self.lastRunStages[numUnchanged:]
+        
+        # restore the longest prefix from the last run or the cache
+        for stage in range(len(stageKeys) - 1, -1, -1):
+            result = self.lastRunStages[stage][1] if stage < numUnchanged else None
+            if result is None:
+                result = self.resultCache.get(stageKeys[stage])
+                if result is None:
+                    continue
+                self.logger.info("Restoring result of %d filter(s) from cache", stage + 1)
+            else:
+                self.logger.info("Resuming after %d unchanged filter(s)", stage + 1)
+            
+            self.restoreStageResult(result, deferredCompaction)
+            if self.incremental:
+                # states of the earlier stages are only kept if unchanged since the last run
+                self.lastRunStages = [(stageKeys[i], self.lastRunStages[i][1] if i < numUnchanged else None)
+                                      for i in range(stage)]
+                self.lastRunStages.append((stageKeys[stage], result))
+            
+            return stage + 1
+        
+        return 0
+    
+    def restoreStageResult(self, result, deferredCompaction):
+        """Restore the state stored in the given stage result."""
+        state = result.state
+        for name in ("visibleAtoms", "interstitials", "vacancies", "antisites", "onAntisites", "splitInterstitials",
+                     "spaghettiAtoms"):
+            setattr(self, name, state[name].copy())
+        
+        for name in ("scalarsDict", "latticeScalarsDict", "vectorsDict"):
+            if deferredCompaction:
+                setattr(self, name, dict(state[name]))
+            else:
+                setattr(self, name, dict((key, array.copy()) for key, array in six.iteritems(state[name])))
+        
+        self.clusterList = list(state["clusterList"])
+        self.bubbleList = list(state["bubbleList"])
+        self.structureCounterDicts = copy.deepcopy(state["structureCounterDicts"])
+    
     def getBubblesIndices(self):
         """Return arrays for bubble vacancy and atom indices."""
         bubbleVacs = []
@@ -297,6 +495,29 @@ class Filterer(object):
         
         return bubbleVacs, bubbleAtoms
     
+    def prepareNeighbourList(self, filterObjects, currentSettings, inputState):
+        """
+        Make sure the shared neighbour list covers the largest cut-off that is
+        required by the given filters. The neighbour list is kept between runs
+        and is only rebuilt if the input lattice changes or a larger cut-off
+        is required.
+        
+        """
+        cutoff = None
+        for filterObject, filterSettings in zip(filterObjects, currentSettings):
+            if filterObject is None:
+                continue
+            
+            filterCutoff = filterObject.getNeighbourCutoff(inputState, filterSettings)
+            if filterCutoff is not None and (cutoff is None or filterCutoff > cutoff):
+                cutoff = filterCutoff
+        
+        if cutoff is None:
+            self.logger.debug("No filters require the neighbour list")
+            return None
+        
+        return self.neighbourList.prepare(inputState, cutoff)
+    
     def povrayAtomsWrittenSlot(self, status, povtime, uniqueID):
         """
         POV-Ray atoms have been written
@@ -307,66 +528,92 @@ class Filterer(object):
         
         self.logger.debug("Povray atoms written in %f s (%s)", povtime, uniqueID)
     
-    def makeFullScalarsArray(self):
+    def storeFullLengthScalars(self, NAtoms, scalarsDict):
         """
-        Combine scalars array into one big array for passing to C
+        Store the given scalars, calculated for the current visible atoms, in
+        full length arrays (zero for atoms that are not visible)
         
         """
-        self.logger.debug("Making full scalars array (N=%d)", len(self.scalarsDict) + len(self.latticeScalarsDict))
-        
-        scalarsList = []
-        for name, scalars in six.iteritems(self.scalarsDict):
-            self.logger.debug("  Adding '%s' scalars", name)
-            scalarsList.append(scalars)
+        for name, scalars in six.iteritems(scalarsDict):
+            self.logger.debug("Storing '%s' scalars (full length)", name)
             if len(scalars) != len(self.visibleAtoms):
                 raise RuntimeError("Wrong length for scalars: '{0}'".format(name))
+            
+            fullLengthScalars = np.zeros(NAtoms, dtype=scalars.dtype)
+            fullLengthScalars[self.visibleAtoms] = scalars
+            self.scalarsDict[name] = fullLengthScalars
+    
+    def compactFullLengthArrays(self):
+        """
+        Compact the full length scalars and vectors to the visible atoms
         
-        for name, scalars in six.iteritems(self.latticeScalarsDict):
-            self.logger.debug("  Adding '%s' scalars (Lattice)", name)
-            scalarsList.append(scalars)
-            if len(scalars) != len(self.visibleAtoms):
-                raise RuntimeError("Wrong length for scalars: '{0}' (Lattice)".format(name))
+        """
+        self.logger.debug("Compacting full length scalars/vectors (NVisible=%d)", len(self.visibleAtoms))
         
-        if len(scalarsList):
-            scalarsFull = np.concatenate(scalarsList)
-        else:
-            scalarsFull = np.array([], dtype=np.float64)
+        # Lattice arrays may have been read with other types (only the visible
+        # atoms are converted)
+        for arrayDict in (self.scalarsDict, self.latticeScalarsDict, self.vectorsDict):
+            for name in list(arrayDict.keys()):
+                arrayDict[name] = np.asarray(arrayDict[name][self.visibleAtoms], dtype=np.float64)
+    
+    def makeFullScalarsArray(self):
+        """
+        Make the list of scalars arrays for passing to C (the arrays are
+        compacted in place by the filters)
+        
+        """
+        self.logger.debug("Making full scalars list (N=%d)", len(self.scalarsDict) + len(self.latticeScalarsDict))
         
-        return len(scalarsList), scalarsFull
+        scalarsList = []
+        for scalarsDict, label in ((self.scalarsDict, ""), (self.latticeScalarsDict, " (Lattice)")):
+            for name in list(scalarsDict.keys()):
+                self.logger.debug("  Adding '%s' scalars%s", name, label)
+                scalars = scalarsDict[name]
+                if len(scalars) != len(self.visibleAtoms):
+                    raise RuntimeError("Wrong length for scalars: '{0}'{1}".format(name, label))
+                
+                # the C library requires contiguous float64 arrays
+                if scalars.dtype != np.float64 or not scalars.flags.c_contiguous:
+                    scalars = np.ascontiguousarray(scalars, dtype=np.float64)
+                    scalarsDict[name] = scalars
+                scalarsList.append(scalars)
+        
+        return len(scalarsList), scalarsList
     
     def makeFullVectorsArray(self):
         """
-        Combine vectors array into one big array for passing to C
+        Make the list of vectors arrays for passing to C (the arrays are
+        compacted in place by the filters)
         
         """
-        self.logger.debug("Making full vectors array (N=%d)", len(self.vectorsDict))
+        self.logger.debug("Making full vectors list (N=%d)", len(self.vectorsDict))
         
         vectorsList = []
-        for name, vectors in six.iteritems(self.vectorsDict):
+        for name in list(self.vectorsDict.keys()):
             self.logger.debug("Adding '%s' vectors", name)
-            vectorsList.append(vectors)
+            vectors = self.vectorsDict[name]
             if vectors.shape != (len(self.visibleAtoms), 3):
                 raise RuntimeError("Shape wrong for vectors array '%s': %r != %r" % (name, vectors.shape,
                                                                                      (len(self.visibleAtoms), 3)))
+            
+            # the C library requires contiguous float64 arrays
+            if vectors.dtype != np.float64 or not vectors.flags.c_contiguous:
+                vectors = np.ascontiguousarray(vectors, dtype=np.float64)
+                self.vectorsDict[name] = vectors
+            vectorsList.append(vectors)
         
-        if len(vectorsList):
-            vectorsFull = np.concatenate(vectorsList)
-        else:
-            vectorsFull = np.array([], dtype=np.float64)
-        
-        return len(vectorsList), vectorsFull
+        return len(vectorsList), vectorsList
     
-    def storeFullScalarsArray(self, NVisible, NScalars, scalarsFull):
+    def storeFullScalarsArray(self, NVisible, NScalars, scalarsList):
         """
-        Split and resize full scalars array; store in dict
+        Resize the scalars arrays that were compacted by the filter
         
         Assumes scalarsDict was not modified since we called
         makeFullScalarsArray.
         
         """
         if NScalars > 0:
-            self.logger.debug("Storing full scalars array")
-            scalarsList = np.split(scalarsFull, NScalars)
+            self.logger.debug("Storing full scalars list")
             
             # Filterer.scalarsDict
             keys = list(self.scalarsDict.keys())
@@ -383,9 +630,7 @@ class Filterer(object):
                     break
                 
                 else:
-                    scalars_cp = copy.copy(scalars)
-                    scalars_cp.resize(NVisible, refcheck=False)
-                    self.scalarsDict[key] = scalars_cp
+                    self.scalarsDict[key] = self._shrinkArray(scalars, NVisible)
             
             if lenError:
                 self.scalarsDict.clear()
@@ -407,24 +652,21 @@ class Filterer(object):
                     break
                 
                 else:
-                    scalars_cp = copy.copy(scalars)
-                    scalars_cp.resize(NVisible, refcheck=False)
-                    self.latticeScalarsDict[key] = scalars_cp
+                    self.latticeScalarsDict[key] = self._shrinkArray(scalars, NVisible)
             
             if lenError:
                 self.latticeScalarsDict.clear()
     
-    def storeFullVectorsArray(self, NVisible, NVectors, vectorsFull):
+    def storeFullVectorsArray(self, NVisible, NVectors, vectorsList):
         """
-        Split and resize full vectors array; store in dict
+        Resize the vectors arrays that were compacted by the filter
         
         Assumes vectorsDict was not modified since we called
         makeFullVectorsArray.
         
         """
         if NVectors > 0:
-            self.logger.debug("Storing full vectors array in dict")
-            vectorsList = np.split(vectorsFull, NVectors)
+            self.logger.debug("Storing full vectors list in dict")
             keys = list(self.vectorsDict.keys())
             lenError = False
             for key, vectors in zip(keys, vectorsList):
@@ -438,9 +680,18 @@ class Filterer(object):
                     break
                 
                 else:
-                    vectors_cp = copy.copy(vectors)
-                    vectors_cp.resize((NVisible, 3), refcheck=False)
-                    self.vectorsDict[key] = vectors_cp
+                    self.vectorsDict[key] = self._shrinkArray(vectors, NVisible)
             
             if lenError:
                 self.vectorsDict.clear()
+    
+    def _shrinkArray(self, array, length):
+        """Shrink the given array to the given length (in place if possible)."""
+        if len(array) == length:
+            return array
+        
+        if array.flags.owndata and array.base is None:
+            array.resize((length,) + array.shape[1:], refcheck=False)
+            return array
+        
+        return array[:length].copy()
@@ -96,7 +96,7 @@ adaptiveCommonNeighbourAnalysis(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, *PBC, NScalars, *counters, filteringEnabled;
     int *structureVisibility, NVectors;
-    double *pos, *scalars, *cellDims, *fullScalars, maxBondDistance;
+    double *pos, *scalars, *cellDims, maxBondDistance;
     PyArrayObject *posIn=NULL;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *PBCIn=NULL;
@@ -104,19 +104,20 @@ adaptiveCommonNeighbourAnalysis(PyObject *self, PyObject *args)
     PyArrayObject *structureVisibilityIn=NULL;
     PyArrayObject *scalarsIn=NULL;
     PyArrayObject *cellDimsIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
+    PyArrayObject *nebStartIn=NULL;
+    PyArrayObject *nebIndexIn=NULL;
     
-    int i, NVisible, status;
-    double *visiblePos, approxBoxWidth, maxSep2;
-    struct Boxes *boxes;
+    int i, NVisible;
     struct NeighbourList2 *nebList;
     
 /* parse and check arguments from Python */
     
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iO!dO!iO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &PyArray_Type, &scalarsIn,
-            &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, &NScalars, &PyArray_Type, &fullScalarsIn, &maxBondDistance, &PyArray_Type,
-            &countersIn, &filteringEnabled, &PyArray_Type, &structureVisibilityIn, &NVectors, &PyArray_Type, &fullVectors))
+    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iOdO!iO!iOO!O!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &PyArray_Type, &scalarsIn,
+            &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, &NScalars, &fullScalars, &maxBondDistance, &PyArray_Type,
+            &countersIn, &filteringEnabled, &PyArray_Type, &structureVisibilityIn, &NVectors, &fullVectors,
+            &PyArray_Type, &nebStartIn, &PyArray_Type, &nebIndexIn))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -135,60 +136,24 @@ adaptiveCommonNeighbourAnalysis(PyObject *self, PyObject *args)
     if (not_intVector(PBCIn)) return NULL;
     PBC = pyvector_to_Cptr_int(PBCIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
-    
     if (not_intVector(countersIn)) return NULL;
     counters = pyvector_to_Cptr_int(countersIn);
     
     if (not_intVector(structureVisibilityIn)) return NULL;
     structureVisibility = pyvector_to_Cptr_int(structureVisibilityIn);
     
-    if (not_doubleVector(fullVectors)) return NULL;
+    if (not_intVector(nebStartIn)) return NULL;
+    if (not_intVector(nebIndexIn)) return NULL;
     
 /* first we construct neighbour list for each atom, containing indexes and separations */
     
-    /* construct visible pos array */
-    visiblePos = malloc(3 * NVisibleIn * sizeof(double));
-    if (visiblePos == NULL)
-    {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate visiblePos");
-        return NULL;
-    }
-    
-    for (i = 0; i < NVisibleIn; i++)
-    {
-        int index = visibleAtoms[i];
-        int ind3 = 3 * index;
-        int i3 = 3 * i;
-        visiblePos[i3    ] = pos[ind3    ];
-        visiblePos[i3 + 1] = pos[ind3 + 1];
-        visiblePos[i3 + 2] = pos[ind3 + 2];
-    }
-    
-    /* box visible atoms */
-    approxBoxWidth = maxBondDistance;
-    maxSep2 = maxBondDistance * maxBondDistance;
-    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
-    if (boxes == NULL)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-    status = putAtomsInBoxes(NVisibleIn, visiblePos, boxes);
-    if (status)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-    
-    /* create neighbour list */
-    nebList = constructNeighbourList2(NVisibleIn, visiblePos, boxes, cellDims, PBC, maxSep2);
-    
-    /* only required for building neb list */
-    freeBoxes(boxes);
-    free(visiblePos);
-    
+    /* use the shared neighbour list if one was passed, otherwise build one */
+    if (PyArray_DIM(nebStartIn, 0) > 0)
+        nebList = constructNeighbourList2FromCSR(NVisibleIn, visibleAtoms, (int) PyArray_DIM(nebStartIn, 0) - 1,
+                pyvector_to_Cptr_int(nebStartIn), pyvector_to_Cptr_int(nebIndexIn), pos, cellDims, PBC,
+                maxBondDistance * maxBondDistance);
+    else
+        nebList = constructVisibleNeighbourList2(NVisibleIn, visibleAtoms, pos, cellDims, PBC, maxBondDistance);
     if (nebList == NULL) return NULL;
     
 /* now we order the neighbour lists by separation */
@@ -218,32 +183,28 @@ adaptiveCommonNeighbourAnalysis(PyObject *self, PyObject *args)
     
     if (filteringEnabled)
     {
-        NVisible = 0;
+        char *keep;
+        
+        keep = malloc((NVisibleIn > 0 ? NVisibleIn : 1) * sizeof(char));
+        if (keep == NULL)
+        {
+            PyErr_SetString(PyExc_MemoryError, "Could not allocate keep");
+            freeNeighbourList2(nebList, NVisibleIn);
+            return NULL;
+        }
+        
+        #pragma omp parallel for num_threads(prefs_numThreads)
         for (i = 0; i < NVisibleIn; i++)
+            keep[i] = structureVisibility[(int) scalars[i]] ? 1 : 0;
+        
+        /* update visible atoms, structure types and full scalars/vectors arrays */
+        NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+        compactDoubleVector(NVisibleIn, scalars, keep);
+        free(keep);
+        if (NVisible < 0)
         {
-            int atomStructure;
-            
-            atomStructure = (int) scalars[i];
-            if (structureVisibility[atomStructure])
-            {
-                int j;
-                
-                visibleAtoms[NVisible] = visibleAtoms[i];
-                scalars[NVisible++] = scalars[i];
-                
-                /* handle full scalars array */
-                for (j = 0; j < NScalars; j++)
-                {
-                    fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-                }
-                
-                for (j = 0; j < NVectors; j++)
-                {
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-                }
-            }
+            freeNeighbourList2(nebList, NVisibleIn);
+            return NULL;
         }
     }
     else NVisible = NVisibleIn;
@@ -55,6 +55,10 @@ class AcnaFilter(base.BaseFilter):
     ACNA filter...
     
     """
+    def getNeighbourCutoff(self, inputState, settings):
+        """Neighbours are required within the maximum bond distance."""
+        return settings.getSetting("maxBondDistance")
+    
     def apply(self, filterInput, settings):
         """Run the filter."""
         # unpack inputs
@@ -79,10 +83,14 @@ class AcnaFilter(base.BaseFilter):
         # counter array
         counters = np.zeros(len(atomStructure.knownStructures), np.int32)
         
+        # shared neighbour list
+        nebStart, nebIndex = self.getNeighbourArrays(filterInput, maxBondDistance)
+        
         # call C library
         NVisible = _acna.adaptiveCommonNeighbourAnalysis(visibleAtoms, inputState.pos, scalars, inputState.cellDims,
                                                          pbc, NScalars, fullScalars, maxBondDistance, counters,
-                                                         filteringEnabled, structureVisibility, NVectors, fullVectors)
+                                                         filteringEnabled, structureVisibility, NVectors, fullVectors,
+                                                         nebStart, nebIndex)
         
         # result
         result = base.FilterResult()
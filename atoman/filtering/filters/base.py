@@ -12,6 +12,25 @@ import numpy as np
 from six import string_types
 
 
+def makeHashable(value):
+    """Return a hashable representation of the given value (for use in cache keys)."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, makeHashable(val)) for key, val in value.items()))
+    
+    if isinstance(value, (list, tuple)):
+        return tuple(makeHashable(val) for val in value)
+    
+    if isinstance(value, np.ndarray):
+        return (value.dtype.str, value.shape, value.tobytes())
+    
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    
+    return value
+
+
 class FilterResult(object):
     """
     Result object returned by a filter.
@@ -120,6 +139,7 @@ class FilterInput(object):
         self.antisites = np.empty(0, np.float64)
         self.onAntisites = np.empty(0, np.float64)
         self.defectFilterSelected = False
+        self.neighbourList = None
 
 
 class BaseSettings(object):
@@ -175,6 +195,10 @@ class BaseSettings(object):
         value = self._settings[name]
         
         return value
+    
+    def getCacheKey(self):
+        """Return a hashable key representing the current values of the settings."""
+        return makeHashable(self._settings)
 
 
 class BaseFilter(object):
@@ -195,3 +219,23 @@ class BaseFilter(object):
     
     def apply(self, *args, **kwargs):
         raise NotImplementedError("apply method not implemented")
+    
+    def getNeighbourCutoff(self, inputState, settings):
+        """
+        Return the cut-off of the neighbours of the input atoms that are used
+        by this filter, or None if it does not use them. Filters that return
+        a cut-off can use the neighbour list that is shared between filters.
+        
+        """
+        return None
+    
+    def getNeighbourArrays(self, filterInput, cutoff):
+        """
+        Return the arrays of the shared neighbour list, if it covers the given
+        cut-off, for passing to the C libraries (empty arrays otherwise).
+        
+        """
+        if filterInput.neighbourList is None:
+            return np.empty(0, np.int32), np.empty(0, np.int32)
+        
+        return filterInput.neighbourList.getArrays(filterInput.inputState, cutoff)
@@ -79,6 +79,10 @@ class BondOrderFilter(base.BaseFilter):
     The Bond Order filter.
     
     """
+    def getNeighbourCutoff(self, inputState, settings):
+        """Neighbours are required within the maximum bond distance."""
+        return settings.getSetting("maxBondDistance")
+    
     def apply(self, filterInput, settings):
         """Run the bond order filter."""
         # check the inputs are correct
@@ -108,10 +112,14 @@ class BondOrderFilter(base.BaseFilter):
         scalarsQ4 = np.zeros(len(visibleAtoms), dtype=np.float64)
         scalarsQ6 = np.zeros(len(visibleAtoms), dtype=np.float64)
         
+        # shared neighbour list
+        nebStart, nebIndex = self.getNeighbourArrays(filterInput, maxBondDistance)
+        
         # call C lib
         NVisible = _bond_order.bondOrderFilter(visibleAtoms, inputState.pos, maxBondDistance, scalarsQ4, scalarsQ6,
                                                inputState.cellDims, inputState.PBC, NScalars, fullScalars, filterQ4Enabled,
-                                               minQ4, maxQ4, filterQ6Enabled, minQ6, maxQ6, NVectors, fullVectors)
+                                               minQ4, maxQ4, filterQ6Enabled, minQ6, maxQ6, NVectors, fullVectors,
+                                               nebStart, nebIndex)
         
         # resize visible atoms and scalars
         visibleAtoms.resize(NVisible, refcheck=False)
@@ -337,27 +337,28 @@ bondOrderFilter(PyObject *self, PyObject *args)
     int NVisibleIn, *visibleAtoms, *PBC, NScalars, filterQ4Enabled, filterQ6Enabled;
     int NVectors;
     double maxBondDistance, *scalarsQ4, *scalarsQ6, *cellDims;
-    double *pos, *fullScalars, minQ4, maxQ4, minQ6, maxQ6;
+    double *pos, minQ4, maxQ4, minQ6, maxQ6;
     PyArrayObject *posIn=NULL;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *PBCIn=NULL;
     PyArrayObject *scalarsQ4In=NULL;
     PyArrayObject *scalarsQ6In=NULL;
     PyArrayObject *cellDimsIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
+    PyArrayObject *nebStartIn=NULL;
+    PyArrayObject *nebIndexIn=NULL;
 
-    int i, NVisible, boxstat;
-    double *visiblePos, maxSep2;
-    struct Boxes *boxes;
+    int i, NVisible;
+    char *keep;
     struct NeighbourList *nebList;
     struct AtomStructureResults *results;
 
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!dO!O!O!O!iO!iddiddiO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &maxBondDistance,
+    if (!PyArg_ParseTuple(args, "O!O!dO!O!O!O!iOiddiddiOO!O!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, &maxBondDistance,
             &PyArray_Type, &scalarsQ4In, &PyArray_Type, &scalarsQ6In, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, &NScalars,
-            &PyArray_Type, &fullScalarsIn, &filterQ4Enabled, &minQ4, &maxQ4, &filterQ6Enabled, &minQ6, &maxQ6, &NVectors,
-            &PyArray_Type, &fullVectors))
+            &fullScalars, &filterQ4Enabled, &minQ4, &maxQ4, &filterQ6Enabled, &minQ6, &maxQ6, &NVectors,
+            &fullVectors, &PyArray_Type, &nebStartIn, &PyArray_Type, &nebIndexIn))
         return NULL;
 
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -379,49 +380,16 @@ bondOrderFilter(PyObject *self, PyObject *args)
     if (not_intVector(PBCIn)) return NULL;
     PBC = pyvector_to_Cptr_int(PBCIn);
 
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
+    if (not_intVector(nebStartIn)) return NULL;
+    if (not_intVector(nebIndexIn)) return NULL;
 
-    if (not_doubleVector(fullVectors)) return NULL;
-
-    /* construct array of positions of visible atoms */
-    visiblePos = malloc(3 * NVisibleIn * sizeof(double));
-    if (visiblePos == NULL)
-    {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate visiblePos");
-        return NULL;
-    }
-    for (i = 0; i < NVisibleIn; i++)
-    {
-        int index = visibleAtoms[i];
-        int ind3 = 3 * index;
-        int i3 = 3 * i;
-        visiblePos[i3    ] = pos[ind3    ];
-        visiblePos[i3 + 1] = pos[ind3 + 1];
-        visiblePos[i3 + 2] = pos[ind3 + 2];
-    }
-
-    /* box visible atoms */
-    boxes = setupBoxes(maxBondDistance, PBC, cellDims);
-    if (boxes == NULL)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-    boxstat = putAtomsInBoxes(NVisibleIn, visiblePos, boxes);
-    if (boxstat)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-
-    /* build neighbour list */
-    maxSep2 = maxBondDistance * maxBondDistance;
-    nebList = constructNeighbourList(NVisibleIn, visiblePos, boxes, cellDims, PBC, maxSep2);
-
-    /* only required for building neb list */
-    free(visiblePos);
-    freeBoxes(boxes);
+    /* build neighbour list (view of the shared neighbour list if one was passed) */
+    if (PyArray_DIM(nebStartIn, 0) > 0)
+        nebList = constructNeighbourListFromCSR(NVisibleIn, visibleAtoms, (int) PyArray_DIM(nebStartIn, 0) - 1,
+                pyvector_to_Cptr_int(nebStartIn), pyvector_to_Cptr_int(nebIndexIn), pos, cellDims, PBC,
+                maxBondDistance * maxBondDistance);
+    else
+        nebList = constructVisibleNeighbourList(NVisibleIn, visibleAtoms, pos, cellDims, PBC, maxBondDistance);
 
     /* return if failed to build the neighbour list */
     if (nebList == NULL) return NULL;
@@ -444,47 +412,42 @@ bondOrderFilter(PyObject *self, PyObject *args)
     /* calculate Q4 and Q6 */
     calculate_Q(NVisibleIn, results);
 
-    /* do filtering here, storing results along the way */
-    NVisible = 0;
+    /* store results and mark the atoms that are within the valid range */
+    keep = malloc((NVisibleIn > 0 ? NVisibleIn : 1) * sizeof(char));
+    if (keep == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate keep");
+        free(results);
+        return NULL;
+    }
+
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i = 0; i < NVisibleIn; i++)
     {
-        int j;
         double q4 = results[i].Q4;
         double q6 = results[i].Q6;
 
+        /* store calculated values */
+        scalarsQ4[i] = q4;
+        scalarsQ6[i] = q6;
+
         /* skip if not within the valid range */
+        keep[i] = 1;
         if (filterQ4Enabled && (q4 < minQ4 || q4 > maxQ4))
-            continue;
+            keep[i] = 0;
         if (filterQ6Enabled && (q6 < minQ6 || q6 > maxQ6))
-            continue;
-
-        /* store in visible atoms array */
-        visibleAtoms[NVisible] = visibleAtoms[i];
-
-        /* store calculated values */
-        scalarsQ4[NVisible] = q4;
-        scalarsQ6[NVisible] = q6;
-
-        /* update full scalars/vectors arrays */
-        for (j = 0; j < NScalars; j++)
-        {
-            int nj = j * NVisibleIn;
-            fullScalars[nj + NVisible] = fullScalars[nj + i];
-        }
-
-        for (j = 0; j < NVectors; j++)
-        {
-            int nj = j * NVisibleIn;
-            DIND2(fullVectors, nj + NVisible, 0) = DIND2(fullVectors, nj + i, 0);
-            DIND2(fullVectors, nj + NVisible, 1) = DIND2(fullVectors, nj + i, 1);
-            DIND2(fullVectors, nj + NVisible, 2) = DIND2(fullVectors, nj + i, 2);
-        }
-
-        NVisible++;
+            keep[i] = 0;
     }
 
     /* free results memory */
     free(results);
 
+    /* update visible atoms, calculated values and full scalars/vectors arrays */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    compactDoubleVector(NVisibleIn, scalarsQ4, keep);
+    compactDoubleVector(NVisibleIn, scalarsQ6, keep);
+    free(keep);
+    if (NVisible < 0) return NULL;
+
     return Py_BuildValue("i", NVisible);
 }
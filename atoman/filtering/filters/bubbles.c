@@ -13,6 +13,7 @@
 #include "visclibs/boxeslib.h"
 #include "visclibs/neb_list.h"
 #include "visclibs/array_utils.h"
+#include "gui/preferences.h"
 
 #if PY_MAJOR_VERSION >= 3
     #define MOD_ERROR_VAL NULL
@@ -32,6 +33,7 @@
 
 static PyObject* identifyBubbles(PyObject*, PyObject*);
 static PyObject* putBubbleAtomsInClusters(PyObject*, PyObject*);
+static int nearestAtomToSite(int, double*, double*, int*, struct Boxes*, double, int*, double*);
 static int classifyVacsAndInts(double, int, double*, int, double*, int*, double*, int*, int*, int*, int, int*);
 static int identifySplitInterstitialsNew(int, int*, int, int*, int*, double*, double*, int*, double*, int*, double);
 static int refineVacancies(int, int*, int, int*, int, int*, int, int*, double*, double*, int*, double*, int*, double, double);
@@ -938,9 +940,9 @@ static int findDefectNeighbours(int index, int clusterID, int numInCluster, int*
     {
         boxIndex = boxNebList[i];
         
-        for (j=0; j<boxes->boxNAtoms[boxIndex]; j++)
+        for (j = boxes->boxStart[boxIndex]; j < boxes->boxStart[boxIndex + 1]; j++)
         {
-            index2 = boxes->boxAtoms[boxIndex][j];
+            index2 = boxes->boxAtoms[j];
             
             /* skip itself or if already searched */
             if ((index == index2) || (atomCluster[index2] != -1)) continue;
@@ -1329,6 +1331,70 @@ identifySplitInterstitialsNew(int NVacancies, int *vacancies, int NInterstitials
     return 0;
 }
 
+/*******************************************************************************
+ * Return the index of the nearest input atom within the vacancy radius of the
+ * given reference site (-1 if there is none), only considering the atoms that
+ * are available (all atoms if available is NULL). Returns -2 if the site could
+ * not be boxed.
+ *******************************************************************************/
+static int
+nearestAtomToSite(int site, double *refPos, double *pos, int *available, struct Boxes *boxes, double vacRad2,
+        int *PBC, double *cellDims)
+{
+    int boxNebList[27], boxIndex, j, boxNebListSize;
+    int nearestIndex = -1;
+    int i3 = 3 * site;
+    double refxpos, refypos, refzpos;
+    double nearestSep2 = 9999.0;
+    
+    refxpos = refPos[i3    ];
+    refypos = refPos[i3 + 1];
+    refzpos = refPos[i3 + 2];
+    
+    /* get box index of this atom */
+    boxIndex = boxIndexOfAtom(refxpos, refypos, refzpos, boxes);
+    if (boxIndex < 0) return -2;
+    
+    /* find neighbouring boxes */
+    boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+    
+    /* loop over neighbouring boxes */
+    for (j = 0; j < boxNebListSize; j++)
+    {
+        int checkBox, k;
+        
+        checkBox = boxNebList[j];
+        
+        /* loop over all input atoms in the box */
+        for (k = boxes->boxStart[checkBox]; k < boxes->boxStart[checkBox + 1]; k++)
+        {
+            int index, index3;
+            double sep2;
+            
+            /* index of this input atom */
+            index = boxes->boxAtoms[k];
+            
+            /* skip if not available */
+            if (available != NULL && !available[index]) continue;
+            
+            /* atomic separation of possible vacancy and possible interstitial */
+            index3 = 3 * index;
+            sep2 = atomicSeparation2(pos[index3], pos[index3 + 1], pos[index3 + 2], refxpos, refypos, refzpos,
+                                     cellDims[0], cellDims[1], cellDims[2],
+                                     PBC[0], PBC[1], PBC[2]);
+            
+            /* check whether this is the closest atom within the vacancy radius */
+            if (sep2 < vacRad2 && sep2 < nearestSep2)
+            {
+                nearestSep2 = sep2;
+                nearestIndex = index;
+            }
+        }
+    }
+    
+    return nearestIndex;
+}
+
 /*******************************************************************************
  ** Classify vacancies and interstitials
  *******************************************************************************/
@@ -1337,7 +1403,8 @@ classifyVacsAndInts(double vacancyRadius, int NAtoms, double *pos, int refNAtoms
         int *PBC, double *cellDims, int *counters, int *vacancies, int *interstitials,
         int NBubbleAtoms, int *bubbleAtomIndexes)
 {
-    int boxstat, i;
+    int boxstat, i, errorCount;
+    int *nearestAtom;
     int *possibleVacancy, *possibleInterstitial;
     int NVacancies, NInterstitials;
     int *bubbleAtomMask;
@@ -1398,99 +1465,58 @@ classifyVacsAndInts(double vacancyRadius, int NAtoms, double *pos, int refNAtoms
     /* constant */
     vacRad2 = vacancyRadius * vacancyRadius;
     
-    /* loop over reference sites */
+    /* nearest atom to each site, ignoring whether other sites take it (in parallel; bubble
+     * atoms are excluded by possibleInterstitial, which is not changed until below) */
+    nearestAtom = malloc(refNAtoms * sizeof(int));
+    if (nearestAtom == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate nearestAtom");
+        freeBoxes(boxes);
+        free(possibleInterstitial);
+        free(possibleVacancy);
+        free(bubbleAtomMask);
+        return 8;
+    }
+    
+    errorCount = 0;
+    #pragma omp parallel for num_threads(prefs_numThreads) reduction(+: errorCount)
     for (i = 0; i < refNAtoms; i++)
     {
-        int boxNebList[27], boxIndex, j, boxNebListSize;
-        int nearestIndex = -1;
-        int occupancyCount = 0;
-        int i3 = 3 * i;
-        double refxpos, refypos, refzpos;
-        double nearestSep2 = 9999.0;
-
-        refxpos = refPos[i3    ];
-        refypos = refPos[i3 + 1];
-        refzpos = refPos[i3 + 2];
-
-        /* get box index of this atom */
-        boxIndex = boxIndexOfAtom(refxpos, refypos, refzpos, boxes);
-        if (boxIndex < 0)
-        {
-            freeBoxes(boxes);
-            free(possibleInterstitial);
-            free(possibleVacancy);
-            free(bubbleAtomMask);
-            return 7;
-        }
-
-        /* find neighbouring boxes */
-        boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
-
-//        printf("Checking site %d for occupancy (%lf, %lf, %lf)\n", i, refxpos, refypos, refzpos);
+        nearestAtom[i] = nearestAtomToSite(i, refPos, pos, possibleInterstitial, boxes, vacRad2, PBC, cellDims);
+        if (nearestAtom[i] == -2) errorCount++;
+    }
+    
+    if (errorCount)
+    {
+        freeBoxes(boxes);
+        free(possibleInterstitial);
+        free(possibleVacancy);
+        free(bubbleAtomMask);
+        free(nearestAtom);
+        return 7;
+    }
+    
+    /* assign atoms to the sites in order: a site takes its nearest atom unless an
+     * earlier site has already taken it, in which case the nearest atom that has
+     * not been taken is found again (only possible if the vacancy radius is large
+     * enough for an atom to be near to more than one site). The result is the
+     * same as searching each site in turn. */
+    for (i = 0; i < refNAtoms; i++)
+    {
+        int nearestIndex = nearestAtom[i];
+        
+        if (nearestIndex >= 0 && !possibleInterstitial[nearestIndex])
+            nearestIndex = nearestAtomToSite(i, refPos, pos, possibleInterstitial, boxes, vacRad2, PBC, cellDims);
         
-        /* loop over neighbouring boxes */
-        for (j = 0; j < boxNebListSize; j++)
-        {
-            int checkBox, k;
-
-            checkBox = boxNebList[j];
-
-            /* loop over all input atoms in the box */
-            for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
-            {
-                int index, index3;
-                double xpos, ypos, zpos, sep2;
-
-                /* index of this input atom */
-                index = boxes->boxAtoms[checkBox][k];
-
-                /* skip if a bubble atom */
-                if (bubbleAtomMask[index]) continue;
-                
-                /* atom position */
-                index3 = 3 * index;
-                xpos = pos[index3    ];
-                ypos = pos[index3 + 1];
-                zpos = pos[index3 + 2];
-
-                /* atomic separation of possible vacancy and possible interstitial */
-                sep2 = atomicSeparation2(xpos, ypos, zpos, refxpos, refypos, refzpos,
-                                         cellDims[0], cellDims[1], cellDims[2],
-                                         PBC[0], PBC[1], PBC[2]);
-
-                /* if within vacancy radius, is it an antisite or normal lattice point */
-                if (sep2 < vacRad2)
-                {
-//                    printf("  Input atom %d within vac rad: sep = %lf (%lf, %lf, %lf)\n", index, sqrt(sep2), xpos, ypos, zpos);
-                    
-                    /* check whether this is the closest atom to this vacancy */
-                    if (sep2 < nearestSep2)
-                    {
-                        if (possibleInterstitial[index])
-                        {
-                            nearestSep2 = sep2;
-                            nearestIndex = index;
-                        }
-                    }
-                    
-                    occupancyCount++;
-                }
-            }
-        }
-
         /* classify - check the atom that was closest to this site (within the vacancy radius) */
         if (nearestIndex != -1)
         {
-//            printf("Classifying site %d: nearest index = %d (sep = %lf)\n", i, nearestIndex, sqrt(nearestSep2));
-
             /* not an interstitial or vacancy */
             possibleInterstitial[nearestIndex] = 0;
             possibleVacancy[i] = 0;
-
-//            if (occupancyCount > 1)
-//                printf("INFO: Occupancy for site %d = %d\n", i, occupancyCount);
         }
     }
+    free(nearestAtom);
     
     /* free box arrays */
     freeBoxes(boxes);
@@ -104,6 +104,10 @@ class ClusterFilter(base.BaseFilter):
     Cluster filter.
     
     """
+    def getNeighbourCutoff(self, inputState, settings):
+        """Neighbours are required within the neighbour radius."""
+        return settings.getSetting("neighbourRadius")
+    
     def apply(self, filterInput, settings):
         """Apply the filter."""
         # unpack inputs
@@ -129,9 +133,12 @@ class ClusterFilter(base.BaseFilter):
         atomCluster = np.empty(len(visibleAtoms), np.int32)
         result = np.empty(2, np.int32)
         
+        # shared neighbour list
+        nebStart, nebIndex = self.getNeighbourArrays(filterInput, nebRad)
+        
         # call C lib
         _clusters.findClusters(visibleAtoms, lattice.pos, atomCluster, nebRad, lattice.cellDims, PBC,
-                               minSize, maxSize, result, NScalars, fullScalars, NVectors, fullVectors)
+                               minSize, maxSize, result, NScalars, fullScalars, NVectors, fullVectors, nebStart, nebIndex)
         
         NVisible = result[0]
         NClusters = result[1]
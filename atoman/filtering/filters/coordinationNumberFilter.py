@@ -37,6 +37,22 @@ class CoordinationNumberFilter(base.BaseFilter):
     The coordination number filter.
     
     """
+    def getNeighbourCutoff(self, inputState, settings):
+        """Neighbours are required within the largest bond length between the species in the lattice."""
+        bondDict = elements.bondDict
+        specieList = inputState.specieList
+        maxBond = None
+        for symi in specieList:
+            if symi in bondDict:
+                d = bondDict[symi]
+                for symj in specieList:
+                    if symj in d:
+                        bondMax = d[symj][1]
+                        if bondMax > 0 and (maxBond is None or bondMax > maxBond):
+                            maxBond = bondMax
+        
+        return maxBond
+    
     def apply(self, filterInput, settings):
         """Apply the coordination number filter."""
         # unpack inputs
@@ -94,10 +110,13 @@ class CoordinationNumberFilter(base.BaseFilter):
         # new scalars array
         scalars = np.zeros(len(visibleAtoms), dtype=np.float64)
         
+        # shared neighbour list
+        nebStart, nebIndex = self.getNeighbourArrays(filterInput, maxBond)
+        
         # run filter
         NVisible = _filtering.coordNumFilter(visibleAtoms, inputState.pos, inputState.specie, NSpecies, bondMinArray, bondMaxArray,
                                              maxBond, inputState.cellDims, inputState.PBC, scalars, minCoordNum, maxCoordNum,
-                                             NScalars, fullScalars, filteringEnabled, NVectors, fullVectors)
+                                             NScalars, fullScalars, filteringEnabled, NVectors, fullVectors, nebStart, nebIndex)
         
         # resize visible atoms and scalars
         visibleAtoms.resize(NVisible, refcheck=False)
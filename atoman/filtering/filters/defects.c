@@ -14,6 +14,7 @@
 #include "visclibs/utilities.h"
 #include "visclibs/array_utils.h"
 #include "filtering/atom_structure.h"
+#include "gui/preferences.h"
 
 #if PY_MAJOR_VERSION >= 3
     #define MOD_ERROR_VAL NULL
@@ -34,6 +35,7 @@
 static PyObject* findDefects(PyObject*, PyObject*);
 static int findDefectClusters(int, double *, int *, int *, struct Boxes *, double, double *, int *);
 static int findDefectNeighbours(int, int, int, int *, double *, struct Boxes *, double, double *, int *);
+static int nearestAtomToSite(int, double *, double *, int *, struct Boxes *, double, int *, double *);
 static int basicDefectClassification(double, int, char *,int *, double *, int, char *, int *, double *, int *,
         double *, int *, int *, int *, int *, int *);
 static int identifySplitInterstitials(int, int *, int, int *, int *, double *, double *, int *, double *, int *, double);
@@ -67,6 +69,70 @@ MOD_INIT(_defects)
     return MOD_SUCCESS_VAL(mod);
 }
 
+/*******************************************************************************
+ * Return the index of the nearest input atom within the vacancy radius of the
+ * given reference site (-1 if there is none), only considering the atoms that
+ * are available (all atoms if available is NULL). Returns -2 if the site could
+ * not be boxed.
+ *******************************************************************************/
+static int
+nearestAtomToSite(int site, double *refPos, double *pos, int *available, struct Boxes *boxes, double vacRad2,
+        int *PBC, double *cellDims)
+{
+    int boxNebList[27], boxIndex, j, boxNebListSize;
+    int nearestIndex = -1;
+    int i3 = 3 * site;
+    double refxpos, refypos, refzpos;
+    double nearestSep2 = 9999.0;
+    
+    refxpos = refPos[i3    ];
+    refypos = refPos[i3 + 1];
+    refzpos = refPos[i3 + 2];
+    
+    /* get box index of this atom */
+    boxIndex = boxIndexOfAtom(refxpos, refypos, refzpos, boxes);
+    if (boxIndex < 0) return -2;
+    
+    /* find neighbouring boxes */
+    boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+    
+    /* loop over neighbouring boxes */
+    for (j = 0; j < boxNebListSize; j++)
+    {
+        int checkBox, k;
+        
+        checkBox = boxNebList[j];
+        
+        /* loop over all input atoms in the box */
+        for (k = boxes->boxStart[checkBox]; k < boxes->boxStart[checkBox + 1]; k++)
+        {
+            int index, index3;
+            double sep2;
+            
+            /* index of this input atom */
+            index = boxes->boxAtoms[k];
+            
+            /* skip if not available */
+            if (available != NULL && !available[index]) continue;
+            
+            /* atomic separation of possible vacancy and possible interstitial */
+            index3 = 3 * index;
+            sep2 = atomicSeparation2(pos[index3], pos[index3 + 1], pos[index3 + 2], refxpos, refypos, refzpos,
+                                     cellDims[0], cellDims[1], cellDims[2],
+                                     PBC[0], PBC[1], PBC[2]);
+            
+            /* check whether this is the closest atom within the vacancy radius */
+            if (sep2 < vacRad2 && sep2 < nearestSep2)
+            {
+                nearestSep2 = sep2;
+                nearestIndex = index;
+            }
+        }
+    }
+    
+    return nearestIndex;
+}
+
 /*******************************************************************************
  * do the basic defect classification: vacancy/interstitial/antisite
  *******************************************************************************/
@@ -75,7 +141,8 @@ basicDefectClassification(double vacancyRadius, int NAtoms, char *specieList, in
         int refNAtoms, char *specieListRef, int *specieRef, double *refPos, int *PBC, double *cellDims,
         int *counters, int *vacancies, int *interstitials, int *antisites, int *onAntisites)
 {
-    int boxstat, i;
+    int boxstat, i, errorCount;
+    int *nearestAtom;
     int *possibleVacancy, *possibleInterstitial;
     int *possibleAntisite, *possibleOnAntisite;
     int NVacancies, NInterstitials, NAntisites;
@@ -144,129 +211,77 @@ basicDefectClassification(double vacancyRadius, int NAtoms, char *specieList, in
     
     vacRad2 = vacancyRadius * vacancyRadius;
     
-    /* loop over reference sites */
+    /* nearest atom to each site, ignoring whether other sites take it (in parallel) */
+    nearestAtom = malloc(refNAtoms * sizeof(int));
+    if (nearestAtom == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate nearestAtom");
+        freeBoxes(boxes);
+        free(possibleAntisite);
+        free(possibleInterstitial);
+        free(possibleVacancy);
+        free(possibleOnAntisite);
+        return 8;
+    }
+    
+    errorCount = 0;
+    #pragma omp parallel for num_threads(prefs_numThreads) reduction(+: errorCount)
     for (i = 0; i < refNAtoms; i++)
     {
-        int boxNebList[27], boxIndex, j, boxNebListSize;
-        int nearestIndex = -1;
-        int occupancyCount = 0;
-        int i3 = 3 * i;
-        double refxpos, refypos, refzpos;
-        double nearestSep2 = 9999.0;
-
-        refxpos = refPos[i3    ];
-        refypos = refPos[i3 + 1];
-        refzpos = refPos[i3 + 2];
-
-        /* get box index of this atom */
-        boxIndex = boxIndexOfAtom(refxpos, refypos, refzpos, boxes);
-        if (boxIndex < 0)
-        {
-            freeBoxes(boxes);
-            free(possibleAntisite);
-            free(possibleInterstitial);
-            free(possibleVacancy);
-            free(possibleOnAntisite);
-            return 7;
-        }
-
-        /* find neighbouring boxes */
-        boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
-
-//        printf("Checking site %d for occupancy (%lf, %lf, %lf)\n", i, refxpos, refypos, refzpos);
+        nearestAtom[i] = nearestAtomToSite(i, refPos, pos, NULL, boxes, vacRad2, PBC, cellDims);
+        if (nearestAtom[i] == -2) errorCount++;
+    }
+    
+    if (errorCount)
+    {
+        freeBoxes(boxes);
+        free(possibleAntisite);
+        free(possibleInterstitial);
+        free(possibleVacancy);
+        free(possibleOnAntisite);
+        free(nearestAtom);
+        return 7;
+    }
+    
+    /* assign atoms to the sites in order: a site takes its nearest atom unless an
+     * earlier site has already taken it, in which case the nearest atom that has
+     * not been taken is found again (only possible if the vacancy radius is large
+     * enough for an atom to be near to more than one site). The result is the
+     * same as searching each site in turn. */
+    for (i = 0; i < refNAtoms; i++)
+    {
+        int nearestIndex = nearestAtom[i];
+        
+        if (nearestIndex >= 0 && !possibleInterstitial[nearestIndex])
+            nearestIndex = nearestAtomToSite(i, refPos, pos, possibleInterstitial, boxes, vacRad2, PBC, cellDims);
         
-        /* loop over neighbouring boxes */
-        for (j = 0; j < boxNebListSize; j++)
-        {
-            int checkBox, k;
-
-            checkBox = boxNebList[j];
-
-            /* loop over all input atoms in the box */
-            for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
-            {
-                int index, index3;
-                double xpos, ypos, zpos, sep2;
-
-                /* index of this input atom */
-                index = boxes->boxAtoms[checkBox][k];
-
-                /* atom position */
-                index3 = 3 * index;
-                xpos = pos[index3    ];
-                ypos = pos[index3 + 1];
-                zpos = pos[index3 + 2];
-
-                /* atomic separation of possible vacancy and possible interstitial */
-                sep2 = atomicSeparation2(xpos, ypos, zpos, refxpos, refypos, refzpos,
-                                         cellDims[0], cellDims[1], cellDims[2],
-                                         PBC[0], PBC[1], PBC[2]);
-
-                /* if within vacancy radius, is it an antisite or normal lattice point */
-                if (sep2 < vacRad2)
-                {
-//                    printf("  Input atom %d within vac rad: sep = %lf (%lf, %lf, %lf)\n", index, sqrt(sep2), xpos, ypos, zpos);
-                    
-                    /* check whether this is the closest atom to this vacancy */
-                    if (sep2 < nearestSep2)
-                    {
-                        /* assume that the vacancy radius is chosen so that atoms cannot belong to multiple sites */
-                        //if (!possibleInterstitial[index])
-                        //{
-                        //    char errstring[256];
-                        //    sprintf(errstring, "Input atom associated with multiple reference sites (index = %d, site = %d).", index, i);
-                        //    PyErr_SetString(PyExc_RuntimeError, errstring);
-                        //    freeBoxes(boxes);
-                        //    free(possibleOnAntisite);
-                        //    free(possibleAntisite);
-                        //    free(possibleInterstitial);
-                        //    free(possibleVacancy);
-                        //    return 8;
-                        //}
-
-                        if (possibleInterstitial[index])
-                        {
-                            nearestSep2 = sep2;
-                            nearestIndex = index;
-                        }
-                    }
-                    
-                    occupancyCount++;
-                }
-            }
-        }
-
         /* classify - check the atom that was closest to this site (within the vacancy radius) */
         if (nearestIndex != -1)
         {
             char symtemp[3], symtemp2[3];
             int comp;
             
-//            printf("Classifying site %d: nearest index = %d (sep = %lf)\n", i, nearestIndex, sqrt(nearestSep2));
-
             /* this site is filled; now we check if antisite or normal site */
             symtemp[0] = specieList[3*specie[nearestIndex]];
             symtemp[1] = specieList[3*specie[nearestIndex]+1];
             symtemp[2] = '\0';
-
+            
             symtemp2[0] = specieListRef[3*specieRef[i]];
             symtemp2[1] = specieListRef[3*specieRef[i]+1];
             symtemp2[2] = '\0';
-
+            
             comp = strcmp(symtemp, symtemp2);
             /* symbols match, so not antisite */
             if (comp == 0) possibleAntisite[i] = 0;
             /* symbols do not match => antisite */
             else possibleOnAntisite[i] = nearestIndex;
-
+            
             /* not an interstitial or vacancy */
             possibleInterstitial[nearestIndex] = 0;
             possibleVacancy[i] = 0;
-
-//            if (occupancyCount > 1)
-//                printf("INFO: Occupancy for site %d = %d\n", i, occupancyCount);
         }
     }
+    free(nearestAtom);
     
     /* free box arrays */
     freeBoxes(boxes);
@@ -1171,12 +1186,12 @@ refineDefectsUsingAcnaOld(int NVacancies, int *vacancies, int NInterstitials, in
             checkBox = boxNebList[j];
             
             /* now loop over all reference atoms in the box */
-            for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
+            for (k = boxes->boxStart[checkBox]; k < boxes->boxStart[checkBox + 1]; k++)
             {
                 int index, intIndex;
                 double xpos, ypos, zpos, sep2;
 
-                intIndex = boxes->boxAtoms[checkBox][k];
+                intIndex = boxes->boxAtoms[k];
                 index = interstitials[intIndex];
                 
                 /* skip if this interstitial has already been detected as lattice atom */
@@ -2038,9 +2053,9 @@ static int findDefectNeighbours(int index, int clusterID, int numInCluster, int*
     {
         boxIndex = boxNebList[i];
         
-        for (j=0; j<boxes->boxNAtoms[boxIndex]; j++)
+        for (j = boxes->boxStart[boxIndex]; j < boxes->boxStart[boxIndex + 1]; j++)
         {
-            index2 = boxes->boxAtoms[boxIndex][j];
+            index2 = boxes->boxAtoms[j];
             
             /* skip itself or if already searched */
             if ((index == index2) || (atomCluster[index2] != -1)) continue;
@@ -12,7 +12,9 @@
 #include <math.h>
 #include "visclibs/utilities.h"
 #include "visclibs/boxeslib.h"
+#include "visclibs/neb_list.h"
 #include "visclibs/array_utils.h"
+#include "gui/preferences.h"
 
 #if PY_MAJOR_VERSION >= 3
     #define MOD_ERROR_VAL NULL
@@ -47,6 +49,7 @@ static PyObject* slipFilter(PyObject*, PyObject*);
 static PyObject* genericScalarFilter(PyObject *, PyObject *);
 static PyObject* cropDefectsFilter(PyObject *self, PyObject *args);
 static PyObject* sliceDefectsFilter(PyObject *self, PyObject *args);
+static char* allocKeepMask(int);
 
 
 /*******************************************************************************
@@ -155,19 +158,18 @@ static PyObject*
 specieFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, visSpecDim, *visSpec, *specie, NScalars, NVectors;
-    double *fullScalars;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *visSpecIn=NULL;
     PyArrayObject *specieIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     
     int i, NVisible;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!O!iO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &visSpecIn, 
-            &PyArray_Type, &specieIn, &NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, &PyArray_Type, 
-            &fullVectors))
+    if (!PyArg_ParseTuple(args, "O!O!O!iOiO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &visSpecIn, 
+            &PyArray_Type, &specieIn, &NScalars, &fullScalars, &NVectors, &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -181,47 +183,34 @@ specieFilter(PyObject *self, PyObject *args)
     if (not_intVector(specieIn)) return NULL;
     specie = pyvector_to_Cptr_int(specieIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
-    
-    if (not_doubleVector(fullVectors)) return NULL;
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
     
     /* run */
-    NVisible = 0;
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i = 0; i < NVisibleIn; i++)
     {
-        int j, index, match;
+        int j, index;
         
         index = visibleAtoms[i];
         
-        match = 0;
+        keep[i] = 0;
         for (j = 0; j < visSpecDim; j++)
         {
             if (specie[index] == visSpec[j])
             {
-                match = 1;
+                keep[i] = 1;
                 break;
             }
         }
-        
-        if (match)
-        {
-            int k;
-            
-            for (k = 0; k < NScalars; k++)
-                fullScalars[NVisibleIn * k + NVisible] = fullScalars[NVisibleIn * k + i];
-            
-            for (k = 0; k < NVectors; k++)
-            {
-                DIND2(fullVectors, NVisibleIn * k + NVisible, 0) = DIND2(fullVectors, NVisibleIn * k + i, 0);
-                DIND2(fullVectors, NVisibleIn * k + NVisible, 1) = DIND2(fullVectors, NVisibleIn * k + i, 1);
-                DIND2(fullVectors, NVisibleIn * k + NVisible, 2) = DIND2(fullVectors, NVisibleIn * k + i, 2);
-            }
-            
-            visibleAtoms[NVisible++] = index;
-        }
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -233,19 +222,20 @@ static PyObject*
 sliceFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, invert, NScalars, NVectors;
-    double *pos, x0, y0, z0, xn, yn, zn, *fullScalars;
+    double *pos, x0, y0, z0, xn, yn, zn;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *posIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     
-    int i, j, NVisible, index;
-    double mag, xd, yd, zd, dotProd, distanceToPlane;
+    int i, NVisible;
+    double mag;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!ddddddiiO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, 
-            &x0, &y0, &z0, &xn, &yn, &zn, &invert, &NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, 
-            &PyArray_Type, &fullVectors))
+    if (!PyArg_ParseTuple(args, "O!O!ddddddiiOiO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, 
+            &x0, &y0, &z0, &xn, &yn, &zn, &invert, &NScalars, &fullScalars, &NVectors, 
+            &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -255,21 +245,20 @@ sliceFilter(PyObject *self, PyObject *args)
     if (not_doubleVector(posIn)) return NULL;
     pos = pyvector_to_Cptr_double(posIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
-    
-    if (not_doubleVector(fullVectors)) return NULL;
-    
     /* normalise (xn, yn, zn) */
     mag = sqrt(xn * xn + yn * yn + zn * zn);
     xn = xn / mag;
     yn = yn / mag;
     zn = zn / mag;
     
-    NVisible = 0;
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
+    
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisibleIn; i++)
     {
-        index = visibleAtoms[i];
+        int index = visibleAtoms[i];
+        double xd, yd, zd, dotProd, distanceToPlane;
         
         xd = pos[3*index] - x0;
         yd = pos[3*index+1] - y0;
@@ -278,23 +267,15 @@ sliceFilter(PyObject *self, PyObject *args)
         dotProd = xd * xn + yd * yn + zd * zn;
         distanceToPlane = dotProd / mag;
         
-        if ((invert && distanceToPlane > 0) || (!invert && distanceToPlane < 0))
-        {
-            /* handle full scalars array */
-            for (j = 0; j < NScalars; j++)
-                fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-            
-            for (j = 0; j < NVectors; j++)
-            {
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-            }
-            
-            visibleAtoms[NVisible++] = index;
-        }
+        keep[i] = (invert && distanceToPlane > 0) || (!invert && distanceToPlane < 0);
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -438,21 +419,22 @@ static PyObject*
 cropSphereFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, *PBC, invertSelection, NScalars, NVectors;
-    double *pos, xCentre, yCentre, zCentre, radius, *cellDims, *fullScalars;
+    double *pos, xCentre, yCentre, zCentre, radius, *cellDims;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *posIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     PyArrayObject *PBCIn=NULL;
     PyArrayObject *cellDimsIn=NULL;
     
-    int i, j, NVisible, index;
-    double radius2, sep2;
+    int i, NVisible;
+    double radius2;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!ddddO!O!iiO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, 
+    if (!PyArg_ParseTuple(args, "O!O!ddddO!O!iiOiO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, 
             &xCentre, &yCentre, &zCentre, &radius, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn,
-            &invertSelection, &NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, &PyArray_Type, &fullVectors))
+            &invertSelection, &NScalars, &fullScalars, &NVectors, &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -462,11 +444,6 @@ cropSphereFilter(PyObject *self, PyObject *args)
     if (not_doubleVector(posIn)) return NULL;
     pos = pyvector_to_Cptr_double(posIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
-    
-    if (not_doubleVector(fullVectors)) return NULL;
-    
     if (not_doubleVector(cellDimsIn)) return NULL;
     cellDims = pyvector_to_Cptr_double(cellDimsIn);
     
@@ -475,54 +452,31 @@ cropSphereFilter(PyObject *self, PyObject *args)
     
     radius2 = radius * radius;
     
-    NVisible = 0;
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
+    
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisibleIn; i++)
     {
-        index = visibleAtoms[i];
+        int index = visibleAtoms[i];
+        double sep2;
         
         sep2 = atomicSeparation2(pos[3*index], pos[3*index+1], pos[3*index+2], 
                                  xCentre, yCentre, zCentre, 
                                  cellDims[0], cellDims[1], cellDims[2], 
                                  PBC[0], PBC[1], PBC[2]);
         
-        if (sep2 < radius2)
-        {
-            if (invertSelection)
-            {
-                /* handle full scalars array */
-                for (j = 0; j < NScalars; j++)
-                    fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-                
-                for (j = 0; j < NVectors; j++)
-                {
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-                }
-                
-                visibleAtoms[NVisible++] = index;
-            }
-        }
-        else
-        {
-            if (!invertSelection)
-            {
-                /* handle full scalars array */
-                for (j = 0; j < NScalars; j++)
-                    fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-                
-                for (j = 0; j < NVectors; j++)
-                {
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-                }
-                
-                visibleAtoms[NVisible++] = index;
-            }
-        }
+        /* inside the sphere if inverted, otherwise outside */
+        if (sep2 < radius2) keep[i] = invertSelection ? 1 : 0;
+        else keep[i] = invertSelection ? 0 : 1;
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -681,18 +635,19 @@ static PyObject*
 cropFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, xEnabled, yEnabled, zEnabled, invertSelection, NScalars, NVectors;
-    double *pos, xmin, xmax, ymin, ymax, zmin, zmax, *fullScalars;
+    double *pos, xmin, xmax, ymin, ymax, zmin, zmax;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *posIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     
     int i, NVisible;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!ddddddiiiiiO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, 
+    if (!PyArg_ParseTuple(args, "O!O!ddddddiiiiiOiO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn, 
             &xmin, &xmax, &ymin, &ymax, &zmin, &zmax, &xEnabled, &yEnabled, &zEnabled, &invertSelection, 
-            &NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, &PyArray_Type, &fullVectors))
+            &NScalars, &fullScalars, &NVectors, &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -702,12 +657,10 @@ cropFilter(PyObject *self, PyObject *args)
     if (not_doubleVector(posIn)) return NULL;
     pos = pyvector_to_Cptr_double(posIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
     
-    if (not_doubleVector(fullVectors)) return NULL;
-
-    NVisible = 0;
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisibleIn; i++)
     {
         int index = visibleAtoms[i];
@@ -744,29 +697,15 @@ cropFilter(PyObject *self, PyObject *args)
             }
         }
         
-        if ((add && !invertSelection) || (!add && invertSelection))
-        {
-            int j;
-
-            /* handle full scalars array */
-            for (j = 0; j < NScalars; j++)
-            {
-                int jn = NVisibleIn * j;
-            	fullScalars[jn + NVisible] = fullScalars[jn + i];
-            }
-            
-            for (j = 0; j < NVectors; j++)
-            {
-                int jn = NVisibleIn * j;
-            	DIND2(fullVectors, jn + NVisible, 0) = DIND2(fullVectors, jn + i, 0);
-                DIND2(fullVectors, jn + NVisible, 1) = DIND2(fullVectors, jn + i, 1);
-                DIND2(fullVectors, jn + NVisible, 2) = DIND2(fullVectors, jn + i, 2);
-            }
-            
-            visibleAtoms[NVisible++] = index;
-        }
+        keep[i] = (add && !invertSelection) || (!add && invertSelection);
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -778,7 +717,7 @@ static PyObject*
 displacementFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, *PBC, NScalars, filteringEnabled, driftCompensation, refPosDim, NVectors;
-    double *scalars, *pos, *refPosIn, *cellDims, minDisp, maxDisp, *fullScalars, *driftVector;
+    double *scalars, *pos, *refPosIn, *cellDims, minDisp, maxDisp, *driftVector;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *refPosIn_np=NULL;
     PyArrayObject *PBCIn=NULL;
@@ -786,18 +725,19 @@ displacementFilter(PyObject *self, PyObject *args)
     PyArrayObject *scalarsIn=NULL;
     PyArrayObject *driftVectorIn=NULL;
     PyArrayObject *cellDimsIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     
-    int i, NVisible, index, j;
-    double sep2, maxDisp2, minDisp2;
+    int i, NVisible;
+    double maxDisp2, minDisp2;
     double *refPos;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!O!ddiO!iiO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &scalarsIn, 
+    if (!PyArg_ParseTuple(args, "O!O!O!O!O!O!ddiOiiO!iO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &scalarsIn, 
             &PyArray_Type, &posIn, &PyArray_Type, &refPosIn_np, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, 
-            &minDisp, &maxDisp, &NScalars, &PyArray_Type, &fullScalarsIn, &filteringEnabled, &driftCompensation, 
-            &PyArray_Type, &driftVectorIn, &NVectors, &PyArray_Type, &fullVectors))
+            &minDisp, &maxDisp, &NScalars, &fullScalars, &filteringEnabled, &driftCompensation, 
+            &PyArray_Type, &driftVectorIn, &NVectors, &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -820,13 +760,10 @@ displacementFilter(PyObject *self, PyObject *args)
     if (not_intVector(PBCIn)) return NULL;
     PBC = pyvector_to_Cptr_int(PBCIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
     
     if (not_doubleVector(driftVectorIn)) return NULL;
     driftVector = pyvector_to_Cptr_double(driftVectorIn);
     
-    if (not_doubleVector(fullVectors)) return NULL;
     
     /* drift compensation? */
     if (driftCompensation)
@@ -838,6 +775,7 @@ displacementFilter(PyObject *self, PyObject *args)
             return NULL;
         }
         
+        #pragma omp parallel for num_threads(prefs_numThreads)
         for (i = 0; i < refPosDim / 3; i++)
         {
             refPos[3*i] = refPosIn[3*i] + driftVector[0];
@@ -853,37 +791,38 @@ displacementFilter(PyObject *self, PyObject *args)
     minDisp2 = minDisp * minDisp;
     maxDisp2 = maxDisp * maxDisp;
     
-    NVisible = 0;
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL)
+    {
+        if (driftCompensation) free(refPos);
+        return NULL;
+    }
+    
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisibleIn; i++)
     {
-        index = visibleAtoms[i];
+        int index = visibleAtoms[i];
+        double sep2;
         
         sep2 = atomicSeparation2(pos[3*index], pos[3*index+1], pos[3*index+2], 
                                  refPos[3*index], refPos[3*index+1], refPos[3*index+2], 
                                  cellDims[0], cellDims[1], cellDims[2], 
                                  PBC[0], PBC[1], PBC[2]);
         
-        if (!filteringEnabled || (sep2 <= maxDisp2 && sep2 >= minDisp2))
-        {
-            /* handle full scalars array */
-            for (j = 0; j < NScalars; j++)
-                fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-            
-            for (j = 0; j < NVectors; j++)
-            {
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-            }
-            
-            visibleAtoms[NVisible] = index;
-            scalars[NVisible++] = sqrt(sep2);
-        }
+        keep[i] = !filteringEnabled || (sep2 <= maxDisp2 && sep2 >= minDisp2);
+        scalars[i] = sqrt(sep2);
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    compactDoubleVector(NVisibleIn, scalars, keep);
+    free(keep);
+    
     if (driftCompensation) free(refPos);
     else refPos = NULL;
     
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -895,17 +834,18 @@ static PyObject*
 KEFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, NScalars, NVectors;
-    double *KE, minKE, maxKE, *fullScalars;
+    double *KE, minKE, maxKE;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *KEIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     
-    int i, j, NVisible, index;
+    int i, NVisible;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!ddiO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &KEIn, 
-            &minKE, &maxKE, &NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, &PyArray_Type, &fullVectors))
+    if (!PyArg_ParseTuple(args, "O!O!ddiOiO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &KEIn, 
+            &minKE, &maxKE, &NScalars, &fullScalars, &NVectors, &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -915,37 +855,23 @@ KEFilter(PyObject *self, PyObject *args)
     if (not_doubleVector(KEIn)) return NULL;
     KE = pyvector_to_Cptr_double(KEIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
-    
-    if (not_doubleVector(fullVectors)) return NULL;
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
     
-    NVisible = 0;
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisibleIn; i++)
     {
-        index = visibleAtoms[i];
+        int index = visibleAtoms[i];
         
-        if (KE[index] < minKE || KE[index] > maxKE)
-        {
-            continue;
-        }
-        else
-        {
-            /* handle full scalars array */
-            for (j = 0; j < NScalars; j++)
-                fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-            
-            for (j = 0; j < NVectors; j++)
-            {
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-            }
-            
-            visibleAtoms[NVisible++] = index;
-        }
+        keep[i] = !(KE[index] < minKE || KE[index] > maxKE);
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -957,17 +883,18 @@ static PyObject*
 PEFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, NScalars, NVectors;
-    double *PE, minPE, maxPE, *fullScalars;
+    double *PE, minPE, maxPE;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *PEIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     
-    int i, j, NVisible, index;
+    int i, NVisible;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!ddiO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &PEIn, 
-            &minPE, &maxPE, &NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, &PyArray_Type, &fullVectors))
+    if (!PyArg_ParseTuple(args, "O!O!ddiOiO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &PEIn, 
+            &minPE, &maxPE, &NScalars, &fullScalars, &NVectors, &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -977,37 +904,23 @@ PEFilter(PyObject *self, PyObject *args)
     if (not_doubleVector(PEIn)) return NULL;
     PE = pyvector_to_Cptr_double(PEIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
     
-    if (not_doubleVector(fullVectors)) return NULL;
-    
-    NVisible = 0;
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisibleIn; i++)
     {
-        index = visibleAtoms[i];
+        int index = visibleAtoms[i];
         
-        if (PE[index] < minPE || PE[index] > maxPE)
-        {
-            continue;
-        }
-        else
-        {
-            /* handle full scalars array */
-            for (j = 0; j < NScalars; j++)
-                fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-            
-            for (j = 0; j < NVectors; j++)
-            {
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-            }
-            
-            visibleAtoms[NVisible++] = index;
-        }
+        keep[i] = !(PE[index] < minPE || PE[index] > maxPE);
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -1019,18 +932,18 @@ static PyObject*
 chargeFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, NScalars, NVectors;
-    double *charge, minCharge, maxCharge, *fullScalars;
+    double *charge, minCharge, maxCharge;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *chargeIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     
-    int i, j, NVisible, index;
+    int i, NVisible;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!ddiO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &chargeIn, 
-            &minCharge, &maxCharge, &NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, &PyArray_Type, 
-            &fullVectors))
+    if (!PyArg_ParseTuple(args, "O!O!ddiOiO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &chargeIn, 
+            &minCharge, &maxCharge, &NScalars, &fullScalars, &NVectors, &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -1040,37 +953,23 @@ chargeFilter(PyObject *self, PyObject *args)
     if (not_doubleVector(chargeIn)) return NULL;
     charge = pyvector_to_Cptr_double(chargeIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
-    
-    if (not_doubleVector(fullVectors)) return NULL;
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
     
-    NVisible = 0;
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisibleIn; i++)
     {
-        index = visibleAtoms[i];
+        int index = visibleAtoms[i];
         
-        if (charge[index] < minCharge || charge[index] > maxCharge)
-        {
-            continue;
-        }
-        else
-        {
-            /* handle full scalars array */
-            for (j = 0; j < NScalars; j++)
-                fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-            
-            for (j = 0; j < NVectors; j++)
-            {
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-            }
-            
-            visibleAtoms[NVisible++] = index;
-        }
+        keep[i] = !(charge[index] < minCharge || charge[index] > maxCharge);
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -1097,12 +996,14 @@ chargeFilter(PyObject *self, PyObject *args)
  **     - NVectors: the number of previously calculated vector values
  **     - fullVectors: the full list of previously calculated vectors
  **     - approxBoxWidth: the approximate size to use when decomposing the system
+ **     - nebStart, nebIndex: shared neighbour list of all atoms (compressed form,
+ **       may be empty in which case the visible atoms are boxed instead)
  *******************************************************************************/
 static PyObject* 
 coordNumFilter(PyObject *self, PyObject *args)
 {
     int NVisible, *visibleAtoms, *specie, NSpecies, *PBC, minCoordNum, maxCoordNum, NScalars, filteringEnabled, NVectors;
-    double *pos, *bondMinArray, *bondMaxArray, approxBoxWidth, *cellDims, *coordArray, *fullScalars;
+    double *pos, *bondMinArray, *bondMaxArray, approxBoxWidth, *cellDims, *coordArray;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *specieIn=NULL;
     PyArrayObject *PBCIn=NULL;
@@ -1111,18 +1012,20 @@ coordNumFilter(PyObject *self, PyObject *args)
     PyArrayObject *bondMinArrayIn=NULL;
     PyArrayObject *bondMaxArrayIn=NULL;
     PyArrayObject *cellDimsIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
-    int i, count, NVisibleNew, boxstat;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
+    PyArrayObject *nebStartIn=NULL;
+    PyArrayObject *nebIndexIn=NULL;
+    int i, NVisibleNew, boxstat;
     double *visiblePos;
     struct Boxes *boxes;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!O!iO!O!dO!O!O!iiiO!iiO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn,
+    if (!PyArg_ParseTuple(args, "O!O!O!iO!O!dO!O!O!iiiOiiOO!O!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &posIn,
             &PyArray_Type, &specieIn, &NSpecies, &PyArray_Type, &bondMinArrayIn, &PyArray_Type, &bondMaxArrayIn,
             &approxBoxWidth, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, &PyArray_Type, &coordArrayIn,
-            &minCoordNum, &maxCoordNum, &NScalars, &PyArray_Type, &fullScalarsIn, &filteringEnabled, &NVectors,
-            &PyArray_Type, &fullVectors))
+            &minCoordNum, &maxCoordNum, &NScalars, &fullScalars, &filteringEnabled, &NVectors,
+            &fullVectors, &PyArray_Type, &nebStartIn, &PyArray_Type, &nebIndexIn))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -1150,10 +1053,8 @@ coordNumFilter(PyObject *self, PyObject *args)
     if (not_doubleVector(coordArrayIn)) return NULL;
     coordArray = pyvector_to_Cptr_double(coordArrayIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
-    
-    if (not_doubleVector(fullVectors)) return NULL;
+    if (not_intVector(nebStartIn)) return NULL;
+    if (not_intVector(nebIndexIn)) return NULL;
     
 #ifdef DEBUG
     printf("COORDNUM CLIB\n");
@@ -1170,80 +1071,37 @@ coordNumFilter(PyObject *self, PyObject *args)
     }
 #endif
     
-    /* construct array of postions of visible atoms */
-    visiblePos = malloc(3 * NVisible * sizeof(double));
-    if (visiblePos == NULL)
+    /* use the shared neighbour list if one was passed */
+    if (PyArray_DIM(nebStartIn, 0) > 0)
     {
-        printf("ERROR: could not allocate visiblePos\n");
-        exit(50);
-    }
-    for (i = 0; i < NVisible; i++)
-    {
-        int index = visibleAtoms[i];
-        int i3 = i * 3;
-        int ind3 = index * 3;
-
-        visiblePos[i3    ] = pos[ind3    ];
-        visiblePos[i3 + 1] = pos[ind3 + 1];
-        visiblePos[i3 + 2] = pos[ind3 + 2];
-    }
-    
-    /* box visible atoms */
-    boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
-    if (boxes == NULL)
-    {
-        free(visiblePos);
-        return NULL;
-    }
-    boxstat = putAtomsInBoxes(NVisible, visiblePos, boxes);
-    
-    /* free visible pos */
-    free(visiblePos);
-    
-    /* return if there was an error during boxing */
-    if (boxstat) return NULL;
-    
-    /* initialise coord array */
-    for (i = 0; i < NVisible; i++) coordArray[i] = 0;
-    
-    /* loop over visible atoms */
-    count = 0;
-    for (i = 0; i < NVisible; i++)
-    {
-        int j, index, speca, boxNebListSize, boxIndex, boxNebList[27];
-        
-        /* index and species of this atom */
-        index = visibleAtoms[i];
-        speca = specie[index];
+        int *nebStart = pyvector_to_Cptr_int(nebStartIn);
+        int *nebIndex = pyvector_to_Cptr_int(nebIndexIn);
+        int *visIndexMap;
         
-        /* get the box index of this atom */
-        boxIndex = boxIndexOfAtom(pos[3*index], pos[3*index+1], pos[3*index+2], boxes);
-        if (boxIndex < 0)
-        {
-            freeBoxes(boxes);
-            return NULL;
-        }
-        
-        /* find neighbouring boxes */
-        boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+        /* map from atom index to visible index */
+        visIndexMap = makeVisibleIndexMap((int) PyArray_DIM(nebStartIn, 0) - 1, NVisible, visibleAtoms);
+        if (visIndexMap == NULL) return NULL;
         
-        /* loop over box neighbourhood */
-        for (j = 0; j < boxNebListSize; j++)
+        /* loop over visible atoms (each atom counts all of its own bonds) */
+        #pragma omp parallel for num_threads(prefs_numThreads)
+        for (i = 0; i < NVisible; i++)
         {
-            int checkBox = boxNebList[j];
-            int k;
+            int j, index, speca, coord;
             
-            for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
+            /* index and species of this atom */
+            index = visibleAtoms[i];
+            speca = specie[index];
+            
+            /* loop over neighbours of this atom */
+            coord = 0;
+            for (j = nebStart[index]; j < nebStart[index + 1]; j++)
             {
-                int specb, visIndex, index2;
+                int specb, index2;
                 double sep2;
-
-                /* index of this atom */
-                visIndex = boxes->boxAtoms[checkBox][k];
-                index2 = visibleAtoms[visIndex];
                 
-                /* we only need to check each pair once */
-                if (index >= index2) continue;
+                /* skip atoms that are not visible */
+                index2 = nebIndex[j];
+                if (visIndexMap[index2] < 0) continue;
                 
                 /* species of the second atom */
                 specb = specie[index2];
@@ -1260,53 +1118,124 @@ coordNumFilter(PyObject *self, PyObject *args)
                 
                 /* check if these atoms are bonded */
                 if (sep2 >= bondMinArray[speca*NSpecies+specb] && sep2 <= bondMaxArray[speca*NSpecies+specb])
-                {
-                    coordArray[i]++;
-                    coordArray[visIndex]++;
-                    count++;
-                }
+                    coord++;
             }
+            coordArray[i] = coord;
         }
+        
+        free(visIndexMap);
     }
-    
-    /* free boxes memory */
-    freeBoxes(boxes);
-
-    /* filter by coordination number, if required */
-    if (filteringEnabled)
+    else
     {
-        NVisibleNew = 0;
+        /* construct array of postions of visible atoms */
+        visiblePos = malloc(3 * NVisible * sizeof(double));
+        if (visiblePos == NULL)
+        {
+            printf("ERROR: could not allocate visiblePos\n");
+            exit(50);
+        }
+        for (i = 0; i < NVisible; i++)
+        {
+            int index = visibleAtoms[i];
+            int i3 = i * 3;
+            int ind3 = index * 3;
+
+            visiblePos[i3    ] = pos[ind3    ];
+            visiblePos[i3 + 1] = pos[ind3 + 1];
+            visiblePos[i3 + 2] = pos[ind3 + 2];
+        }
+    
+        /* box visible atoms */
+        boxes = setupBoxes(approxBoxWidth, PBC, cellDims);
+        if (boxes == NULL)
+        {
+            free(visiblePos);
+            return NULL;
+        }
+        boxstat = putAtomsInBoxes(NVisible, visiblePos, boxes);
+    
+        /* free visible pos */
+        free(visiblePos);
+    
+        /* return if there was an error during boxing */
+        if (boxstat) return NULL;
+    
+        /* loop over visible atoms (each atom counts all of its own bonds) */
+        #pragma omp parallel for num_threads(prefs_numThreads)
         for (i = 0; i < NVisible; i++)
         {
-            /* check if this atom is visible */
-            if (coordArray[i] >= minCoordNum && coordArray[i] <= maxCoordNum)
+            int j, index, speca, boxNebListSize, boxIndex, boxNebList[27], coord;
+        
+            /* index and species of this atom */
+            index = visibleAtoms[i];
+            speca = specie[index];
+        
+            /* get the box index of this atom (cannot fail, the same positions were boxed above) */
+            boxIndex = boxIndexOfAtom(pos[3*index], pos[3*index+1], pos[3*index+2], boxes);
+        
+            /* find neighbouring boxes */
+            boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+        
+            /* loop over box neighbourhood */
+            coord = 0;
+            for (j = 0; j < boxNebListSize; j++)
             {
-                int j;
+                int checkBox = boxNebList[j];
+                int k;
+            
+                for (k = boxes->boxStart[checkBox]; k < boxes->boxStart[checkBox + 1]; k++)
+                {
+                    int specb, index2;
+                    double sep2;
 
-                /* updatre visible atoms and coordination number arrays */
-                visibleAtoms[NVisibleNew] = visibleAtoms[i];
-                coordArray[NVisibleNew] = coordArray[i];
+                    /* index of this atom */
+                    index2 = visibleAtoms[boxes->boxAtoms[k]];
+                    if (index == index2) continue;
                 
-                /* update full scalars/vectors array */
-                for (j = 0; j < NScalars; j++)
-                {
-                    int nj = NVisible * j;
-                    fullScalars[nj + NVisibleNew] = fullScalars[nj + i];
-                }
-                for (j = 0; j < NVectors; j++)
-                {
-                    int nj = NVisible * j;
-                    DIND2(fullVectors, nj + NVisibleNew, 0) = DIND2(fullVectors, nj + i, 0);
-                    DIND2(fullVectors, nj + NVisibleNew, 1) = DIND2(fullVectors, nj + i, 1);
-                    DIND2(fullVectors, nj + NVisibleNew, 2) = DIND2(fullVectors, nj + i, 2);
-                }
+                    /* species of the second atom */
+                    specb = specie[index2];
+                
+                    /* if no bond was specified for this pair we skip it */
+                    if (bondMinArray[speca*NSpecies+specb] == 0.0 && bondMaxArray[speca*NSpecies+specb] == 0.0)
+                        continue;
                 
-                NVisibleNew++;
+                    /* atomic separation */
+                    sep2 = atomicSeparation2(pos[3*index], pos[3*index+1], pos[3*index+2], 
+                                             pos[3*index2], pos[3*index2+1], pos[3*index2+2], 
+                                             cellDims[0], cellDims[1], cellDims[2], 
+                                             PBC[0], PBC[1], PBC[2]);
+                
+                    /* check if these atoms are bonded */
+                    if (sep2 >= bondMinArray[speca*NSpecies+specb] && sep2 <= bondMaxArray[speca*NSpecies+specb])
+                        coord++;
+                }
             }
+            coordArray[i] = coord;
         }
+    
+        /* free boxes memory */
+        freeBoxes(boxes);
+    }
+
+    /* filter by coordination number, if required */
+    if (filteringEnabled)
+    {
+        char *keep = allocKeepMask(NVisible);
+        if (keep == NULL) return NULL;
+        
+        #pragma omp parallel for num_threads(prefs_numThreads)
+        for (i = 0; i < NVisible; i++)
+            keep[i] = coordArray[i] >= minCoordNum && coordArray[i] <= maxCoordNum;
+        
+        /* update visible atoms, coordination number and full scalars/vectors arrays */
+        NVisibleNew = compactVisibleAtoms(NVisible, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+        compactDoubleVector(NVisible, coordArray, keep);
+        free(keep);
     }
     else NVisibleNew = NVisible;
     
+    if (NVisibleNew < 0) return NULL;
+    
     return Py_BuildValue("i", NVisibleNew);
 }
 
@@ -1317,19 +1246,20 @@ static PyObject*
 voronoiVolumeFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, NScalars, filteringEnabled, NVectors;
-    double *volume, minVolume, maxVolume, *fullScalars, *scalars;
+    double *volume, minVolume, maxVolume, *scalars;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *volumeIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
+    PyObject *fullScalars=NULL;
     PyArrayObject *scalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullVectors=NULL;
     
-    int i, j, NVisible, index;
+    int i, NVisible;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!ddO!iO!iiO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &volumeIn, 
-            &minVolume, &maxVolume, &PyArray_Type, &scalarsIn, &NScalars, &PyArray_Type, &fullScalarsIn,
-            &filteringEnabled, &NVectors, &PyArray_Type, &fullVectors))
+    if (!PyArg_ParseTuple(args, "O!O!ddO!iOiiO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &volumeIn, 
+            &minVolume, &maxVolume, &PyArray_Type, &scalarsIn, &NScalars, &fullScalars,
+            &filteringEnabled, &NVectors, &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -1339,37 +1269,30 @@ voronoiVolumeFilter(PyObject *self, PyObject *args)
     if (not_doubleVector(volumeIn)) return NULL;
     volume = pyvector_to_Cptr_double(volumeIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
     
     if (not_doubleVector(scalarsIn)) return NULL;
     scalars = pyvector_to_Cptr_double(scalarsIn);
     
-    if (not_doubleVector(fullVectors)) return NULL;
     
-    NVisible = 0;
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
+    
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisibleIn; i++)
     {
-        index = visibleAtoms[i];
+        int index = visibleAtoms[i];
         
-        if (!filteringEnabled || (volume[index] >= minVolume && volume[index] <= maxVolume))
-        {
-            /* handle full scalars array */
-            for (j = 0; j < NScalars; j++)
-                fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-            
-            for (j = 0; j < NVectors; j++)
-            {
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-            }
-            
-            visibleAtoms[NVisible] = index;
-            scalars[NVisible++] = volume[index];
-        }
+        keep[i] = !filteringEnabled || (volume[index] >= minVolume && volume[index] <= maxVolume);
+        scalars[i] = volume[index];
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    compactDoubleVector(NVisibleIn, scalars, keep);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -1380,19 +1303,20 @@ static PyObject*
 voronoiNeighboursFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, NScalars, filteringEnabled, *num_nebs_array, minNebs, maxNebs, NVectors;
-    double *fullScalars, *scalars;
+    double *scalars;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *num_nebs_arrayIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
+    PyObject *fullScalars=NULL;
     PyArrayObject *scalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullVectors=NULL;
     
-    int i, j, NVisible, index;
+    int i, NVisible;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!iiO!iO!iiO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &num_nebs_arrayIn, 
-            &minNebs, &maxNebs, &PyArray_Type, &scalarsIn, &NScalars, &PyArray_Type, &fullScalarsIn,
-            &filteringEnabled, &NVectors, &PyArray_Type, &fullVectors))
+    if (!PyArg_ParseTuple(args, "O!O!iiO!iOiiO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &num_nebs_arrayIn, 
+            &minNebs, &maxNebs, &PyArray_Type, &scalarsIn, &NScalars, &fullScalars,
+            &filteringEnabled, &NVectors, &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtomsIn)) return NULL;
@@ -1402,37 +1326,30 @@ voronoiNeighboursFilter(PyObject *self, PyObject *args)
     if (not_intVector(num_nebs_arrayIn)) return NULL;
     num_nebs_array = pyvector_to_Cptr_int(num_nebs_arrayIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
     
     if (not_doubleVector(scalarsIn)) return NULL;
     scalars = pyvector_to_Cptr_double(scalarsIn);
     
-    if (not_doubleVector(fullVectors)) return NULL;
     
-    NVisible = 0;
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
+    
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i=0; i<NVisibleIn; i++)
     {
-        index = visibleAtoms[i];
+        int index = visibleAtoms[i];
         
-        if (!filteringEnabled || (num_nebs_array[index] >= minNebs && num_nebs_array[index] <= maxNebs))
-        {
-            /* handle full scalars array */
-            for (j = 0; j < NScalars; j++)
-                fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-            
-            for (j = 0; j < NVectors; j++)
-            {
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-            }
-            
-            visibleAtoms[NVisible] = index;
-            scalars[NVisible++] = num_nebs_array[index];
-        }
+        keep[i] = !filteringEnabled || (num_nebs_array[index] >= minNebs && num_nebs_array[index] <= maxNebs);
+        scalars[i] = num_nebs_array[index];
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    compactDoubleVector(NVisibleIn, scalars, keep);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -1443,19 +1360,19 @@ static PyObject*
 atomIndexFilter(PyObject *self, PyObject *args)
 {
     int NVisibleIn, *visibleAtoms, NScalars, *atomID, NVectors, numr;
-    double *fullScalars;
     PyArrayObject *visibleAtomsIn=NULL;
     PyArrayObject *atomIDIn=NULL;
-    PyArrayObject *fullScalarsIn=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     PyArrayObject *rangeArray=NULL;
     
     int i, NVisible;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!O!iO!iO!", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &atomIDIn, 
-            &PyArray_Type, &rangeArray, &NScalars, &PyArray_Type, &fullScalarsIn, &NVectors, 
-            &PyArray_Type, &fullVectors))
+    if (!PyArg_ParseTuple(args, "O!O!O!iOiO", &PyArray_Type, &visibleAtomsIn, &PyArray_Type, &atomIDIn, 
+            &PyArray_Type, &rangeArray, &NScalars, &fullScalars, &NVectors, 
+            &fullVectors))
         return NULL;
     
     /* check array types */
@@ -1466,53 +1383,39 @@ atomIndexFilter(PyObject *self, PyObject *args)
     if (not_intVector(atomIDIn)) return NULL;
     atomID = pyvector_to_Cptr_int(atomIDIn);
     
-    if (not_doubleVector(fullScalarsIn)) return NULL;
-    fullScalars = pyvector_to_Cptr_double(fullScalarsIn);
-    
-    if (not_doubleVector(fullVectors)) return NULL;
-    
     if (not_intVector(rangeArray)) return NULL;
     numr = (int) PyArray_DIM(rangeArray, 0);
     
-    NVisible = 0;
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
+    
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i = 0; i < NVisibleIn; i++)
     {
         int j;
         int index = visibleAtoms[i];
         int id = atomID[index];
-        int visible = 0;
         
         /* loop over ranges, looking to see if this atom is visible */
+        keep[i] = 0;
         for (j = 0; j < numr; j++)
         {
             int minid = IIND2(rangeArray, j, 0);
             int maxid = IIND2(rangeArray, j, 1);
             if (id >= minid && id <= maxid)
             {
-                visible = 1;
+                keep[i] = 1;
                 break;
             }
         }
-        
-        if (visible)
-        {
-            /* handle full scalars array */
-            for (j = 0; j < NScalars; j++)
-            {
-                fullScalars[NVisibleIn * j + NVisible] = fullScalars[NVisibleIn * j + i];
-            }
-        
-            for (j = 0; j < NVectors; j++)
-            {
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-            }
-        
-            visibleAtoms[NVisible++] = index;
-        }
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, visibleAtoms, keep, NScalars, fullScalars, NVectors, fullVectors);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -1527,24 +1430,26 @@ genericScalarFilter(PyObject *self, PyObject *args)
     double minVal, maxVal;
     PyArrayObject *visibleAtoms=NULL;
     PyArrayObject *scalars=NULL;
-    PyArrayObject *fullScalars=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     
     int i, NVisible;
+    char *keep;
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!ddiO!iO!", &PyArray_Type, &visibleAtoms, &PyArray_Type, &scalars, &minVal, 
-            &maxVal, &NScalars, &PyArray_Type, &fullScalars, &NVectors, &PyArray_Type, &fullVectors))
+    if (!PyArg_ParseTuple(args, "O!O!ddiOiO", &PyArray_Type, &visibleAtoms, &PyArray_Type, &scalars, &minVal, 
+            &maxVal, &NScalars, &fullScalars, &NVectors, &fullVectors))
         return NULL;
     
     if (not_intVector(visibleAtoms)) return NULL;
     NVisibleIn = (int) PyArray_DIM(visibleAtoms, 0);
     if (not_doubleVector(scalars)) return NULL;
-    if (not_doubleVector(fullScalars)) return NULL;
-    if (not_doubleVector(fullVectors)) return NULL;
+    
+    keep = allocKeepMask(NVisibleIn);
+    if (keep == NULL) return NULL;
     
     /* loop over visible atoms */
-    NVisible = 0;
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i = 0; i < NVisibleIn; i++)
     {
         int index;
@@ -1553,35 +1458,16 @@ genericScalarFilter(PyObject *self, PyObject *args)
         index = IIND1(visibleAtoms, i);
         scalarVal = DIND1(scalars, index);
         
-        if (!(scalarVal < minVal || scalarVal > maxVal))
-        {
-            int j;
-            
-            /* handle full scalars array */
-            for (j = 0; j < NScalars; j++)
-            {
-                int nj = NVisibleIn * j;
-                
-                DIND1(fullScalars, nj + NVisible) = DIND1(fullScalars, nj + i);
-            }
-            
-            for (j = 0; j < NVectors; j++)
-            {
-                int nj, njn, nji;
-                
-                nj = NVisibleIn * j;
-                njn = nj + NVisible;
-                nji = nj + i;
-                
-                DIND2(fullVectors, njn, 0) = DIND2(fullVectors, nji, 0);
-                DIND2(fullVectors, njn, 1) = DIND2(fullVectors, nji, 1);
-                DIND2(fullVectors, njn, 2) = DIND2(fullVectors, nji, 2);
-            }
-            
-            IIND1(visibleAtoms, NVisible++) = IIND1(visibleAtoms, i);
-        }
+        keep[i] = !(scalarVal < minVal || scalarVal > maxVal);
     }
     
+    /* remove atoms that are not visible */
+    NVisible = compactVisibleAtoms(NVisibleIn, pyvector_to_Cptr_int(visibleAtoms), keep, NScalars,
+                                   fullScalars, NVectors, fullVectors);
+    free(keep);
+    
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
 
@@ -1601,13 +1487,11 @@ slipFilter(PyObject *self, PyObject *args)
     PyArrayObject *scalars=NULL;
     PyArrayObject *driftVector=NULL;
     PyArrayObject *cellDimsIn=NULL;
-    PyArrayObject *fullScalars=NULL;
-    PyArrayObject *fullVectors=NULL;
+    PyObject *fullScalars=NULL;
+    PyObject *fullVectors=NULL;
     
     int i, NVisible, boxstat;
-    int *slippedAtoms;
     double *refPos, *visiblePos;
-    double *slipx, *slipy, *slipz;
     double approxBoxWidth;
     double neighbourCutOff2, atomSlipTol2;
     struct Boxes *boxes;
@@ -1617,10 +1501,10 @@ slipFilter(PyObject *self, PyObject *args)
 #endif
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!O!ddiO!iiO!iO!dd", &PyArray_Type, &visibleAtoms, &PyArray_Type, &scalars, 
+    if (!PyArg_ParseTuple(args, "O!O!O!O!O!O!ddiOiiO!iOdd", &PyArray_Type, &visibleAtoms, &PyArray_Type, &scalars, 
             &PyArray_Type, &pos, &PyArray_Type, &refPosOrig, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn, 
-            &minSlip, &maxSlip, &NScalars, &PyArray_Type, &fullScalars, &filteringEnabled, &driftCompensation, 
-            &PyArray_Type, &driftVector, &NVectors, &PyArray_Type, &fullVectors, &neighbourCutOff, &atomSlipTol))
+            &minSlip, &maxSlip, &NScalars, &fullScalars, &filteringEnabled, &driftCompensation, 
+            &PyArray_Type, &driftVector, &NVectors, &fullVectors, &neighbourCutOff, &atomSlipTol))
         return NULL;
     
     if (not_intVector(visibleAtoms)) return NULL;
@@ -1639,11 +1523,9 @@ slipFilter(PyObject *self, PyObject *args)
     if (not_intVector(PBCIn)) return NULL;
     PBC = pyvector_to_Cptr_int(PBCIn);
     
-    if (not_doubleVector(fullScalars)) return NULL;
     
     if (not_doubleVector(driftVector)) return NULL;
     
-    if (not_doubleVector(fullVectors)) return NULL;
     
 #ifdef DEBUG
     printf("SLIPC: Parsed args\n");
@@ -1666,6 +1548,7 @@ slipFilter(PyObject *self, PyObject *args)
             return NULL;
         }
         
+        #pragma omp parallel for num_threads(prefs_numThreads)
         for (i = 0; i < refPosDim / 3; i++)
         {
             int j, i3;
@@ -1679,7 +1562,7 @@ slipFilter(PyObject *self, PyObject *args)
         refPos = pyvector_to_Cptr_double(refPosOrig);
     }
     
-    /* visible pos */
+    /* reference positions of the visible atoms (neighbours are defined by the reference positions) */
     visiblePos = malloc(3 * NVisibleIn * sizeof(double));
     if (visiblePos == NULL)
     {
@@ -1693,9 +1576,9 @@ slipFilter(PyObject *self, PyObject *args)
         
         i3 = 3 * i;
         index3 = IIND1(visibleAtoms, i) * 3;
-        visiblePos[i3    ] = DIND1(pos, index3    );
-        visiblePos[i3 + 1] = DIND1(pos, index3 + 1);
-        visiblePos[i3 + 2] = DIND1(pos, index3 + 2);
+        visiblePos[i3    ] = refPos[index3    ];
+        visiblePos[i3 + 1] = refPos[index3 + 1];
+        visiblePos[i3 + 2] = refPos[index3 + 2];
     }
     
     /* boxAtoms */
@@ -1715,82 +1598,20 @@ slipFilter(PyObject *self, PyObject *args)
     if (boxstat)
     {
         if (driftCompensation) free(refPos);
-        freeBoxes(boxes);
         return NULL;
     }
     
-    /* allocate slip arrays */
-#ifdef DEBUG
-    printf("SLIPC: Allocating slip arrays...\n");
-#endif
-    slipx = calloc(NVisibleIn, sizeof(double));
-    if (slipx == NULL)
-    {
-        int err = errno;
-        char errstring[512];
-        
-        if (driftCompensation) free(refPos);
-        freeBoxes(boxes);
-        sprintf(errstring, "Allocate slipx (slipFilter) failed: '%s'", strerror(err));
-        PyErr_SetString(PyExc_MemoryError, errstring);
-        return NULL;
-    }
-    
-    slipy = calloc(NVisibleIn, sizeof(double));
-    if (slipy == NULL)
-    {
-        int err = errno;
-        char errstring[512];
-        
-        if (driftCompensation) free(refPos);
-        free(slipx);
-        freeBoxes(boxes);
-        sprintf(errstring, "Allocate slipy (slipFilter) failed: '%s'", strerror(err));
-        PyErr_SetString(PyExc_MemoryError, errstring);
-        return NULL;
-    }
-    
-    slipz = calloc(NVisibleIn, sizeof(double));
-    if (slipz == NULL)
-    {
-        int err = errno;
-        char errstring[512];
-        
-        if (driftCompensation) free(refPos);
-        free(slipx);
-        free(slipy);
-        freeBoxes(boxes);
-        sprintf(errstring, "Allocate slipz (slipFilter) failed: '%s'", strerror(err));
-        PyErr_SetString(PyExc_MemoryError, errstring);
-        return NULL;
-    }
-    
-    slippedAtoms = calloc(NVisibleIn, sizeof(int));
-    if (slippedAtoms == NULL)
-    {
-        int err = errno;
-        char errstring[512];
-        
-        if (driftCompensation) free(refPos);
-        free(slipx);
-        free(slipy);
-        free(slipz);
-        freeBoxes(boxes);
-        sprintf(errstring, "Allocate slippedAtoms (slipFilter) failed: '%s'", strerror(err));
-        PyErr_SetString(PyExc_MemoryError, errstring);
-        return NULL;
-    }
-    
-    /* loop over visible atoms */
+    /* loop over visible atoms (each atom sums the slip with all of its own neighbours) */
 #ifdef DEBUG
     printf("SLIPC: Beginning main loop...\n");
 #endif
     neighbourCutOff2 = neighbourCutOff * neighbourCutOff;
     atomSlipTol2 = atomSlipTol * atomSlipTol;
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i = 0; i < NVisibleIn; i++)
     {
-        int j, index, index3, boxIndex, boxNebList[27], boxNebListSize;
-        double refxposi, refyposi, refzposi;
+        int j, index, index3, boxIndex, boxNebList[27], boxNebListSize, slippedAtoms;
+        double refxposi, refyposi, refzposi, slipx, slipy, slipz;
         
         index = IIND1(visibleAtoms, i);
         index3 = index * 3;
@@ -1798,48 +1619,27 @@ slipFilter(PyObject *self, PyObject *args)
         refyposi = refPos[index3 + 1];
         refzposi = refPos[index3 + 2];
         
-        /* find box for ref pos of this visible atom */
+        /* find box for ref pos of this visible atom (cannot fail, the same positions were boxed above) */
         boxIndex = boxIndexOfAtom(refxposi, refyposi, refzposi, boxes);
-        if (boxIndex < 0)
-        {
-            if (driftCompensation) free(refPos);
-            free(slipx);
-            free(slipy);
-            free(slipz);
-            free(slippedAtoms);
-            freeBoxes(boxes);
-            return NULL;
-        }
         
         /* box neighbourhood */
         boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
         
         /* loop over boxes */
+        slipx = slipy = slipz = 0.0;
+        slippedAtoms = 0;
         for (j = 0; j < boxNebListSize; j++)
         {
             int k;
             
             boxIndex = boxNebList[j];
-            if (boxIndex < 0)
-            {
-                if (driftCompensation) free(refPos);
-                free(slipx);
-                free(slipy);
-                free(slipz);
-                free(slippedAtoms);
-                freeBoxes(boxes);
-                return NULL;
-            }
             
             /* loop over atoms in box */
-            for (k = 0; k < boxes->boxNAtoms[boxIndex]; k++)
+            for (k = boxes->boxStart[boxIndex]; k < boxes->boxStart[boxIndex + 1]; k++)
             {
-                int visIndex, index2;
+                int index2 = IIND1(visibleAtoms, boxes->boxAtoms[k]);
                 
-                visIndex = boxes->boxAtoms[boxIndex][k];
-                index2 = IIND1(visibleAtoms, visIndex);
-                
-                if (index < index2)
+                if (index != index2)
                 {
                     int index23;
                     double refxposj, refyposj, refzposj, sep2;
@@ -1878,31 +1678,20 @@ slipFilter(PyObject *self, PyObject *args)
                         slipMag = dslipx * dslipx + dslipy * dslipy + dslipz * dslipz;
                         if (slipMag > atomSlipTol2)
                         {
-                            slipx[i] += dslipx;
-                            slipy[i] += dslipy;
-                            slipz[i] += dslipz;
-                            slippedAtoms[i]++;
-                            
-                            slipx[visIndex] += dslipx;
-                            slipy[visIndex] += dslipy;
-                            slipz[visIndex] += dslipz;
-                            slippedAtoms[visIndex]++;
+                            slipx += dslipx;
+                            slipy += dslipy;
+                            slipz += dslipz;
+                            slippedAtoms++;
                         }
                     }
                 }
             }
         }
-    }
-    
-    /* store slip value */
-#ifdef DEBUG
-    printf("SLIPC: Storing slip values...\n");
-#endif
-    for (i = 0; i < NVisibleIn; i++)
-    {
-        if (slippedAtoms[i])
+        
+        /* store slip value */
+        if (slippedAtoms)
         {
-            DIND1(scalars, i) = sqrt(slipx[i] * slipx[i] + slipy[i] * slipy[i] + slipz[i] * slipz[i]) / ((double) slippedAtoms[i]);
+            DIND1(scalars, i) = sqrt(slipx * slipx + slipy * slipy + slipz * slipz) / ((double) slippedAtoms);
         }
         else
         {
@@ -1913,35 +1702,28 @@ slipFilter(PyObject *self, PyObject *args)
     /* filtering */
     if (filteringEnabled)
     {
+        char *keep;
+        
 #ifdef DEBUG
         printf("SLIPC: Applying filter...\n");
 #endif
-    
-        NVisible = 0;
-        for (i = 0; i < NVisibleIn; i++)
+        
+        keep = allocKeepMask(NVisibleIn);
+        if (keep == NULL)
         {
-            if (DIND1(scalars, i) >= minSlip && DIND1(scalars, i) < maxSlip)
-            {
-                int j;
-                
-                /* handle full scalars array */
-                for (j = 0; j < NScalars; j++)
-                {
-                    DIND1(fullScalars, NVisibleIn * j + NVisible) = DIND1(fullScalars, NVisibleIn * j + i);
-                }
-                
-                /* handle full vectors array */
-                for (j = 0; j < NVectors; j++)
-                {
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 0) = DIND2(fullVectors, NVisibleIn * j + i, 0);
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 1) = DIND2(fullVectors, NVisibleIn * j + i, 1);
-                    DIND2(fullVectors, NVisibleIn * j + NVisible, 2) = DIND2(fullVectors, NVisibleIn * j + i, 2);
-                }
-                
-                DIND1(scalars, NVisible) = DIND1(scalars, i);
-                IIND1(visibleAtoms, NVisible++) = IIND1(visibleAtoms, i);
-            }
+            freeBoxes(boxes);
+            if (driftCompensation) free(refPos);
+            return NULL;
         }
+        
+        #pragma omp parallel for num_threads(prefs_numThreads)
+        for (i = 0; i < NVisibleIn; i++)
+            keep[i] = DIND1(scalars, i) >= minSlip && DIND1(scalars, i) < maxSlip;
+        
+        NVisible = compactVisibleAtoms(NVisibleIn, pyvector_to_Cptr_int(visibleAtoms), keep, NScalars,
+                                       fullScalars, NVectors, fullVectors);
+        compactDoubleVector(NVisibleIn, pyvector_to_Cptr_double(scalars), keep);
+        free(keep);
     }
     else NVisible = NVisibleIn;
     
@@ -1949,10 +1731,6 @@ slipFilter(PyObject *self, PyObject *args)
 #ifdef DEBUG
     printf("SLIPC: Freeing memory...\n");
 #endif
-    free(slipx);
-    free(slipy);
-    free(slipz);
-    free(slippedAtoms);
     freeBoxes(boxes);
     if (driftCompensation) free(refPos);
     else refPos = NULL;
@@ -1961,5 +1739,26 @@ slipFilter(PyObject *self, PyObject *args)
     printf("SLIPC: Leaving slip C lib\n");
 #endif
     
+    if (NVisible < 0) return NULL;
+    
     return Py_BuildValue("i", NVisible);
 }
+
+/*******************************************************************************
+ ** Allocate the array that marks which of the visible atoms are kept by a
+ ** filter. Must be freed by the caller.
+ *******************************************************************************/
+static char* allocKeepMask(int NVisible)
+{
+    char *keep;
+    
+    
+    keep = malloc((NVisible > 0 ? NVisible : 1) * sizeof(char));
+    if (keep == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate keep mask");
+        return NULL;
+    }
+    
+    return keep;
+}
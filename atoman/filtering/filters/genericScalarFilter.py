@@ -6,6 +6,9 @@ a Lattice object.
 """
 from __future__ import absolute_import
 from __future__ import unicode_literals
+
+import numpy as np
+
 from . import base
 from . import _filtering
 
@@ -46,6 +49,8 @@ class GenericScalarFilter(base.BaseFilter):
         
         # scalars array (the full, unmodified one stored on the Lattice)
         scalarsArray = inputState.scalarsDict[scalarsName]
+        if scalarsArray.dtype != np.float64:
+            scalarsArray = np.ascontiguousarray(scalarsArray, dtype=np.float64)
         
         # call C library
         NVisible = _filtering.genericScalarFilter(visibleAtoms, scalarsArray, minVal, maxVal, NScalars, fullScalars,
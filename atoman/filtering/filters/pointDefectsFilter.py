@@ -96,6 +96,13 @@ class PointDefectsFilter(base.BaseFilter):
     Point defects filter.
     
     """
+    def getNeighbourCutoff(self, inputState, settings):
+        """Neighbours of the input atoms are only required when computing ACNA."""
+        if settings.getSetting("useAcna"):
+            return settings.getSetting("acnaMaxBondDistance")
+        
+        return None
+    
     def apply(self, filterInput, settings):
         """Apply the filter."""
         # unpack inputs
@@ -128,6 +135,7 @@ class PointDefectsFilter(base.BaseFilter):
             acnaInput.fullVectors = np.empty(acnaInput.NVectors, np.float64)
             acnaInput.ompNumThreads = ompNumThreads
             acnaInput.visibleAtoms = np.arange(inputLattice.NAtoms, dtype=np.int32)
+            acnaInput.neighbourList = filterInput.neighbourList
             
             # acna filter
             acna = acnaFilter.AcnaFilter("ACNA - Defects")
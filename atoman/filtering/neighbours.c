@@ -0,0 +1,241 @@
+/*******************************************************************************
+ ** Build a neighbour list for all atoms in a lattice, stored in compressed
+ ** form, so that it can be shared between filters
+ *******************************************************************************/
+
+#define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
+
+#include <Python.h> // includes stdio.h, string.h, errno.h, stdlib.h
+#include <numpy/arrayobject.h>
+#include <math.h>
+#include <limits.h>
+#include "visclibs/boxeslib.h"
+#include "visclibs/utilities.h"
+#include "visclibs/array_utils.h"
+#include "gui/preferences.h"
+
+#if PY_MAJOR_VERSION >= 3
+    #define MOD_ERROR_VAL NULL
+    #define MOD_SUCCESS_VAL(val) val
+    #define MOD_INIT(name) PyMODINIT_FUNC PyInit_##name(void)
+    #define MOD_DEF(ob, name, doc, methods) \
+        static struct PyModuleDef moduledef = { \
+            PyModuleDef_HEAD_INIT, name, doc, -1, methods, }; \
+        ob = PyModule_Create(&moduledef);
+#else
+    #define MOD_ERROR_VAL
+    #define MOD_SUCCESS_VAL(val)
+    #define MOD_INIT(name) void init##name(void)
+    #define MOD_DEF(ob, name, doc, methods) \
+        ob = Py_InitModule3(name, methods, doc);
+#endif
+
+static PyObject* buildNeighbourList(PyObject*, PyObject*);
+static int visitNeighbours(int, double *, int *, struct Boxes *, double *, int *, double, int *);
+
+
+/*******************************************************************************
+ ** List of python methods available in this module
+ *******************************************************************************/
+static struct PyMethodDef module_methods[] = {
+    {"buildNeighbourList", buildNeighbourList, METH_VARARGS, "Build the neighbour list for all atoms (compressed form)"},
+    {NULL, NULL, 0, NULL}
+};
+
+/*******************************************************************************
+ ** Module initialisation function
+ *******************************************************************************/
+MOD_INIT(_neighbours)
+{
+    PyObject *mod;
+
+    MOD_DEF(mod, "_neighbours", "Shared neighbour lists", module_methods)
+    if (mod == NULL)
+        return MOD_ERROR_VAL;
+
+    import_array();
+
+    return MOD_SUCCESS_VAL(mod);
+}
+
+/*******************************************************************************
+ ** Visit the neighbours of the given atom. If nebs is NULL the neighbours are
+ ** only counted, otherwise they are also stored in nebs. Returns the number
+ ** of neighbours.
+ *******************************************************************************/
+static int visitNeighbours(int index, double *pos, int *atomBox, struct Boxes *boxes, double *cellDims, int *PBC,
+        double maxSep2, int *nebs)
+{
+    int j, count, boxNebListSize, boxNebList[27];
+    double rxa, rya, rza;
+
+
+    /* atom position */
+    rxa = pos[3*index];
+    rya = pos[3*index+1];
+    rza = pos[3*index+2];
+
+    /* find neighbouring boxes */
+    boxNebListSize = getBoxNeighbourhood(atomBox[index], boxNebList, boxes);
+
+    /* loop over box neighbourhood */
+    count = 0;
+    for (j = 0; j < boxNebListSize; j++)
+    {
+        int k, boxIndex = boxNebList[j];
+
+        /* loop over atoms in box */
+        for (k = boxes->boxStart[boxIndex]; k < boxes->boxStart[boxIndex + 1]; k++)
+        {
+            int indexb = boxes->boxAtoms[k];
+            double sep2;
+
+            if (indexb == index) continue;
+
+            /* separation */
+            sep2 = atomicSeparation2(rxa, rya, rza, pos[3*indexb], pos[3*indexb+1], pos[3*indexb+2],
+                                     cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+
+            /* the cut-off is inclusive, so views can apply their own (in)equality */
+            if (sep2 <= maxSep2)
+            {
+                if (nebs != NULL) nebs[count] = indexb;
+                count++;
+            }
+        }
+    }
+
+    return count;
+}
+
+/*******************************************************************************
+ ** Build the neighbour list for all atoms within the given cut-off. The result
+ ** is returned as a tuple of two arrays (nebStart, nebIndex), where the
+ ** neighbours of atom i are nebIndex[nebStart[i]] to nebIndex[nebStart[i+1]-1].
+ ** Each pair is stored twice (i in j's list and j in i's list).
+ *******************************************************************************/
+static PyObject*
+buildNeighbourList(PyObject *self, PyObject *args)
+{
+    int NAtoms, *PBC, *nebStart, *nebIndex, *atomBox;
+    int i, boxstat, errorFlag;
+    long total;
+    double *pos, *cellDims, cutoff, maxSep2;
+    npy_intp dims[1];
+    PyArrayObject *posIn=NULL;
+    PyArrayObject *cellDimsIn=NULL;
+    PyArrayObject *PBCIn=NULL;
+    PyArrayObject *nebStartArray=NULL;
+    PyArrayObject *nebIndexArray=NULL;
+    struct Boxes *boxes;
+
+
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "O!O!O!d", &PyArray_Type, &posIn, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn,
+            &cutoff))
+        return NULL;
+
+    if (not_doubleVector(posIn)) return NULL;
+    pos = pyvector_to_Cptr_double(posIn);
+    NAtoms = ((int) PyArray_DIM(posIn, 0)) / 3;
+
+    if (not_doubleVector(cellDimsIn)) return NULL;
+    cellDims = pyvector_to_Cptr_double(cellDimsIn);
+
+    if (not_intVector(PBCIn)) return NULL;
+    PBC = pyvector_to_Cptr_int(PBCIn);
+
+    if (cutoff <= 0.0)
+    {
+        PyErr_SetString(PyExc_ValueError, "Neighbour list cut-off must be positive");
+        return NULL;
+    }
+    maxSep2 = cutoff * cutoff;
+
+    /* box the atoms */
+    boxes = setupBoxes(cutoff, PBC, cellDims);
+    if (boxes == NULL) return NULL;
+    boxstat = putAtomsInBoxes(NAtoms, pos, boxes);
+    if (boxstat) return NULL;
+
+    /* box index of each atom */
+    atomBox = malloc(NAtoms * sizeof(int));
+    if (atomBox == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate atomBox");
+        freeBoxes(boxes);
+        return NULL;
+    }
+    for (i = 0; i < NAtoms; i++)
+    {
+        atomBox[i] = boxIndexOfAtom(pos[3*i], pos[3*i+1], pos[3*i+2], boxes);
+        if (atomBox[i] < 0)
+        {
+            free(atomBox);
+            freeBoxes(boxes);
+            return NULL;
+        }
+    }
+
+    /* allocate the offsets array */
+    dims[0] = (npy_intp) (NAtoms + 1);
+    nebStartArray = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_INT32);
+    if (nebStartArray == NULL)
+    {
+        free(atomBox);
+        freeBoxes(boxes);
+        return NULL;
+    }
+    nebStart = pyvector_to_Cptr_int(nebStartArray);
+
+    /* first pass: count the neighbours of each atom */
+    #pragma omp parallel for num_threads(prefs_numThreads)
+    for (i = 0; i < NAtoms; i++)
+        nebStart[i + 1] = visitNeighbours(i, pos, atomBox, boxes, cellDims, PBC, maxSep2, NULL);
+
+    /* convert counts to offsets */
+    nebStart[0] = 0;
+    total = 0;
+    errorFlag = 0;
+    for (i = 0; i < NAtoms; i++)
+    {
+        total += nebStart[i + 1];
+        if (total > INT_MAX)
+        {
+            errorFlag = 1;
+            break;
+        }
+        nebStart[i + 1] = (int) total;
+    }
+    if (errorFlag)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Neighbour list is too large (reduce the cut-off)");
+        Py_DECREF(nebStartArray);
+        free(atomBox);
+        freeBoxes(boxes);
+        return NULL;
+    }
+
+    /* allocate the neighbours array */
+    dims[0] = (npy_intp) total;
+    nebIndexArray = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_INT32);
+    if (nebIndexArray == NULL)
+    {
+        Py_DECREF(nebStartArray);
+        free(atomBox);
+        freeBoxes(boxes);
+        return NULL;
+    }
+    nebIndex = pyvector_to_Cptr_int(nebIndexArray);
+
+    /* second pass: store the neighbours (each atom writes to its own range) */
+    #pragma omp parallel for num_threads(prefs_numThreads)
+    for (i = 0; i < NAtoms; i++)
+        visitNeighbours(i, pos, atomBox, boxes, cellDims, PBC, maxSep2, &nebIndex[nebStart[i]]);
+
+    /* tidy up */
+    free(atomBox);
+    freeBoxes(boxes);
+
+    return Py_BuildValue("(NN)", PyArray_Return(nebStartArray), PyArray_Return(nebIndexArray));
+}
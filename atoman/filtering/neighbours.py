@@ -0,0 +1,133 @@
+"""
+Neighbour lists that are shared between filters
+
+The neighbour list of all atoms in a lattice is built once, for the largest
+cut-off required by the filters in a filter list, and stored in compressed
+form (an offsets array and an indices array). Filters that need neighbours
+within a smaller cut-off, or only between visible atoms, take a view of the
+shared list instead of boxing the atoms and building their own.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import time
+import weakref
+import logging
+
+import numpy as np
+
+from . import _neighbours
+
+
+class NeighbourList(object):
+    """
+    Neighbour list of all atoms in a lattice.
+    
+    The neighbours of atom i are `nebIndex[nebStart[i]:nebStart[i+1]]`. All
+    neighbours within the cut-off (inclusive) are stored.
+    
+    """
+    def __init__(self, cutoff, nebStart, nebIndex):
+        self.cutoff = cutoff
+        self.nebStart = nebStart
+        self.nebIndex = nebIndex
+    
+    def __len__(self):
+        return len(self.nebStart) - 1
+    
+    def neighbours(self, index):
+        """Return the neighbours of the given atom."""
+        return self.nebIndex[self.nebStart[index]:self.nebStart[index + 1]]
+    
+    def memory(self):
+        """Return the memory used by the neighbour list in bytes."""
+        return self.nebStart.nbytes + self.nebIndex.nbytes
+
+
+class NeighbourListCache(object):
+    """
+    Caches the neighbour list of a lattice.
+    
+    The list is rebuilt when the lattice, its version, cell dimensions or
+    periodic boundaries change, or when a larger cut-off is required.
+    
+    """
+    # passed to the C libraries when there is no neighbour list
+    emptyArray = np.empty(0, np.int32)
+    
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.clear()
+    
+    def clear(self):
+        """Discard the cached neighbour list."""
+        self._latticeRef = None
+        self._version = None
+        self._cellDims = None
+        self._PBC = None
+        self._neighbourList = None
+    
+    def _isValid(self, lattice, cutoff):
+        """Is the cached neighbour list valid for the given lattice and cut-off."""
+        if self._neighbourList is None or self._latticeRef is None:
+            return False
+        
+        if self._latticeRef() is not lattice or self._version != lattice.version:
+            return False
+        
+        if not np.array_equal(self._cellDims, lattice.cellDims) or not np.array_equal(self._PBC, lattice.PBC):
+            return False
+        
+        return cutoff <= self._neighbourList.cutoff
+    
+    def prepare(self, lattice, cutoff):
+        """
+        Make sure the cached neighbour list covers the given cut-off for the
+        given lattice, building it if required.
+        
+        """
+        if cutoff is None or cutoff <= 0 or not lattice.NAtoms:
+            return None
+        
+        if self._isValid(lattice, cutoff):
+            self.logger.debug("Reusing neighbour list (cut-off %f)", self._neighbourList.cutoff)
+            return self._neighbourList
+        
+        self.logger.debug("Building neighbour list: %d atoms; cut-off %f", lattice.NAtoms, cutoff)
+        buildTime = time.time()
+        nebStart, nebIndex = _neighbours.buildNeighbourList(lattice.pos, lattice.cellDims, lattice.PBC, cutoff)
+        self.logger.debug("Built neighbour list in %f s (%d neighbours)", time.time() - buildTime, len(nebIndex))
+        
+        self._neighbourList = NeighbourList(cutoff, nebStart, nebIndex)
+        self._latticeRef = weakref.ref(lattice)
+        self._version = lattice.version
+        self._cellDims = lattice.cellDims.copy()
+        self._PBC = lattice.PBC.copy()
+        
+        return self._neighbourList
+    
+    def get(self, lattice, cutoff):
+        """
+        Return the cached neighbour list if it is valid for the given lattice
+        and cut-off, otherwise None. The list is not built here.
+        
+        """
+        if cutoff is None or cutoff <= 0 or not self._isValid(lattice, cutoff):
+            return None
+        
+        return self._neighbourList
+    
+    def getArrays(self, lattice, cutoff):
+        """
+        Return the (nebStart, nebIndex) arrays to pass to the C libraries.
+        Empty arrays are returned if the cached list cannot be used, in which
+        case the C libraries build their own neighbour list.
+        
+        """
+        neighbourList = self.get(lattice, cutoff)
+        if neighbourList is None:
+            return self.emptyArray, self.emptyArray
+        
+        return neighbourList.nebStart, neighbourList.nebIndex
@@ -0,0 +1,171 @@
+"""
+Cache of the results of filter stages
+
+The state of the filterer after each filter in a filter list (visible atoms,
+defects, new scalars, cluster/bubble lists, structure counters, ...) is
+stored in a least recently used cache. The key of a stage identifies the
+input and reference lattices, the global options and the names and settings
+of all filters up to and including that stage, so when a list is re-run the
+longest unchanged prefix of the list can be restored instead of recomputed.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import collections
+import itertools
+import logging
+import weakref
+
+import numpy as np
+import six
+
+
+# tokens identifying arrays, by id (see arrayToken)
+_arrayTokens = {}
+_tokenCounter = itertools.count()
+
+
+def arrayToken(array):
+    """
+    Return a token identifying the given array object.
+    
+    Unlike the id of the array, which may be reused by a new array once the
+    array is freed, a token is never reused.
+    
+    """
+    key = id(array)
+    entry = _arrayTokens.get(key)
+    if entry is not None and entry[0]() is array:
+        return entry[1]
+    
+    def forget(ref, key=key):
+        if key in _arrayTokens and _arrayTokens[key][0] is ref:
+            del _arrayTokens[key]
+    
+    token = next(_tokenCounter)
+    _arrayTokens[key] = (weakref.ref(array, forget), token)
+    
+    return token
+
+
+def latticeKey(lattice):
+    """
+    Return a key identifying the current state of the given lattice.
+    
+    The lattice version is unique across lattices and changes when the atoms
+    are modified. The scalars and vectors are identified by name and array
+    (see arrayToken), so adding or replacing them also changes the key. The
+    cell dimensions and periodic boundaries are included by value because
+    they are changed in place (eg. from the PBC check boxes) without changing
+    the version.
+    
+    """
+    if lattice is None:
+        return None
+    
+    scalarsKey = tuple(sorted((name, arrayToken(array)) for name, array in six.iteritems(lattice.scalarsDict)))
+    vectorsKey = tuple(sorted((name, arrayToken(array)) for name, array in six.iteritems(lattice.vectorsDict)))
+    
+    return (lattice.version, lattice.NAtoms, lattice.cellDims.tobytes(), lattice.PBC.tobytes(), scalarsKey,
+            vectorsKey)
+
+
+def estimateMemory(value):
+    """Return an estimate of the memory used by the given value in bytes."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    
+    if isinstance(value, dict):
+        return sum(estimateMemory(val) for val in value.values())
+    
+    if isinstance(value, (list, tuple)):
+        return sum(estimateMemory(val) for val in value)
+    
+    if hasattr(value, "__len__"):
+        # clusters, bubbles, ...
+        return 8 * len(value)
+    
+    return 8
+
+
+class StageResult(object):
+    """
+    The state of the filterer after a filter stage.
+    
+    `state` is a dict of the filterer attributes to restore and `memory` is
+    the estimated memory used by the result, in bytes.
+    
+    """
+    def __init__(self, state, memory):
+        self.state = state
+        self.memory = memory
+
+
+class FilterResultCache(object):
+    """
+    Least recently used cache of filter stage results.
+    
+    The least recently used results are discarded when the memory used by the
+    stored results exceeds `maxMemory` (in bytes). A `maxMemory` of zero
+    disables the cache.
+    
+    """
+    def __init__(self, maxMemory):
+        self.logger = logging.getLogger(__name__)
+        self._results = collections.OrderedDict()
+        self._memory = 0
+        self.maxMemory = maxMemory
+    
+    def __len__(self):
+        return len(self._results)
+    
+    def __contains__(self, key):
+        return key in self._results
+    
+    @property
+    def memory(self):
+        """The memory used by the stored results in bytes."""
+        return self._memory
+    
+    def setMaxMemory(self, maxMemory):
+        """Set the memory cap (in bytes), discarding results if required."""
+        self.maxMemory = maxMemory
+        self._evict()
+    
+    def clear(self):
+        """Discard all stored results."""
+        self._results.clear()
+        self._memory = 0
+    
+    def get(self, key):
+        """Return the result stored for the given key (or None), marking it as recently used."""
+        result = self._results.pop(key, None)
+        if result is not None:
+            self._results[key] = result
+        
+        return result
+    
+    def put(self, key, result):
+        """Store the given result, discarding the least recently used results to stay within the memory cap."""
+        old = self._results.pop(key, None)
+        if old is not None:
+            self._memory -= old.memory
+        
+        if result.memory > self.maxMemory:
+            self.logger.debug("Not caching filter result (%d bytes > %d bytes)", result.memory, self.maxMemory)
+            return False
+        
+        self._results[key] = result
+        self._memory += result.memory
+        self._evict()
+        
+        return True
+    
+    def _evict(self):
+        """Discard least recently used results until within the memory cap."""
+        while self._results and self._memory > self.maxMemory:
+            key, result = self._results.popitem(last=False)
+            self._memory -= result.memory
+            self.logger.debug("Discarded cached filter result (%d bytes)", result.memory)
@@ -18,6 +18,8 @@ def configuration(parent_package='', top_path=None):
                 os.path.join("..", "visclibs", "utilities.h")]
     arraydeps = [os.path.join("..", "visclibs", "array_utils.c"),
                  os.path.join("..", "visclibs", "array_utils.h")]
+    nebdeps = [os.path.join("..", "visclibs", "neb_list.c"),
+               os.path.join("..", "visclibs", "neb_list.h")]
     
     # config
     config = Configuration("filtering", parent_package, top_path)
@@ -33,13 +35,19 @@ def configuration(parent_package='', top_path=None):
     config.add_extension("_clusters",
                          ["clusters.c"],
                          include_dirs=[incdir],
+                         depends=boxesdeps + utildeps + nebdeps + arraydeps,
+                         libraries=["boxeslib", "utilities", "neb_list", "array_utils"])
+    
+    config.add_extension("_neighbours",
+                         ["neighbours.c"],
+                         include_dirs=[incdir],
                          depends=boxesdeps + utildeps + arraydeps,
                          libraries=["boxeslib", "utilities", "array_utils"])
     
+    # the voro++ sources are included in voro_iface.cpp
     config.add_extension("_voronoi",
-                         ["voronoi.c", "voro_iface.cpp",
-                          "voro++/src/voro++.cc"],
-                         depends=["voro_iface.h"] + arraydeps,
+                         ["voronoi.c", "voro_iface.cpp"],
+                         depends=["voro_iface.h", "voro++/src/voro++.cc"] + arraydeps,
                          libraries=["array_utils"],
                          include_dirs=[incdir])
     
@@ -0,0 +1,108 @@
+"""
+Benchmark of the per filter overhead of passing scalars/vectors to the filters
+
+Runs a list of cheap filters (crop boxes) on a lattice with many scalars and
+vectors, and compares the time per filter when:
+
+    - the scalars/vectors are concatenated into one array before every filter
+      and split again afterwards (the old behaviour)
+    - the scalars/vectors are passed as lists of arrays that are compacted in
+      place (Filterer with deferredCompaction=False)
+    - the scalars/vectors are kept at full length and compacted once at the
+      end (Filterer with deferredCompaction=True)
+
+Run with:
+
+    python -m atoman.filtering.tests.benchmark_filterer [NCells [NScalars]]
+
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+import sys
+
+import numpy as np
+
+from .. import filterer
+from ..filters import _filtering
+from ..filters import cropBoxFilter
+from ...lattice_gen import lattice_gen_fcc
+from ...visutils.benchmarks import DummyVoroOpts, timeit
+
+
+def makeLattice(NCells, NScalars, NVectors=2):
+    """Return an FCC lattice with the given number of random scalars and vectors."""
+    args = lattice_gen_fcc.Args(NCells=[NCells] * 3)
+    status, lattice = lattice_gen_fcc.FCCLatticeGenerator().generateLattice(args)
+    if status:
+        raise RuntimeError("Generate lattice failed (%d)" % status)
+    
+    np.random.seed(42)
+    for i in range(NScalars):
+        lattice.scalarsDict["Scalar %d" % i] = np.random.uniform(size=lattice.NAtoms)
+    for i in range(NVectors):
+        lattice.vectorsDict["Vector %d" % i] = np.random.uniform(size=(lattice.NAtoms, 3))
+    
+    return lattice
+
+
+def makeFilters(lattice, NFilters):
+    """Return a list of crop box filters that each remove a thin slab of atoms."""
+    names = []
+    settingsList = []
+    for i in range(NFilters):
+        settings = cropBoxFilter.CropBoxFilterSettings()
+        settings.updateSetting("xEnabled", True)
+        settings.updateSetting("xmin", lattice.cellDims[0] * (i + 1) / (4.0 * NFilters))
+        settings.updateSetting("xmax", lattice.cellDims[0])
+        names.append("Crop box")
+        settingsList.append(settings)
+    
+    return names, settingsList
+
+
+def concatenatedFilters(lattice, settingsList):
+    """Apply the crop boxes, concatenating and splitting the scalars/vectors for each one."""
+    visibleAtoms = np.arange(lattice.NAtoms, dtype=np.int32)
+    scalarsList = [scalars.copy() for scalars in lattice.scalarsDict.values()]
+    vectorsList = [vectors.copy() for vectors in lattice.vectorsDict.values()]
+    for settings in settingsList:
+        fullScalars = np.concatenate(scalarsList)
+        fullVectors = np.concatenate(vectorsList)
+        NVisible = _filtering.cropFilter(visibleAtoms, lattice.pos, settings.getSetting("xmin"),
+                                         settings.getSetting("xmax"), 0.0, 0.0, 0.0, 0.0, 1, 0, 0, 0,
+                                         len(scalarsList), fullScalars, len(vectorsList), fullVectors)
+        visibleAtoms.resize(NVisible, refcheck=False)
+        scalarsList = [scalars[:NVisible].copy() for scalars in np.split(fullScalars, len(scalarsList))]
+        vectorsList = [vectors[:NVisible].copy() for vectors in np.split(fullVectors, len(vectorsList))]
+    
+    return visibleAtoms, scalarsList
+
+
+def main(NCells, NScalars, NFilters=10):
+    lattice = makeLattice(NCells, NScalars)
+    names, settingsList = makeFilters(lattice, NFilters)
+    print("%d atoms, %d scalars, %d vectors, %d filters" % (lattice.NAtoms, len(lattice.scalarsDict),
+                                                            len(lattice.vectorsDict), NFilters))
+    
+    concatTime, (visibleAtoms, scalarsList) = timeit(concatenatedFilters, lattice, settingsList)
+    results = [("concatenate/split", concatTime)]
+    for deferred, name in ((False, "list in place"), (True, "deferred")):
+        filt = filterer.Filterer(DummyVoroOpts(), deferredCompaction=deferred)
+        elapsed, _ = timeit(filt.runFilters, names, settingsList, lattice, lattice)
+        if not np.array_equal(filt.visibleAtoms, visibleAtoms):
+            raise RuntimeError("Visible atoms differ (%s)" % name)
+        for scalars, scalarsName in zip(scalarsList, lattice.scalarsDict.keys()):
+            if not np.array_equal(filt.latticeScalarsDict[scalarsName], scalars):
+                raise RuntimeError("Scalars '%s' differ (%s)" % (scalarsName, name))
+        results.append((name, elapsed))
+    
+    print("%20s  %16s  %10s" % ("mode", "per filter (ms)", "speed-up"))
+    for name, elapsed in results:
+        print("%20s  %16.3f  %10.2f" % (name, elapsed * 1000.0 / NFilters, concatTime / elapsed))
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(args[0] if len(args) > 0 else 40, args[1] if len(args) > 1 else 20)
@@ -0,0 +1,184 @@
+"""
+Scaling benchmark for the OpenMP kernels
+
+Times each kernel with 1 to 16 threads and checks that the results (including
+the order of the visible atoms after filtering) are identical to the results
+with one thread. Run with:
+
+    python -m atoman.filtering.tests.benchmark_openmp [NCells [threads ...]]
+
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+import sys
+
+import numpy as np
+
+from .. import _neighbours
+from .. import _clusters
+from .. import _voronoi
+from .. import bonds
+from ..filters import _filtering
+from ..filters import _acna
+from ..filters import _bond_order
+from ..filters import _defects
+from ..filters import _bubbles
+from ...gui import _preferences
+from ...visutils.benchmarks import makeLattice, timeit
+
+
+def makeKernels(pos, refPos, cellDims):
+    """Return a list of (name, function) for the kernels to benchmark."""
+    NAtoms = len(pos) // 3
+    PBC = np.ones(3, np.int32)
+    specie = np.zeros(NAtoms, np.int32)
+    empty = np.empty(0, np.int32)
+    noVectors = np.empty(0, np.float64)
+    
+    def visible():
+        return np.arange(NAtoms, dtype=np.int32)
+    
+    def neighbourList():
+        return _neighbours.buildNeighbourList(pos, cellDims, PBC, 5.0)
+    
+    def cropSphere():
+        vis = visible()
+        fullScalars = np.arange(NAtoms, dtype=np.float64)
+        nvis = _filtering.cropSphereFilter(vis, pos, cellDims[0] / 2.0, cellDims[1] / 2.0, cellDims[2] / 2.0,
+                                           cellDims[0] / 3.0, cellDims, PBC, 0, 1, fullScalars, 0, noVectors)
+        return vis[:nvis], fullScalars[:nvis]
+    
+    def displacement():
+        vis = visible()
+        scalars = np.zeros(NAtoms, np.float64)
+        fullScalars = np.arange(NAtoms, dtype=np.float64)
+        nvis = _filtering.displacementFilter(vis, scalars, pos, refPos, cellDims, PBC, 0.2, 1000.0, 1, fullScalars, 1, 0,
+                                             np.zeros(3, np.float64), 0, noVectors)
+        return vis[:nvis], scalars[:nvis], fullScalars[:nvis]
+    
+    def coordinationNumber():
+        vis = visible()
+        scalars = np.zeros(NAtoms, np.float64)
+        bondMin = np.zeros((1, 1), np.float64)
+        bondMax = np.asarray([[3.5]], np.float64)
+        nvis = _filtering.coordNumFilter(vis, pos, specie, 1, bondMin, bondMax, 3.5, cellDims, PBC, scalars, 12, 100, 1,
+                                         noVectors, 0, 0, noVectors, empty, empty)
+        return vis[:nvis], scalars[:nvis]
+    
+    def acna():
+        vis = visible()
+        scalars = np.zeros(NAtoms, np.float64)
+        counters = np.zeros(8, np.int32)
+        nvis = _acna.adaptiveCommonNeighbourAnalysis(vis, pos, scalars, cellDims, PBC, 0, noVectors, 5.0, counters, 0,
+                                                     np.ones(8, np.int32), 0, noVectors, empty, empty)
+        return vis[:nvis], scalars[:nvis], counters
+    
+    def bondOrder():
+        vis = visible()
+        q4 = np.zeros(NAtoms, np.float64)
+        q6 = np.zeros(NAtoms, np.float64)
+        nvis = _bond_order.bondOrderFilter(vis, pos, 3.5, q4, q6, cellDims, PBC, 0, noVectors, 0, 0.0, 99.0, 0, 0.0, 99.0,
+                                           0, noVectors, empty, empty)
+        return vis[:nvis], q4[:nvis], q6[:nvis]
+    
+    def clusters():
+        vis = visible()[::3].copy()
+        atomCluster = np.empty(len(vis), np.int32)
+        results = np.empty(2, np.int32)
+        _clusters.findClusters(vis, pos, atomCluster, 3.2, cellDims, PBC, 2, -1, results, 0, noVectors, 0, noVectors,
+                               empty, empty)
+        return vis[:results[0]], atomCluster[:results[0]], results
+    
+    def bondCalculation():
+        vis = visible()
+        maxBondsPerAtom = 50
+        size = NAtoms * maxBondsPerAtom // 2
+        bondArray = np.empty(size, np.int32)
+        NBondsArray = np.zeros(NAtoms, np.int32)
+        bondVectorArray = np.empty(3 * size, np.float64)
+        bondSpecieCounter = np.zeros((1, 1), np.int32)
+        status = bonds.calculateBonds(vis, pos, specie, 1, np.zeros((1, 1)), np.asarray([[3.2]]), 3.2, maxBondsPerAtom,
+                                      cellDims, PBC, bondArray, NBondsArray, bondVectorArray, bondSpecieCounter)
+        total = NBondsArray.sum()
+        return status, NBondsArray, bondArray[:total], bondVectorArray[:3 * total], bondSpecieCounter
+    
+    # defects: remove every 20th atom and add some atoms between the sites
+    defectPos = np.concatenate([np.delete(pos.reshape(-1, 3), np.s_[::20], axis=0).ravel(),
+                                (refPos.reshape(-1, 3)[::25] + 1.0).ravel() % np.tile(cellDims, (NAtoms + 24) // 25)])
+    defectNAtoms = len(defectPos) // 3
+    defectSpecie = np.zeros(defectNAtoms, np.int32)
+    
+    def pointDefects():
+        vacancies = np.empty(NAtoms, np.int32)
+        interstitials = np.empty(defectNAtoms, np.int32)
+        antisites = np.empty(NAtoms, np.int32)
+        onAntisites = np.empty(NAtoms, np.int32)
+        splitInterstitials = np.empty(3 * NAtoms, np.int32)
+        counters = np.zeros(6, np.int32)
+        _defects.findDefects(1, 1, 1, counters, vacancies, interstitials, antisites, onAntisites, empty, empty,
+                             defectNAtoms, ["Au"], defectSpecie, defectPos, NAtoms, ["Au"], specie, refPos, cellDims,
+                             PBC, 1.3, 0, 3.5, np.empty(0, np.int32), np.zeros(1, np.int32), np.zeros(1, np.int32),
+                             np.zeros(1, np.int32), np.zeros((1, 1), np.int32), np.zeros((1, 1), np.int32), 1, -1,
+                             splitInterstitials, 0, 0, np.zeros(3, np.float64), noVectors, 0, 0, 0, 0)
+        return (counters, vacancies[:counters[1]], interstitials[:counters[2]], antisites[:counters[3]],
+                onAntisites[:counters[3]])
+    
+    def bubbles():
+        bubbleAtoms = np.arange(NAtoms - (NAtoms + 24) // 25, defectNAtoms, 2, dtype=np.int32)
+        result = _bubbles.identifyBubbles(defectNAtoms, defectPos, NAtoms, refPos, 0, np.zeros(3, np.float64),
+                                          cellDims, PBC, len(bubbleAtoms), bubbleAtoms, 5.0, noVectors, 0, 1.3, 5.0,
+                                          2.0)
+        return tuple(np.concatenate([np.asarray(item).ravel() for item in items]) if len(items) else np.empty(0)
+                     for items in result[:3])
+    
+    def voronoi(useRadii):
+        def func():
+            vor = _voronoi.Voronoi()
+            radii = np.asarray([1.2], np.float64)
+            vor.computeVoronoi(pos, np.zeros(3, np.float64), cellDims.copy(), cellDims, PBC, specie, radii, useRadii, 0.1)
+            vertices = np.concatenate([np.asarray(vor.atomVertices(i)).ravel() for i in range(NAtoms)])
+            nebs = np.concatenate([np.asarray(vor.atomNebList(i)) for i in range(NAtoms)])
+            return vor.atomVolumesArray(), vor.atomNumNebsArray(), nebs, vertices
+        return func
+    
+    return [("neighbour list", neighbourList), ("crop sphere", cropSphere), ("displacement", displacement),
+            ("coordination", coordinationNumber), ("ACNA", acna), ("bond order", bondOrder), ("clusters", clusters),
+            ("bonds", bondCalculation), ("point defects", pointDefects), ("bubbles", bubbles),
+            ("Voronoi", voronoi(0)), ("Voronoi (radii)", voronoi(1))]
+
+
+def sameResult(result, reference):
+    """Check the result is identical to the reference result."""
+    if isinstance(reference, tuple):
+        return all(sameResult(r, ref) for r, ref in zip(result, reference))
+    
+    return np.array_equal(result, reference)
+
+
+def main(NCells, threads):
+    pos, refPos, cellDims = makeLattice(NCells)
+    print("%d atoms" % (len(pos) // 3))
+    print("%16s" % "kernel" + "".join("  %8s" % ("%d thr" % n) for n in threads))
+    
+    for name, func in makeKernels(pos, refPos, cellDims):
+        _preferences.setNumThreads(1)
+        serialTime, reference = timeit(func)
+        
+        line = "%16s" % name
+        for numThreads in threads:
+            _preferences.setNumThreads(numThreads)
+            elapsed, result = timeit(func)
+            if not sameResult(result, reference):
+                raise RuntimeError("Result of '%s' with %d threads differs from serial" % (name, numThreads))
+            line += "  %8.2f" % (serialTime / elapsed)
+        
+        print(line + "   (serial: %.3f s)" % serialTime)
+    
+    _preferences.setNumThreads(1)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(args[0] if args else 30, args[1:] or [1, 2, 4, 8, 16])
@@ -0,0 +1,84 @@
+"""
+Benchmark of writing the Voronoi volumes/neighbours to file
+
+Compares the throughput of:
+
+    - the original line by line Python writer
+    - the CSV writer in the C extension (with and without neighbour lists)
+    - NumPy arrays (npz, with and without neighbour lists)
+
+Run with:
+
+    python -m atoman.filtering.tests.benchmark_voronoi_output [NCells]
+
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+
+from .. import voronoi
+from ...lattice_gen import lattice_gen_fcc
+from ...visutils.benchmarks import DummyVoroOpts, timeit
+from six.moves import range
+
+
+def pythonWriter(vor, lattice, filename):
+    """The original Python writer."""
+    lines = ["Atom index,Voronoi volume,Voronoi neighbours (faces)"]
+    for i in range(lattice.NAtoms):
+        lines.append("%d,%f,%s" % (i, vor.atomVolume(i), vor.atomNumNebs(i)))
+    lines.append("")
+    with open(filename, "w") as f:
+        f.write("\n".join(lines))
+
+
+def main(NCells):
+    args = lattice_gen_fcc.Args(NCells=[NCells] * 3)
+    status, lattice = lattice_gen_fcc.FCCLatticeGenerator().generateLattice(args)
+    if status:
+        raise RuntimeError("Generate lattice failed (%d)" % status)
+    vor = voronoi.VoronoiAtomsCalculator(DummyVoroOpts()).getVoronoi(lattice)
+    print("%d atoms" % lattice.NAtoms)
+    
+    tmpdir = tempfile.mkdtemp(prefix="atomanBench")
+    try:
+        csvFile = os.path.join(tmpdir, "voronoi.csv")
+        npzFile = os.path.join(tmpdir, "voronoi.npz")
+        
+        # check the C writer reproduces the original output
+        pythonWriter(vor, lattice, csvFile)
+        with open(csvFile) as f:
+            original = f.read()
+        voronoi.writeVoronoiToFile(vor, lattice, csvFile)
+        with open(csvFile) as f:
+            if f.read() != original:
+                raise RuntimeError("CSV output differs from the original writer")
+        
+        writers = [
+            ("python csv", csvFile, lambda: pythonWriter(vor, lattice, csvFile)),
+            ("C csv", csvFile, lambda: voronoi.writeVoronoiToFile(vor, lattice, csvFile)),
+            ("C csv + nebs", csvFile, lambda: voronoi.writeVoronoiToFile(vor, lattice, csvFile, True)),
+            ("npz", npzFile, lambda: voronoi.writeVoronoiToFile(vor, lattice, npzFile)),
+            ("npz + nebs", npzFile, lambda: voronoi.writeVoronoiToFile(vor, lattice, npzFile, True)),
+        ]
+        
+        print("%15s  %10s  %14s  %10s  %10s" % ("writer", "time (s)", "atoms/s", "MB/s", "speed-up"))
+        baseTime = None
+        for name, filename, writer in writers:
+            elapsed, _ = timeit(writer)
+            size = os.path.getsize(filename) / (1024.0 * 1024.0)
+            baseTime = elapsed if baseTime is None else baseTime
+            print("%15s  %10.4f  %14.0f  %10.1f  %10.2f" % (name, elapsed, lattice.NAtoms / elapsed, size / elapsed,
+                                                            baseTime / elapsed))
+    
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 30)
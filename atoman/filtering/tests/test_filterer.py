@@ -11,6 +11,7 @@ import unittest
 import numpy as np
 
 from ..import filterer
+from .. import resultCache
 from ...lattice_gen import lattice_gen_bcc
 from ..filters import acnaFilter
 from ..filters import bondOrderFilter
@@ -159,3 +160,268 @@ class TestFilterer(unittest.TestCase):
         # self.assertEqual(self.filterer.structureCounterDicts["ACNA structure count"]["BCC"], nvis)
         
         
+    def test_deferredCompaction(self):
+        """
+        Filterer deferred compaction
+        
+        TEST:
+            - scalars and vectors are the same whether they are compacted
+              by every filter or once at the end
+        
+        """
+        # lattice scalars and vectors
+        np.random.seed(7)
+        self.inputState.scalarsDict["Random"] = np.random.uniform(size=self.inputState.NAtoms)
+        self.inputState.vectorsDict["Force"] = np.random.uniform(size=(self.inputState.NAtoms, 3))
+        
+        # filters
+        filterNames = []
+        filterSettings = []
+        
+        # add crop box Filter
+        cropBoxSettings = cropBoxFilter.CropBoxFilterSettings()
+        cropBoxSettings.updateSetting("xEnabled", True)
+        cropBoxSettings.updateSetting("xmin", 0.0)
+        cropBoxSettings.updateSetting("xmax", 10.0)
+        filterNames.append("Crop box")
+        filterSettings.append(cropBoxSettings)
+        
+        # add the bond order filter
+        bondOrderSettings = bondOrderFilter.BondOrderFilterSettings()
+        bondOrderSettings.updateSetting("maxBondDistance", 4.0)
+        filterNames.append("Bond order")
+        filterSettings.append(bondOrderSettings)
+        
+        # add another crop box filter
+        cropBoxSettings = cropBoxFilter.CropBoxFilterSettings()
+        cropBoxSettings.updateSetting("yEnabled", True)
+        cropBoxSettings.updateSetting("ymin", 0.0)
+        cropBoxSettings.updateSetting("ymax", 10.0)
+        filterNames.append("Crop box")
+        filterSettings.append(cropBoxSettings)
+        
+        # apply with and without deferred compaction
+        results = []
+        for deferred in (True, False):
+            filt = filterer.Filterer(DummyVoroOpts(), deferredCompaction=deferred)
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            results.append(filt)
+        deferred, compacted = results
+        
+        self.assertEqual(len(deferred.visibleAtoms), 250)
+        self.assertTrue(np.array_equal(deferred.visibleAtoms, compacted.visibleAtoms))
+        for attr in ("scalarsDict", "latticeScalarsDict", "vectorsDict"):
+            deferredDict = getattr(deferred, attr)
+            compactedDict = getattr(compacted, attr)
+            self.assertEqual(sorted(deferredDict.keys()), sorted(compactedDict.keys()))
+            for key in compactedDict:
+                self.assertTrue(np.array_equal(deferredDict[key], compactedDict[key]))
+        
+        # the lattice scalars are unchanged
+        self.assertEqual(len(self.inputState.scalarsDict["Random"]), self.inputState.NAtoms)
+    
+    def makeCacheTestList(self):
+        """Return the filter names and settings used to test the result cache."""
+        np.random.seed(7)
+        self.inputState.scalarsDict["Random"] = np.random.uniform(size=self.inputState.NAtoms)
+        
+        cropBoxSettings = cropBoxFilter.CropBoxFilterSettings()
+        cropBoxSettings.updateSetting("xEnabled", True)
+        cropBoxSettings.updateSetting("xmin", 0.0)
+        cropBoxSettings.updateSetting("xmax", 10.0)
+        bondOrderSettings = bondOrderFilter.BondOrderFilterSettings()
+        bondOrderSettings.updateSetting("maxBondDistance", 4.0)
+        cropBoxSettings2 = cropBoxFilter.CropBoxFilterSettings()
+        cropBoxSettings2.updateSetting("yEnabled", True)
+        cropBoxSettings2.updateSetting("ymin", 0.0)
+        cropBoxSettings2.updateSetting("ymax", 10.0)
+        
+        return ["Crop box", "Bond order", "Crop box"], [cropBoxSettings, bondOrderSettings, cropBoxSettings2]
+    
+    def checkSameResult(self, filt, filterNames, filterSettings):
+        """Check the result of the filterer is the same as applying the list without caching."""
+        ref = filterer.Filterer(DummyVoroOpts(), resultCacheMemory=0, incremental=False)
+        ref.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+        self.assertEqual(len(ref.resultCache), 0)
+        
+        self.assertTrue(np.array_equal(filt.visibleAtoms, ref.visibleAtoms))
+        for attr in ("scalarsDict", "latticeScalarsDict", "vectorsDict"):
+            filtDict = getattr(filt, attr)
+            refDict = getattr(ref, attr)
+            self.assertEqual(sorted(filtDict.keys()), sorted(refDict.keys()))
+            for key in refDict:
+                self.assertTrue(np.array_equal(filtDict[key], refDict[key]))
+    
+    def countAppliedFilters(self):
+        """Return a list that the names of the filters are appended to when they are applied."""
+        applied = []
+        filterClasses = (cropBoxFilter.CropBoxFilter, bondOrderFilter.BondOrderFilter)
+        origApply = [filterClass.apply for filterClass in filterClasses]
+        def countApplied(apply):
+            def wrapper(filterObject, *args, **kwargs):
+                applied.append(filterObject.filterName)
+                return apply(filterObject, *args, **kwargs)
+            return wrapper
+        for filterClass, apply in zip(filterClasses, origApply):
+            filterClass.apply = countApplied(apply)
+        self.addCleanup(lambda: [setattr(filterClass, "apply", apply)
+                                 for filterClass, apply in zip(filterClasses, origApply)])
+        
+        return applied
+    
+    def test_resultCache(self):
+        """
+        Filterer result cache
+        
+        TEST:
+            - re-running a list restores the results from the cache
+            - only the filters after a changed filter are applied again
+            - modifying the input lattice invalidates the cached results
+            - changing the periodic boundaries invalidates the cached results
+        
+        """
+        filterNames, filterSettings = self.makeCacheTestList()
+        cropBoxSettings2 = filterSettings[2]
+        applied = self.countAppliedFilters()
+        
+        for deferred in (True, False):
+            filt = filterer.Filterer(DummyVoroOpts(), deferredCompaction=deferred, incremental=False)
+            
+            # first run applies all filters
+            del applied[:]
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            self.assertEqual(applied, ["Crop box", "Bond order", "Crop box"])
+            self.assertEqual(len(filt.resultCache), 3)
+            self.checkSameResult(filt, filterNames, filterSettings)
+            
+            # second run is restored from the cache
+            del applied[:]
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            self.assertEqual(applied, [])
+            self.checkSameResult(filt, filterNames, filterSettings)
+            
+            # change the last filter
+            cropBoxSettings2.updateSetting("ymax", 8.0)
+            del applied[:]
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            self.assertEqual(applied, ["Crop box"])
+            self.checkSameResult(filt, filterNames, filterSettings)
+            cropBoxSettings2.updateSetting("ymax", 10.0)
+            
+            # modifying the lattice invalidates the cache
+            self.inputState.modified()
+            del applied[:]
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            self.assertEqual(applied, ["Crop box", "Bond order", "Crop box"])
+            self.checkSameResult(filt, filterNames, filterSettings)
+            
+            # changing the PBCs in place invalidates the cache
+            self.inputState.PBC[0] = 0
+            del applied[:]
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            self.assertEqual(applied, ["Crop box", "Bond order", "Crop box"])
+            self.checkSameResult(filt, filterNames, filterSettings)
+            self.inputState.PBC[0] = 1
+            
+            # memory cap
+            filt.setResultCacheMemory(filt.resultCache.memory // 2)
+            self.assertLessEqual(filt.resultCache.memory, filt.resultCache.maxMemory)
+            filt.setResultCacheMemory(0)
+            self.assertEqual(len(filt.resultCache), 0)
+    
+    def test_resultCacheArrays(self):
+        """
+        Filterer result cache key of the scalars and vectors
+        
+        TEST:
+            - replacing a scalars array changes the key, even if the new
+              array has the id of the old one
+        
+        """
+        lattice = self.inputState
+        lattice.scalarsDict["test"] = np.zeros(lattice.NAtoms)
+        key = resultCache.latticeKey(lattice)
+        self.assertEqual(resultCache.latticeKey(lattice), key)
+        
+        # new arrays until one reuses the id of the old one
+        oldId = id(lattice.scalarsDict["test"])
+        del lattice.scalarsDict["test"]
+        arrays = []
+        for _ in range(1000):
+            array = np.ones(lattice.NAtoms)
+            if id(array) == oldId:
+                break
+            arrays.append(array)
+        
+        lattice.scalarsDict["test"] = array
+        self.assertNotEqual(resultCache.latticeKey(lattice), key)
+        del lattice.scalarsDict["test"]
+    
+    def test_incremental(self):
+        """
+        Filterer incremental re-filtering
+        
+        TEST:
+            - with the result cache disabled, re-running a list resumes from
+              the first filter that changed since the last run
+            - reordering the list resumes from the first moved filter
+            - changing the periodic boundaries or cell runs all the filters
+        
+        """
+        filterNames, filterSettings = self.makeCacheTestList()
+        applied = self.countAppliedFilters()
+        
+        for deferred in (True, False):
+            filt = filterer.Filterer(DummyVoroOpts(), deferredCompaction=deferred, resultCacheMemory=0)
+            
+            del applied[:]
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            self.assertEqual(applied, ["Crop box", "Bond order", "Crop box"])
+            self.assertEqual(len(filt.resultCache), 0)
+            self.assertEqual(len(filt.lastRunStages), 3)
+            
+            # unchanged
+            del applied[:]
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            self.assertEqual(applied, [])
+            self.checkSameResult(filt, filterNames, filterSettings)
+            
+            # tune the last filter repeatedly
+            for ymax in (9.0, 8.0, 7.0):
+                filterSettings[2].updateSetting("ymax", ymax)
+                del applied[:]
+                filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+                self.assertEqual(applied, ["Crop box"])
+                self.checkSameResult(filt, filterNames, filterSettings)
+            filterSettings[2].updateSetting("ymax", 10.0)
+            
+            # swap the last two filters
+            names = [filterNames[0], filterNames[2], filterNames[1]]
+            settings = [filterSettings[0], filterSettings[2], filterSettings[1]]
+            del applied[:]
+            filt.runFilters(names, settings, self.inputState, self.refState)
+            self.assertEqual(applied, ["Crop box", "Bond order"])
+            self.checkSameResult(filt, names, settings)
+            
+            # PBC and cell changes in place
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            for pbc in (0, 1):
+                self.inputState.PBC[1] = pbc
+                del applied[:]
+                filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+                self.assertEqual(applied, ["Crop box", "Bond order", "Crop box"])
+                self.checkSameResult(filt, filterNames, filterSettings)
+            self.inputState.cellDims[2] += 1.0
+            del applied[:]
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            self.assertEqual(applied, ["Crop box", "Bond order", "Crop box"])
+            self.checkSameResult(filt, filterNames, filterSettings)
+            self.inputState.cellDims[2] -= 1.0
+            
+            # not incremental
+            filt.incremental = False
+            filt.clearResultCache()
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            del applied[:]
+            filt.runFilters(filterNames, filterSettings, self.inputState, self.refState)
+            self.assertEqual(applied, ["Crop box", "Bond order", "Crop box"])
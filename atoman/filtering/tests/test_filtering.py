@@ -93,6 +93,39 @@ class TestSpecieFilter(unittest.TestCase):
         self.assertEqual(fullScalars[1], 4)
         self.assertEqual(fullScalars[5], 7)
         self.assertEqual(fullScalars[6], 9)
+    
+    def test_specieFilterColumnList(self):
+        """
+        Specie filter C lib full scalars/vectors as lists of arrays
+        
+        """
+        N = 5
+        specieArray = np.asarray([0,0,1,0,1], dtype=np.int32)
+        
+        visibleAtoms = np.arange(N, dtype=np.int32)
+        visibleSpecieArray = np.asarray([0], dtype=np.int32)
+        scalarsList = [np.arange(N, dtype=np.float64), np.arange(N, 2 * N, dtype=np.float64)]
+        vectorsList = [np.arange(3 * N, dtype=np.float64).reshape((N, 3))]
+        nvis = _filtering.specieFilter(visibleAtoms, visibleSpecieArray, specieArray, len(scalarsList), scalarsList,
+                                       len(vectorsList), vectorsList)
+        self.assertEqual(nvis, 3)
+        self.assertEqual(list(visibleAtoms[:nvis]), [0, 1, 3])
+        self.assertEqual(list(scalarsList[0][:nvis]), [0, 1, 3])
+        self.assertEqual(list(scalarsList[1][:nvis]), [5, 6, 8])
+        self.assertEqual(list(vectorsList[0][:nvis].flatten()), [0, 1, 2, 3, 4, 5, 9, 10, 11])
+        
+        # 2D stacked scalars (one row per scalar)
+        visibleAtoms = np.arange(N, dtype=np.int32)
+        stackedScalars = np.arange(2 * N, dtype=np.float64).reshape((2, N))
+        nvis = _filtering.specieFilter(visibleAtoms, visibleSpecieArray, specieArray, 2, stackedScalars, 0, [])
+        self.assertEqual(nvis, 3)
+        self.assertEqual(list(stackedScalars[0][:nvis]), [0, 1, 3])
+        self.assertEqual(list(stackedScalars[1][:nvis]), [5, 6, 8])
+        
+        # wrong number of columns in the list
+        visibleAtoms = np.arange(N, dtype=np.int32)
+        with self.assertRaises(ValueError):
+            _filtering.specieFilter(visibleAtoms, visibleSpecieArray, specieArray, 3, scalarsList, 0, [])
 
 ################################################################################
 
@@ -0,0 +1,157 @@
+"""
+Unit tests for the shared neighbour list
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import unittest
+
+import numpy as np
+
+from ...lattice_gen import lattice_gen_fcc
+from .. import neighbours
+from ..filters import acnaFilter
+from ..filters import clusterFilter
+from ..filters import base
+from ...gui import _preferences
+from six.moves import range
+
+
+################################################################################
+
+class TestNeighbourList(unittest.TestCase):
+    """
+    Test the shared neighbour list
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # generate lattice
+        args = lattice_gen_fcc.Args(sym="Au", NCells=[6, 6, 6], a0=4.078, pbcx=True, pbcy=True, pbcz=True)
+        gen = lattice_gen_fcc.FCCLatticeGenerator()
+        status, self.lattice = gen.generateLattice(args)
+        if status:
+            raise unittest.SkipTest("Generate lattice failed (%d)" % status)
+        
+        # displace the atoms slightly
+        np.random.seed(42)
+        self.lattice.pos += np.random.uniform(-0.1, 0.1, len(self.lattice.pos))
+        self.lattice.wrapAtoms()
+        
+        # set number of threads
+        _preferences.setNumThreads(1)
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        self.lattice = None
+    
+    def makeFilterInput(self, visibleAtoms, neighbourList):
+        """Create a filter input object."""
+        filterInput = base.FilterInput()
+        filterInput.inputState = self.lattice
+        filterInput.visibleAtoms = visibleAtoms
+        filterInput.NScalars = 0
+        filterInput.fullScalars = np.empty(0, np.float64)
+        filterInput.NVectors = 0
+        filterInput.fullVectors = np.empty(0, np.float64)
+        filterInput.neighbourList = neighbourList
+        
+        return filterInput
+    
+    def test_neighbourListBuild(self):
+        """
+        Neighbour list build
+        
+        """
+        cutoff = 3.5
+        cache = neighbours.NeighbourListCache()
+        nebList = cache.prepare(self.lattice, cutoff)
+        self.assertEqual(len(nebList), self.lattice.NAtoms)
+        
+        # compare against brute force
+        for i in range(0, self.lattice.NAtoms, 37):
+            expected = []
+            for j in range(self.lattice.NAtoms):
+                if i != j and self.lattice.atomSeparation(i, j, self.lattice.PBC) <= cutoff:
+                    expected.append(j)
+            self.assertEqual(sorted(nebList.neighbours(i)), expected)
+    
+    def test_neighbourListCache(self):
+        """
+        Neighbour list cache
+        
+        """
+        cache = neighbours.NeighbourListCache()
+        nebList = cache.prepare(self.lattice, 4.0)
+        
+        # smaller cut-off reuses the list
+        self.assertIs(cache.prepare(self.lattice, 3.0), nebList)
+        self.assertIs(cache.get(self.lattice, 3.0), nebList)
+        
+        # larger cut-off is not covered
+        self.assertIsNone(cache.get(self.lattice, 5.0))
+        
+        # modifying the lattice invalidates the list
+        self.lattice.wrapAtoms()
+        self.assertIsNone(cache.get(self.lattice, 3.0))
+        nebList = cache.prepare(self.lattice, 4.0)
+        
+        # changing the PBCs invalidates the list
+        self.lattice.PBC[0] = 0
+        self.assertIsNone(cache.get(self.lattice, 3.0))
+        
+        # no list for an invalid cut-off
+        self.assertIsNone(cache.prepare(self.lattice, 0.0))
+    
+    def test_acnaSharedNeighbourList(self):
+        """
+        ACNA with shared neighbour list
+        
+        """
+        settings = acnaFilter.AcnaFilterSettings()
+        settings.updateSetting("maxBondDistance", 4.0)
+        visibleAtoms = np.arange(0, self.lattice.NAtoms, 2, dtype=np.int32)
+        
+        # without neighbour list
+        filterInput = self.makeFilterInput(visibleAtoms.copy(), None)
+        result = acnaFilter.AcnaFilter("ACNA").apply(filterInput, settings)
+        expected = result.getScalars()["ACNA"]
+        
+        # with neighbour list (larger cut-off)
+        cache = neighbours.NeighbourListCache()
+        cache.prepare(self.lattice, 5.0)
+        filterInput = self.makeFilterInput(visibleAtoms.copy(), cache)
+        result = acnaFilter.AcnaFilter("ACNA").apply(filterInput, settings)
+        
+        self.assertTrue(np.array_equal(result.getScalars()["ACNA"], expected))
+    
+    def test_clustersSharedNeighbourList(self):
+        """
+        Clusters with shared neighbour list
+        
+        """
+        settings = clusterFilter.ClusterFilterSettings()
+        settings.updateSetting("neighbourRadius", 3.0)
+        settings.updateSetting("minClusterSize", 2)
+        visibleAtoms = np.arange(0, self.lattice.NAtoms, 7, dtype=np.int32)
+        
+        # without neighbour list
+        filterInput = self.makeFilterInput(visibleAtoms.copy(), None)
+        result = clusterFilter.ClusterFilter("Cluster").apply(filterInput, settings)
+        expectedVisible = filterInput.visibleAtoms
+        expectedClusters = [sorted(cluster) for cluster in result.getClusterList()]
+        
+        # with neighbour list
+        cache = neighbours.NeighbourListCache()
+        cache.prepare(self.lattice, 4.0)
+        filterInput = self.makeFilterInput(visibleAtoms.copy(), cache)
+        result = clusterFilter.ClusterFilter("Cluster").apply(filterInput, settings)
+        
+        self.assertTrue(np.array_equal(filterInput.visibleAtoms, expectedVisible))
+        self.assertEqual([sorted(cluster) for cluster in result.getClusterList()], expectedClusters)
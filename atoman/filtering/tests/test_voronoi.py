@@ -8,6 +8,7 @@ Unit tests for Voronoi tessellation
 from __future__ import absolute_import
 from __future__ import unicode_literals
 import os
+import copy
 import unittest
 import tempfile
 import shutil
@@ -16,40 +17,42 @@ import numpy as np
 
 from ...system.latticeReaders import LbomdDatReader, basic_displayError, basic_displayWarning, basic_log
 from .. import _voronoi
+from .. import voronoi
+from ...gui import _preferences
 
 ################################################################################
-   
+
 def path_to_file(path):
     return os.path.join(os.path.dirname(__file__), "..", "..", "..", "testing", path)
-   
+
 ################################################################################
-   
+
 class TestVoronoi(unittest.TestCase):
     """
     Test Voronoi
-        
+    
     """
     def setUp(self):
         # tmp dir
         self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
-         
+        
         # create reader
         reader = LbomdDatReader(self.tmpLocation, basic_log, basic_displayWarning, basic_displayError)
-         
+        
         status, self.lattice = reader.readFile(path_to_file("lattice.dat"))
         if status:
             self.fail("Error reading in Lattice")
-     
+    
     def tearDown(self):
         # remove tmp dir
         shutil.rmtree(self.tmpLocation)
-         
+        
         self.lattice = None
-     
+    
     def test_voronoiSumVolumes(self):
         """
         Voronoi volume sum
-            
+        
         """
         lattice = self.lattice
         
@@ -71,7 +74,7 @@ class TestVoronoi(unittest.TestCase):
     def test_voronoiSumVolumesRadii(self):
         """
         Voronoi volume sum (radii)
-            
+        
         """
         lattice = self.lattice
         
@@ -90,40 +93,64 @@ class TestVoronoi(unittest.TestCase):
         
         self.assertAlmostEqual(volsum, V)
     
+    def test_voronoiThreads(self):
+        """
+        Voronoi independent of number of threads
+        
+        """
+        lattice = self.lattice
+        PBC = np.ones(3, np.int32)
+        fthresh = 0.1
+        
+        for useRadii in (0, 1):
+            results = []
+            for numThreads in (1, 2, 4):
+                _preferences.setNumThreads(numThreads)
+                vor = _voronoi.Voronoi()
+                vor.computeVoronoi(lattice.pos, lattice.minPos, lattice.maxPos, lattice.cellDims, PBC, lattice.specie,
+                                   lattice.specieCovalentRadius, useRadii, fthresh)
+                nebs = [list(vor.atomNebList(i)) for i in range(lattice.NAtoms)]
+                results.append((vor.atomVolumesArray(), nebs))
+            _preferences.setNumThreads(1)
+            
+            for vols, nebs in results[1:]:
+                self.assertTrue(np.array_equal(vols, results[0][0]))
+                self.assertEqual(nebs, results[0][1])
+
 #     def test_resultOrder(self):
 #         """
 #         Voronoi result order
 #         
 #         """
-        
+
 ################################################################################
-   
+
 class TestVoronoi2(unittest.TestCase):
     """
     Test Voronoi2
-        
+    
     """
     def setUp(self):
         # tmp dir
         self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
-         
+        
         # create reader
         reader = LbomdDatReader(self.tmpLocation, basic_log, basic_displayWarning, basic_displayError)
-         
+        
         status, self.lattice = reader.readFile(path_to_file("kenny_lattice.dat"))
         if status:
             self.fail("Error reading in Lattice")
-     
+    
     def tearDown(self):
         # remove tmp dir
         shutil.rmtree(self.tmpLocation)
-         
+        
         self.lattice = None
-     
+    
     def test_voronoiSumVolumes(self):
         """
         Voronoi volume sum 2
-            
+        
         """
         lattice = self.lattice
         
@@ -145,7 +172,7 @@ class TestVoronoi2(unittest.TestCase):
     def test_voronoiSumVolumesRadii(self):
         """
         Voronoi volume sum (radii) 2
-            
+        
         """
         lattice = self.lattice
         
@@ -163,3 +190,204 @@ class TestVoronoi2(unittest.TestCase):
         V = self.lattice.volume()
         
         self.assertAlmostEqual(volsum, V)
+
+################################################################################
+
+class DummyVoroOpts(object):
+    def __init__(self):
+        self.dispersion = 10.0
+        self.displayVoronoi = False
+        self.useRadii = False
+        self.opacity = 0.8
+        self.outputToFile = False
+        self.outputFilename = "voronoi.csv"
+        self.faceAreaThreshold = 0.1
+
+################################################################################
+
+class TestVoronoiCache(unittest.TestCase):
+    """
+    Test the Voronoi cache
+    
+    """
+    def setUp(self):
+        # tmp dir
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        
+        # create reader
+        reader = LbomdDatReader(self.tmpLocation, basic_log, basic_displayWarning, basic_displayError)
+        
+        status, self.lattice = reader.readFile(path_to_file("lattice.dat"))
+        if status:
+            self.fail("Error reading in Lattice")
+        
+        voronoi.voronoiCache.clear()
+    
+    def tearDown(self):
+        # remove tmp dir
+        shutil.rmtree(self.tmpLocation)
+        
+        self.lattice = None
+        voronoi.voronoiCache.clear()
+        voronoi.voronoiCache.setMaxEntries(4)
+        voronoi.voronoiCache.setMaxMemory(voronoi.VoronoiCache.defaultMaxMemory)
+    
+    def test_voronoiCacheAtoms(self):
+        """
+        Voronoi cache (atoms)
+        
+        """
+        opts = DummyVoroOpts()
+        
+        # calculators share the tessellation
+        vor = voronoi.VoronoiAtomsCalculator(opts).getVoronoi(self.lattice)
+        self.assertEqual(len(voronoi.voronoiCache), 1)
+        calc = voronoi.VoronoiAtomsCalculator(opts)
+        self.assertFalse(calc.isCalculated())
+        self.assertTrue(calc.fetchCached(self.lattice))
+        self.assertTrue(calc.isCalculated())
+        self.assertIs(calc.getVoronoi(), vor)
+        self.assertIs(voronoi.VoronoiAtomsCalculator(opts).getVoronoi(self.lattice), vor)
+        self.assertEqual(len(voronoi.voronoiCache), 1)
+        
+        # options that affect the tessellation
+        opts2 = DummyVoroOpts()
+        opts2.faceAreaThreshold = 0.2
+        vor2 = voronoi.VoronoiAtomsCalculator(opts2).getVoronoi(self.lattice)
+        self.assertIsNot(vor2, vor)
+        self.assertEqual(len(voronoi.voronoiCache), 2)
+        
+        # modifying the lattice
+        self.lattice.modified()
+        self.assertFalse(voronoi.VoronoiAtomsCalculator(opts).fetchCached(self.lattice))
+        vor3 = calc.getVoronoi(self.lattice)
+        self.assertIsNot(vor3, vor)
+        self.assertTrue(np.allclose(vor3.atomVolumesArray(), vor.atomVolumesArray()))
+        
+        # least recently used tessellations are discarded
+        voronoi.voronoiCache.setMaxEntries(1)
+        self.assertEqual(len(voronoi.voronoiCache), 1)
+        self.assertIs(voronoi.VoronoiAtomsCalculator(opts).getVoronoi(self.lattice), vor3)
+    
+    def test_voronoiCacheMemory(self):
+        """
+        Voronoi cache (memory cap)
+        
+        """
+        cache = voronoi.voronoiCache
+        opts = DummyVoroOpts()
+        vor = voronoi.VoronoiAtomsCalculator(opts).getVoronoi(self.lattice)
+        memory = vor.memoryUsage()
+        self.assertGreater(memory, self.lattice.NAtoms * 13 * 4)
+        self.assertEqual(cache.memory, memory)
+        
+        opts2 = DummyVoroOpts()
+        opts2.faceAreaThreshold = 0.2
+        vor2 = voronoi.VoronoiAtomsCalculator(opts2).getVoronoi(self.lattice)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.memory, memory + vor2.memoryUsage())
+        
+        # least recently used tessellations are discarded
+        cache.setMaxMemory(max(memory, vor2.memoryUsage()) + 1)
+        self.assertEqual(len(cache), 1)
+        self.assertIs(voronoi.VoronoiAtomsCalculator(opts2).getVoronoi(self.lattice), vor2)
+        self.assertEqual(cache.memory, vor2.memoryUsage())
+        
+        # tessellations larger than the cap are not stored
+        cache.setMaxMemory(memory // 2)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.memory, 0)
+        self.assertFalse(cache.put("key", vor))
+        self.assertEqual(len(cache), 0)
+    
+    def test_voronoiCacheDefects(self):
+        """
+        Voronoi cache (defects)
+        
+        """
+        opts = DummyVoroOpts()
+        refLattice = self.lattice
+        inputLattice = copy.deepcopy(refLattice)
+        inputLattice.removeAtom(5)
+        inputLattice.removeAtom(0)
+        vacancies = np.asarray([0, 5], dtype=np.int32)
+        
+        vor = voronoi.VoronoiDefectsCalculator(opts).getVoronoi(inputLattice, refLattice, vacancies)
+        self.assertIs(voronoi.VoronoiDefectsCalculator(opts).getVoronoi(inputLattice, refLattice, vacancies.copy()),
+                      vor)
+        self.assertEqual(len(vor.atomVolumesArray()), refLattice.NAtoms)
+        
+        # different vacancies
+        calc = voronoi.VoronoiDefectsCalculator(opts)
+        vor2 = calc.getVoronoi(inputLattice, refLattice, np.asarray([0], dtype=np.int32))
+        self.assertIsNot(vor2, vor)
+        self.assertEqual(len(vor2.atomVolumesArray()), refLattice.NAtoms - 1)
+        self.assertEqual(len(voronoi.voronoiCache), 2)
+    
+    def test_voronoiOutputToFile(self):
+        """
+        Voronoi output to file
+        
+        """
+        opts = DummyVoroOpts()
+        opts.outputToFile = True
+        opts.outputFilename = os.path.join(self.tmpLocation, "voronoi.csv")
+        
+        vor = voronoi.VoronoiAtomsCalculator(opts).getVoronoi(self.lattice)
+        os.unlink(opts.outputFilename)
+        
+        # written even if the tessellation was cached
+        self.assertIs(voronoi.VoronoiAtomsCalculator(opts).getVoronoi(self.lattice), vor)
+        with open(opts.outputFilename) as f:
+            lines = f.read().split("\n")
+        self.assertEqual(lines[0], "Atom index,Voronoi volume,Voronoi neighbours (faces)")
+        self.assertEqual(len(lines), self.lattice.NAtoms + 2)
+    
+    def test_voronoiWriteFile(self):
+        """
+        Voronoi write to file (CSV/npz)
+        
+        """
+        opts = DummyVoroOpts()
+        vor = voronoi.VoronoiAtomsCalculator(opts).getVoronoi(self.lattice)
+        NAtoms = self.lattice.NAtoms
+        volumes = vor.atomVolumesArray()
+        numNebs = vor.atomNumNebsArray()
+        
+        # CSV matches the original format
+        expected = ["Atom index,Voronoi volume,Voronoi neighbours (faces)"]
+        expected.extend("%d,%f,%s" % (i, vor.atomVolume(i), vor.atomNumNebs(i)) for i in range(NAtoms))
+        expected.append("")
+        filename = os.path.join(self.tmpLocation, "voronoi.csv")
+        voronoi.writeVoronoiToFile(vor, self.lattice, filename)
+        with open(filename) as f:
+            self.assertEqual(f.read(), "\n".join(expected))
+        
+        # CSV with neighbour lists
+        voronoi.writeVoronoiToFile(vor, self.lattice, filename, includeNeighbours=True)
+        with open(filename) as f:
+            lines = f.read().split("\n")
+        self.assertEqual(len(lines), NAtoms + 2)
+        for i in (0, NAtoms - 1):
+            nebs = [int(val) for val in lines[i + 1].split(",")[3].split()]
+            self.assertEqual(nebs, list(vor.atomNebList(i)))
+        
+        # npz
+        filename = os.path.join(self.tmpLocation, "voronoi.npz")
+        voronoi.writeVoronoiToFile(vor, self.lattice, filename, includeNeighbours=True)
+        data = np.load(filename)
+        self.assertTrue(np.array_equal(data["volume"], volumes[:NAtoms]))
+        self.assertTrue(np.array_equal(data["numNeighbours"], numNebs[:NAtoms]))
+        nebStart = data["neighbourStart"]
+        nebIndex = data["neighbourIndex"]
+        self.assertEqual(len(nebStart), NAtoms + 1)
+        for i in (0, NAtoms - 1):
+            self.assertEqual(list(nebIndex[nebStart[i]:nebStart[i + 1]]), list(vor.atomNebList(i)))
+        
+        voronoi.writeVoronoiToFile(vor, self.lattice, filename)
+        data = np.load(filename)
+        self.assertNotIn("neighbourIndex", data.files)
+        
+        # bad path
+        with self.assertRaises(IOError):
+            voronoi.writeVoronoiToFile(vor, self.lattice, os.path.join(self.tmpLocation, "missing", "voronoi.csv"))
@@ -7,7 +7,9 @@
 #include "stdlib.h"
 #include "math.h"
 #include "filtering/voro_iface.h"
-#include "filtering/voro++/src/voro++.hh"
+/* the voro++ sources are compiled here (rather than separately) so that
+ * voro_compute can be instantiated for container_poly_view below */
+#include "filtering/voro++/src/voro++.cc"
 #include <vector>
 
 using namespace voro;
@@ -15,14 +17,112 @@ using namespace voro;
 static int processAtomCell(voronoicell_neighbor&, int, double*, double, vorores_t*);
 
 
+/*******************************************************************************
+ * View of a polydisperse container for one thread
+ *
+ * While computing a cell the container stores the radius of that cell (in
+ * radius_poly), so a container_poly cannot be shared between threads. The
+ * view refers to the particles of a shared container and holds only the
+ * radius state, so each thread needs a view rather than a copy of the
+ * container.
+ *******************************************************************************/
+class container_poly_view : public radius_poly
+{
+    public:
+        container_poly &con;
+        /* used by voro_compute */
+        const double boxx, boxy, boxz;
+        const double xsp, ysp, zsp;
+        const int ps;
+        int **id;
+        double **p;
+        int *co;
+        const unsigned int *wl;
+        double *mrad;
+        /* used by computeBlockCells */
+        const int nx, nxy, nxyz;
+        
+        container_poly_view(container_poly &con_) :
+            con(con_), boxx(con_.boxx), boxy(con_.boxy), boxz(con_.boxz),
+            xsp(con_.xsp), ysp(con_.ysp), zsp(con_.zsp), ps(con_.ps),
+            id(con_.id), p(con_.p), co(con_.co), wl(con_.wl), mrad(con_.mrad),
+            nx(con_.nx), nxy(con_.nxy), nxyz(con_.nxyz)
+        {
+            ppr = con_.ppr;
+            max_radius = con_.max_radius;
+        }
+        
+        inline void initialize_search(int ci, int cj, int ck, int ijk, int &i, int &j, int &k, int &disp)
+        {
+            con.initialize_search(ci, cj, ck, ijk, i, j, k, disp);
+        }
+        
+        inline void frac_pos(double x, double y, double z, double ci, double cj, double ck,
+                double &fx, double &fy, double &fz)
+        {
+            con.frac_pos(x, y, z, ci, cj, ck, fx, fy, fz);
+        }
+        
+        inline int region_index(int ci, int cj, int ck, int ei, int ej, int ek, double &qx, double &qy, double &qz,
+                int &disp)
+        {
+            return con.region_index(ci, cj, ck, ei, ej, ek, qx, qy, qz, disp);
+        }
+        
+        template<class v_cell>
+        inline bool initialize_voronoicell(v_cell &c, int ijk, int q, int ci, int cj, int ck,
+                int &i, int &j, int &k, double &x, double &y, double &z, int &disp)
+        {
+            return con.initialize_voronoicell(c, ijk, q, ci, cj, ck, i, j, k, x, y, z, disp);
+        }
+    
+    private:
+        friend class voro_compute<container_poly_view>;
+};
+
+
+/*******************************************************************************
+ * Compute the cells of the particles in one block of the container
+ *
+ * Returns the number of cells that could not be processed.
+ *******************************************************************************/
+template<class c_class>
+static int computeBlockCells(c_class &con, voro_compute<c_class> &vc, voronoicell_neighbor &c, int ijk, double *pos,
+        double faceAreaThreshold, vorores_t *voroResult)
+{
+    int q, errcnt = 0;
+    int k = ijk / con.nxy;
+    int j = (ijk - con.nxy * k) / con.nx;
+    int i = ijk - con.nxy * k - con.nx * j;
+    
+    for (q = 0; q < con.co[ijk]; q++)
+    {
+        if (vc.compute_cell(c, ijk, q, i, j, k))
+        {
+            if (processAtomCell(c, con.id[ijk][q], pos, faceAreaThreshold, voroResult)) errcnt++;
+        }
+    }
+    
+    return errcnt;
+}
+
 /*******************************************************************************
  * Main interface function to be called from C
+ *
+ * The blocks of the container (the spatial decomposition used by voro++) are
+ * distributed between the threads. Every thread computes its cells against
+ * the same container: each thread has its own voro_compute scratch space and,
+ * when radii are used, its own container_poly_view onto the shared container
+ * (which holds the radius of the current cell). The cells are therefore
+ * identical to the serial computation whatever the number of threads. The
+ * number of threads is passed in by the caller (prefs_numThreads needs
+ * Python, see preferences.h).
  *******************************************************************************/
 extern "C" int computeVoronoiVoroPlusPlusWrapper(int NAtoms, double *pos, int *PBC, 
         double *bound_lo, double *bound_hi, int useRadii, double *radii, 
-        double faceAreaThreshold, vorores_t *voroResult)
+        double faceAreaThreshold, vorores_t *voroResult, int numThreads)
 {
-    int i;
+    int i, errcnt;
     
     /* number of cells for spatial decomposition */
     double n[3];
@@ -34,9 +134,16 @@ extern "C" int computeVoronoiVoroPlusPlusWrapper(int NAtoms, double *pos, int *P
         n[i] = n[i] == 0 ? 1 : n[i];
 //        printf("DEBUG: n[%d] = %lf\n", i, n[i]);
     }
+    int nx = int(n[0]);
+    int ny = int(n[1]);
+    int nz = int(n[2]);
+    
+    /* size of the search mask (as used by the container) */
+    int hx = PBC[0] ? 2 * nx + 1 : nx;
+    int hy = PBC[1] ? 2 * ny + 1 : ny;
+    int hz = PBC[2] ? 2 * nz + 1 : nz;
     
-    // voro cell with neighbour information
-    voronoicell_neighbor c;
+    errcnt = 0;
     
     // use radii or not
     if (useRadii)
@@ -45,24 +152,30 @@ extern "C" int computeVoronoiVoroPlusPlusWrapper(int NAtoms, double *pos, int *P
         container_poly con(bound_lo[0], bound_hi[0],
                            bound_lo[1], bound_hi[1],
                            bound_lo[2], bound_hi[2],
-                           int(n[0]),int(n[1]),int(n[2]),
+                           nx, ny, nz,
                            bool(PBC[0]), bool(PBC[1]), bool(PBC[2]), 8); 
-    
+        
         // pass coordinates for local and ghost atoms to voro++
         for (i = 0; i < NAtoms; i++)
             con.put(i, pos[3*i], pos[3*i+1], pos[3*i+2], radii[i]);
         
-        // invoke voro++ and fetch results for owned atoms in group
-        int count = 0;
-        c_loop_all cl(con);
-        if (cl.start()) do if (con.compute_cell(c,cl))
+        #pragma omp parallel num_threads(numThreads) reduction(+: errcnt)
         {
-            i = cl.pid();
-            processAtomCell(c, i, pos, faceAreaThreshold, voroResult);
-            count++;
-        } while (cl.inc());
-        
-//        printf("DEBUG: COUNT = %d (%d atoms)\n", count, NAtoms);
+            int j;
+            
+            /* the radius of the current cell is stored in the view, the
+             * particles are read from the shared container */
+            container_poly_view view(con);
+            
+            // voro cell with neighbour information and compute object (scratch space)
+            voronoicell_neighbor c;
+            voro_compute<container_poly_view> vc(view, hx, hy, hz);
+            
+            // invoke voro++ and fetch results for owned atoms in group
+            #pragma omp for schedule(dynamic, 4)
+            for (j = 0; j < view.nxyz; j++)
+                errcnt += computeBlockCells(view, vc, c, j, pos, faceAreaThreshold, voroResult);
+        }
     }
     else
     {
@@ -70,37 +183,31 @@ extern "C" int computeVoronoiVoroPlusPlusWrapper(int NAtoms, double *pos, int *P
         container con(bound_lo[0], bound_hi[0],
                       bound_lo[1], bound_hi[1],
                       bound_lo[2], bound_hi[2],
-                      int(n[0]),int(n[1]),int(n[2]),
+                      nx, ny, nz,
                       bool(PBC[0]), bool(PBC[1]), bool(PBC[2]), 8); 
     
         // pass coordinates for local and ghost atoms to voro++
         for (i = 0; i < NAtoms; i++)
             con.put(i, pos[3*i], pos[3*i+1], pos[3*i+2]);
         
-        // invoke voro++ and fetch results for owned atoms in group
-        int count = 0;
-        int errcnt = 0;
-        c_loop_all cl(con);
-        if (cl.start()) do if (con.compute_cell(c,cl))
+        #pragma omp parallel num_threads(numThreads) reduction(+: errcnt)
         {
-            int retval;
-            
-            i = cl.pid();
-            retval = processAtomCell(c, i, pos, faceAreaThreshold, voroResult);
+            int j;
             
-            if (retval)
-            {
-                errcnt++;
-            }
+            // voro cell with neighbour information and compute object (scratch space)
+            voronoicell_neighbor c;
+            voro_compute<container> vc(con, hx, hy, hz);
             
-            count++;
-        } while (cl.inc());
-//        printf("DEBUG: COUNT = %d (%d atoms)\n", count, NAtoms);
-        
-        /* return error */
-        if (errcnt) return -1;
+            // invoke voro++ and fetch results for owned atoms in group
+            #pragma omp for schedule(dynamic, 4)
+            for (j = 0; j < con.nxyz; j++)
+                errcnt += computeBlockCells(con, vc, c, j, pos, faceAreaThreshold, voroResult);
+        }
     }
     
+    /* return error */
+    if (errcnt) return -1;
+    
     return 0;
 }
 
@@ -11,6 +11,7 @@
 #include <math.h>
 #include "visclibs/array_utils.h"
 #include "filtering/voro_iface.h"
+#include "gui/preferences.h"
 
 #if PY_MAJOR_VERSION >= 3
     #define MOD_ERROR_VAL NULL
@@ -51,6 +52,9 @@ static PyObject* Voronoi_atomVertices(Voronoi*, PyObject*);
 static PyObject* Voronoi_atomFaces(Voronoi*, PyObject*);
 static PyObject* Voronoi_atomVolumesArray(Voronoi*);
 static PyObject* Voronoi_atomNumNebsArray(Voronoi*);
+static PyObject* Voronoi_neighbourArrays(Voronoi*);
+static PyObject* Voronoi_writeCSV(Voronoi*, PyObject*);
+static PyObject* Voronoi_memoryUsage(Voronoi*);
 
 /*******************************************************************************
  ** free vorores pointer
@@ -236,6 +240,175 @@ Voronoi_atomNumNebsArray(Voronoi *self)
     return PyArray_Return(nebsArray);
 }
 
+/*******************************************************************************
+ ** Return the memory used by the result arrays (in bytes)
+ *******************************************************************************/
+static PyObject*
+Voronoi_memoryUsage(Voronoi *self)
+{
+    int i, j;
+    long long nbytes;
+    
+    nbytes = (long long) self->voroResultSize * sizeof(vorores_t);
+    for (i = 0; i < self->voroResultSize; i++)
+    {
+        vorores_t *res = &self->voroResult[i];
+        
+        nbytes += (long long) res->numNeighbours * sizeof(int);
+        nbytes += (long long) 3 * res->numVertices * sizeof(double);
+        nbytes += (long long) res->numFaces * (sizeof(int) + sizeof(int*));
+        for (j = 0; j < res->numFaces; j++)
+            nbytes += (long long) res->numFaceVertices[j] * sizeof(int);
+    }
+    
+    return PyLong_FromLongLong(nbytes);
+}
+
+/*******************************************************************************
+ ** Return the neighbours of all atoms in compressed form: the neighbours of
+ ** atom i are nebIndex[nebStart[i]:nebStart[i+1]]
+ *******************************************************************************/
+static PyObject*
+Voronoi_neighbourArrays(Voronoi *self)
+{
+    int i, size, count;
+    npy_intp dims[1];
+    PyArrayObject *nebStart=NULL;
+    PyArrayObject *nebIndex=NULL;
+    
+    /* offsets */
+    size = self->voroResultSize;
+    dims[0] = (npy_intp) (size + 1);
+    nebStart = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_INT32);
+    if (nebStart == NULL) return NULL;
+    count = 0;
+    for (i = 0; i < size; i++)
+    {
+        IIND1(nebStart, i) = count;
+        count += self->voroResult[i].numNeighbours;
+    }
+    IIND1(nebStart, size) = count;
+    
+    /* neighbour indices */
+    dims[0] = (npy_intp) count;
+    nebIndex = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_INT32);
+    if (nebIndex == NULL)
+    {
+        Py_DECREF(nebStart);
+        return NULL;
+    }
+    count = 0;
+    for (i = 0; i < size; i++)
+    {
+        int j;
+        
+        for (j = 0; j < self->voroResult[i].numNeighbours; j++)
+        {
+            int nebidx = self->voroResult[i].neighbours[j];
+            
+            /* return exception if negative neighbour (infinite cell??) */
+            if (nebidx < 0)
+            {
+                Py_DECREF(nebStart);
+                Py_DECREF(nebIndex);
+                PyErr_SetString(PyExc_RuntimeError, "Negative neighbour index (infinite cell?)");
+                return NULL;
+            }
+            
+            IIND1(nebIndex, count++) = nebidx;
+        }
+    }
+    
+    return Py_BuildValue("(NN)", PyArray_Return(nebStart), PyArray_Return(nebIndex));
+}
+
+/*******************************************************************************
+ ** Write the volumes and number of neighbours (and optionally the neighbours)
+ ** of the first NAtoms cells to a CSV file
+ *******************************************************************************/
+static PyObject*
+Voronoi_writeCSV(Voronoi *self, PyObject *args)
+{
+    char *filename;
+    int i, NAtoms, includeNeighbours, status;
+    FILE *fp;
+    
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "sii", &filename, &NAtoms, &includeNeighbours))
+        return NULL;
+    
+    /* check number of atoms within range */
+    if (NAtoms < 0 || NAtoms > self->voroResultSize)
+    {
+        char msg[64];
+        
+        sprintf(msg, "Number of atoms is out of range (%d > %d)", NAtoms, self->voroResultSize);
+        PyErr_SetString(PyExc_IndexError, msg);
+        return NULL;
+    }
+    
+    /* open the file, with a large buffer */
+    fp = fopen(filename, "w");
+    if (fp == NULL)
+    {
+        PyErr_SetFromErrnoWithFilename(PyExc_IOError, filename);
+        return NULL;
+    }
+    setvbuf(fp, NULL, _IOFBF, 1 << 20);
+    
+    /* write (status: 1 = negative neighbour, 2 = write error) */
+    status = 0;
+    Py_BEGIN_ALLOW_THREADS
+    
+    if (includeNeighbours)
+        fprintf(fp, "Atom index,Voronoi volume,Voronoi neighbours (faces),Neighbour indices\n");
+    else
+        fprintf(fp, "Atom index,Voronoi volume,Voronoi neighbours (faces)\n");
+    
+    for (i = 0; i < NAtoms && !status; i++)
+    {
+        int j, numNebs;
+        
+        /* check not infinite cell */
+        numNebs = self->voroResult[i].numNeighbours;
+        for (j = 0; j < numNebs; j++)
+        {
+            if (self->voroResult[i].neighbours[j] < 0)
+            {
+                status = 1;
+                break;
+            }
+        }
+        if (status) break;
+        
+        fprintf(fp, "%d,%f,%d", i, self->voroResult[i].volume, numNebs);
+        if (includeNeighbours)
+        {
+            fputc(',', fp);
+            for (j = 0; j < numNebs; j++)
+                fprintf(fp, j ? " %d" : "%d", self->voroResult[i].neighbours[j]);
+        }
+        if (fputc('\n', fp) == EOF) status = 2;
+    }
+    
+    if (fclose(fp) != 0 && !status) status = 2;
+    
+    Py_END_ALLOW_THREADS
+    
+    if (status == 1)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "Negative neighbour index (infinite cell?)");
+        return NULL;
+    }
+    else if (status == 2)
+    {
+        PyErr_SetFromErrnoWithFilename(PyExc_IOError, filename);
+        return NULL;
+    }
+    
+    Py_RETURN_NONE;
+}
+
 /*******************************************************************************
  ** Return neighbours of an atom
  *******************************************************************************/
@@ -504,8 +677,9 @@ Voronoi_computeVoronoi(Voronoi *self, PyObject *args)
     /* deallocate if ran previously */
     free_vorores(self);
     
-    /* allocate structure for holding results */
-    self->voroResult = malloc(NAtoms * sizeof(vorores_t));
+    /* allocate structure for holding results (zeroed, so the results of any
+     * cells that voro++ does not compute can be freed safely) */
+    self->voroResult = calloc(NAtoms, sizeof(vorores_t));
     if (self->voroResult == NULL)
     {
         PyErr_SetString(PyExc_RuntimeError, "Could not allocate voroResult pointer");
@@ -514,7 +688,8 @@ Voronoi_computeVoronoi(Voronoi *self, PyObject *args)
     self->voroResultSize = NAtoms;
     
     /* call voro++ wrapper */
-    status = computeVoronoiVoroPlusPlusWrapper(NAtoms, pos, PBC, bound_lo, bound_hi, useRadii, radii, faceAreaThreshold, self->voroResult);
+    status = computeVoronoiVoroPlusPlusWrapper(NAtoms, pos, PBC, bound_lo, bound_hi, useRadii, radii, faceAreaThreshold, self->voroResult,
+                                               prefs_numThreads);
     
     /* if status, we should dealloc everything and return error */
     if (status)
@@ -562,6 +737,15 @@ static PyMethodDef Voronoi_methods[] = {
     {"atomNumNebsArray", (PyCFunction)Voronoi_atomNumNebsArray, METH_NOARGS, 
                     "Return array of number of neighbours of atoms"
     },
+    {"neighbourArrays", (PyCFunction)Voronoi_neighbourArrays, METH_NOARGS, 
+                    "Return the neighbours of all atoms as (offsets, indices) arrays"
+    },
+    {"writeCSV", (PyCFunction)Voronoi_writeCSV, METH_VARARGS, 
+                    "Write the volumes and number of neighbours (and optionally the neighbours) of the atoms to a CSV file"
+    },
+    {"memoryUsage", (PyCFunction)Voronoi_memoryUsage, METH_NOARGS, 
+                    "Return the memory used by the result arrays (in bytes)"
+    },
     {NULL}  /* Sentinel */
 };
 
@@ -9,6 +9,8 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 import time
 import logging
+import hashlib
+import collections
 
 import numpy as np
 
@@ -16,10 +18,121 @@ from . import _voronoi
 from six.moves import range
 
 
+class VoronoiCache(object):
+    """
+    Cache of Voronoi tessellations that is shared by all filter lists.
+    
+    Tessellations are keyed by the lattice (its version, which changes when
+    the atoms are modified, and its cell/PBCs), the options that affect the
+    tessellation and, for systems containing defects, the reference lattice
+    and the vacancies. The least recently used tessellations are discarded
+    when there are more than `maxEntries` or the memory used by their arrays
+    exceeds `maxMemory` (in bytes); a tessellation larger than `maxMemory`
+    is not stored.
+    
+    """
+    defaultMaxMemory = 512 * 1024 * 1024
+    
+    def __init__(self, maxEntries=4, maxMemory=None):
+        self._logger = logging.getLogger(__name__ + ".VoronoiCache")
+        self._entries = collections.OrderedDict()
+        self._memory = 0
+        self.maxEntries = maxEntries
+        self.maxMemory = self.defaultMaxMemory if maxMemory is None else maxMemory
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    @property
+    def memory(self):
+        """The memory used by the stored tessellations in bytes."""
+        return self._memory
+    
+    def clear(self):
+        """Discard all tessellations."""
+        self._entries.clear()
+        self._memory = 0
+    
+    def setMaxEntries(self, maxEntries):
+        """Set the maximum number of tessellations stored."""
+        self.maxEntries = maxEntries
+        self._evict()
+    
+    def setMaxMemory(self, maxMemory):
+        """Set the memory cap (in bytes), discarding tessellations if required."""
+        self.maxMemory = maxMemory
+        self._evict()
+    
+    def get(self, key):
+        """Return the tessellation for the given key (or None)."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._entries[key] = entry
+        
+        return entry[0]
+    
+    def put(self, key, vor):
+        """Store the tessellation for the given key (unless it is larger than the memory cap)."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._memory -= old[1]
+        
+        memory = vor.memoryUsage()
+        if memory > self.maxMemory:
+            self._logger.debug("Not caching Voronoi tessellation (%d bytes > %d bytes)", memory, self.maxMemory)
+            return False
+        
+        self._entries[key] = (vor, memory)
+        self._memory += memory
+        self._evict()
+        
+        return True
+    
+    def _evict(self):
+        """Discard least recently used tessellations."""
+        while self._entries and (len(self._entries) > max(self.maxEntries, 0) or self._memory > self.maxMemory):
+            key, (vor, memory) = self._entries.popitem(last=False)
+            self._memory -= memory
+            self._logger.debug("Discarded cached Voronoi tessellation (%d bytes)", memory)
+
+
+# the Voronoi cache (shared by all Voronoi calculators)
+voronoiCache = VoronoiCache()
+
+
+def latticeVoronoiKey(lattice, voronoiOptions):
+    """Return the key of the tessellation of the given lattice with the given options."""
+    key = (lattice.version, lattice.NAtoms, lattice.cellDims.tobytes(), lattice.PBC.tobytes(),
+           bool(voronoiOptions.useRadii), voronoiOptions.faceAreaThreshold)
+    if voronoiOptions.useRadii:
+        key += (lattice.specie.tobytes(), np.asarray(lattice.specieCovalentRadius, np.float64).tobytes())
+    
+    return key
+
+
+def defectsVoronoiKey(lattice, refLattice, vacancies, voronoiOptions):
+    """Return the key of the tessellation of the given lattice and vacancies with the given options."""
+    vacancies = np.ascontiguousarray(vacancies, dtype=np.int32)
+    vacanciesKey = (len(vacancies), hashlib.sha1(vacancies.tobytes()).hexdigest())
+    
+    return latticeVoronoiKey(lattice, voronoiOptions) + (refLattice.version, refLattice.NAtoms, vacanciesKey)
+
+
 class VoronoiCalculator(object):
-    """Base object for Voronoi calculators."""
+    """
+    Base object for Voronoi calculators.
+    
+    The tessellation is taken from the shared Voronoi cache if it has already
+    been computed (by any calculator) for the same inputs and options.
+    
+    """
     def __init__(self, options):
         self._voronoi = None
+        self._key = None
         self._options = options
     
     def isCalculated(self):
@@ -27,15 +140,50 @@ class VoronoiCalculator(object):
         return True if isinstance(self._voronoi, _voronoi.Voronoi) else False
     
     def getVoronoi(self, *args):
-        """Return the Voronoi object."""
-        if not self.isCalculated():
-            self._calculate(*args)
+        """Return the Voronoi object (for the given inputs, if specified)."""
+        if args:
+            key = self._makeKey(*args)
+            if key != self._key or not self.isCalculated():
+                vor = voronoiCache.get(key)
+                if vor is None:
+                    vor = self._calculate(*args)
+                    voronoiCache.put(key, vor)
+                else:
+                    self._logger.debug("Using cached Voronoi tessellation")
+                self._voronoi = vor
+                self._key = key
+                
+                # save to file
+                if self._options.outputToFile:
+                    self._writeToFile(*args)
+        
+        elif not self.isCalculated():
+            raise RuntimeError("Voronoi has not been calculated")
         
         return self._voronoi
     
-    def calculate(*args):
+    def fetchCached(self, *args):
+        """Use the tessellation for the given inputs if it is in the cache (it is not calculated)."""
+        key = self._makeKey(*args)
+        if key not in voronoiCache:
+            return False
+        
+        self._voronoi = voronoiCache.get(key)
+        self._key = key
+        
+        return True
+    
+    def _makeKey(self, *args):
+        """Return the cache key for the given inputs: to be overridden."""
+        raise NotImplementedError("VoronoiCalculator._makeKey has not been implemented")
+    
+    def _calculate(self, *args):
         """Calculate Voronoi: to be overridden."""
-        raise NotImplementedError("VoronoiCalculator.calculate has not been implemented")
+        raise NotImplementedError("VoronoiCalculator._calculate has not been implemented")
+    
+    def _writeToFile(self, *args):
+        """Write the Voronoi data to file (not supported by default)."""
+        pass
 
 
 class VoronoiAtomsCalculator(VoronoiCalculator):
@@ -47,10 +195,18 @@ class VoronoiAtomsCalculator(VoronoiCalculator):
         super(VoronoiAtomsCalculator, self).__init__(options)
         self._logger = logging.getLogger(__name__ + ".VoronoiAtomsCalculator")
     
+    def _makeKey(self, lattice):
+        return latticeVoronoiKey(lattice, self._options)
+    
     def _calculate(self, lattice):
         """Calculate Voronoi."""
         self._logger.info("Calculating Voronoi (Atoms)")
-        self._voronoi = computeVoronoi(lattice, self._options)
+        return computeVoronoi(lattice, self._options)
+    
+    def _writeToFile(self, lattice):
+        """Write the Voronoi volumes/number of neighbours to file."""
+        writeVoronoiToFile(self._voronoi, lattice, self._options.outputFilename,
+                           includeNeighbours=getattr(self._options, "outputNeighbours", False))
 
 
 class VoronoiDefectsCalculator(VoronoiCalculator):
@@ -62,10 +218,13 @@ class VoronoiDefectsCalculator(VoronoiCalculator):
         super(VoronoiDefectsCalculator, self).__init__(options)
         self._logger = logging.getLogger(__name__ + ".VoronoiDefectsCalculator")
     
+    def _makeKey(self, lattice, refLattice, vacancies):
+        return defectsVoronoiKey(lattice, refLattice, vacancies, self._options)
+    
     def _calculate(self, lattice, refLattice, vacancies):
         """Calculate Voronoi."""
         self._logger.info("Calculating Voronoi (Defects)")
-        self._voronoi = computeVoronoiDefects(lattice, refLattice, vacancies, self._options)
+        return computeVoronoiDefects(lattice, refLattice, vacancies, self._options)
 
 
 def computeVoronoi(lattice, voronoiOptions):
@@ -91,43 +250,51 @@ def computeVoronoi(lattice, voronoiOptions):
                        lattice.specieCovalentRadius, voronoiOptions.useRadii, voronoiOptions.faceAreaThreshold)
     callTime = time.time() - callTime
     
-    # save to file
-    writeTime = 0
-    if voronoiOptions.outputToFile:
-        writeTime = time.time()
-        
-        fn = voronoiOptions.outputFilename
-        
-        # TODO: make this a CLIB
-        
-        lines = []
-        nl = lines.append
-        
-        nl("Atom index,Voronoi volume,Voronoi neighbours (faces)")
-        
-        for i in range(lattice.NAtoms):
-            line = "%d,%f,%s" % (i, vor.atomVolume(i), vor.atomNumNebs(i))
-            nl(line)
-        
-        nl("")
-        
-        logger.info("Writing Voronoi data to file: %s", fn)
-        
-        f = open(fn, "w")
-        f.write("\n".join(lines))
-        f.close()
-        
-        writeTime = time.time() - writeTime
-    
     vorotime = time.time() - vorotime
     logger.debug("  Compute Voronoi time: %f", vorotime)
     logger.debug("    Compute time: %f", callTime)
-    if writeTime > 0:
-        logger.debug("    Write time: %f", writeTime)
     
     return vor
 
 
+def writeVoronoiToFile(vor, lattice, filename, includeNeighbours=False):
+    """
+    Write the Voronoi volumes and number of neighbours (and optionally the
+    neighbour lists) of the atoms to file.
+    
+    If the filename ends with ".npz" the data are written as NumPy
+    arrays ("volume", "numNeighbours" and, if included, "neighbourStart" and
+    "neighbourIndex", where the neighbours of atom i are
+    neighbourIndex[neighbourStart[i]:neighbourStart[i+1]]). Otherwise a CSV
+    file is written by the C extension.
+    
+    """
+    logger = logging.getLogger(__name__)
+    
+    writeTime = time.time()
+    
+    logger.info("Writing Voronoi data to file: %s", filename)
+    
+    if filename.lower().endswith(".npz"):
+        NAtoms = lattice.NAtoms
+        nebStart, nebIndex = vor.neighbourArrays()
+        data = {
+            "volume": vor.atomVolumesArray()[:NAtoms],
+            "numNeighbours": np.diff(nebStart[:NAtoms + 1]).astype(np.int32),
+        }
+        if includeNeighbours:
+            data["neighbourStart"] = nebStart[:NAtoms + 1]
+            data["neighbourIndex"] = nebIndex[:nebStart[NAtoms]]
+        
+        np.savez(filename, **data)
+    
+    else:
+        vor.writeCSV(filename, lattice.NAtoms, int(includeNeighbours))
+    
+    writeTime = time.time() - writeTime
+    logger.debug("  Write Voronoi time: %f", writeTime)
+
+
 def computeVoronoiDefects(lattice, refLattice, vacancies, voronoiOptions):
     """
     Compute Voronoi for system containing defects
@@ -849,7 +849,8 @@ class AtomInfoWindow(QtGui.QDialog):
                 # set override cursor
                 QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
                 try:
-                    # shift atoms
+                    # shift atoms (copying any arrays shared with other systems first)
+                    lattice.detach()
                     for i in range(num):
                         for k in range(rangeArray[i][1]-rangeArray[i][0]+1): 
                             i3 = 3 * (rangeArray[i][0]+k-1)  
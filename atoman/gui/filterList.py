@@ -452,6 +452,7 @@ class FilterList(QtGui.QWidget):
             self.clearActors(sequencer=sequencer)
             
             # apply filters
+            self.filterer.setResultCacheMemory(self.mainWindow.preferences.generalForm.resultCacheMemory * 1024 * 1024)
             self.filterer.runFilters(currentFilters, currentSettings, inputState, refState)
             
             # this is where the rendering should be done
@@ -524,6 +525,30 @@ class FilterList(QtGui.QWidget):
         
         return currentScalars
     
+    def getRequiredColumns(self):
+        """
+        Return the set of lattice columns (scalars, vectors and charge) used by
+        the filters, colouring and vectors options of this list
+        
+        """
+        columns = set()
+        for name, settingsGui in zip(self.getCurrentFilterNames(), self.getCurrentFilterSettings()):
+            if name == "Charge":
+                columns.add("Charge")
+            elif name.startswith("Scalar: "):
+                columns.add(settingsGui.getSettings().getSetting("scalarsName"))
+        
+        colourBy = self.colouringOptions.colourBy
+        if colourBy.startswith("Lattice: "):
+            colourBy = colourBy[9:]
+        if colourBy not in ("Species", "Height", "Solid colour"):
+            columns.add(colourBy)
+        
+        if self.vectorsOptions.selectedVectorsName is not None:
+            columns.add(self.vectorsOptions.selectedVectorsName)
+        
+        return columns
+    
     def clearList(self):
         """
         Clear filters and actors from list.
@@ -9,6 +9,11 @@ Display options for a filter list.
 * The "Sphere resolution" settings determine how the atoms (spheres) are drawn.
   There are three defaults: "low", "medium" and "high, or you can enter the 
   settings manually.  In the formula "N" is the number of visible spheres.
+* "Atom glyphs" selects how the spheres are drawn: "Geometry" builds a mesh
+  containing a sphere for every atom; "Instanced" draws the same sphere at
+  every atom and "Sprites" draws every atom as a shaded disc that looks like
+  a sphere (the sphere resolution is not used). Instanced and sprites use
+  much less memory and are faster to set up for large numbers of atoms.
 
 """
 from __future__ import absolute_import
@@ -29,6 +34,10 @@ class DisplayOptionsWindow(QtGui.QDialog):
     Display options dialog.
     
     """
+    # atom glyph modes (see AtomRenderer) and their labels
+    atomGlyphModes = ("geometry", "instanced", "sprites")
+    atomGlyphModeLabels = ("Geometry", "Instanced", "Sprites")
+    
     def __init__(self, mainWindow, parent=None):
         super(DisplayOptionsWindow, self).__init__(parent)
         
@@ -49,6 +58,9 @@ class DisplayOptionsWindow(QtGui.QDialog):
         self.atomScaleFactor = 1.0
         self.resA = float(settings.value("display/resA", 250.0))
         self.resB = float(settings.value("display/resB", 0.36))
+        self.atomGlyphMode = str(settings.value("display/atomGlyphMode", "geometry"))
+        if self.atomGlyphMode not in self.atomGlyphModes:
+            self.atomGlyphMode = "geometry"
         
         self.resDefaults = {
             "medium": (250, 0.36),
@@ -142,6 +154,22 @@ class DisplayOptionsWindow(QtGui.QDialog):
         
         layout.addWidget(resGroupBox)
         
+        # group box for atom glyph settings
+        glyphGroupBox = genericForm.GenericForm(self, None, "Atom glyphs")
+        glyphGroupBox.show()
+        
+        self.atomGlyphModeCombo = QtGui.QComboBox()
+        self.atomGlyphModeCombo.addItems(self.atomGlyphModeLabels)
+        self.atomGlyphModeCombo.setCurrentIndex(self.atomGlyphModes.index(self.atomGlyphMode))
+        self.atomGlyphModeCombo.setToolTip("<p>How the atoms are drawn: a mesh containing a sphere for every atom, "
+                                           "the same sphere drawn at every atom (less memory) or shaded "
+                                           "sprites (least memory, resolution not used)</p>")
+        self.atomGlyphModeCombo.currentIndexChanged[int].connect(self.atomGlyphModeChanged)
+        row = glyphGroupBox.newRow()
+        row.addWidget(self.atomGlyphModeCombo)
+        
+        layout.addWidget(glyphGroupBox)
+        
         buttonBox = QtGui.QDialogButtonBox(QtGui.QDialogButtonBox.Close)
         buttonBox.rejected.connect(self.reject)
         layout.addWidget(buttonBox)
@@ -154,6 +182,7 @@ class DisplayOptionsWindow(QtGui.QDialog):
         settings = QtCore.QSettings()
         settings.setValue("display/resA", self.resA)
         settings.setValue("display/resB", self.resB)
+        settings.setValue("display/atomGlyphMode", self.atomGlyphMode)
     
     def applyDefault(self, setting):
         """
@@ -188,6 +217,13 @@ class DisplayOptionsWindow(QtGui.QDialog):
         """
         self.resB = val
     
+    def atomGlyphModeChanged(self, index):
+        """
+        Atom glyph mode changed
+        
+        """
+        self.atomGlyphMode = self.atomGlyphModes[index]
+    
     def atomScaleSpinChanged(self, val):
         """
         Atom scale factor spin box changed.
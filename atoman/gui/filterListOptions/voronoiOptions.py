@@ -55,6 +55,7 @@ class VoronoiOptionsWindow(QtGui.QDialog):
         self.opacity = 0.8
         self.outputToFile = False
         self.outputFilename = "voronoi.csv"
+        self.outputNeighbours = False
         self.faceAreaThreshold = 0.1
 
         # layout
@@ -83,9 +84,14 @@ class VoronoiOptionsWindow(QtGui.QDialog):
         saveToFileCheck.setToolTip("Save Voronoi volumes/number of neighbours to file")
         filenameEdit = QtGui.QLineEdit(self.outputFilename)
         filenameEdit.textChanged.connect(self.filenameChanged)
+        filenameEdit.setToolTip("Output file (CSV, or NumPy arrays if the name ends with '.npz')")
+        outputNeighboursCheck = QtGui.QCheckBox("Include neighbour lists")
+        outputNeighboursCheck.stateChanged.connect(self.outputNeighboursChanged)
+        outputNeighboursCheck.setToolTip("Also save the indexes of the neighbouring cells of each atom")
         vbox = QtGui.QVBoxLayout()
         vbox.addWidget(saveToFileCheck)
         vbox.addWidget(filenameEdit)
+        vbox.addWidget(outputNeighboursCheck)
         dialogLayout.addRow("Save to file", vbox)
 
         # break
@@ -189,6 +195,15 @@ class VoronoiOptionsWindow(QtGui.QDialog):
 
         self.clearVoronoiResults()
 
+    def outputNeighboursChanged(self, state):
+        """
+        Output neighbours changed
+
+        """
+        self.outputNeighbours = False if state == QtCore.Qt.Unchecked else True
+
+        self.clearVoronoiResults()
+
     def opacityChanged(self, val):
         """
         Opacity changed
@@ -21,6 +21,7 @@ from PySide import QtGui, QtCore
 
 from ..visutils.utilities import iconPath, resourcePath
 from ..system import latticeReaderGeneric
+from ..system import latticeStore
 from six.moves import range
 from six.moves import zip
 
@@ -175,8 +176,11 @@ class GeneralLatticeReaderForm(QtGui.QWidget):
         filepath, zipFlag = self.latticeReader.checkForZipped(filename)
         
         try:
-            # file format
-            fileFormat = self.determineFileFormat(filepath, filename)
+            # file format (lattice stores are binary, so are not detected from the lines)
+            if latticeStore.isLatticeStore(filepath):
+                fileFormat = latticeReaderGeneric.LATTICE_STORE_FORMAT
+            else:
+                fileFormat = self.determineFileFormat(filepath, filename)
             if fileFormat is None:
                 return 1
             
@@ -187,6 +191,7 @@ class GeneralLatticeReaderForm(QtGui.QWidget):
                     return 2
 
             # open file
+            self.latticeReader.setCacheLocation(self.mainWindow.preferences.generalForm.latticeCacheLocation)
             status, state = self.latticeReader.readFile(filepath, fileFormat, rouletteIndex=rouletteIndex, linkedLattice=linkedLattice)
         
         except:
@@ -274,7 +279,7 @@ class GeneralLatticeReaderForm(QtGui.QWidget):
         
         # read required lines
         lines = []
-        with open(filename) as f:
+        with latticeReaderGeneric.openFile(filename) as f:
             for count, line in enumerate(f):
                 if count == maxIdLen:
                     break
@@ -25,6 +25,10 @@ from PIL import Image
 
 from ..visutils import utilities
 from ..visutils import threading_vis
+from ..system import latticeReaderGeneric
+from ..system.lattice import Lattice
+from ..system import prefetch
+from ..rendering import povrayQueue
 from ..visutils.utilities import iconPath
 from . import genericForm
 from ..plotting import rdf
@@ -1447,6 +1451,8 @@ class ImageSequenceTab(QtGui.QWidget):
         self.fileprefixText = "guess"
         self.overwrite = False
         self.flickerFlag = False
+        self.framesFlag = False
+        self.prefetchDepth = 2
         self.rotateAfter = False
 #         self.createMovie = 1
 
@@ -1576,6 +1582,29 @@ class ImageSequenceTab(QtGui.QWidget):
 
         mainLayout.addWidget(row)
 
+        # frames of the current file check
+        row = QtGui.QWidget(self)
+        rowLayout = QtGui.QHBoxLayout(row)
+        rowLayout.setContentsMargins(0, 0, 0, 0)
+        rowLayout.setAlignment(QtCore.Qt.AlignHCenter)
+        self.framesCheck = QtGui.QCheckBox("Frames of current file")
+        self.framesCheck.setToolTip("Step through the frames of the current (multi-frame) file instead of a numbered "
+                                    "sequence of files")
+        self.framesCheck.stateChanged[int].connect(self.framesCheckChanged)
+        rowLayout.addWidget(self.framesCheck)
+        rowLayout.addStretch()
+        label = QtGui.QLabel("Read ahead:")
+        self.prefetchSpinBox = QtGui.QSpinBox()
+        self.prefetchSpinBox.setMinimum(0)
+        self.prefetchSpinBox.setMaximum(16)
+        self.prefetchSpinBox.setValue(self.prefetchDepth)
+        self.prefetchSpinBox.setToolTip("Number of files to read in the background while the current one is filtered "
+                                        "and rendered (0 to disable)")
+        self.prefetchSpinBox.valueChanged[int].connect(self.prefetchDepthChanged)
+        rowLayout.addWidget(label)
+        rowLayout.addWidget(self.prefetchSpinBox)
+        mainLayout.addWidget(row)
+
         # overwrite check box
 #         row = QtGui.QWidget(self)
 #         rowLayout = QtGui.QHBoxLayout(row)
@@ -1803,89 +1832,125 @@ class ImageSequenceTab(QtGui.QWidget):
         # formatted string
         fileText = "%s%s%s" % (str(self.fileprefix.text()), self.numberFormat, pipelinePage.extension)
 
-        # check abspath (for sftp)
-        abspath = pipelinePage.abspath
+        # reader
+        readerForm = self.mainWindow.systemsDialog.load_system_form.readerForm
+        reader = readerForm.latticeReader
+
         sftpBrowser = None
-        if pipelinePage.fromSFTP:
-            self.logger.debug("Sequencing SFTP file: '%s'", abspath)
-            array = abspath.split(":")
-            sftpHost = array[0]
-            # handle case where ":"'s are in the file path
-            sftpFile = ":".join(array[1:])
-            self.logger.debug("Host: '%s'; path: '%s'", sftpHost, sftpFile)
-
-            sysDiag = self.mainWindow.systemsDialog
-            sftpDlg = sysDiag.load_system_form.sftp_browser
-            match = False
-            for i in range(sftpDlg.stackedWidget.count()):
-                w = sftpDlg.stackedWidget.widget(i)
-                if w.connectionID == sftpHost:
-                    match = True
-                    break
+        transfer = None
+        if self.framesFlag:
+            # step through the frames of the current file
+            if pipelinePage.fromSFTP:
+                self.logger.error("Cannot sequence the frames of an SFTP file")
+                self.mainWindow.displayError("Cannot sequence the frames of an SFTP file")
+                return
+
+            framesFile = pipelinePage.abspath
+            try:
+                numFrames = reader.numFrames(framesFile, pipelinePage.fileFormat)
 
-            if not match:
-                self.logger.error("Could not find SFTP browser for '%s'", sftpHost)
+            except (IOError, ValueError) as error:
+                self.logger.exception("Could not index frames")
+                self.mainWindow.displayError("Could not index the frames of '%s'\n\n%s" % (framesFile, error))
                 return
 
-            # browser
-            sftpBrowser = w
+            if self.minIndex >= numFrames:
+                self.mainWindow.displayError("First frame (%d) is beyond the end of the file (%d frames)" %
+                                             (self.minIndex, numFrames))
+                return
+
+            if self.maxIndex > self.minIndex:
+                if self.maxIndex >= numFrames:
+                    self.mainWindow.displayError("Last frame (%d) is beyond the end of the file (%d frames)" %
+                                                 (self.maxIndex, numFrames))
+                    return
+
+                maxIndex = self.maxIndex
+
+            else:
+                maxIndex = numFrames - 1
+                self.logger.info("Last frame detected as: %d", maxIndex)
 
-        # check first file exists
-        if sftpBrowser is None:
-            firstFileExists = utilities.checkForFile(str(self.firstFileLabel.text()))
         else:
-            rp = os.path.join(os.path.dirname(sftpFile), str(self.firstFileLabel.text()))
-            self.logger.debug("Checking first file exists (SFTP): '%s'", rp)
-            firstFileExists = bool(sftpBrowser.checkPathExists(rp)) or bool(sftpBrowser.checkPathExists(rp+".gz")) or bool(sftpBrowser.checkPathExists(rp+".bz2"))
+            # check abspath (for sftp)
+            abspath = pipelinePage.abspath
+            if pipelinePage.fromSFTP:
+                self.logger.debug("Sequencing SFTP file: '%s'", abspath)
+                array = abspath.split(":")
+                sftpHost = array[0]
+                # handle case where ":"'s are in the file path
+                sftpFile = ":".join(array[1:])
+                self.logger.debug("Host: '%s'; path: '%s'", sftpHost, sftpFile)
+
+                sysDiag = self.mainWindow.systemsDialog
+                sftpDlg = sysDiag.load_system_form.sftp_browser
+                match = False
+                for i in range(sftpDlg.stackedWidget.count()):
+                    w = sftpDlg.stackedWidget.widget(i)
+                    if w.connectionID == sftpHost:
+                        match = True
+                        break
+
+                if not match:
+                    self.logger.error("Could not find SFTP browser for '%s'", sftpHost)
+                    return
 
-        if not firstFileExists:
-            self.warnFileNotPresent(str(self.firstFileLabel.text()), tag="first")
-            return
+                # browser
+                sftpBrowser = w
+
+                # resolves the remote files from one listing of the directory
+                transfer = sftpBrowser.sequenceTransfer(os.path.dirname(sftpFile), self.mainWindow.tmpDirectory)
 
-        # check last file exists
-        if self.maxIndex > self.minIndex:
-            lastFile = fileText % self.maxIndex
+            # check first file exists
             if sftpBrowser is None:
-                lastFileExists = utilities.checkForFile(lastFile)
+                firstFileExists = utilities.checkForFile(str(self.firstFileLabel.text()))
             else:
-                rp = os.path.join(os.path.dirname(sftpFile), lastFile)
-                self.logger.debug("Checking last file exists (SFTP): '%s'", rp)
-                lastFileExists = bool(sftpBrowser.checkPathExists(rp)) or bool(sftpBrowser.checkPathExists(rp+".gz")) or bool(sftpBrowser.checkPathExists(rp+".bz2"))
+                self.logger.debug("Checking first file exists (SFTP): '%s'", str(self.firstFileLabel.text()))
+                firstFileExists = transfer.resolve(str(self.firstFileLabel.text())) is not None
 
-            if not lastFileExists:
-                self.warnFileNotPresent(lastFile, tag="last")
+            if not firstFileExists:
+                self.warnFileNotPresent(str(self.firstFileLabel.text()), tag="first")
                 return
 
-            maxIndex = self.maxIndex
-
-        else:
-            # find greatest file
-            self.logger.info("Auto-detecting last sequencer file")
+            # check last file exists
+            if self.maxIndex > self.minIndex:
+                lastFile = fileText % self.maxIndex
+                if sftpBrowser is None:
+                    lastFileExists = utilities.checkForFile(lastFile)
+                else:
+                    self.logger.debug("Checking last file exists (SFTP): '%s'", lastFile)
+                    lastFileExists = transfer.resolve(lastFile) is not None
 
-            lastIndex = self.minIndex
-            lastFile = fileText % lastIndex
+                if not lastFileExists:
+                    self.warnFileNotPresent(lastFile, tag="last")
+                    return
 
-            if sftpBrowser is None:
-                def _checkForLastFile(fn):
-                    return utilities.checkForFile(fn)
+                maxIndex = self.maxIndex
 
             else:
-                def _checkForLastFile(fn):
-                    rp = os.path.join(os.path.dirname(sftpFile), lastFile)
-                    return bool(sftpBrowser.checkPathExists(rp)) or bool(sftpBrowser.checkPathExists(rp+".gz")) or bool(sftpBrowser.checkPathExists(rp+".bz2"))
+                # find greatest file
+                self.logger.info("Auto-detecting last sequencer file")
 
-            while _checkForLastFile(lastFile):
-                lastIndex += 1
-                lastFile = fileText % lastIndex
+                if sftpBrowser is None:
+                    lastIndex = self.minIndex
+                    lastFile = fileText % lastIndex
+                    while utilities.checkForFile(lastFile):
+                        lastIndex += 1
+                        lastFile = fileText % lastIndex
 
-            lastIndex -= 1
-            lastFile = fileText % lastIndex
-            maxIndex = lastIndex
+                    lastIndex -= 1
 
-            self.logger.info("Last file detected as: '%s'", lastFile)
+                else:
+                    lastIndex = transfer.lastIndex(fileText, self.minIndex)
 
-        # store current input state
-        origInput = copy.deepcopy(self.rendererWindow.getCurrentInputState())
+                lastFile = fileText % lastIndex
+                maxIndex = lastIndex
+
+                self.logger.info("Last file detected as: '%s'", lastFile)
+
+        # store current input state (the atom arrays are shared until modified)
+        origInput = Lattice()
+        origInput.clone(self.rendererWindow.getCurrentInputState(), copyOnWrite=True)
 
         # pipeline index
         pipelineIndex = self.rendererWindow.currentPipelineIndex
@@ -1894,9 +1959,6 @@ class ImageSequenceTab(QtGui.QWidget):
         systemsDialog = self.mainWindow.systemsDialog
         loadPage = systemsDialog.load_system_form
 
-        # reader
-        readerForm = loadPage.readerForm
-        reader = readerForm.latticeReader
         self.logger.debug("  Reader: %s %s", str(readerForm), str(reader))
 
         # directory
@@ -1935,50 +1997,88 @@ class ImageSequenceTab(QtGui.QWidget):
 
         QtGui.QApplication.processEvents()
 
+        # reader for the background threads (no progress callbacks), using the preferred number of threads
+        if self.prefetchDepth > 0:
+            cacheLocation = None if reader.cache is None else reader.cache.location
+            numThreads = self.mainWindow.preferences.generalForm.openmpNumThreads
+            loadReader = latticeReaderGeneric.LatticeReaderGeneric(self.mainWindow.tmpDirectory,
+                                                                   cacheLocation=cacheLocation,
+                                                                   parallel=reader.parallel, numThreads=numThreads)
+        else:
+            loadReader = reader
+
+        def loadFile(i):
+            """Copy (SFTP) and read the given file or frame; called on the prefetch threads."""
+            if self.framesFlag:
+                currentFile = framesFile
+                self.logger.info("Current frame: %d", i)
+
+            elif sftpBrowser is None:
+                currentFile = fileText % i
+                self.logger.info("Current file: '%s'", currentFile)
+
+            else:
+                # the files are copied locally (in order, several at a time) and deleted afterwards
+                basename, currentFile = next(fetcher)
+                assert basename == fileText % i
+                self.logger.info("Current file: '%s' (SFTP)", basename)
+
+            # read in state
+            if self.framesFlag:
+                status, state = loadReader.readFrame(currentFile, pipelinePage.fileFormat, i,
+                                                     linkedLattice=pipelinePage.linkedLattice, columns=columns)
+            else:
+                status, state = loadReader.readFile(currentFile, pipelinePage.fileFormat, rouletteIndex=i-1,
+                                                    linkedLattice=pipelinePage.linkedLattice, columns=columns)
+
+            return currentFile, status, state
+
+        # only read the columns the filter lists use
+        columns = pipelinePage.getRequiredColumns()
+        self.logger.debug("Sequencer reading columns: %r", sorted(columns))
+
+        # read the files ahead in the background while filtering and rendering
+        indexes = range(self.minIndex, maxIndex + self.interval, self.interval)
+        if transfer is not None:
+            # one file per SFTP session at a time (none ahead if reading ahead is disabled)
+            fetchDepth = None if self.prefetchDepth > 0 else 0
+            fetcher = transfer.fetchAhead([fileText % i for i in indexes], depth=fetchDepth)
+        prefetcher = prefetch.Prefetcher(indexes, loadFile, depth=self.prefetchDepth)
+        self.logger.debug("Reading ahead %d files", self.prefetchDepth)
+
+        # POV-Ray images are rendered in parallel while the next files are filtered
+        renderQueue = None
+        if self.parent.renderType == "POV":
+            numJobs = self.mainWindow.preferences.povrayForm.numJobs
+            renderQueue = povrayQueue.PovrayRenderQueue(povray, numProcesses=numJobs,
+                                                        processEvents=QtGui.QApplication.processEvents)
+        povrayFailed = []
+        merges = []
+
+        def povrayFinished(filename):
+            """A queued POV-Ray image has been rendered."""
+            if filename is None:
+                povrayFailed.append(True)
+
         # loop over files
         status = 0
         previousPos = None
+        currentFile = None
         try:
             count = 0
-            for i in range(self.minIndex, maxIndex + self.interval, self.interval):
-                if sftpBrowser is None:
-                    currentFile = fileText % i
-                    self.logger.info("Current file: '%s'", currentFile)
+            while True:
+                try:
+                    i, (currentFile, status, state) = next(prefetcher)
+
+                except StopIteration:
+                    break
+
+                except Exception as error:
+                    self.logger.exception("Sequencer read file failed")
+                    self.mainWindow.displayError("Sequencer read file failed\n\n%s" % error)
+                    status = 1
+                    break
 
-                else:
-                    # we have to copy current file locally and use that, then delete it afterwards
-                    basename = fileText % i
-                    remoteFile = os.path.join(os.path.dirname(sftpFile), basename)
-                    currentFile = os.path.join(self.mainWindow.tmpDirectory, basename)
-
-                    # check exists
-                    remoteFileTest = remoteFile
-                    fileExists = bool(sftpBrowser.checkPathExists(remoteFileTest))
-                    if not fileExists:
-                        # check gzip
-                        remoteFileTest = remoteFile + ".gz"
-                        fileExists = bool(sftpBrowser.checkPathExists(remoteFileTest))
-                        if fileExists:
-                            currentFile += ".gz"
-                        else:
-                            # check bzip
-                            remoteFileTest = remoteFile + ".bz2"
-                            fileExists = bool(sftpBrowser.checkPathExists(remoteFileTest))
-                            if fileExists:
-                                currentFile += ".bz2"
-                            else:
-                                self.logger.error("SFTP sequencer file does not exist: '%s'", remoteFile)
-                                return
-
-                    remoteFile = remoteFileTest
-
-                    # copy locally
-                    self.logger.debug("Copying file for sequencer: '%s' to '%s'", remoteFile, currentFile)
-                    # copy file and roulette if exists..,
-                    sftpBrowser.copySystem(remoteFile, currentFile)
-
-                # read in state
-                status, state = reader.readFile(currentFile, pipelinePage.fileFormat, rouletteIndex=i-1, linkedLattice=pipelinePage.linkedLattice)
                 if status:
                     self.logger.error("Sequencer read file failed with status: %d" % status)
                     break
@@ -2065,36 +2165,39 @@ class ImageSequenceTab(QtGui.QWidget):
                 saveName = saveText % count
                 self.logger.info("  Saving image: '%s'", saveName)
 
-                # now save image
-                filename = self.rendererWindow.renderer.saveImage(self.parent.renderType, self.parent.imageFormat, saveName, 1, povray=povray)
+                # now save image (POV-Ray images are queued and rendered in the background)
+                renderer = self.rendererWindow.renderer
+                if renderQueue is not None:
+                    filename = renderer.queuePovrayImage(renderQueue, self.parent.imageFormat, saveName, 1,
+                                                         callback=povrayFinished)
+                else:
+                    filename = renderer.saveImage(self.parent.renderType, self.parent.imageFormat, saveName, 1,
+                                                  povray=povray)
 
                 # linked image
                 if rw2 is not None:
                     saveName2 = saveText2 % count
                     self.logger.info("  Saving linked image: '%s'", saveName2)
 
-                    filename2 = rw2.renderer.saveImage(self.parent.renderType, self.parent.imageFormat, saveName2, 1, povray=povray)
+                    if renderQueue is not None:
+                        filename2 = rw2.renderer.queuePovrayImage(renderQueue, self.parent.imageFormat, saveName2, 1,
+                                                                  callback=povrayFinished)
+                    else:
+                        filename2 = rw2.renderer.saveImage(self.parent.renderType, self.parent.imageFormat, saveName2,
+                                                           1, povray=povray)
 
-                    # merge the files
+                    # merge the files (once they have been rendered)
                     mergeFn = os.path.join(saveDir, "merge%d.%s" % (i, self.parent.imageFormat))
-                    self.logger.debug("Merging the files together: '%s'", mergeFn)
-
-                    # read images
-                    im1 = Image.open(filename)
-                    im2 = Image.open(filename2)
-
-                    assert im1.size[1] == im2.size[1], "Image sizes do not match: %r != %r" % (im1.size, im2.size)
-
-                    # new empty image
-                    newSize = (im1.size[0] + im2.size[0], im1.size[1])
-                    newIm = Image.new('RGB', newSize)
-
-                    # paste images
-                    newIm.paste(im1, (0, 0))
-                    newIm.paste(im2, (im1.size[0], 0))
+                    if renderQueue is not None:
+                        merges.append((filename, filename2, mergeFn))
+                    else:
+                        self.mergeImages(filename, filename2, mergeFn)
 
-                    # save
-                    newIm.save(mergeFn)
+                # stop if a POV-Ray job failed
+                if povrayFailed:
+                    self.logger.error("Sequencer POV-Ray rendering failed")
+                    status = 1
+                    break
 
                 # increment output counter
                 count += 1
@@ -2114,6 +2217,20 @@ class ImageSequenceTab(QtGui.QWidget):
 
                 QtGui.QApplication.processEvents()
 
+            # wait for the queued POV-Ray images
+            if renderQueue is not None and not status:
+                progDialog.setLabelText("Waiting for POV-Ray...")
+                if not renderQueue.wait(cancelled=progDialog.wasCanceled):
+                    return
+
+                if povrayFailed:
+                    self.logger.error("Sequencer POV-Ray rendering failed")
+                    status = 1
+
+                else:
+                    for filename, filename2, mergeFn in merges:
+                        self.mergeImages(filename, filename2, mergeFn)
+
             # create movie
             if not status and self.createMovieBox.isChecked():
                 # show wait cursor
@@ -2136,6 +2253,20 @@ class ImageSequenceTab(QtGui.QWidget):
                 self.parent.imageRotateTab.startRotator()
 
         finally:
+            # kill any POV-Ray jobs that are still running (cancelled or failed)
+            if renderQueue is not None:
+                renderQueue.cancel()
+
+            # stop reading ahead and remove any local copies that were not used (SFTP)
+            prefetcher.close()
+            if transfer is not None:
+                fetcher.close()
+                pendingFiles = [pendingFile for _, pendingFile in fetcher.pending()]
+                pendingFiles.extend(pendingFile for pendingFile, _, _ in prefetcher.pending())
+                for pendingFile in pendingFiles:
+                    if os.path.exists(pendingFile):
+                        os.unlink(pendingFile)
+
             self.logger.debug("Reloading original input")
 
             # reload original input
@@ -2149,7 +2280,29 @@ class ImageSequenceTab(QtGui.QWidget):
             # close progress dialog
             progDialog.close()
 
+    def mergeImages(self, filename, filename2, mergeFn):
+        """
+        Merge the images from the linked renderer windows side by side
+
+        """
+        self.logger.debug("Merging the files together: '%s'", mergeFn)
 
+        # read images
+        im1 = Image.open(filename)
+        im2 = Image.open(filename2)
+
+        assert im1.size[1] == im2.size[1], "Image sizes do not match: %r != %r" % (im1.size, im2.size)
+
+        # new empty image
+        newSize = (im1.size[0] + im2.size[0], im1.size[1])
+        newIm = Image.new('RGB', newSize)
+
+        # paste images
+        newIm.paste(im1, (0, 0))
+        newIm.paste(im2, (im1.size[0], 0))
+
+        # save
+        newIm.save(mergeFn)
 
     def eliminateFlicker(self, state, previousPos, pipelinePage):
         """
@@ -2166,6 +2319,8 @@ class ImageSequenceTab(QtGui.QWidget):
         logger = self.logger
         logger.debug("Attempting to eliminate PBC flicker")
 
+        # the positions are modified in place (copying any arrays shared with other systems first)
+        state.detach()
         if len(previousPos) < len(state.pos):
             prevNAtoms = len(previousPos)/3
             count = vectors_c.eliminatePBCFlicker(prevNAtoms, state.pos, previousPos, state.cellDims, pbc)
@@ -2201,6 +2356,24 @@ class ImageSequenceTab(QtGui.QWidget):
         else:
             self.flickerFlag = True
 
+    def framesCheckChanged(self, state):
+        """
+        Frames of current file check changed
+
+        """
+        if state == QtCore.Qt.Unchecked:
+            self.framesFlag = False
+
+        else:
+            self.framesFlag = True
+
+    def prefetchDepthChanged(self, val):
+        """
+        Read ahead changed
+
+        """
+        self.prefetchDepth = val
+
     def overwriteCheckChanged(self, val):
         """
         Overwrite check changed
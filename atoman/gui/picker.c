@@ -213,12 +213,12 @@ pickObject(PyObject *self, PyObject *args)
             int k;
             int checkBox = boxNebList[i];
             
-            for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
+            for (k = boxes->boxStart[checkBox]; k < boxes->boxStart[checkBox + 1]; k++)
             {
                 int index, realIndex;
                 double sep2, rad;
                 
-                index = boxes->boxAtoms[checkBox][k];
+                index = boxes->boxAtoms[k];
                 
                 /* atomic separation */
                 sep2 = atomicSeparation2(pickPos[0], pickPos[1], pickPos[2], 
@@ -380,12 +380,12 @@ pickObject(PyObject *self, PyObject *args)
             int k;
             int checkBox = boxNebList[i];
             
-            for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
+            for (k = boxes->boxStart[checkBox]; k < boxes->boxStart[checkBox + 1]; k++)
             {
                 int index;
                 double sep2, rad;
                 
-                index = boxes->boxAtoms[checkBox][k];
+                index = boxes->boxAtoms[k];
                 
                 /* atomic separation */
                 sep2 = atomicSeparation2(pickPos[0], pickPos[1], pickPos[2], 
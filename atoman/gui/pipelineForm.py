@@ -282,7 +282,8 @@ class PipelineForm(QtGui.QWidget):
                 # set override cursor
                 QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
                 try:
-                    # shift atoms
+                    # shift atoms (copying any arrays shared with other systems first)
+                    lattice.detach()
                     for i in range(num):
                         for k in range(rangeArray[i][1]-rangeArray[i][0]+1): 
                             i3 = 3 * (rangeArray[i][0]+k-1)  
@@ -342,7 +343,8 @@ class PipelineForm(QtGui.QWidget):
                     # add progress dialog
                     self.mainWindow.updateProgress(0, lattice.NAtoms, "Shifting cell")
                     
-                    # loop over atoms
+                    # loop over atoms (copying any arrays shared with other systems first)
+                    lattice.detach()
                     for i in range(lattice.NAtoms):
                         i3 = 3 * i
                         for j in range(3):
@@ -401,9 +403,7 @@ class PipelineForm(QtGui.QWidget):
                 self.logger.warning("Replicating cell: this will modify the current input state everywhere")
                 self.logger.debug("Replicating cell: %r", repDirs)
                 
-                # TODO: write in C
                 lattice = self.inputState
-                newpos = np.empty(3, np.float64)
                 cellDims = lattice.cellDims
                 
                 # calculate final number of atoms
@@ -413,13 +413,6 @@ class PipelineForm(QtGui.QWidget):
                 numadd = numfin - lattice.NAtoms
                 self.logger.debug("Replicating cell: adding %d atoms", numadd)
                 
-                # progress update interval
-                progressInterval = int(numadd / 10)
-                if progressInterval < 50:
-                    progressInterval = 50
-                elif progressInterval > 500:
-                    progressInterval = 500
-                
                 # set override cursor
                 QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
                 try:
@@ -429,38 +422,31 @@ class PipelineForm(QtGui.QWidget):
                     # loop over directions
                     count = 0
                     for i in range(3):
+                        if not repDirs[i]:
+                            continue
+                        
                         self.logger.debug("Replicating along axis %d: %d times", i, repDirs[i])
                         
-                        # store num atoms at beginning of this direction
+                        # all the copies along this direction are added at once
                         NAtoms = lattice.NAtoms
+                        reps = repDirs[i]
+                        newpos = np.tile(lattice.pos.reshape((-1, 3)), (reps, 1))
+                        newpos[:, i] += np.repeat(np.arange(1, reps + 1) * cellDims[i], NAtoms)
+                        scalarVals = {}
+                        for name, scalarsArray in six.iteritems(lattice.scalarsDict):
+                            scalarVals[name] = np.tile(scalarsArray, reps)
+                        vectorVals = {}
+                        for name, vectorsArray in six.iteritems(lattice.vectorsDict):
+                            vectorVals[name] = np.tile(vectorsArray, (reps,) + (1,) * (vectorsArray.ndim - 1))
+                        
+                        # add atoms
+                        lattice.addAtoms(np.tile(lattice.specie, reps), newpos, np.tile(lattice.charge, reps),
+                                         scalarVals=scalarVals, vectorVals=vectorVals)
+                        
+                        # progress
+                        count += NAtoms * reps
+                        self.mainWindow.updateProgress(count, numadd, "Replicating cell")
                         
-                        # loop over number of replications in this direction
-                        for j in range(repDirs[i]):
-                            # loop over atoms
-                            for k in range(NAtoms):
-                                # attributes to copy to new atom
-                                sym = lattice.atomSym(k)
-                                q = lattice.charge[k]
-                                scalarVals = {}
-                                for name, scalarsArray in six.iteritems(lattice.scalarsDict):
-                                    scalarVals[name] = scalarsArray[k]
-                                vectorVals = {}
-                                for name, vectorsArray in six.iteritems(lattice.vectorsDict):
-                                    vectorVals[name] = vectorsArray[k]
-                                
-                                # new position
-                                pos = lattice.atomPos(k)
-                                newpos[:] = pos[:]
-                                newpos[i] += (j + 1) * cellDims[i]
-                                
-                                # add atom
-                                lattice.addAtom(sym, newpos, q, scalarVals=scalarVals, vectorVals=vectorVals)
-                                
-                                # progress
-                                count += 1
-                                if count % progressInterval == 0:
-                                    self.mainWindow.updateProgress(count, numadd, "Replicating cell")
-                                    
                         # change cell dimension
                         lattice.cellDims[i] += cellDims[i] * repDirs[i]
                         self.logger.debug("New cellDims along axis %d: %f", i, lattice.cellDims[i])
@@ -761,6 +747,18 @@ class PipelineForm(QtGui.QWidget):
         
         return status
     
+    def getRequiredColumns(self):
+        """
+        Return the set of lattice columns used by the filter lists (the other
+        columns do not need to be read when sequencing)
+        
+        """
+        columns = set()
+        for filterList_ in self.filterLists:
+            columns.update(filterList_.getRequiredColumns())
+        
+        return columns
+    
     def refreshOnScreenInfo(self):
         """
         Refresh the on-screen information.
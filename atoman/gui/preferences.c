@@ -25,6 +25,10 @@
 #endif
 
 static PyObject* setNumThreads(PyObject*, PyObject*);
+static PyObject* getNumThreads(PyObject*, PyObject*);
+
+/* number of threads to use in OpenMP (shared with the other extensions, see preferences.h) */
+static int numThreads = 1;
 
 
 /*******************************************************************************
@@ -32,6 +36,7 @@ static PyObject* setNumThreads(PyObject*, PyObject*);
  *******************************************************************************/
 static struct PyMethodDef module_methods[] = {
     {"setNumThreads", setNumThreads, METH_VARARGS, "Set the number of OpenMP threads to use."},
+    {"getNumThreads", getNumThreads, METH_NOARGS, "Return the number of OpenMP threads to use."},
     {NULL, NULL, 0, NULL}
 };
 
@@ -40,12 +45,26 @@ static struct PyMethodDef module_methods[] = {
  *******************************************************************************/
 MOD_INIT(_preferences)
 {
-    PyObject *mod;
+    PyObject *mod, *capsule;
     
     MOD_DEF(mod, "_preferences", "Preferences for C extensions", module_methods)
     if (mod == NULL)
         return MOD_ERROR_VAL;
     
+    /* default to the OpenMP default (eg. from OMP_NUM_THREADS) */
+#ifdef _OPENMP
+    numThreads = omp_get_max_threads();
+#endif
+    
+    /* export the number of threads to the other extensions */
+    capsule = PyCapsule_New((void *) &numThreads, PREFS_NUM_THREADS_CAPSULE, NULL);
+    if (capsule == NULL || PyModule_AddObject(mod, "_numThreads", capsule) < 0)
+    {
+        Py_XDECREF(capsule);
+        Py_DECREF(mod);
+        return MOD_ERROR_VAL;
+    }
+    
     return MOD_SUCCESS_VAL(mod);
 }
 
@@ -55,16 +74,33 @@ MOD_INIT(_preferences)
 static PyObject*
 setNumThreads(PyObject *self, PyObject *args)
 {
-    int numThreads;
+    int num;
     
     
     /* parse arguments from Python */
-    if (!PyArg_ParseTuple(args, "i", &numThreads))
+    if (!PyArg_ParseTuple(args, "i", &num))
+        return NULL;
+    
+    if (num < 1)
+    {
+        PyErr_SetString(PyExc_ValueError, "Number of threads must be positive");
         return NULL;
+    }
     
-    /* set the number of threads */
-    prefs_numThreads = numThreads;
+    /* set the number of threads (used by all extensions from any thread, see preferences.h) */
+#ifdef _OPENMP
+    numThreads = num;
+#endif
     
     /* return None on success */
     Py_RETURN_NONE;
 }
+
+/*******************************************************************************
+ ** Return the number of OpenMP threads
+ *******************************************************************************/
+static PyObject*
+getNumThreads(PyObject *self, PyObject *unused)
+{
+    return Py_BuildValue("i", numThreads);
+}
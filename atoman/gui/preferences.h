@@ -1,8 +1,48 @@
-
 #ifndef _PREFERENCES_H_
 #define _PREFERENCES_H_
 
-/* number of threads to use in OpenMP */
-int prefs_numThreads;
+/* number of threads to use in OpenMP
+ *
+ * Each extension module is loaded separately, so a global variable here would
+ * not be shared between them, and the OpenMP runtime setting is per-thread (a
+ * kernel run on another thread, eg. a prefetch thread, would not see it).
+ * Instead the number of threads is stored in the _preferences module, which
+ * exports a pointer to it in a capsule; prefs_numThreads reads it from any
+ * thread (the capsule is imported, with the GIL, on first use). Kernels pass
+ * it explicitly with num_threads(prefs_numThreads).
+ */
+#define PREFS_NUM_THREADS_CAPSULE "atoman.gui._preferences._numThreads"
+
+#ifdef _OPENMP
+    #include <omp.h>
+
+    static int *prefs_numThreadsPtr = NULL;
+
+    static int prefs_getNumThreads(void) __attribute__((unused));
+    static int prefs_getNumThreads(void)
+    {
+        if (prefs_numThreadsPtr == NULL)
+        {
+            PyGILState_STATE gilState = PyGILState_Ensure();
+
+            prefs_numThreadsPtr = (int*) PyCapsule_Import(PREFS_NUM_THREADS_CAPSULE, 0);
+            if (prefs_numThreadsPtr == NULL)
+            {
+                /* preferences module not available: use the OpenMP default */
+                PyErr_Clear();
+                PyGILState_Release(gilState);
+                return omp_get_max_threads();
+            }
+
+            PyGILState_Release(gilState);
+        }
+
+        return *prefs_numThreadsPtr;
+    }
+
+    #define prefs_numThreads prefs_getNumThreads()
+#else
+    #define prefs_numThreads 1
+#endif
 
 #endif
@@ -253,6 +253,20 @@ class RenderingSettingsForm(GenericPreferencesSettingsForm):
         The custom format to use for the scalar bar labels. Must match the regular expression:
         "%[+- 0#]*[0-9]*([.]?[0-9]+)?[adefgADEFG]".
 
+    **Level of detail**
+        While the scene is being rotated, zoomed, etc. draw a reduced number of points for atoms,
+        bonds and vectors, restoring full quality when the interaction ends.
+
+    **LOD minimum points**
+        Level of detail is only used for actors containing at least this many points.
+
+    **LOD cloud points**
+        The number of points drawn while interacting.
+
+    **Interactive frame rate**
+        The frame rate to aim for while interacting; the low detail version of an actor is drawn
+        if the full version would be too slow.
+
     """
     def __init__(self, parent):
         super(RenderingSettingsForm, self).__init__(parent)
@@ -266,6 +280,10 @@ class RenderingSettingsForm(GenericPreferencesSettingsForm):
         self.numScalarBarLabels = int(settings.value("rendering/numScalarBarLabels", 5))
         self.enableFmtScalarBarLabels = bool(int(settings.value("rendering/enableFmtScalarBarLabels", 0)))
         self.fmtScalarBarLabels = settings.value("rendering/fmtScalarBarLabels", "%+#6.2e")
+        self.lodEnabled = bool(int(settings.value("rendering/lodEnabled", 1)))
+        self.lodMinPoints = int(settings.value("rendering/lodMinPoints", 500000))
+        self.lodCloudPoints = int(settings.value("rendering/lodCloudPoints", 100000))
+        self.interactiveFrameRate = float(settings.value("rendering/interactiveFrameRate", 15.0))
 
         # max atoms auto run
         maxAtomsSpin = QtGui.QSpinBox()
@@ -307,6 +325,44 @@ class RenderingSettingsForm(GenericPreferencesSettingsForm):
         self.layout.addRow("Enable custom scalar bar labels", enableFmtCheck)
         self.layout.addRow("Custom scalar bar label format", self.fmtScalarBarLabelsEdit)
 
+        self.addHorizontalDivide()
+
+        # level of detail options
+        lodCheck = QtGui.QCheckBox()
+        lodCheck.setChecked(self.lodEnabled)
+        lodCheck.setToolTip("<p>Draw fewer points for large atoms, bonds and vectors actors while interacting "
+                            "with the scene.</p>")
+        lodCheck.stateChanged.connect(self.lodEnabledChanged)
+        self.layout.addRow("Level of detail", lodCheck)
+
+        lodMinPointsSpin = QtGui.QSpinBox()
+        lodMinPointsSpin.setMinimum(1)
+        lodMinPointsSpin.setMaximum(999999999)
+        lodMinPointsSpin.setSingleStep(100000)
+        lodMinPointsSpin.setValue(self.lodMinPoints)
+        lodMinPointsSpin.setToolTip("<p>Only use level of detail for actors with at least this many points.</p>")
+        lodMinPointsSpin.valueChanged.connect(self.lodMinPointsChanged)
+        self.layout.addRow("LOD minimum points", lodMinPointsSpin)
+
+        lodCloudPointsSpin = QtGui.QSpinBox()
+        lodCloudPointsSpin.setMinimum(1000)
+        lodCloudPointsSpin.setMaximum(99999999)
+        lodCloudPointsSpin.setSingleStep(10000)
+        lodCloudPointsSpin.setValue(self.lodCloudPoints)
+        lodCloudPointsSpin.setToolTip("<p>The number of points to draw while interacting.</p>")
+        lodCloudPointsSpin.valueChanged.connect(self.lodCloudPointsChanged)
+        self.layout.addRow("LOD cloud points", lodCloudPointsSpin)
+
+        frameRateSpin = QtGui.QDoubleSpinBox()
+        frameRateSpin.setMinimum(1.0)
+        frameRateSpin.setMaximum(120.0)
+        frameRateSpin.setSingleStep(1.0)
+        frameRateSpin.setValue(self.interactiveFrameRate)
+        frameRateSpin.setSuffix(" fps")
+        frameRateSpin.setToolTip("<p>The frame rate to aim for while interacting with the scene.</p>")
+        frameRateSpin.valueChanged.connect(self.interactiveFrameRateChanged)
+        self.layout.addRow("Interactive frame rate", frameRateSpin)
+
         self.init()
 
     def fmtEdited(self):
@@ -343,6 +399,39 @@ class RenderingSettingsForm(GenericPreferencesSettingsForm):
         settings = QtCore.QSettings()
         settings.setValue("rendering/numScalarBarLabels", val)
 
+    def lodEnabledChanged(self, state):
+        """Level of detail enabled changed."""
+        self.lodEnabled = False if state == QtCore.Qt.Unchecked else True
+        self.logger.debug("Level of detail enabled: %s", self.lodEnabled)
+
+        # store in settings
+        settings = QtCore.QSettings()
+        settings.setValue("rendering/lodEnabled", int(self.lodEnabled))
+
+    def lodMinPointsChanged(self, val):
+        """LOD minimum points changed."""
+        self.lodMinPoints = val
+
+        # store in settings
+        settings = QtCore.QSettings()
+        settings.setValue("rendering/lodMinPoints", val)
+
+    def lodCloudPointsChanged(self, val):
+        """LOD cloud points changed."""
+        self.lodCloudPoints = val
+
+        # store in settings
+        settings = QtCore.QSettings()
+        settings.setValue("rendering/lodCloudPoints", val)
+
+    def interactiveFrameRateChanged(self, val):
+        """Interactive frame rate changed."""
+        self.interactiveFrameRate = val
+
+        # store in settings
+        settings = QtCore.QSettings()
+        settings.setValue("rendering/interactiveFrameRate", val)
+
 ################################################################################
 
 class FfmpegSettingsForm(GenericPreferencesSettingsForm):
@@ -445,6 +534,10 @@ class PovraySettingsForm(GenericPreferencesSettingsForm):
     **Cell frame radius**
         The radius of the lattice cell frame to use in POV-Ray images
 
+    **Parallel jobs**
+        The number of POV-Ray processes to run at the same time when rendering the frames of a sequence
+        or rotation (the default is the number of cores).  The cores are shared between the processes.
+
     """
     def __init__(self, parent):
         super(PovraySettingsForm, self).__init__(parent)
@@ -459,6 +552,7 @@ class PovraySettingsForm(GenericPreferencesSettingsForm):
         self.VRes = 600
         self.viewAngle = 45
         self.cellFrameRadius = 0.15
+        self.numJobs = int(settings.value("povray/numJobs", mp.cpu_count()))
 
         self.pathToPovray = str(settings.value("povray/pathToPovray", "povray"))
         if not os.path.exists(self.pathToPovray):
@@ -518,8 +612,26 @@ class PovraySettingsForm(GenericPreferencesSettingsForm):
         cellFrameSpinBox.valueChanged.connect(self.cellFrameRadiusChanged)
         self.layout.addRow("Cell frame radius", cellFrameSpinBox)
 
+        # number of parallel jobs
+        numJobsSpinBox = QtGui.QSpinBox()
+        numJobsSpinBox.setMinimum(1)
+        numJobsSpinBox.setMaximum(max(mp.cpu_count(), self.numJobs))
+        numJobsSpinBox.setValue(self.numJobs)
+        numJobsSpinBox.valueChanged.connect(self.numJobsChanged)
+        numJobsSpinBox.setToolTip("Number of POV-Ray images to render at the same time (sequencer and rotator)")
+        self.layout.addRow("Parallel jobs", numJobsSpinBox)
+
         self.init()
 
+    def numJobsChanged(self, val):
+        """
+        Number of parallel jobs changed.
+
+        """
+        self.numJobs = val
+        settings = QtCore.QSettings()
+        settings.setValue("povray/numJobs", val)
+
     def pathToPovrayEdited(self):
         """
         Path to povray finished being edited.
@@ -849,6 +961,17 @@ class GeneralSettingsForm(GenericPreferencesSettingsForm):
         places, for example the "Bond order" and "ACNA" filters and RDF plotting. The
         default is "0" which will run on all available threads.
 
+    **FILTER_RESULT_CACHE**
+        The maximum memory (in MB) used by each filter list to cache the results of
+        its filters. When a filter list is applied again, the filters whose inputs
+        and settings have not changed are restored from the cache instead of being
+        recalculated. Set to "0" to disable the cache.
+
+    **LATTICE_CACHE**
+        Store the data parsed from lattice files in a binary cache file, either next
+        to the file or in the data directory, so that reopening an unchanged file
+        does not require it to be decompressed and parsed again. Disabled by default.
+
     **DISABLE_MOUSE_WHEEL**
         Setting this option disables the use of the mouse wheel for zooming in/out of
         the VTK window. This was added because it is easy to accidentally touch the
@@ -887,6 +1010,34 @@ class GeneralSettingsForm(GenericPreferencesSettingsForm):
         ompNumThreadsSpin.setToolTip('<p>The number of threads that can be used by OpenMP. "0" means use all available processors.</p>')
         self.layout.addRow("OpenMP threads", ompNumThreadsSpin)
 
+        # filter result cache
+        self.resultCacheMemory = int(self.settings.value("filtering/resultCacheMemory", 512))
+        self.logger.debug("Filter result cache memory (initial value): %d MB", self.resultCacheMemory)
+        resultCacheSpin = QtGui.QSpinBox()
+        resultCacheSpin.setMinimum(0)
+        resultCacheSpin.setMaximum(65536)
+        resultCacheSpin.setSuffix(" MB")
+        resultCacheSpin.setValue(self.resultCacheMemory)
+        resultCacheSpin.valueChanged.connect(self.resultCacheMemoryChanged)
+        resultCacheSpin.setToolTip("<p>Memory used by each filter list to cache filter results. "
+                                   "\"0\" disables the cache.</p>")
+        self.layout.addRow("Filter result cache", resultCacheSpin)
+
+        # lattice cache
+        self.latticeCacheOptions = [("Off", None), ("Next to file", "source"), ("Data directory", "data")]
+        latticeCache = str(self.settings.value("reading/latticeCache", "off"))
+        locations = [location for _, location in self.latticeCacheOptions]
+        self.latticeCacheLocation = latticeCache if latticeCache in locations else None
+        self.logger.debug("Lattice cache location (initial value): %s", self.latticeCacheLocation)
+        latticeCacheCombo = QtGui.QComboBox()
+        for text, _ in self.latticeCacheOptions:
+            latticeCacheCombo.addItem(text)
+        latticeCacheCombo.setCurrentIndex(locations.index(self.latticeCacheLocation))
+        latticeCacheCombo.currentIndexChanged.connect(self.latticeCacheChanged)
+        latticeCacheCombo.setToolTip("<p>Cache the data parsed from lattice files in a binary file, so reopening "
+                                     "an unchanged file is instant.</p>")
+        self.layout.addRow("Lattice cache", latticeCacheCombo)
+
         # disable mouse wheel
         disableMouseWheel = int(self.settings.value("mouse/disableWheel", 0))
         self.disableMouseWheel = bool(disableMouseWheel)
@@ -960,6 +1111,22 @@ class GeneralSettingsForm(GenericPreferencesSettingsForm):
         for rw in self.parent.mainWindow.rendererWindows:
             rw.vtkRenWinInteract.changeDisableMouseWheel(self.disableMouseWheel)
 
+    def resultCacheMemoryChanged(self, val):
+        """
+        Filter result cache memory changed
+
+        """
+        self.resultCacheMemory = val
+        self.settings.setValue("filtering/resultCacheMemory", val)
+
+    def latticeCacheChanged(self, index):
+        """
+        Lattice cache location changed
+
+        """
+        self.latticeCacheLocation = self.latticeCacheOptions[index][1]
+        self.settings.setValue("reading/latticeCache", self.latticeCacheLocation or "off")
+
     def ompNumThreadsChanged(self, n):
         """
         Number of OpenMP threads has been changed
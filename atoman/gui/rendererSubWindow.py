@@ -136,7 +136,15 @@ class RendererWindow(QtGui.QWidget):
         self.vtkRenWinInteract = vtkWindow.VTKWindow(self, rw=self.vtkRenWin, iren=iren)
         
         # interactor style
-        self.vtkRenWinInteract._Iren.SetInteractorStyle(vtk.vtkInteractorStyleTrackballCamera())
+        interactorStyle = vtk.vtkInteractorStyleTrackballCamera()
+        self.vtkRenWinInteract._Iren.SetInteractorStyle(interactorStyle)
+        
+        # interactive frame rate (level of detail) and frame rate measurements
+        self._interactionFrameTimes = None
+        self._stillFramePending = False
+        interactorStyle.AddObserver("StartInteractionEvent", self.interactionStarted)
+        interactorStyle.AddObserver("EndInteractionEvent", self.interactionEnded)
+        self.vtkRenWin.AddObserver("EndEvent", self.renderEnded)
         
         # disable wheel event?
         self.vtkRenWinInteract.changeDisableMouseWheel(self.mainWindow.preferences.generalForm.disableMouseWheel)
@@ -207,6 +215,46 @@ class RendererWindow(QtGui.QWidget):
         
         layout.addLayout(row)
     
+    def interactionStarted(self, obj, event):
+        """
+        Interaction with the scene started: set the frame rate to aim for
+        (actors with level of detail will draw fewer points to achieve it)
+        and start measuring the frame rate.
+        
+        """
+        frameRate = self.mainWindow.preferences.renderingForm.interactiveFrameRate
+        self.vtkRenWinInteract._Iren.SetDesiredUpdateRate(frameRate)
+        self.vtkRenWin.SetDesiredUpdateRate(frameRate)
+        self._interactionFrameTimes = []
+    
+    def renderEnded(self, obj, event):
+        """
+        A frame was rendered.
+        
+        """
+        if self._interactionFrameTimes is not None:
+            self._interactionFrameTimes.append(self.vtkRen.GetLastRenderTimeInSeconds())
+        
+        elif self._stillFramePending:
+            self._stillFramePending = False
+            self.logger.info("Full quality frame time: %.3f s", self.vtkRen.GetLastRenderTimeInSeconds())
+    
+    def interactionEnded(self, obj, event):
+        """
+        Interaction with the scene ended: log the frame rate.
+        
+        """
+        frameTimes = self._interactionFrameTimes
+        self._interactionFrameTimes = None
+        if frameTimes:
+            meanTime = sum(frameTimes) / len(frameTimes)
+            self.logger.info("Interaction frame rate: %.1f fps (%d frames, mean %.3f s, slowest %.3f s)",
+                             1.0 / meanTime if meanTime > 0 else float("inf"), len(frameTimes), meanTime,
+                             max(frameTimes))
+            
+            # the full quality frame is rendered next
+            self._stillFramePending = True
+    
     def toggleProjection(self):
         """
         Toggle projection
@@ -27,9 +27,14 @@ import getpass
 import logging
 import re
 import errno
+import shutil
+import posixpath
+import threading
+import contextlib
 
 from PySide import QtGui, QtCore
 from six.moves import range
+from six.moves import queue
 try:
     import paramiko
     logging.getLogger("paramiko").setLevel(logging.WARNING)
@@ -38,6 +43,249 @@ except ImportError:
     PARAMIKO_LOADED = False
 
 from ..visutils.utilities import iconPath
+from ..system import prefetch
+
+# regular expression for finding Roulette index
+_intRegex = re.compile(r'[0-9]+')
+
+
+################################################################################
+
+def rouletteCandidates(basename):
+    """
+    Return the Roulette index for the given file name and the paths (relative
+    to the directory of the file) where the Roulette file may be, or None and
+    an empty list if the name does not contain an index.
+
+    """
+    result = _intRegex.findall(basename)
+    if not len(result):
+        return None, []
+
+    rouletteIndex = int(result[0]) - 1
+    paths = [
+        "Roulette%d.OUT" % rouletteIndex,
+        "../Step%d/Roulette.OUT" % rouletteIndex,
+    ]
+
+    return rouletteIndex, paths
+
+
+################################################################################
+
+class SFTPChannelPool(object):
+    """
+    Pool of SFTP sessions, each on its own channel of the same SSH connection,
+    so several files can be transferred at the same time.
+
+    `openChannel` is called to open a new session when one is needed (for
+    example `ssh.open_sftp`); at most `size` sessions are opened.
+
+    """
+    def __init__(self, openChannel, size=4):
+        self.logger = logging.getLogger(__name__ + ".SFTPChannelPool")
+        self._openChannel = openChannel
+        self.size = max(1, int(size))
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._channels = []
+        self._closed = False
+
+    def acquire(self):
+        """
+        Return an idle session, opening a new one if all are busy and the pool
+        is not full (otherwise wait for one to be released).
+
+        """
+        if self._closed:
+            raise IOError("SFTP channel pool is closed")
+
+        try:
+            return self._idle.get_nowait()
+
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._closed:
+                raise IOError("SFTP channel pool is closed")
+
+            if len(self._channels) < self.size:
+                self.logger.debug("Opening SFTP channel %d of %d", len(self._channels) + 1, self.size)
+                channel = self._openChannel()
+                self._channels.append(channel)
+                return channel
+
+        return self._idle.get()
+
+    def release(self, channel):
+        """
+        Return the session to the pool
+
+        """
+        self._idle.put(channel)
+
+    @contextlib.contextmanager
+    def channel(self):
+        """
+        Context manager for using a session from the pool
+
+        """
+        channel = self.acquire()
+        try:
+            yield channel
+
+        finally:
+            self.release(channel)
+
+    def close(self):
+        """
+        Close all the sessions
+
+        """
+        with self._lock:
+            self._closed = True
+            channels = self._channels
+            self._channels = []
+            self._idle = queue.LifoQueue()
+
+        for channel in channels:
+            try:
+                channel.close()
+
+            except Exception:
+                self.logger.debug("Error closing SFTP channel", exc_info=True)
+
+
+################################################################################
+
+class SFTPSequenceTransfer(object):
+    """
+    Copies the files of a remote sequence (numbered files in one directory)
+    to a local directory.
+
+    The remote directory is listed once and all the file names (including the
+    gzip/bzip2 variants) are resolved from that listing, rather than checking
+    each possible name on the server. Files are copied over the sessions of a
+    channel pool, several at a time when fetching ahead, and the reads of each
+    file are pipelined. Compressed files are copied as they are (the reader
+    decompresses them while reading).
+
+    """
+    # compressed variants of the file names, in the order they are checked
+    extensions = ("", ".gz", ".bz2")
+
+    def __init__(self, pool, remoteDir, localDir, blockSize=32768):
+        self.logger = logging.getLogger(__name__ + ".SFTPSequenceTransfer")
+        self.pool = pool
+        self.remoteDir = remoteDir
+        self.localDir = localDir
+        self.blockSize = blockSize
+        self._names = None
+        self._listLock = threading.Lock()
+
+    def listDirectory(self, refresh=False):
+        """
+        Return the set of names in the remote directory (listed the first time)
+
+        """
+        with self._listLock:
+            if self._names is None or refresh:
+                self.logger.debug("Listing remote directory: '%s'", self.remoteDir)
+                with self.pool.channel() as sftp:
+                    self._names = set(sftp.listdir(self.remoteDir))
+
+        return self._names
+
+    def resolve(self, basename):
+        """
+        Return the name of the remote file (or of its compressed variant), or
+        None if it does not exist
+
+        """
+        names = self.listDirectory()
+        for ext in self.extensions:
+            if basename + ext in names:
+                return basename + ext
+
+        return None
+
+    def lastIndex(self, fileText, firstIndex):
+        """
+        Return the index of the last file in the sequence of consecutive files
+        starting at `firstIndex` (`firstIndex - 1` if the first does not exist)
+
+        """
+        index = firstIndex
+        while self.resolve(fileText % index) is not None:
+            index += 1
+
+        return index - 1
+
+    def fetch(self, basename):
+        """
+        Copy the given file (or its compressed variant) to the local directory
+        and return the local path. The Roulette file is copied too if one exists.
+
+        Raises IOError if the remote file does not exist.
+
+        """
+        name = self.resolve(basename)
+        if name is None:
+            raise IOError("Remote file does not exist: '%s'" % posixpath.join(self.remoteDir, basename))
+
+        remotePath = posixpath.join(self.remoteDir, name)
+        localPath = os.path.join(self.localDir, name)
+        with self.pool.channel() as sftp:
+            self.logger.debug("Copying file: '%s' to '%s'", remotePath, localPath)
+            self._copy(sftp, remotePath, localPath)
+
+            # Roulette file
+            if basename.endswith(".dat"):
+                rouletteIndex, paths = rouletteCandidates(basename)
+                for path in paths:
+                    # names in the remote directory were already listed
+                    if "/" not in path and path not in self.listDirectory():
+                        continue
+
+                    rouletteRemote = posixpath.normpath(posixpath.join(self.remoteDir, path))
+                    rouletteLocal = os.path.join(self.localDir, "Roulette%d.OUT" % rouletteIndex)
+                    try:
+                        self._copy(sftp, rouletteRemote, rouletteLocal)
+
+                    except IOError as e:
+                        if e.errno != errno.ENOENT:
+                            raise
+
+                    else:
+                        self.logger.debug("Copied Roulette file: '%s'", rouletteRemote)
+                        break
+
+        return localPath
+
+    def fetchAhead(self, basenames, depth=None):
+        """
+        Return an iterator over `(basename, localPath)` for the given files,
+        fetching up to `depth` files ahead (by default one per session in the
+        pool) in parallel. Close the iterator when finished with it.
+
+        """
+        if depth is None:
+            depth = self.pool.size
+
+        return prefetch.Prefetcher(basenames, self.fetch, depth=depth, numWorkers=self.pool.size)
+
+    def _copy(self, sftp, remotePath, localPath):
+        """
+        Copy the remote file, requesting all the blocks up front
+
+        """
+        with sftp.open(remotePath, "rb") as remote:
+            if hasattr(remote, "prefetch"):
+                remote.prefetch()
+
+            with open(localPath, "wb") as local:
+                shutil.copyfileobj(remote, local, self.blockSize)
 
 ################################################################################
 
@@ -311,8 +559,9 @@ class SFTPBrowser(QtGui.QGroupBox):
             ("All files", ["*"]),
         ]
 
-        # regular expression for finding Roulette index
-        self.intRegex = re.compile(r'[0-9]+')
+        # number of SFTP sessions used for transferring sequences
+        self.numChannels = 4
+        self.pool = None
 
         # layout
         self.layout = QtGui.QFormLayout(self)
@@ -369,18 +618,11 @@ class SFTPBrowser(QtGui.QGroupBox):
         basename = os.path.basename(fn)
         self.logger.debug("Looking for Roulette file for: '%s'", basename)
 
-        # look for integers in the name
-        result = self.intRegex.findall(basename)
-        if len(result):
-            rouletteIndex = int(result[0]) - 1
+        # look for integers in the name (possible roulette file paths)
+        rouletteIndex, roulette_paths = rouletteCandidates(basename)
+        if rouletteIndex is not None:
             self.logger.debug("Found integer in filename: %d", rouletteIndex)
 
-            # possible roulette file paths
-            roulette_paths = [
-                "Roulette%d.OUT" % rouletteIndex,
-                "../Step%d/Roulette.OUT" % rouletteIndex,
-            ]
-
             # check if one exists
             while rouletteFile is None and len(roulette_paths):
                 test = roulette_paths.pop(0)
@@ -465,11 +707,26 @@ class SFTPBrowser(QtGui.QGroupBox):
 
         """
         self.logger.debug("Closing SFTP/SSH connection")
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
         self.sftp.close()
         self.ssh.close()
 
         self.connected = False
 
+    def sequenceTransfer(self, remoteDir, localDir):
+        """
+        Return a transfer for copying the files of a sequence in the given
+        remote directory (the sessions of the pool are kept open until the
+        browser is disconnected)
+
+        """
+        if self.pool is None:
+            self.pool = SFTPChannelPool(self.ssh.open_sftp, size=self.numChannels)
+
+        return SFTPSequenceTransfer(self.pool, remoteDir, localDir)
+
     def chdir(self, dirname):
         """
         Change directory
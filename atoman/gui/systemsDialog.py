@@ -14,7 +14,6 @@ from __future__ import unicode_literals
 import os
 import logging
 import functools
-import copy
 
 from PySide import QtGui, QtCore
 import numpy as np
@@ -26,6 +25,7 @@ from . import latticeGeneratorForms
 from . import sftpDialog
 from .dialogs import infoDialogs
 from .filterList import FilterList
+from ..system.lattice import Lattice
 from six.moves import range
 
 
@@ -180,7 +180,7 @@ class SystemsListWidgetItem(QtGui.QListWidgetItem):
         self.generated = generated
         self.fromSFTP = fromSFTP
 
-        zip_exts = ('.bz2', '.gz')
+        zip_exts = ('.bz2', '.gz', '.xz', '.zst')
         root, ext = os.path.splitext(filename)
         if ext in zip_exts:
             ext = os.path.splitext(root)[1]
@@ -425,6 +425,7 @@ class SystemsDialog(QtGui.QWidget):
                 # store on lattice
                 lattice.scalarsDict[scalarName] = scalars
                 lattice.scalarsFiles[scalarName] = filename
+                lattice.modified()
 
                 self.logger.info("Added '%s' scalars to '%s'", scalarName, item.displayName)
 
@@ -521,6 +522,7 @@ class SystemsDialog(QtGui.QWidget):
                 # store on lattice
                 lattice.vectorsDict[vectorName] = vectors
                 lattice.vectorsFiles[vectorName] = filename
+                lattice.modified()
 
                 self.logger.info("Added '%s' vectors to '%s'", vectorName, item.displayName)
 
@@ -548,8 +550,9 @@ class SystemsDialog(QtGui.QWidget):
             if not len(text.strip()):
                 text = item.displayName
 
-            # then we copy and add the new system
-            newState = copy.deepcopy(item.lattice)
+            # then we copy and add the new system (the atom arrays are shared until modified)
+            newState = Lattice()
+            newState.clone(item.lattice, copyOnWrite=True)
 
             # stack indexes
             ida, idb = item.stackIndex
@@ -716,7 +719,7 @@ class SystemsDialog(QtGui.QWidget):
                 return
 
         if displayName is None:
-            zip_exts = ('.gz', '.bz2')
+            zip_exts = ('.gz', '.bz2', '.xz', '.zst')
             displayName = os.path.basename(filename)
             if os.path.splitext(displayName)[1] in zip_exts:
                 displayName = os.path.splitext(displayName)[0]
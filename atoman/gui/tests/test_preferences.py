@@ -0,0 +1,84 @@
+"""
+Unit tests for the preferences C extension
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import ctypes
+import threading
+import unittest
+
+import numpy as np
+
+from .. import _preferences
+from ...filtering import _neighbours
+
+
+# name of the capsule the kernels read the number of threads from (see preferences.h)
+NUM_THREADS_CAPSULE = b"atoman.gui._preferences._numThreads"
+
+
+def kernelNumThreads():
+    """Return the number of threads a kernel would use, read as in prefs_getNumThreads."""
+    capsuleImport = ctypes.pythonapi.PyCapsule_Import
+    capsuleImport.argtypes = [ctypes.c_char_p, ctypes.c_int]
+    capsuleImport.restype = ctypes.POINTER(ctypes.c_int)
+    
+    return capsuleImport(NUM_THREADS_CAPSULE, 0)[0]
+
+
+class TestPreferences(unittest.TestCase):
+    """
+    Test the number of OpenMP threads preference
+    
+    """
+    def setUp(self):
+        self.numThreads = _preferences.getNumThreads()
+    
+    def tearDown(self):
+        _preferences.setNumThreads(self.numThreads)
+    
+    def runInThread(self, func):
+        """Run the function in another thread and return its result."""
+        result = []
+        thread = threading.Thread(target=lambda: result.append(func()))
+        thread.start()
+        thread.join()
+        
+        return result[0]
+    
+    def test_numThreads(self):
+        """
+        Number of threads is shared between threads
+        
+        """
+        _preferences.setNumThreads(3)
+        self.assertEqual(_preferences.getNumThreads(), 3)
+        self.assertEqual(self.runInThread(_preferences.getNumThreads), 3)
+        
+        self.runInThread(lambda: _preferences.setNumThreads(2))
+        self.assertEqual(_preferences.getNumThreads(), 2)
+        
+        with self.assertRaises(ValueError):
+            _preferences.setNumThreads(0)
+    
+    def test_kernelInThread(self):
+        """
+        Kernels read the number of threads from another thread
+        
+        """
+        np.random.seed(0)
+        cellDims = np.asarray([20.0, 20.0, 20.0])
+        pos = np.random.uniform(0.0, 20.0, 3 * 500)
+        PBC = np.ones(3, np.int32)
+        
+        _preferences.setNumThreads(2)
+        self.assertEqual(self.runInThread(kernelNumThreads), 2)
+        result = self.runInThread(lambda: _neighbours.buildNeighbourList(pos, cellDims, PBC, 3.0))
+        _preferences.setNumThreads(1)
+        self.assertEqual(self.runInThread(kernelNumThreads), 1)
+        reference = _neighbours.buildNeighbourList(pos, cellDims, PBC, 3.0)
+        
+        self.assertEqual(len(result), len(reference))
+        for nebs, refNebs in zip(result, reference):
+            self.assertTrue(np.array_equal(np.asarray(nebs), np.asarray(refNebs)))
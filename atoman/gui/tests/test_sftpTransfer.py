@@ -0,0 +1,146 @@
+"""
+Unit tests for the SFTP sequence transfer (using a local stand-in for the SFTP sessions)
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import gzip
+import shutil
+import tempfile
+import threading
+import unittest
+
+from .. import sftpDialog
+
+
+class LocalSFTP(object):
+    """
+    Stand-in for an SFTP session that serves files from a local directory and
+    counts the requests made to it
+    
+    """
+    def __init__(self, root, counts):
+        self.root = root
+        self.counts = counts
+        self.closed = False
+    
+    def _count(self, name):
+        with self.counts["lock"]:
+            self.counts[name] = self.counts.get(name, 0) + 1
+    
+    def listdir(self, path):
+        self._count("listdir")
+        return os.listdir(os.path.join(self.root, path))
+    
+    def open(self, path, mode="r"):
+        self._count("open")
+        return open(os.path.join(self.root, path), mode)
+    
+    def close(self):
+        self.closed = True
+
+
+class TestSFTPSequenceTransfer(unittest.TestCase):
+    """
+    Test the SFTP sequence transfer
+    
+    """
+    def setUp(self):
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        self.remoteDir = "Step10"
+        os.makedirs(os.path.join(self.tmpLocation, "remote", self.remoteDir))
+        os.makedirs(os.path.join(self.tmpLocation, "remote", "Step2"))
+        self.localDir = os.path.join(self.tmpLocation, "local")
+        os.mkdir(self.localDir)
+        
+        # sequence of files: plain, gzipped and bzipped names
+        remote = os.path.join(self.tmpLocation, "remote", self.remoteDir)
+        for i in range(6):
+            data = ("file %d\n" % i).encode("utf-8")
+            if i == 2:
+                with gzip.open(os.path.join(remote, "PuGaH%04d.dat.gz" % i), "wb") as f:
+                    f.write(data)
+            else:
+                with open(os.path.join(remote, "PuGaH%04d.dat" % i), "wb") as f:
+                    f.write(data)
+        with open(os.path.join(remote, "Roulette3.OUT"), "w") as f:
+            f.write("roulette 3\n")
+        with open(os.path.join(self.tmpLocation, "remote", "Step2", "Roulette.OUT"), "w") as f:
+            f.write("roulette 2\n")
+        
+        self.counts = {"lock": threading.Lock()}
+        self.sessions = []
+        
+        def openChannel():
+            session = LocalSFTP(os.path.join(self.tmpLocation, "remote"), self.counts)
+            self.sessions.append(session)
+            return session
+        
+        self.pool = sftpDialog.SFTPChannelPool(openChannel, size=3)
+        self.transfer = sftpDialog.SFTPSequenceTransfer(self.pool, self.remoteDir, self.localDir)
+    
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.tmpLocation)
+    
+    def test_resolve(self):
+        """
+        SFTP transfer resolves names from one listing
+        
+        """
+        self.assertEqual(self.transfer.resolve("PuGaH0000.dat"), "PuGaH0000.dat")
+        self.assertEqual(self.transfer.resolve("PuGaH0002.dat"), "PuGaH0002.dat.gz")
+        self.assertIsNone(self.transfer.resolve("PuGaH0006.dat"))
+        self.assertEqual(self.transfer.lastIndex("PuGaH%04d.dat", 0), 5)
+        self.assertEqual(self.transfer.lastIndex("PuGaH%04d.dat", 7), 6)
+        self.assertEqual(self.counts["listdir"], 1)
+    
+    def test_fetch(self):
+        """
+        SFTP transfer fetches files and Roulette files
+        
+        """
+        localPath = self.transfer.fetch("PuGaH0004.dat")
+        self.assertEqual(localPath, os.path.join(self.localDir, "PuGaH0004.dat"))
+        with open(localPath) as f:
+            self.assertEqual(f.read(), "file 4\n")
+        with open(os.path.join(self.localDir, "Roulette3.OUT")) as f:
+            self.assertEqual(f.read(), "roulette 3\n")
+        
+        # compressed files are copied as they are; Roulette file in another directory
+        self.transfer.fetch("PuGaH0003.dat")
+        with open(os.path.join(self.localDir, "Roulette2.OUT")) as f:
+            self.assertEqual(f.read(), "roulette 2\n")
+        localPath = self.transfer.fetch("PuGaH0002.dat")
+        self.assertEqual(localPath, os.path.join(self.localDir, "PuGaH0002.dat.gz"))
+        with gzip.open(localPath) as f:
+            self.assertEqual(f.read(), b"file 2\n")
+        
+        with self.assertRaises(IOError):
+            self.transfer.fetch("PuGaH0007.dat")
+    
+    def test_fetchAhead(self):
+        """
+        SFTP transfer fetches ahead in parallel, in order
+        
+        """
+        basenames = ["PuGaH%04d.dat" % i for i in range(6)]
+        fetcher = self.transfer.fetchAhead(basenames)
+        try:
+            for i, (basename, localPath) in enumerate(fetcher):
+                self.assertEqual(basename, basenames[i])
+                with (gzip.open(localPath) if localPath.endswith(".gz") else open(localPath, "rb")) as f:
+                    self.assertEqual(f.read(), ("file %d\n" % i).encode("utf-8"))
+        
+        finally:
+            fetcher.close()
+        
+        # no more sessions than the size of the pool
+        self.assertLessEqual(len(self.sessions), self.pool.size)
+        self.assertEqual(self.counts["listdir"], 1)
+        
+        self.pool.close()
+        self.assertTrue(all(session.closed for session in self.sessions))
+        with self.assertRaises(IOError):
+            self.pool.acquire()
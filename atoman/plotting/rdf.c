@@ -262,13 +262,13 @@ computeHistogram(int NAtoms, int NVisible, int *visibleAtoms, double *pos, int *
                 int k;
                 int checkBox = boxNebList[j];
                 
-                for (k = 0; k < boxes->boxNAtoms[checkBox]; k++)
+                for (k = boxes->boxStart[checkBox]; k < boxes->boxStart[checkBox + 1]; k++)
                 {
                     int visIndex, index2, ind23;
                     double sep2;
                     
                     /* the index of this atom in the visibleAtoms array */
-                    visIndex = boxes->boxAtoms[checkBox][k];
+                    visIndex = boxes->boxAtoms[k];
                     
                     /* skip if this atom is not in the second selection */
                     if (!sel2[visIndex]) continue;
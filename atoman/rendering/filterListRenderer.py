@@ -49,6 +49,10 @@ class FilterListRenderer(object):
         
         # dictionaries for storing current actors
         self._renderersDict = {}
+        self._previousRenderers = {}
+        self._lut = None
+        self._lutSettings = None
+        self._lodSettings = None
         self._traceCoords = np.empty((0, 3), dtype=np.float64)
         self._traceVectors = np.empty((0, 3), dtype=np.float64)
         self._traceScalars = np.empty(0, dtype=np.float64)
@@ -96,6 +100,9 @@ class FilterListRenderer(object):
         inputState = self._filterer.inputState
         visibleAtoms = self._filterer.visibleAtoms
         
+        # level of detail settings (rendering preferences)
+        self._lodSettings = self._filterList.mainWindow.preferences.renderingForm
+        
         # set resolution
         numForRes = len(visibleAtoms) + len(self._filterer.interstitials) + len(self._filterer.onAntisites)
         resolution = utils.setRes(numForRes, self.displayOptions)
@@ -113,8 +120,12 @@ class FilterListRenderer(object):
         # get the scalars array
         scalarsArray = self._getScalarsArray(inputState, visibleAtoms)
         
-        # make the look up table
-        lut = utils.setupLUT(inputState.specieList, inputState.specieRGB, self.colouringOptions)
+        # make the look up table (reused if the colouring has not changed)
+        lutSettings = utils.lutSettings(inputState.specieList, inputState.specieRGB, self.colouringOptions)
+        if self._lut is None or lutSettings != self._lutSettings:
+            self._lut = utils.setupLUT(inputState.specieList, inputState.specieRGB, self.colouringOptions)
+            self._lutSettings = lutSettings
+        lut = self._lut
         
         # render atoms
         self._renderAtoms(atomPoints, scalarsArray, radiusArray, lut, resolution)
@@ -146,6 +157,9 @@ class FilterListRenderer(object):
         # scalar bar
         self._createScalarBar(lut)
         
+        # release any previous renderers that were not reused
+        self._previousRenderers = {}
+        
         # refresh actors options
         self.actorsOptions.refresh(self.getActorsDict())
     
@@ -479,10 +493,14 @@ class FilterListRenderer(object):
         # scalars
         scalars = self._getScalarsArray(inputState, atomList)
         
-        # render
-        rend = atomRenderer.AtomRenderer()
-        rend.render(points, scalars, radius, len(inputState.specieList), self.colouringOptions,
-                    self.displayOptions.atomScaleFactor, lut, resolution)
+        # render (updating the previous frame in place if possible)
+        args = (points, scalars, radius, len(inputState.specieList), self.colouringOptions,
+                self.displayOptions.atomScaleFactor, lut, resolution)
+        rend = self._previousRenderers.get(actorName)
+        if rend is None or not rend.update(*args, glyphMode=self.displayOptions.atomGlyphMode,
+                                           lodSettings=self._lodSettings):
+            rend = atomRenderer.AtomRenderer()
+            rend.render(*args, glyphMode=self.displayOptions.atomGlyphMode, lodSettings=self._lodSettings)
         self._renderersDict[actorName] = rend
     
     def _renderBonds(self, scalarsArray, lut):
@@ -568,7 +586,8 @@ class FilterListRenderer(object):
         
         # draw bonds
         bondRend = bondRenderer.BondRenderer()
-        bondRend.render(bondCoords, bondVectors, bondScalars, NSpecies, self.colouringOptions, self.bondsOptions, lut)
+        bondRend.render(bondCoords, bondVectors, bondScalars, NSpecies, self.colouringOptions, self.bondsOptions, lut,
+                        lodSettings=self._lodSettings)
         self._renderersDict["Bonds"] = bondRend
     
     def _renderClusters(self):
@@ -602,9 +621,15 @@ class FilterListRenderer(object):
         self._logger.debug("Rendering atoms")
         
         inputState = self._filterer.inputState
-        atomRend = atomRenderer.AtomRenderer()
-        atomRend.render(atomPoints, scalarsArray, radiusArray, len(inputState.specieList), self.colouringOptions,
-                        self.displayOptions.atomScaleFactor, lut, resolution)
+        args = (atomPoints, scalarsArray, radiusArray, len(inputState.specieList), self.colouringOptions,
+                self.displayOptions.atomScaleFactor, lut, resolution)
+        
+        # update the previous frame in place if possible (sequencer)
+        atomRend = self._previousRenderers.get("Atoms")
+        if atomRend is None or not atomRend.update(*args, glyphMode=self.displayOptions.atomGlyphMode,
+                                                   lodSettings=self._lodSettings):
+            atomRend = atomRenderer.AtomRenderer()
+            atomRend.render(*args, glyphMode=self.displayOptions.atomGlyphMode, lodSettings=self._lodSettings)
         self._renderersDict["Atoms"] = atomRend
     
     def _renderVectors(self, atomPoints, scalarsArray, lut):
@@ -626,10 +651,13 @@ class FilterListRenderer(object):
                 vectors = vectorslib.normalise(vectors)
             vectors = utils.NumpyVTKData(vectors, name="vectors")
             
-            # render vectors
-            vectorRend = vectorRenderer.VectorRenderer()
-            vectorRend.render(atomPoints, scalarsArray, vectors, len(inputState.specieList), self.colouringOptions,
-                              self.vectorsOptions, lut)
+            # render vectors (updating the previous frame in place if possible)
+            args = (atomPoints, scalarsArray, vectors, len(inputState.specieList), self.colouringOptions,
+                    self.vectorsOptions, lut)
+            vectorRend = self._previousRenderers.get("Vectors")
+            if vectorRend is None or not vectorRend.update(*args, lodSettings=self._lodSettings):
+                vectorRend = vectorRenderer.VectorRenderer()
+                vectorRend.render(*args, lodSettings=self._lodSettings)
             self._renderersDict["Vectors"] = vectorRend
     
     def _getScalarsArray(self, lattice, atomList):
@@ -682,6 +710,9 @@ class FilterListRenderer(object):
         """
         self.hideActors()
         
+        # when running the sequencer keep the renderers so that the next frame
+        # can update their pipelines in place instead of rebuilding them
+        self._previousRenderers = self._renderersDict if sequencer else {}
         self._renderersDict = {}
         if not sequencer:
             self._traceCoords = np.empty((0, 3), dtype=np.float64)
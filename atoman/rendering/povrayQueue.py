@@ -0,0 +1,230 @@
+"""
+Queue for running POV-Ray jobs in parallel.
+
+Each job renders its own scene/INI file. Up to `numProcesses` POV-Ray
+processes run at once (by default one per core) and jobs are finished in the
+order they complete, so the caller can carry on preparing the next frames
+(filtering, writing scene files) while earlier frames are being raytraced.
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import time
+import logging
+import subprocess
+import collections
+import multiprocessing
+
+
+class PovrayJob(object):
+    """
+    A POV-Ray job: the INI file to render (relative to `workingDirectory`)
+    and the function to call when it has finished.
+    
+    `callback` is called with the job when it completes; `status` is then
+    the exit status of POV-Ray (or None if it could not be run) and `output`
+    contains what it wrote to stdout/stderr.
+    
+    `tempFiles` are the files created for the job (scene, INI, output image,
+    ...; relative to `workingDirectory`). Any that still exist are removed
+    when the job has completed (after the callback) or is cancelled.
+    
+    """
+    def __init__(self, workingDirectory, iniFile, callback=None, name=None, tempFiles=None):
+        self.workingDirectory = workingDirectory
+        self.iniFile = iniFile
+        self.callback = callback
+        self.name = name if name is not None else iniFile
+        self.tempFiles = list(tempFiles) if tempFiles is not None else []
+        self.status = None
+        self.output = ""
+        self.renderTime = None
+        
+        # log file for the output of POV-Ray
+        self.logFile = os.path.join(workingDirectory, os.path.splitext(os.path.basename(iniFile))[0] + ".log")
+        
+        self._process = None
+        self._logHandle = None
+        self._startTime = None
+
+
+class PovrayRenderQueue(object):
+    """
+    Run POV-Ray jobs using a bounded pool of processes.
+    
+    Jobs are added with `submit` and started as processes become free. Call
+    `poll` regularly (eg. between frames) to start queued jobs and finish the
+    completed ones, and `wait` to finish all of them. At most `maxPending`
+    jobs can be queued or running; `submit` waits for one to complete if
+    there are more.
+    
+    """
+    def __init__(self, povray, numProcesses=None, maxPending=None, processEvents=None):
+        self._logger = logging.getLogger(__name__)
+        
+        self.povray = povray
+        self.numProcesses = max(1, numProcesses if numProcesses else multiprocessing.cpu_count())
+        self.maxPending = max(self.numProcesses, maxPending if maxPending else 2 * self.numProcesses)
+        
+        # called while waiting for jobs (eg. to keep the GUI responsive)
+        self._processEvents = processEvents
+        
+        self._queued = collections.deque()
+        self._running = []
+        self.numCompleted = 0
+        self.numFailed = 0
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.wait()
+        else:
+            self.cancel()
+    
+    def __len__(self):
+        """Return the number of jobs that are queued or running."""
+        return len(self._queued) + len(self._running)
+    
+    def submit(self, job):
+        """
+        Add a job to the queue, first waiting for a job to complete if the
+        queue is full.
+        
+        """
+        while len(self) >= self.maxPending:
+            if not self._waitForJob():
+                break
+        
+        self._queued.append(job)
+        self._logger.debug("Queued POV-Ray job: '%s' (%d pending)", job.name, len(self))
+        self.poll()
+    
+    def poll(self):
+        """
+        Finish the jobs that have completed and start queued jobs on free
+        processes. Returns the jobs that were finished.
+        
+        """
+        finished = []
+        for job in list(self._running):
+            if job._process.poll() is not None:
+                self._running.remove(job)
+                self._finishJob(job)
+                finished.append(job)
+        
+        while self._queued and len(self._running) < self.numProcesses:
+            self._startJob(self._queued.popleft())
+        
+        return finished
+    
+    def wait(self, cancelled=None):
+        """
+        Wait for all jobs to complete. If `cancelled` is given it is called
+        while waiting and the remaining jobs are cancelled if it returns True.
+        Returns False if the jobs were cancelled.
+        
+        """
+        while len(self):
+            if cancelled is not None and cancelled():
+                self.cancel()
+                return False
+            
+            self._waitForJob()
+        
+        return True
+    
+    def cancel(self):
+        """Cancel queued jobs and kill running ones, removing their temporary files."""
+        if len(self):
+            self._logger.debug("Cancelling %d POV-Ray jobs", len(self))
+        
+        for job in self._queued:
+            self._removeTempFiles(job)
+        self._queued.clear()
+        for job in self._running:
+            try:
+                job._process.kill()
+            except OSError:
+                pass
+            job._process.wait()
+            job._logHandle.close()
+            os.unlink(job.logFile)
+            self._removeTempFiles(job)
+        self._running = []
+    
+    def threadsPerProcess(self):
+        """Return the number of threads each POV-Ray process should use so the cores are not oversubscribed."""
+        return max(1, multiprocessing.cpu_count() // self.numProcesses)
+    
+    def _waitForJob(self):
+        """Wait until a job completes; returns False if there are no jobs."""
+        if not len(self):
+            return False
+        
+        numCompleted = self.numCompleted
+        self.poll()
+        while self.numCompleted == numCompleted and len(self):
+            if self._processEvents is not None:
+                self._processEvents()
+            time.sleep(0.05)
+            self.poll()
+        
+        return True
+    
+    def _startJob(self, job):
+        """Start a POV-Ray process for the job."""
+        self._logger.debug("Starting POV-Ray job: '%s'", job.name)
+        job._logHandle = open(job.logFile, "w")
+        job._startTime = time.time()
+        try:
+            job._process = subprocess.Popen([self.povray, job.iniFile], cwd=job.workingDirectory,
+                                            stdout=job._logHandle, stderr=subprocess.STDOUT)
+        
+        except OSError as error:
+            job._logHandle.close()
+            os.unlink(job.logFile)
+            job.output = str(error)
+            self._logger.error("Could not run POV-Ray ('%s'): %s", self.povray, error)
+            self._complete(job)
+        
+        else:
+            self._running.append(job)
+    
+    def _finishJob(self, job):
+        """Collect the result of a completed job."""
+        job.status = job._process.returncode
+        job.renderTime = time.time() - job._startTime
+        job._logHandle.close()
+        with open(job.logFile) as fh:
+            job.output = fh.read()
+        os.unlink(job.logFile)
+        
+        self._logger.debug("POV-Ray job finished: '%s' (status %d, %f s)", job.name, job.status, job.renderTime)
+        self._complete(job)
+    
+    def _complete(self, job):
+        """Count the job and call its callback."""
+        self.numCompleted += 1
+        if job.status != 0:
+            self.numFailed += 1
+            self._logger.error("POV-Ray failed (%s): %s", job.name, job.output)
+        
+        try:
+            if job.callback is not None:
+                job.callback(job)
+        
+        finally:
+            self._removeTempFiles(job)
+    
+    def _removeTempFiles(self, job):
+        """Remove the temporary files of the job that still exist."""
+        for fn in job.tempFiles:
+            path = os.path.join(job.workingDirectory, fn)
+            try:
+                if os.path.exists(path):
+                    os.unlink(path)
+            except OSError as error:
+                self._logger.warning("Could not remove POV-Ray file '%s': %s", path, error)
@@ -23,6 +23,7 @@ from PySide import QtGui, QtCore
 from ..visutils import utilities
 from . import cell
 from . import axes
+from . import povrayQueue
 from six.moves import range
 
 
@@ -49,6 +50,9 @@ class Renderer(object):
         # axes
         self.axes = axes.Axes(self.renWinInteract)
         
+        # counter for naming POV-Ray jobs (see queuePovrayImage)
+        self._povrayJobCount = 0
+        
 #         self.distanceWidget = vtk.vtkDistanceWidget()
 #         self.distanceWidget.SetInteractor(self.renWinInteract)
 #         self.distanceWidget.CreateDefaultRepresentation()
@@ -255,6 +259,18 @@ class Renderer(object):
         progDialog.show()
         QtGui.QApplication.processEvents()
         
+        # POV-Ray images are rendered in parallel while the camera is rotated
+        renderQueue = None
+        if renderType == "POV":
+            renderQueue = povrayQueue.PovrayRenderQueue(povray, numProcesses=self.mainWindow.preferences.povrayForm.numJobs,
+                                                        processEvents=QtGui.QApplication.processEvents)
+        povrayFailed = []
+        
+        def povrayFinished(filename):
+            """A queued POV-Ray image has been rendered."""
+            if filename is None:
+                povrayFailed.append(True)
+        
         # main loop
         try:
             status = 0
@@ -268,9 +284,13 @@ class Renderer(object):
                     break
                 
                 # save image
-                savedFile = self.saveImage(renderType, imageFormat, fileprefixFull, overwrite, povray=povray)
+                if renderQueue is not None:
+                    savedFile = self.queuePovrayImage(renderQueue, imageFormat, fileprefixFull, overwrite,
+                                                      callback=povrayFinished)
+                else:
+                    savedFile = self.saveImage(renderType, imageFormat, fileprefixFull, overwrite, povray=povray)
                 
-                if savedFile is None:
+                if savedFile is None or povrayFailed:
                     status = 1
                     break
                 
@@ -298,8 +318,20 @@ class Renderer(object):
                     break
                 
                 self.reinit()
+            
+            # wait for the queued POV-Ray images
+            if renderQueue is not None and not status:
+                progDialog.setLabelText("Waiting for POV-Ray...")
+                if not renderQueue.wait(cancelled=progDialog.wasCanceled):
+                    status = 2
+                elif povrayFailed:
+                    status = 1
         
         finally:
+            # kill any POV-Ray jobs that are still running (cancelled or failed)
+            if renderQueue is not None:
+                renderQueue.cancel()
+            
             # close progress dialog
             progDialog.close()
         
@@ -350,53 +382,16 @@ class Renderer(object):
         elif renderType == "POV":
             self.logger.debug("Rendering using POV-Ray")
 
-            # which renderer and pipeline
-            renIndex = self.parent.rendererIndex
-            pipelineIndex = self.parent.currentPipelineIndex
-            
-            self.logger.debug("Renderer %d; Pipeline %d", renIndex, pipelineIndex)
-            
-            # header file
-            povfile = os.path.join(self.mainWindow.tmpDirectory, "renderer%d.pov" % renIndex)
-            self.logger.debug("Povray file: '%s'", povfile)
-            with open(povfile, "w") as fh:
-                # first write the header (camera info etc.)
-                self.writePOVRAYHeader(fh)
-                
-                # write cell frame if visible
-                if self.latticeFrame.visible:
-                    self.writePOVRAYCellFrame(fh)
-                
-                # TODO: write axes if visible
-            
-            # write povray files for active renderers
-            self.logger.debug("Writing renderer povray data")
-            filterLists = self.parent.getFilterLists()
-            for flist in filterLists:
-                if flist.visible:
-                    for rend in flist.renderer.renderers():
-                        rend.writePovray(povfile)
+            # write the scene and INI files
+            povfile, povIniFile, tmpPovOutputFile = self.writePovrayScene(imageFormat)
             
             # POV-Ray settings
             settings = self.mainWindow.preferences.povrayForm
             overlay = settings.overlayImage
             
-            # then join filter list files
             _cwd = os.getcwd()
             os.chdir(self.mainWindow.tmpDirectory)
             try:
-                # create povray ini file
-                povIniFile = "renderer%d_image.ini" % renIndex
-                tmpPovOutputFile = "renderer%d_image.%s" % (renIndex, imageFormat)
-                with open(povIniFile, "w") as fh:
-                    fh.write("; Atoman auto-generated POV-Ray INI file\n")
-                    fh.write("Input_File_Name='%s'\n" % os.path.basename(povfile))
-                    fh.write("Width=%d\n" % settings.HRes)
-                    fh.write("Height=%d\n" % settings.VRes)
-                    fh.write("Display=off\n")
-                    fh.write("Antialias=on\n")
-                    fh.write("Output_File_Name='%s'\n" % tmpPovOutputFile)
-                
                 # run povray
                 command = "%s '%s'" % (povray, povIniFile)
                 resultQ = six.moves.queue.Queue()
@@ -424,12 +419,7 @@ class Renderer(object):
                 os.chdir(_cwd)
             
             # output filename
-            filename = "%s.%s" % (fileprefix, imageFormat)
-            if not overwrite:
-                count = 0
-                while os.path.exists(filename):
-                    count += 1
-                    filename = "%s(%d).%s" % (fileprefix, count, imageFormat)
+            filename = self.imageFilename(fileprefix, imageFormat, overwrite)
             
             # rename tmp image file to where it should be
             try:
@@ -450,6 +440,130 @@ class Renderer(object):
         
         return filename
     
+    def imageFilename(self, fileprefix, imageFormat, overwrite):
+        """
+        Return the name of the image file to save (if not overwriting, a
+        number is added to the prefix if the file already exists).
+        
+        """
+        filename = "%s.%s" % (fileprefix, imageFormat)
+        if not overwrite:
+            count = 0
+            while os.path.exists(filename):
+                count += 1
+                filename = "%s(%d).%s" % (fileprefix, count, imageFormat)
+        
+        return filename
+    
+    def writePovrayScene(self, imageFormat, jobName="", threads=None):
+        """
+        Write the POV-Ray scene file for the current view and the INI file for
+        rendering it to the temporary directory. `jobName` is added to the
+        file names so that several scenes can be written at once.
+        
+        Returns the scene file and the names of the INI file and of the image
+        it renders (relative to the temporary directory).
+        
+        """
+        # which renderer and pipeline
+        renIndex = self.parent.rendererIndex
+        pipelineIndex = self.parent.currentPipelineIndex
+        
+        self.logger.debug("Renderer %d; Pipeline %d", renIndex, pipelineIndex)
+        
+        # header file
+        povfile = os.path.join(self.mainWindow.tmpDirectory, "renderer%d%s.pov" % (renIndex, jobName))
+        self.logger.debug("Povray file: '%s'", povfile)
+        with open(povfile, "w") as fh:
+            # first write the header (camera info etc.)
+            self.writePOVRAYHeader(fh)
+            
+            # write cell frame if visible
+            if self.latticeFrame.visible:
+                self.writePOVRAYCellFrame(fh)
+            
+            # TODO: write axes if visible
+        
+        # write povray files for active renderers
+        self.logger.debug("Writing renderer povray data")
+        filterLists = self.parent.getFilterLists()
+        for flist in filterLists:
+            if flist.visible:
+                for rend in flist.renderer.renderers():
+                    rend.writePovray(povfile)
+        
+        # POV-Ray settings
+        settings = self.mainWindow.preferences.povrayForm
+        
+        # create povray ini file
+        povIniFile = "renderer%d%s_image.ini" % (renIndex, jobName)
+        tmpPovOutputFile = "renderer%d%s_image.%s" % (renIndex, jobName, imageFormat)
+        with open(os.path.join(self.mainWindow.tmpDirectory, povIniFile), "w") as fh:
+            fh.write("; Atoman auto-generated POV-Ray INI file\n")
+            fh.write("Input_File_Name='%s'\n" % os.path.basename(povfile))
+            fh.write("Width=%d\n" % settings.HRes)
+            fh.write("Height=%d\n" % settings.VRes)
+            fh.write("Display=off\n")
+            fh.write("Antialias=on\n")
+            fh.write("Output_File_Name='%s'\n" % tmpPovOutputFile)
+            if threads is not None:
+                fh.write("Work_Threads=%d\n" % threads)
+        
+        return povfile, povIniFile, tmpPovOutputFile
+    
+    def queuePovrayImage(self, renderQueue, imageFormat, fileprefix, overwrite, callback=None):
+        """
+        Write the POV-Ray scene for the current view and add a job to render it
+        to the render queue (see `povrayQueue.PovrayRenderQueue`). Returns the
+        name of the image file without waiting for it to be rendered.
+        
+        When the job completes the image is moved into place and the on screen
+        info (captured now) is overlaid, then `callback` is called with the
+        name of the image file (or None if it failed). The temporary scene,
+        INI, output and overlay files are removed by the queue when the job
+        completes, fails or is cancelled.
+        
+        """
+        self._povrayJobCount += 1
+        jobName = "_job%d" % self._povrayJobCount
+        tmpDirectory = self.mainWindow.tmpDirectory
+        
+        # write the scene and INI files
+        povfile, povIniFile, tmpPovOutputFile = self.writePovrayScene(imageFormat, jobName=jobName,
+                                                                      threads=renderQueue.threadsPerProcess())
+        
+        # the overlay has to be captured now, the view will have changed when the job completes
+        overlayFile = None
+        if self.mainWindow.preferences.povrayForm.overlayImage:
+            overlayFile = self.saveOverlayImage(name=jobName)
+        
+        # output filename
+        filename = self.imageFilename(fileprefix, imageFormat, overwrite)
+        
+        def finished(job):
+            """Move the rendered image into place and overlay the on screen info."""
+            result = None
+            try:
+                if job.status == 0:
+                    shutil.move(os.path.join(tmpDirectory, tmpPovOutputFile), filename)
+                    if overlayFile is not None:
+                        self.applyOverlayImage(filename, overlayFile)
+                    result = filename
+            
+            except (IOError, OSError) as error:
+                self.logger.error("Could not save POV-Ray image '%s': %s", filename, error)
+            
+            if callback is not None:
+                callback(result)
+        
+        tempFiles = [povfile, povIniFile, tmpPovOutputFile]
+        if overlayFile is not None:
+            tempFiles.append(overlayFile)
+        renderQueue.submit(povrayQueue.PovrayJob(tmpDirectory, povIniFile, callback=finished,
+                                                 name=os.path.basename(filename), tempFiles=tempFiles))
+        
+        return filename
+    
     def overlayImage(self, filename):
         """
         Overlay the image with on screen info.
@@ -457,6 +571,20 @@ class Renderer(object):
         """
         overlayTime = time.time()
         
+        overlayFile = self.saveOverlayImage()
+        if overlayFile is not None:
+            self.applyOverlayImage(filename, overlayFile)
+        
+        overlayTime = time.time() - overlayTime
+        self.logger.debug("Overlay time: %f s", overlayTime)
+    
+    def saveOverlayImage(self, name=""):
+        """
+        Save an image containing only the on screen info (text, scalar bar),
+        for overlaying onto a POV-Ray image. Returns the file name, or None if
+        it could not be saved.
+        
+        """
         # local refs
         ren = self.ren
         renWinInteract = self.renWinInteract
@@ -483,92 +611,11 @@ class Renderer(object):
         
         try:
             # save image
-            overlayFilePrefix = os.path.join(self.mainWindow.tmpDirectory, "renderer%d_overlay" % renIndex)
+            overlayFilePrefix = os.path.join(self.mainWindow.tmpDirectory, "renderer%d%s_overlay" % (renIndex, name))
             overlayFile = self.saveImage("VTK", "jpg", overlayFilePrefix, False)
-            if not os.path.exists(overlayFile):
+            if overlayFile is None or not os.path.exists(overlayFile):
                 print("WARNING: overlay file does not exist: %s" % overlayFile)
-                return
-            
-            try:
-                # open POV-Ray image
-                povim = Image.open(filename)
-                modified = False
-                
-                # find text in top left corner
-                im = Image.open(overlayFile)
-                
-                # start point
-                xmin = ymin = 0
-                xmax = int(im.size[0] * 0.5)
-                ymax = int(im.size[1] * 0.8)
-                
-                # find extremes
-                xmin, xmax, ymin, ymax = self.findOverlayExtremes(im, xmin, xmax, ymin, ymax)
-                
-                # crop
-                region = im.crop((xmin, ymin, xmax + 2, ymax + 2))
-                
-                # add to povray image
-                if region.size[0] != 0:
-                    region = region.resize((region.size[0], region.size[1]), Image.ANTIALIAS)
-                    povim.paste(region, (0, 0))
-                    modified = True
-                
-                # now look for anything at the bottom => scalar bar
-                im = Image.open(overlayFile)
-                
-                # start point
-                xmin = 0
-                ymin = im.size[1] - 80
-                xmax = im.size[0]
-                ymax = im.size[1]
-                
-                # find extremes
-                xmin, xmax, ymin, ymax = self.findOverlayExtremes(im, xmin, xmax, ymin, ymax)
-                
-                # crop
-                region = im.crop((xmin, ymin, xmax, ymax))
-                
-                # add?
-                if region.size[0] != 0:
-                    newregiondimx = int(povim.size[0] * 0.8)
-                    dx = (float(povim.size[0]) * 0.8 - float(region.size[0])) / float(region.size[0])
-                    newregiondimy = region.size[1] + int(region.size[1] * dx)
-                    region = region.resize((newregiondimx, newregiondimy), Image.ANTIALIAS)
-                    
-                    xpos = int((povim.size[0] - region.size[0]) / 2.0)
-                    povim.paste(region, (xpos, int(povim.size[1] - region.size[1])))
-                    
-                    modified = True
-                
-                # now look for text in top right corner
-                im = Image.open(overlayFile)
-                
-                # start point
-                xmin = int(im.size[0] * 0.5)
-                ymin = 0
-                xmax = im.size[0]
-                ymax = int(im.size[1] * 0.6)
-                
-                # find extremes
-                xmin, xmax, ymin, ymax = self.findOverlayExtremes(im, xmin, xmax, ymin, ymax)
-                
-                # crop
-                region = im.crop((xmin - 2, ymin, xmax, ymax + 2))
-                
-                if region.size[0] != 0:
-                    region = region.resize((region.size[0], region.size[1]), Image.ANTIALIAS)
-                    xpos = povim.size[0] - 220
-                    povim.paste(region, (xpos, 0))
-                    
-                    modified = True
-                
-                # save image
-                if modified:
-                    povim.save(filename)
-            
-            finally:
-                os.unlink(overlayFile)
+                return None
         
         finally:
             # return to original cam pos
@@ -579,9 +626,95 @@ class Renderer(object):
             if axesHidden:
                 self.toggleAxes()
         
-        overlayTime = time.time() - overlayTime
-        self.logger.debug("Overlay time: %f s", overlayTime)
+        return overlayFile
+    
+    def applyOverlayImage(self, filename, overlayFile):
+        """
+        Paste the on screen info from the overlay image (see
+        `saveOverlayImage`) onto the image, then remove the overlay image.
+        
+        """
+        try:
+            # open POV-Ray image
+            povim = Image.open(filename)
+            modified = False
+            
+            # find text in top left corner
+            im = Image.open(overlayFile)
+            
+            # start point
+            xmin = ymin = 0
+            xmax = int(im.size[0] * 0.5)
+            ymax = int(im.size[1] * 0.8)
+            
+            # find extremes
+            xmin, xmax, ymin, ymax = self.findOverlayExtremes(im, xmin, xmax, ymin, ymax)
+            
+            # crop
+            region = im.crop((xmin, ymin, xmax + 2, ymax + 2))
+            
+            # add to povray image
+            if region.size[0] != 0:
+                region = region.resize((region.size[0], region.size[1]), Image.ANTIALIAS)
+                povim.paste(region, (0, 0))
+                modified = True
+            
+            # now look for anything at the bottom => scalar bar
+            im = Image.open(overlayFile)
+            
+            # start point
+            xmin = 0
+            ymin = im.size[1] - 80
+            xmax = im.size[0]
+            ymax = im.size[1]
+            
+            # find extremes
+            xmin, xmax, ymin, ymax = self.findOverlayExtremes(im, xmin, xmax, ymin, ymax)
+            
+            # crop
+            region = im.crop((xmin, ymin, xmax, ymax))
+            
+            # add?
+            if region.size[0] != 0:
+                newregiondimx = int(povim.size[0] * 0.8)
+                dx = (float(povim.size[0]) * 0.8 - float(region.size[0])) / float(region.size[0])
+                newregiondimy = region.size[1] + int(region.size[1] * dx)
+                region = region.resize((newregiondimx, newregiondimy), Image.ANTIALIAS)
+                
+                xpos = int((povim.size[0] - region.size[0]) / 2.0)
+                povim.paste(region, (xpos, int(povim.size[1] - region.size[1])))
+                
+                modified = True
+            
+            # now look for text in top right corner
+            im = Image.open(overlayFile)
+            
+            # start point
+            xmin = int(im.size[0] * 0.5)
+            ymin = 0
+            xmax = im.size[0]
+            ymax = int(im.size[1] * 0.6)
+            
+            # find extremes
+            xmin, xmax, ymin, ymax = self.findOverlayExtremes(im, xmin, xmax, ymin, ymax)
+            
+            # crop
+            region = im.crop((xmin - 2, ymin, xmax, ymax + 2))
+            
+            if region.size[0] != 0:
+                region = region.resize((region.size[0], region.size[1]), Image.ANTIALIAS)
+                xpos = povim.size[0] - 220
+                povim.paste(region, (xpos, 0))
+                
+                modified = True
+            
+            # save image
+            if modified:
+                povim.save(filename)
         
+        finally:
+            os.unlink(overlayFile)
+    
     def findOverlayExtremes(self, im, i0, i1, j0, j1):
         """
         Find extremes of non-white area.
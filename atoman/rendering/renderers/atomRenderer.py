@@ -14,23 +14,58 @@ from . import povrayWriters
 from .. import utils
 
 
+# how the atoms are drawn:
+#   "geometry": a sphere mesh is generated for every atom (vtkGlyph3D)
+#   "instanced": one sphere mesh is drawn at every atom (vtkGlyph3DMapper)
+#   "sprites": every atom is drawn as a shaded sphere impostor (vtkPointGaussianMapper)
+GLYPH_MODES = ("geometry", "instanced", "sprites")
+
+# fragment shader for drawing the sprites as spheres
+_SPHERE_SPLAT_SHADER = """
+//VTK::Color::Impl
+float dist = dot(offsetVCVSOutput.xy, offsetVCVSOutput.xy);
+if (dist > 1.0) {
+  discard;
+} else {
+  float scale = (1.0 - dist);
+  ambientColor *= scale;
+  diffuseColor *= scale;
+}
+"""
+
+
 class AtomRenderer(baseRenderer.BaseRenderer):
     """
     Render a set of atoms.
     
     """
+    # set to False if the sprites mapper could not be created (see _supportedGlyphMode)
+    _spritesSupported = True
+    
     def __init__(self, shape="sphere"):
         super(AtomRenderer, self).__init__()
         self._logger = logging.getLogger(__name__)
         self._shape = shape
     
     def render(self, pointsData, scalarsArray, radiusArray, nspecies, colouringOptions, atomScaleFactor, lut,
-               resolution):
+               resolution, glyphMode="geometry", lodSettings=None):
         """
         Render the given atoms.
         
+        `glyphMode` is one of `GLYPH_MODES`; "instanced" and "sprites" do not
+        generate a mesh per atom, so use much less memory for large systems.
+        
+        If level of detail rendering is enabled in `lodSettings` (see
+        `utils.useLOD`) a random subset of the atoms is drawn with low
+        resolution spheres while the scene is being manipulated.
+        
         """
-        self._logger.debug("Rendering atoms: shape is '%s', colour by: '%s'", self._shape, colouringOptions.colourBy)
+        if glyphMode not in GLYPH_MODES:
+            raise ValueError("Unrecognised glyph mode: '%s'" % glyphMode)
+        glyphMode = self._supportedGlyphMode(glyphMode)
+        
+        self._logger.debug("Rendering atoms: shape is '%s', colour by: '%s', glyph mode: '%s'", self._shape,
+                           colouringOptions.colourBy, glyphMode)
         
         # points
         atomPoints = vtk.vtkPoints()
@@ -42,12 +77,113 @@ class AtomRenderer(baseRenderer.BaseRenderer):
         atomsPolyData.GetPointData().AddArray(scalarsArray.getVTK())
         atomsPolyData.GetPointData().SetScalars(radiusArray.getVTK())
         
-        # glyph source
-        atomsGlyphSource = vtk.vtkSphereSource()  # TODO: depends on self._shape
-        atomsGlyphSource.SetPhiResolution(resolution)
-        atomsGlyphSource.SetThetaResolution(resolution)
-        atomsGlyphSource.SetRadius(1.0)
+        # mapper
+        atomsMapper = None
+        if glyphMode == "sprites":
+            try:
+                atomsMapper = self._spritesMapper(atomsPolyData, atomScaleFactor)
+            except (AttributeError, TypeError) as err:
+                self._logger.warning("Could not create the sprites mapper (%s); using instanced glyphs", err)
+                AtomRenderer._spritesSupported = False
+                glyphMode = "instanced"
+        
+        if atomsMapper is None:
+            # glyph source
+            atomsGlyphSource = vtk.vtkSphereSource()  # TODO: depends on self._shape
+            atomsGlyphSource.SetPhiResolution(resolution)
+            atomsGlyphSource.SetThetaResolution(resolution)
+            atomsGlyphSource.SetRadius(1.0)
+            
+            if glyphMode == "instanced":
+                atomsMapper = self._instancedMapper(atomsPolyData, atomsGlyphSource, atomScaleFactor)
+            else:
+                atomsMapper = self._geometryMapper(atomsPolyData, atomsGlyphSource, atomScaleFactor)
+        
+        mappers = [atomsMapper]
+        
+        # low detail mapper for interaction
+        numAtoms = atomsPolyData.GetNumberOfPoints()
+        lodPoints = lodSettings.lodCloudPoints if utils.useLOD(numAtoms, lodSettings) else 0
+        if lodPoints:
+            mappers.append(self._lodMapper(atomsPolyData, glyphMode, atomScaleFactor, lodPoints))
+        
+        for mapper in mappers:
+            mapper.SetLookupTable(lut)
+            mapper.SetScalarModeToUsePointFieldData()
+            mapper.SelectColorArray("colours")
+            utils.setMapperScalarRange(mapper, colouringOptions, nspecies)
+        
+        # actor
+        atomsActor = utils.makeLODActor(atomsMapper, numAtoms, lodSettings)
+        if lodPoints:
+            atomsActor.AddLODMapper(mappers[1])
+        atomsActor.GetProperty().SetSpecular(0.4)
+        atomsActor.GetProperty().SetSpecularPower(50)
+        
+        # store attributes
+        self._actor = utils.ActorObject(atomsActor)
+        self._polyData = atomsPolyData
+        self._mappers = mappers
+        self._settings = (nspecies, atomScaleFactor, resolution, glyphMode, lodPoints)
+        self._data["Points"] = pointsData
+        self._data["Scalars"] = scalarsArray
+        self._data["Radius"] = radiusArray
+        self._data["LUT"] = lut
+        self._data["Scale factor"] = atomScaleFactor
+        self._data["Glyph mode"] = glyphMode
+    
+    def update(self, pointsData, scalarsArray, radiusArray, nspecies, colouringOptions, atomScaleFactor, lut,
+               resolution, glyphMode="geometry", lodSettings=None):
+        """
+        Update the atoms in place, keeping the existing VTK pipeline and actor.
+        
+        This is only possible if the atoms were rendered with the same settings
+        and look up table and the number of atoms has not changed. Returns
+        False (without changing anything) if not, in which case `render` must
+        be called instead.
+        
+        """
+        if self._actor is None or lut is not self._data["LUT"]:
+            return False
+        glyphMode = self._supportedGlyphMode(glyphMode)
+        numAtoms = len(pointsData.getNumpy())
+        if numAtoms != len(self._data["Points"].getNumpy()):
+            return False
+        lodPoints = lodSettings.lodCloudPoints if utils.useLOD(numAtoms, lodSettings) else 0
+        if (nspecies, atomScaleFactor, resolution, glyphMode, lodPoints) != self._settings:
+            return False
+        
+        self._logger.debug("Updating atoms in place")
+        
+        # swap the arrays (replaces the arrays with the same names)
+        self._polyData.GetPoints().SetData(pointsData.getVTK())
+        pointData = self._polyData.GetPointData()
+        pointData.AddArray(scalarsArray.getVTK())
+        pointData.SetScalars(radiusArray.getVTK())
+        self._polyData.Modified()
         
+        for mapper in self._mappers:
+            utils.setMapperScalarRange(mapper, colouringOptions, nspecies)
+        
+        # store attributes
+        self._data["Points"] = pointsData
+        self._data["Scalars"] = scalarsArray
+        self._data["Radius"] = radiusArray
+        
+        return True
+    
+    def _supportedGlyphMode(self, glyphMode):
+        """Return the glyph mode to use: instanced glyphs if sprites are not supported by VTK."""
+        if glyphMode == "sprites" and not (AtomRenderer._spritesSupported and hasattr(vtk, "vtkPointGaussianMapper")):
+            if AtomRenderer._spritesSupported:
+                self._logger.warning("Sprites are not supported by this version of VTK; using instanced glyphs")
+                AtomRenderer._spritesSupported = False
+            glyphMode = "instanced"
+        
+        return glyphMode
+    
+    def _geometryMapper(self, atomsPolyData, atomsGlyphSource, atomScaleFactor):
+        """Return a mapper for a mesh containing a sphere for every atom."""
         # glyph
         atomsGlyph = vtk.vtkGlyph3D()
         if vtk.vtkVersion.GetVTKMajorVersion() <= 5:
@@ -59,44 +195,67 @@ class AtomRenderer(baseRenderer.BaseRenderer):
         atomsGlyph.SetScaleFactor(atomScaleFactor)
         atomsGlyph.SetScaleModeToScaleByScalar()
         atomsGlyph.ClampingOff()
-          
+        
         # mapper
         atomsMapper = vtk.vtkPolyDataMapper()
         atomsMapper.SetInputConnection(atomsGlyph.GetOutputPort())
-        atomsMapper.SetLookupTable(lut)
-        atomsMapper.SetScalarModeToUsePointFieldData()
-        atomsMapper.SelectColorArray("colours")
-        utils.setMapperScalarRange(atomsMapper, colouringOptions, nspecies)
-        
-        # glyph mapper
-        # glyphMapper = vtk.vtkGlyph3DMapper()
-        # if vtk.vtkVersion.GetVTKMajorVersion() <= 5:
-        #     glyphMapper.SetInputConnection(atomsPolyData.GetProducerPort())
-        # else:
-        #     glyphMapper.SetInputData(atomsPolyData)
-        # glyphMapper.SetSourceConnection(atomsGlyphSource.GetOutputPort())
-        # glyphMapper.SetScaleFactor(displayOptions.atomScaleFactor)
-        # glyphMapper.SetScaleModeToScaleByMagnitude()
-        # glyphMapper.ClampingOff()
-        # glyphMapper.SetLookupTable(lut)
-        # glyphMapper.SetScalarModeToUsePointFieldData()
-        # glyphMapper.SelectColorArray("colours")
-        # setMapperScalarRange(glyphMapper, colouringOptions, NSpecies)
-        # atomsMapper = glyphMapper
         
-        # actor
-        atomsActor = vtk.vtkActor()
-        atomsActor.SetMapper(atomsMapper)
-        atomsActor.GetProperty().SetSpecular(0.4)
-        atomsActor.GetProperty().SetSpecularPower(50)
+        return atomsMapper
+    
+    def _instancedMapper(self, atomsPolyData, atomsGlyphSource, atomScaleFactor):
+        """Return a mapper that draws the same sphere at every atom."""
+        glyphMapper = vtk.vtkGlyph3DMapper()
+        if vtk.vtkVersion.GetVTKMajorVersion() <= 5:
+            glyphMapper.SetInputConnection(atomsPolyData.GetProducerPort())
+        else:
+            glyphMapper.SetInputData(atomsPolyData)
+        glyphMapper.SetSourceConnection(atomsGlyphSource.GetOutputPort())
+        glyphMapper.SetScaleArray("radius")
+        glyphMapper.SetScaleFactor(atomScaleFactor)
+        glyphMapper.SetScaleModeToScaleByMagnitude()
+        glyphMapper.ClampingOff()
         
-        # store attributes
-        self._actor = utils.ActorObject(atomsActor)
-        self._data["Points"] = pointsData
-        self._data["Scalars"] = scalarsArray
-        self._data["Radius"] = radiusArray
-        self._data["LUT"] = lut
-        self._data["Scale factor"] = atomScaleFactor
+        return glyphMapper
+    
+    def _spritesMapper(self, atomsPolyData, atomScaleFactor):
+        """Return a mapper that draws a sphere impostor at every atom."""
+        spritesMapper = vtk.vtkPointGaussianMapper()
+        spritesMapper.SetInputData(atomsPolyData)
+        spritesMapper.SetScaleArray("radius")
+        spritesMapper.SetScaleFactor(atomScaleFactor)
+        spritesMapper.SetSplatShaderCode(_SPHERE_SPLAT_SHADER)
+        # the shader discards fragments outside the sphere, so the splats do not
+        # need to be larger than the atom (the triangle scale was removed in VTK 9)
+        if hasattr(spritesMapper, "SetTriangleScale"):
+            spritesMapper.SetTriangleScale(1.0)
+        spritesMapper.EmissiveOff()
+        
+        return spritesMapper
+    
+    def _lodMapper(self, atomsPolyData, glyphMode, atomScaleFactor, lodPoints):
+        """Return a mapper that draws a random subset of the atoms with low resolution spheres."""
+        # decimate the points
+        maskPoints = vtk.vtkMaskPoints()
+        if vtk.vtkVersion.GetVTKMajorVersion() <= 5:
+            maskPoints.SetInput(atomsPolyData)
+        else:
+            maskPoints.SetInputData(atomsPolyData)
+        maskPoints.SetOnRatio(max(1, atomsPolyData.GetNumberOfPoints() // lodPoints))
+        maskPoints.SetMaximumNumberOfPoints(lodPoints)
+        maskPoints.RandomModeOn()
+        
+        # sprites are already cheap to draw; otherwise use a coarse sphere
+        if glyphMode == "sprites":
+            lodMapper = self._spritesMapper(atomsPolyData, atomScaleFactor)
+        else:
+            lodGlyphSource = vtk.vtkSphereSource()
+            lodGlyphSource.SetPhiResolution(4)
+            lodGlyphSource.SetThetaResolution(4)
+            lodGlyphSource.SetRadius(1.0)
+            lodMapper = self._instancedMapper(atomsPolyData, lodGlyphSource, atomScaleFactor)
+        lodMapper.SetInputConnection(maskPoints.GetOutputPort())
+        
+        return lodMapper
     
     def writePovray(self, filename):
         """Write atoms to POV-Ray file."""
@@ -41,10 +41,14 @@ class BondRenderer(baseRenderer.BaseRenderer):
         super(BondRenderer, self).__init__()
         self._logger = logging.getLogger(__name__ + ".BondRenderer")
     
-    def render(self, bondCoords, bondVectors, bondScalars, numSpecies, colouringOptions, bondsOptions, lut):
+    def render(self, bondCoords, bondVectors, bondScalars, numSpecies, colouringOptions, bondsOptions, lut,
+               lodSettings=None):
         """
         Render the given bonds.
         
+        Level of detail rendering is used if enabled in `lodSettings` (see
+        `utils.useLOD`).
+        
         """
         self._logger.debug("Rendering bonds")
         
@@ -92,8 +96,7 @@ class BondRenderer(baseRenderer.BaseRenderer):
         utils.setMapperScalarRange(mapper, colouringOptions, numSpecies)
         
         # actor
-        actor = vtk.vtkActor()
-        actor.SetMapper(mapper)
+        actor = utils.makeLODActor(mapper, bondPolyData.GetNumberOfPoints(), lodSettings)
         actor.GetProperty().SetOpacity(1)
         actor.GetProperty().SetLineWidth(bondThicknessVTK)
         
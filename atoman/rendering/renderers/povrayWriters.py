@@ -2,6 +2,11 @@
 """
 Classes for writing POV-Ray files from renderers.
 
+The atoms, bonds, vectors, vacancies and antisites writers do not loop over
+the points in Python: the colours of all the points are looked up at once from
+a NumPy copy of the look up table (`lookupColours`) and the text is formatted
+a large chunk of points at a time (`writeRows`).
+
 """
 from __future__ import absolute_import
 from __future__ import unicode_literals
@@ -15,11 +20,56 @@ import six
 from six.moves import range
 
 
+# number of points formatted and written at a time
+WRITE_CHUNK_SIZE = 10000
+
+
+def lookupColours(lut, scalars):
+    """
+    Return the RGB colours (N x 3 array) of the given scalars from the VTK
+    look up table, as `lut.GetColor` would for each one.
+    
+    The table values are copied to a NumPy array once and indexed for all of
+    the scalars together.
+    
+    """
+    numColours = lut.GetNumberOfTableValues()
+    table = np.asarray([lut.GetTableValue(i)[:3] for i in range(numColours)], dtype=np.float64)
+    
+    # linear mapping of the table range onto the table values (clamped)
+    scalars = np.asarray(scalars, dtype=np.float64)
+    minVal, maxVal = lut.GetTableRange()
+    if maxVal > minVal:
+        indexes = np.floor((scalars - minVal) * (numColours / (maxVal - minVal)))
+        indexes = np.clip(indexes, 0, numColours - 1).astype(np.intp)
+    else:
+        indexes = np.zeros(len(scalars), dtype=np.intp)
+    
+    return table[indexes]
+
+
+def writeRows(fh, fmt, data, chunkSize=WRITE_CHUNK_SIZE):
+    """
+    Write one record per row of the 2D array `data` to the file handle, where
+    `fmt` is the format string of one record (including the new line). A
+    chunk of rows is formatted with a single string operation and written at
+    once.
+    
+    """
+    for start in range(0, len(data), chunkSize):
+        chunk = data[start:start + chunkSize]
+        fh.write((fmt * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
 class PovrayAtomsWriter(object):
     """
     Write POV-Ray atoms to file.
     
     """
+    # one atom: position, radius, colour
+    _format = ("sphere { <%f,%f,%f>, %f pigment { color rgb <%f,%f,%f> } "
+               "finish { ambient 0.250000 phong 0.900000 } }\n")
+    
     def write(self, filename, pointsArray, scalarsArray, radiusArray, scaleFactor, lut, mode="a"):
         """Write to POV-Ray file."""
         # numpy arrays of data
@@ -27,24 +77,16 @@ class PovrayAtomsWriter(object):
         scalars = scalarsArray.getNumpy()
         radii = radiusArray.getNumpy()
         
-        # array for holding rgb
-        rgb = np.empty(3, np.float64)
+        # rows of values to write
+        data = np.empty((len(points), 7), np.float64)
+        data[:, 0] = -points[:, 0]
+        data[:, 1:3] = points[:, 1:3]
+        data[:, 3] = radii * scaleFactor
+        data[:, 4:7] = lookupColours(lut, scalars)
         
-        # open file to write
-        # TODO: write in C to improve performance
+        # write to file
         with open(filename, mode) as fh:
-            # loop over visible atoms
-            for i in range(len(points)):
-                # colour for povray atom
-                lut.GetColor(scalars[i], rgb)
-                
-                # atom line
-                line = "sphere { <%f,%f,%f>, %f " % (-points[i][0], points[i][1], points[i][2], radii[i] * scaleFactor)
-                line += "pigment { color rgb <%f,%f,%f> } " % (rgb[0], rgb[1], rgb[2])
-                line += "finish { ambient %f phong %f } }\n" % (0.25, 0.9)
-                
-                # povray atom
-                fh.write(line)
+            writeRows(fh, self._format, data)
 
 
 class PovrayBondsWriter(object):
@@ -59,31 +101,85 @@ class PovrayBondsWriter(object):
         scalars = scalarsArray.getNumpy()
         vectors = vectorsArray.getNumpy()
         
-        # array for holding rgb
-        rgb = np.empty(3, np.float64)
-        
         # TODO: make these options
         phong = 0.9
         metallic = ""
         transparency = 0.0
         
-        # open file to write
-        # TODO: write in C to improve performance
+        # one bond: end points, thickness, colour
+        fmt = ("cylinder { <%f,%f,%f>,<%f,%f,%f>, %f\n"
+               "           pigment { color rgbt <%f,%f,%f,%f> }\n"
+               "           finish { phong " + "%f" % phong + " " + metallic + " } }\n")
+        
+        # rows of values to write
+        data = np.empty((len(points), 11), np.float64)
+        data[:, 0:3] = points
+        data[:, 3:6] = points + vectors
+        data[:, 0] *= -1
+        data[:, 3] *= -1
+        data[:, 6] = bondThickness
+        data[:, 7:10] = lookupColours(lut, scalars)
+        data[:, 10] = transparency
+        
+        # write to file
         with open(filename, mode) as fh:
-            # loop over visible atoms
-            for i in range(len(points)):
-                # colour for povray bond
-                lut.GetColor(scalars[i], rgb)
-                
-                # end point positions
-                posa = points[i]
-                posb = posa + vectors[i]
-                
-                # write to file
-                fh.write("cylinder { <%f,%f,%f>,<%f,%f,%f>, %f\n" % (-posa[0], posa[1], posa[2], -posb[0], posb[1],
-                                                                     posb[2], bondThickness))
-                fh.write("           pigment { color rgbt <%f,%f,%f,%f> }\n" % (rgb[0], rgb[1], rgb[2], transparency))
-                fh.write("           finish { phong %f %s } }\n" % (phong, metallic))
+            writeRows(fh, fmt, data)
+
+
+class PovrayVectorsWriter(object):
+    """
+    Write POV-Ray vectors (arrows) to file.
+    
+    The arrows have the proportions of the VTK arrow source that is used to
+    render them.
+    
+    """
+    # arrow proportions (relative to the length of the arrow)
+    tipLength = 0.35
+    tipRadius = 0.1
+    shaftRadius = 0.03
+    
+    # one arrow: shaft start and end, shaft radius, tip base, tip radius, tip, colour
+    _format = ("union { cylinder { <%f,%f,%f>,<%f,%f,%f>, %f } cone { <%f,%f,%f>, %f, <%f,%f,%f>, 0 }\n"
+               "        pigment { color rgb <%f,%f,%f> } finish { ambient 0.250000 phong 0.900000 } }\n")
+    
+    def write(self, filename, pointsArray, vectorsArray, scalarsArray, scaleFactor, lut, invert=False, mode="a"):
+        """Write to POV-Ray file."""
+        # numpy arrays of data
+        points = pointsArray.getNumpy()
+        scalars = scalarsArray.getNumpy()
+        vectors = vectorsArray.getNumpy() * scaleFactor
+        
+        # skip zero length vectors (they would be degenerate objects)
+        lengths = np.sqrt(np.sum(vectors * vectors, axis=1))
+        mask = lengths > 0
+        points = points[mask]
+        vectors = vectors[mask]
+        lengths = lengths[mask]
+        
+        # the base and tip of the arrows (inverted arrows point back to the point)
+        if invert:
+            base = points + vectors
+            tip = points
+        else:
+            base = points
+            tip = points + vectors
+        tipBase = tip - (tip - base) * self.tipLength
+        
+        # rows of values to write
+        data = np.empty((len(points), 17), np.float64)
+        data[:, 0:3] = base
+        data[:, 3:6] = tipBase
+        data[:, 6] = lengths * self.shaftRadius
+        data[:, 7:10] = tipBase
+        data[:, 10] = lengths * self.tipRadius
+        data[:, 11:14] = tip
+        data[:, [0, 3, 7, 11]] *= -1
+        data[:, 14:17] = lookupColours(lut, scalars[mask])
+        
+        # write to file
+        with open(filename, mode) as fh:
+            writeRows(fh, self._format, data)
 
 
 class PovrayClustersWriter(object):
@@ -178,6 +274,10 @@ class PovrayVacanciesWriter(object):
     Write vacancies to povray file.
     
     """
+    # one vacancy: box corners, colour and transparency
+    _format = ("box { <%f,%f,%f>,<%f,%f,%f> pigment { color rgbt <%f,%f,%f,%f> } "
+               "finish {diffuse 0.400000 ambient 0.250000 phong 0.900000 } }\n")
+    
     def write(self, filename, pointsArray, scalarsArray, radiusArray, scaleFactor, lut, vacancyOpacity, mode="a"):
         """Write vacancies to povray file."""
         # numpy arrays of data
@@ -185,34 +285,28 @@ class PovrayVacanciesWriter(object):
         scalars = scalarsArray.getNumpy()
         radii = radiusArray.getNumpy()
         
-        # array for holding rgb
-        rgb = np.empty(3, np.float64)
+        # position and radius
+        pos = points * np.asarray([-1.0, 1.0, 1.0])
+        rad = (radii * scaleFactor)[:, np.newaxis]
         
-        # transparency
-        transparency = 1.0 - vacancyOpacity
+        # rows of values to write
+        data = np.empty((len(points), 10), np.float64)
+        data[:, 0:3] = pos + rad * np.asarray([1.0, -1.0, -1.0])
+        data[:, 3:6] = pos + rad * np.asarray([-1.0, 1.0, 1.0])
+        data[:, 6:9] = lookupColours(lut, scalars)
+        data[:, 9] = 1.0 - vacancyOpacity
         
-        # open file to write
-        # TODO: write in C to improve performance
+        # write to file
         with open(filename, mode) as fh:
-            # loop over visible atoms
-            for i in range(len(points)):
-                # colour for povray vacancy
-                lut.GetColor(scalars[i], rgb)
-                
-                # position and radius
-                atompos = points[i]
-                rx = -1 * atompos[0]
-                ry = atompos[1]
-                rz = atompos[2]
-                rad = radii[i] * scaleFactor
-                
-                # atom line
-                line = "box { <%f,%f,%f>,<%f,%f,%f> " % (rx + rad, ry - rad, rz - rad, rx - rad, ry + rad, rz + rad)
-                line += "pigment { color rgbt <%lf,%lf,%lf,%lf> } " % (rgb[0], rgb[1], rgb[2], transparency)
-                line += "finish {diffuse %lf ambient %lf phong %lf } }\n" % (0.4, 0.25, 0.9)
-                
-                # write to file
-                fh.write(line)
+            writeRows(fh, self._format, data)
+
+
+# spheres at the corners and cylinders along the edges of an antisite frame (indexes
+# into the opposite corners of the frame: [a0, a1, a2, b0, b1, b2])
+_ANTISITE_SPHERES = ((0, 1, 2), (3, 1, 2), (0, 1, 5), (3, 1, 5), (0, 4, 2), (3, 4, 2), (0, 4, 5), (3, 4, 5))
+_ANTISITE_CYLINDERS = ((0, 1, 2, 3, 1, 2), (0, 1, 5, 3, 1, 5), (0, 4, 2, 3, 4, 2), (0, 4, 5, 3, 4, 5),
+                       (0, 1, 2, 0, 4, 2), (0, 1, 5, 0, 4, 5), (3, 1, 2, 3, 4, 2), (3, 1, 5, 3, 4, 5),
+                       (0, 1, 2, 0, 1, 5), (0, 4, 2, 0, 4, 5), (3, 1, 2, 3, 1, 5), (3, 4, 2, 3, 4, 5))
 
 
 class PovrayAntisitesWriter(object):
@@ -220,6 +314,18 @@ class PovrayAntisitesWriter(object):
     Write antisites to povray file.
     
     """
+    # one antisite: a frame of spheres and cylinders around the site
+    _format = ("#declare R = 0.1;\n"
+               "#declare cellObject = union {\n" +
+               "  sphere { <%f,%f,%f>, R }\n" * len(_ANTISITE_SPHERES) +
+               "  cylinder { <%s,%s,%s>,<%s,%s,%s>, R }\n" * len(_ANTISITE_CYLINDERS) +
+               "  texture { pigment { color rgb <%f,%f,%f> }\n"
+               "            finish { diffuse 0.9 phong 1 } } }\n"
+               "object{cellObject}\n")
+    
+    # columns of [a0, a1, a2, b0, b1, b2, r, g, b] in the order they appear in the format
+    _columns = list(sum(_ANTISITE_SPHERES, ()) + sum(_ANTISITE_CYLINDERS, ()) + (6, 7, 8))
+    
     def write(self, filename, pointsArray, scalarsArray, radiusArray, scaleFactor, lut, mode="a"):
         """Write antisites to povray file."""
         # numpy arrays of data
@@ -227,50 +333,18 @@ class PovrayAntisitesWriter(object):
         scalars = scalarsArray.getNumpy()
         radii = radiusArray.getNumpy()
         
-        # array for holding rgb
-        rgb = np.empty(3, np.float64)
+        # opposite corners of the frame and colour
+        rad = (radii * scaleFactor)[:, np.newaxis]
+        values = np.empty((len(points), 9), np.float64)
+        values[:, 0:3] = points - rad
+        values[:, 3:6] = points + rad
+        values[:, 0] *= -1
+        values[:, 3] *= -1
+        values[:, 6:9] = lookupColours(lut, scalars)
         
-        # open file to write
-        # TODO: write in C to improve performance
+        # write to file
         with open(filename, mode) as fh:
-            # loop over visible atoms
-            for i in range(len(points)):
-                # colour for povray vacancy
-                lut.GetColor(scalars[i], rgb)
-                
-                # position and radius
-                atompos = points[i]
-                rad = radii[i] * scaleFactor
-                a = atompos - rad
-                b = atompos + rad
-                a[0] *= -1
-                b[0] *= -1
-                
-                fh.write("#declare R = 0.1;\n")
-                fh.write("#declare cellObject = union {\n")
-                fh.write("  sphere { <%f,%f,%f>, R }\n" % (a[0], a[1], a[2]))
-                fh.write("  sphere { <%f,%f,%f>, R }\n" % (b[0], a[1], a[2]))
-                fh.write("  sphere { <%f,%f,%f>, R }\n" % (a[0], a[1], b[2]))
-                fh.write("  sphere { <%f,%f,%f>, R }\n" % (b[0], a[1], b[2]))
-                fh.write("  sphere { <%f,%f,%f>, R }\n" % (a[0], b[1], a[2]))
-                fh.write("  sphere { <%f,%f,%f>, R }\n" % (b[0], b[1], a[2]))
-                fh.write("  sphere { <%f,%f,%f>, R }\n" % (a[0], b[1], b[2]))
-                fh.write("  sphere { <%f,%f,%f>, R }\n" % (b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{0},{1},{2}>,<{3},{1},{2}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{0},{1},{5}>,<{3},{1},{5}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{0},{4},{2}>,<{3},{4},{2}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{0},{4},{5}>,<{3},{4},{5}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{0},{1},{2}>,<{0},{4},{2}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{0},{1},{5}>,<{0},{4},{5}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{3},{1},{2}>,<{3},{4},{2}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{3},{1},{5}>,<{3},{4},{5}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{0},{1},{2}>,<{0},{1},{5}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{0},{4},{2}>,<{0},{4},{5}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{3},{1},{2}>,<{3},{1},{5}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  cylinder {{ <{3},{4},{2}>,<{3},{4},{5}>, R }}\n".format(a[0], a[1], a[2], b[0], b[1], b[2]))
-                fh.write("  texture { pigment { color rgb <%f,%f,%f> }\n" % (rgb[0], rgb[1], rgb[2]))
-                fh.write("            finish { diffuse 0.9 phong 1 } } }\n")
-                fh.write("object{cellObject}\n")
+            writeRows(fh, self._format, values[:, self._columns])
 
 
 class PovrayVoronoiWriter(object):
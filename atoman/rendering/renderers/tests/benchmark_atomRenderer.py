@@ -0,0 +1,176 @@
+"""
+Benchmark of the atom renderer glyph modes
+
+Renders random atoms offscreen with each of the glyph modes (see
+`atomRenderer.GLYPH_MODES`) and reports the time to build the actor, the time
+to draw the first frame (which includes generating the glyphs), the time to
+draw another frame and the resident memory afterwards. Each case is run in a
+separate process so the memory of one does not affect the next; a case that
+fails (for example runs out of memory) is reported as failed.
+
+Software rendering (Mesa) is requested by setting LIBGL_ALWAYS_SOFTWARE=1 in the
+environment of the child processes.
+
+Run with:
+
+    python -m atoman.rendering.renderers.tests.benchmark_atomRenderer [NAtoms ...] [--resolution RES]
+
+(the default is 1M and 10M atoms with sphere resolution 8)
+
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+import os
+import sys
+import json
+import time
+import resource
+import subprocess
+
+import numpy as np
+
+
+def residentMemory():
+    """Return the current and peak resident memory of this process (MB)."""
+    current = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024.0
+                    break
+    except IOError:
+        pass
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024.0
+    peak /= 1024.0
+    
+    return current, peak
+
+
+class DummyColouringOpts(object):
+    """Colouring options (colour by species)."""
+    def __init__(self):
+        self.colourBy = "Species"
+        self.heightAxis = 1
+        self.minVal = 0.0
+        self.maxVal = 1.0
+        self.solidColourRGB = (1.0, 0.0, 0.0)
+        self.scalarBarText = "Height in Y (A)"
+
+
+def runCase(glyphMode, NAtoms, resolution):
+    """Render the atoms with the given glyph mode and return the timings and memory."""
+    import vtk
+    from .. import atomRenderer
+    from ... import utils
+    
+    # random atoms (two species) at roughly solid density
+    np.random.seed(42)
+    cellDim = (NAtoms / 0.08) ** (1.0 / 3.0)
+    points = np.random.uniform(0, cellDim, size=(NAtoms, 3))
+    scalars = np.random.randint(0, 2, size=NAtoms).astype(np.float64)
+    radii = np.where(scalars == 0, 1.2, 0.8)
+    
+    pointsData = utils.NumpyVTKData(points)
+    radiusArray = utils.NumpyVTKData(radii, name="radius")
+    scalarsArray = utils.NumpyVTKData(scalars, name="colours")
+    
+    lut = vtk.vtkLookupTable()
+    lut.SetNumberOfColors(2)
+    lut.SetNumberOfTableValues(2)
+    lut.SetTableRange(0, 1)
+    lut.SetRange(0, 1)
+    lut.SetTableValue(0, 1, 0, 0, 1.0)
+    lut.SetTableValue(1, 0, 0, 1, 1.0)
+    baseMemory = residentMemory()[0]
+    
+    # build the actor
+    t0 = time.time()
+    renderer = atomRenderer.AtomRenderer()
+    renderer.render(pointsData, scalarsArray, radiusArray, 2, DummyColouringOpts(), 1.0, lut, resolution,
+                    glyphMode=glyphMode)
+    buildTime = time.time() - t0
+    
+    # offscreen render window
+    ren = vtk.vtkRenderer()
+    ren.AddActor(renderer.getActor().actor)
+    renWin = vtk.vtkRenderWindow()
+    renWin.SetOffScreenRendering(1)
+    renWin.SetSize(800, 600)
+    renWin.AddRenderer(ren)
+    ren.ResetCamera()
+    
+    t0 = time.time()
+    renWin.Render()
+    firstFrameTime = time.time() - t0
+    
+    ren.GetActiveCamera().Azimuth(10)
+    t0 = time.time()
+    renWin.Render()
+    frameTime = time.time() - t0
+    
+    memory, peakMemory = residentMemory()
+    
+    return {
+        "build": buildTime,
+        "first frame": firstFrameTime,
+        "frame": frameTime,
+        "memory": memory - baseMemory if memory is not None and baseMemory is not None else None,
+        "peak memory": peakMemory,
+    }
+
+
+def runChild(glyphMode, NAtoms, resolution):
+    """Run a case in a child process and return its result (None if it failed)."""
+    env = dict(os.environ)
+    env["LIBGL_ALWAYS_SOFTWARE"] = "1"
+    command = [sys.executable, "-m", "atoman.rendering.renderers.tests.benchmark_atomRenderer", "--child", glyphMode,
+               str(NAtoms), str(resolution)]
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    stdout, stderr = proc.communicate()
+    if proc.returncode:
+        lines = stderr.decode("utf-8", "replace").strip().splitlines()
+        return None, lines[-1] if len(lines) else "exit status %d" % proc.returncode
+    
+    return json.loads(stdout.decode("utf-8").strip().splitlines()[-1]), None
+
+
+def main(NAtomsList, resolution):
+    from .. import atomRenderer
+    
+    print("Sphere resolution %d" % resolution)
+    print("%10s %10s %10s %12s %10s %12s %12s" % ("atoms", "mode", "build (s)", "1st frame (s)", "frame (s)",
+                                                    "memory (MB)", "peak (MB)"))
+    for NAtoms in NAtomsList:
+        for glyphMode in atomRenderer.GLYPH_MODES:
+            result, error = runChild(glyphMode, NAtoms, resolution)
+            if result is None:
+                print("%10d %10s   failed: %s" % (NAtoms, glyphMode, error))
+                continue
+            
+            memory = "%12.1f" % result["memory"] if result["memory"] is not None else "%12s" % "-"
+            print("%10d %10s %10.3f %12.3f %10.3f %s %12.1f" % (NAtoms, glyphMode, result["build"],
+                                                                   result["first frame"], result["frame"], memory,
+                                                                   result["peak memory"]))
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(runCase(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))))
+    
+    else:
+        args = sys.argv[1:]
+        resolution = 8
+        if "--resolution" in args:
+            index = args.index("--resolution")
+            resolution = int(args[index + 1])
+            del args[index:index + 2]
+        
+        NAtomsList = [int(float(arg)) for arg in args] if len(args) else [1000000, 10000000]
+        main(NAtomsList, resolution)
@@ -0,0 +1,89 @@
+"""
+Benchmark of the POV-Ray writers
+
+Writes random atoms, bonds, vectors, vacancies and antisites with each of the
+POV-Ray writers and reports the time taken, the number of objects written per
+second and the size and write rate of the file.
+
+Run with:
+
+    python -m atoman.rendering.renderers.tests.benchmark_povrayWriters [NAtoms ...]
+
+(the default is 100k and 2M atoms)
+
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+import vtk
+
+from .. import povrayWriters
+from ... import utils
+
+
+def makeLUT():
+    """Return a two colour look up table."""
+    lut = vtk.vtkLookupTable()
+    lut.SetNumberOfColors(2)
+    lut.SetNumberOfTableValues(2)
+    lut.SetTableRange(0, 1)
+    lut.SetRange(0, 1)
+    lut.SetTableValue(0, 1, 0, 0, 1.0)
+    lut.SetTableValue(1, 0, 0, 1, 1.0)
+    
+    return lut
+
+
+def makeCases(NAtoms):
+    """Return the writers to benchmark and their arguments."""
+    np.random.seed(42)
+    cellDim = (NAtoms / 0.08) ** (1.0 / 3.0)
+    points = utils.NumpyVTKData(np.random.uniform(0, cellDim, size=(NAtoms, 3)))
+    scalars = utils.NumpyVTKData(np.random.randint(0, 2, size=NAtoms).astype(np.float64), name="colours")
+    radii = utils.NumpyVTKData(np.where(scalars.getNumpy() == 0, 1.2, 0.8), name="radius")
+    vectors = utils.NumpyVTKData(np.random.uniform(-1, 1, size=(NAtoms, 3)), name="vectors")
+    lut = makeLUT()
+    
+    return [
+        ("atoms", povrayWriters.PovrayAtomsWriter(), (points, scalars, radii, 1.0, lut)),
+        ("bonds", povrayWriters.PovrayBondsWriter(), (points, vectors, scalars, lut, 0.2)),
+        ("vectors", povrayWriters.PovrayVectorsWriter(), (points, vectors, scalars, 1.0, lut)),
+        ("vacancies", povrayWriters.PovrayVacanciesWriter(), (points, scalars, radii, 1.0, lut, 0.8)),
+        ("antisites", povrayWriters.PovrayAntisitesWriter(), (points, scalars, radii, 1.0, lut)),
+    ]
+
+
+def main(NAtomsList):
+    tmpDirectory = tempfile.mkdtemp(prefix="atomanBenchmark")
+    try:
+        filename = os.path.join(tmpDirectory, "benchmark.pov")
+        print("%10s %10s %10s %14s %10s %10s" % ("objects", "writer", "time (s)", "objects/s", "size (MB)", "MB/s"))
+        for NAtoms in NAtomsList:
+            for name, writer, args in makeCases(NAtoms):
+                if os.path.exists(filename):
+                    os.unlink(filename)
+                
+                t0 = time.time()
+                writer.write(filename, *args)
+                writeTime = time.time() - t0
+                
+                size = os.path.getsize(filename) / 1024.0 / 1024.0
+                print("%10d %10s %10.3f %14.0f %10.1f %10.1f" % (NAtoms, name, writeTime, NAtoms / writeTime, size,
+                                                                 size / writeTime))
+                sys.stdout.flush()
+    
+    finally:
+        shutil.rmtree(tmpDirectory)
+
+
+if __name__ == "__main__":
+    NAtomsList = [int(float(arg)) for arg in sys.argv[1:]] if len(sys.argv) > 1 else [100000, 2000000]
+    main(NAtomsList)
@@ -90,3 +90,111 @@ class TestAtomRenderer(unittest.TestCase):
         
         # check result is correct type
         self.assertIsInstance(renderer.getActor(), utils.ActorObject)
+    
+    def test_atomRendererGlyphModes(self):
+        """
+        Atom renderer glyph modes
+        
+        """
+        colouringOptions = DummyColouringOpts()
+        for glyphMode in atomRenderer.GLYPH_MODES:
+            renderer = atomRenderer.AtomRenderer()
+            renderer.render(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies, colouringOptions,
+                            1, self.lut, 10, glyphMode=glyphMode)
+            self.assertIsInstance(renderer.getActor(), utils.ActorObject)
+        
+        # instanced mapper
+        renderer = atomRenderer.AtomRenderer()
+        renderer.render(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies, colouringOptions,
+                        1, self.lut, 10, glyphMode="instanced")
+        self.assertIsInstance(renderer.getActor().actor.GetMapper(), vtk.vtkGlyph3DMapper)
+        
+        # sprites mapper
+        renderer = atomRenderer.AtomRenderer()
+        renderer.render(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies, colouringOptions,
+                        1, self.lut, 10, glyphMode="sprites")
+        self.assertIsInstance(renderer.getActor().actor.GetMapper(), vtk.vtkPointGaussianMapper)
+        
+        # instanced glyphs if the sprites mapper cannot be created
+        def noSprites(*args):
+            raise AttributeError("vtkPointGaussianMapper")
+        renderer = atomRenderer.AtomRenderer()
+        renderer._spritesMapper = noSprites
+        try:
+            renderer.render(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies, colouringOptions,
+                            1, self.lut, 10, glyphMode="sprites")
+            self.assertIsInstance(renderer.getActor().actor.GetMapper(), vtk.vtkGlyph3DMapper)
+            self.assertEqual(renderer._data["Glyph mode"], "instanced")
+            self.assertTrue(renderer.update(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies,
+                                            colouringOptions, 1, self.lut, 10, glyphMode="sprites"))
+        finally:
+            atomRenderer.AtomRenderer._spritesSupported = True
+        
+        with self.assertRaises(ValueError):
+            renderer.render(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies, colouringOptions,
+                            1, self.lut, 10, glyphMode="cubes")
+    
+    def test_atomRendererUpdate(self):
+        """
+        Atom renderer update in place
+        
+        """
+        colouringOptions = DummyColouringOpts()
+        renderer = atomRenderer.AtomRenderer()
+        renderer.render(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies, colouringOptions,
+                        1, self.lut, 10)
+        actor = renderer.getActor()
+        
+        # same number of atoms and settings: the pipeline is kept
+        points = utils.NumpyVTKData(self.atomPoints.getNumpy() + 1.0)
+        self.assertTrue(renderer.update(points, self.scalarsArray, self.radiusArray, self.nspecies,
+                                        colouringOptions, 1, self.lut, 10))
+        self.assertIs(renderer.getActor(), actor)
+        polyData = actor.actor.GetMapper().GetInputAlgorithm().GetInputDataObject(0, 0)
+        updated = numpy_support.vtk_to_numpy(polyData.GetPoints().GetData())
+        self.assertTrue(np.allclose(updated, self.atomPoints.getNumpy() + 1.0))
+        
+        # different number of atoms, glyph mode or LUT: must be rendered again
+        points = utils.NumpyVTKData(self.atomPoints.getNumpy()[:3])
+        self.assertFalse(renderer.update(points, self.scalarsArray, self.radiusArray, self.nspecies,
+                                         colouringOptions, 1, self.lut, 10))
+        self.assertFalse(renderer.update(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies,
+                                         colouringOptions, 1, self.lut, 10, glyphMode="instanced"))
+        self.assertFalse(renderer.update(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies,
+                                         colouringOptions, 1, vtk.vtkLookupTable(), 10))
+        self.assertTrue(np.allclose(renderer._data["Points"].getNumpy(), self.atomPoints.getNumpy() + 1.0))
+    
+    def test_atomRendererLOD(self):
+        """
+        Atom renderer level of detail
+        
+        """
+        class DummyLODSettings(object):
+            lodEnabled = True
+            lodMinPoints = 5
+            lodCloudPoints = 2
+        
+        colouringOptions = DummyColouringOpts()
+        lodSettings = DummyLODSettings()
+        
+        # enough atoms for level of detail
+        renderer = atomRenderer.AtomRenderer()
+        renderer.render(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies, colouringOptions,
+                        1, self.lut, 10, lodSettings=lodSettings)
+        self.assertIsInstance(renderer.getActor().actor, vtk.vtkLODActor)
+        
+        # not enough atoms or disabled
+        lodSettings.lodMinPoints = 6
+        renderer.render(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies, colouringOptions,
+                        1, self.lut, 10, lodSettings=lodSettings)
+        self.assertNotIsInstance(renderer.getActor().actor, vtk.vtkLODActor)
+        lodSettings.lodMinPoints = 5
+        lodSettings.lodEnabled = False
+        renderer.render(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies, colouringOptions,
+                        1, self.lut, 10, lodSettings=lodSettings)
+        self.assertNotIsInstance(renderer.getActor().actor, vtk.vtkLODActor)
+        
+        # enabling level of detail requires the pipeline to be rebuilt
+        lodSettings.lodEnabled = True
+        self.assertFalse(renderer.update(self.atomPoints, self.scalarsArray, self.radiusArray, self.nspecies,
+                                         colouringOptions, 1, self.lut, 10, lodSettings=lodSettings))
@@ -0,0 +1,132 @@
+"""
+Unit tests for the POV-Ray writers
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+
+from .. import povrayWriters
+from ... import utils
+from six.moves import range
+
+
+################################################################################
+
+class TestPovrayWriters(unittest.TestCase):
+    """
+    Test the POV-Ray writers
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        # temporary directory
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        self.filename = os.path.join(self.tmpLocation, "test.pov")
+        
+        # arrays
+        points = np.asarray([[1.2,1.2,1.6],  [0,0,0], [8,8,8], [5.4,8,1], [4,1,0]], dtype=np.float64)
+        scalars = np.asarray([0,0,1,0,1], dtype=np.float64)
+        radii = np.asarray([1.2, 1.2, 0.8, 1.5, 1.1], dtype=np.float64)
+        vectors = np.asarray([[1,0,0], [0,0,0], [0,2,0], [0.5,0.5,0.5], [0,0,-1]], dtype=np.float64)
+        self.atomPoints = utils.NumpyVTKData(points)
+        self.scalarsArray = utils.NumpyVTKData(scalars, name="colours")
+        self.radiusArray = utils.NumpyVTKData(radii, name="radius")
+        self.vectorsArray = utils.NumpyVTKData(vectors, name="vectors")
+        
+        # lut
+        self.lut = vtk.vtkLookupTable()
+        self.lut.SetNumberOfColors(2)
+        self.lut.SetNumberOfTableValues(2)
+        self.lut.SetTableRange(0, 1)
+        self.lut.SetRange(0, 1)
+        self.lut.SetTableValue(0, 1, 0, 0, 1.0)
+        self.lut.SetTableValue(1, 0, 0.5, 1, 1.0)
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        shutil.rmtree(self.tmpLocation)
+    
+    def test_lookupColours(self):
+        """
+        POV-Ray writers look up colours
+        
+        """
+        # species lut
+        colours = povrayWriters.lookupColours(self.lut, self.scalarsArray.getNumpy())
+        rgb = np.empty(3, np.float64)
+        for i, scalar in enumerate(self.scalarsArray.getNumpy()):
+            self.lut.GetColor(scalar, rgb)
+            self.assertTrue(np.allclose(colours[i], rgb))
+        
+        # colour ramp lut (including values outside the range)
+        lut = vtk.vtkLookupTable()
+        lut.SetNumberOfColors(1024)
+        lut.SetHueRange(0.667, 0.0)
+        lut.SetRange(-2.0, 3.0)
+        lut.SetRampToLinear()
+        lut.Build()
+        scalars = np.linspace(-3.0, 4.0, 1001)
+        colours = povrayWriters.lookupColours(lut, scalars)
+        for i in range(len(scalars)):
+            lut.GetColor(scalars[i], rgb)
+            self.assertTrue(np.allclose(colours[i], rgb, atol=0.01))
+    
+    def test_atomsWriter(self):
+        """
+        POV-Ray atoms writer
+        
+        """
+        writer = povrayWriters.PovrayAtomsWriter()
+        writer.write(self.filename, self.atomPoints, self.scalarsArray, self.radiusArray, 2.0, self.lut,
+                     mode="w")
+        
+        with open(self.filename) as fh:
+            lines = fh.readlines()
+        self.assertEqual(len(lines), 5)
+        
+        # the colour as returned by the lut (which stores it with 8 bits per channel)
+        rgb = np.empty(3, np.float64)
+        self.lut.GetColor(self.scalarsArray.getNumpy()[2], rgb)
+        self.assertEqual(lines[2], "sphere { <-8.000000,8.000000,8.000000>, 1.600000 pigment { color rgb "
+                                   "<%f,%f,%f> } finish { ambient 0.250000 phong 0.900000 } }\n" % tuple(rgb))
+    
+    def test_writeRows(self):
+        """
+        POV-Ray writers write rows in chunks
+        
+        """
+        data = np.arange(25, dtype=np.float64).reshape((-1, 1))
+        with open(self.filename, "w") as fh:
+            povrayWriters.writeRows(fh, "%.1f\n", data, chunkSize=7)
+        
+        with open(self.filename) as fh:
+            values = [float(line) for line in fh]
+        self.assertEqual(values, list(range(25)))
+    
+    def test_vectorsWriter(self):
+        """
+        POV-Ray vectors writer
+        
+        """
+        writer = povrayWriters.PovrayVectorsWriter()
+        writer.write(self.filename, self.atomPoints, self.vectorsArray, self.scalarsArray, 1.0, self.lut, mode="w")
+        
+        # zero length vectors are skipped
+        with open(self.filename) as fh:
+            lines = fh.readlines()
+        self.assertEqual(len(lines), 8)
+        self.assertTrue(lines[0].startswith("union { cylinder { <-1.200000,1.200000,1.600000>,"
+                                            "<-1.850000,1.200000,1.600000>, 0.030000 }"))
@@ -10,6 +10,7 @@ import logging
 import vtk
 
 from . import baseRenderer
+from . import povrayWriters
 from .. import utils
 
 
@@ -23,10 +24,13 @@ class VectorRenderer(baseRenderer.BaseRenderer):
         self._logger = logging.getLogger(__name__)
     
     def render(self, pointsData, scalarsArray, vectorsArray, nspecies, colouringOptions, vectorsOptions, lut,
-               invert=False):
+               invert=False, lodSettings=None):
         """
         Render vectors.
         
+        Level of detail rendering is used if enabled in `lodSettings` (see
+        `utils.useLOD`).
+        
         """
         self._logger.debug("Rendering vectors")
         
@@ -66,13 +70,64 @@ class VectorRenderer(baseRenderer.BaseRenderer):
         utils.setMapperScalarRange(arrowMapper, colouringOptions, nspecies)
     
         # actor
-        arrowActor = vtk.vtkActor()
-        arrowActor.SetMapper(arrowMapper)
+        numPoints = arrowPolyData.GetNumberOfPoints()
+        arrowActor = utils.makeLODActor(arrowMapper, numPoints, lodSettings)
         
         # store attributes
         self._actor = utils.ActorObject(arrowActor)
+        self._polyData = arrowPolyData
+        self._settings = (nspecies, vectorsOptions.vectorScaleFactor, vectorsOptions.vectorResolution, invert,
+                          utils.useLOD(numPoints, lodSettings))
         self._data["Points"] = pointsData
         self._data["Scalars"] = scalarsArray
         self._data["Vectors"] = vectorsArray
         self._data["LUT"] = lut
         self._data["Scale factor"] = vectorsOptions.vectorScaleFactor
+        self._data["Invert"] = invert
+    
+    def update(self, pointsData, scalarsArray, vectorsArray, nspecies, colouringOptions, vectorsOptions, lut,
+               invert=False, lodSettings=None):
+        """
+        Update the vectors in place, keeping the existing VTK pipeline and actor.
+        
+        Returns False (without changing anything) if the vectors were rendered
+        with different settings or a different number of points, in which case
+        `render` must be called instead.
+        
+        """
+        if self._actor is None or lut is not self._data["LUT"]:
+            return False
+        numPoints = len(pointsData.getNumpy())
+        if numPoints != len(self._data["Points"].getNumpy()):
+            return False
+        settings = (nspecies, vectorsOptions.vectorScaleFactor, vectorsOptions.vectorResolution, invert,
+                    utils.useLOD(numPoints, lodSettings))
+        if settings != self._settings:
+            return False
+        
+        self._logger.debug("Updating vectors in place")
+        
+        # swap the arrays
+        self._polyData.GetPoints().SetData(pointsData.getVTK())
+        pointData = self._polyData.GetPointData()
+        pointData.SetScalars(scalarsArray.getVTK())
+        pointData.SetVectors(vectorsArray.getVTK())
+        self._polyData.Modified()
+        
+        utils.setMapperScalarRange(self._actor.actor.GetMapper(), colouringOptions, nspecies)
+        
+        # store attributes
+        self._data["Points"] = pointsData
+        self._data["Scalars"] = scalarsArray
+        self._data["Vectors"] = vectorsArray
+        
+        return True
+    
+    def writePovray(self, filename):
+        """Write vectors to POV-Ray file."""
+        self._logger.debug("Writing vectors POV-Ray file")
+        
+        # povray writer
+        writer = povrayWriters.PovrayVectorsWriter()
+        writer.write(filename, self._data["Points"], self._data["Vectors"], self._data["Scalars"],
+                     self._data["Scale factor"], self._data["LUT"], invert=self._data["Invert"])
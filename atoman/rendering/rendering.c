@@ -8,6 +8,7 @@
 #include <Python.h> // includes stdio.h, string.h, errno.h, stdlib.h
 #include <numpy/arrayobject.h>
 #include "visclibs/array_utils.h"
+#include "gui/preferences.h"
 
 #if PY_MAJOR_VERSION >= 3
     #define MOD_ERROR_VAL NULL
@@ -636,6 +637,7 @@ makeVisibleRadiusArray(PyObject *self, PyObject *args)
     radius = (PyArrayObject *) PyArray_SimpleNew(1, numpydims, NPY_FLOAT64);
 
     /* populate array */
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i = 0; i < NVisible; i++)
     {
         int index, specieIndex;
@@ -677,6 +679,7 @@ makeVisibleScalarArray(PyObject *self, PyObject *args)
     scalars = (PyArrayObject *) PyArray_SimpleNew(1, numpydims, NPY_FLOAT64);
 
     /* populate array */
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i = 0; i < NVisible; i++)
     {
         int index;
@@ -717,6 +720,7 @@ makeVisiblePointsArray(PyObject *self, PyObject *args)
     visiblePos = (PyArrayObject *) PyArray_SimpleNew(2, numpydims, NPY_FLOAT64);
 
     /* populate array */
+    #pragma omp parallel for num_threads(prefs_numThreads)
     for (i = 0; i < NVisible; i++)
     {
         int index, index3, j;
@@ -0,0 +1,164 @@
+
+"""
+Unit tests for the POV-Ray render queue
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import unittest
+
+from .. import povrayQueue
+
+
+################################################################################
+
+# fake povray: the INI file contains the time to sleep and the exit status;
+# records the maximum number of processes running at once in "running.max"
+_FAKE_POVRAY = """#!/bin/sh
+read delay status < "$1"
+touch "$1.running"
+ls *.running | wc -l >> running.max
+sleep "$delay"
+rm -f "$1.running"
+echo "rendered $1"
+exit "$status"
+"""
+
+################################################################################
+
+@unittest.skipIf(sys.platform.startswith("win"), "requires a POSIX shell")
+class TestPovrayRenderQueue(unittest.TestCase):
+    """
+    Test the POV-Ray render queue
+    
+    """
+    def setUp(self):
+        """
+        Called before each test
+        
+        """
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        
+        self.povray = os.path.join(self.tmpLocation, "povray.sh")
+        with open(self.povray, "w") as fh:
+            fh.write(_FAKE_POVRAY)
+        os.chmod(self.povray, os.stat(self.povray).st_mode | stat.S_IEXEC)
+    
+    def tearDown(self):
+        """
+        Called after each test
+        
+        """
+        shutil.rmtree(self.tmpLocation)
+    
+    def makeJob(self, name, delay, status=0, finished=None):
+        """Return a job that sleeps for `delay` seconds and exits with `status`."""
+        iniFile = "%s.ini" % name
+        with open(os.path.join(self.tmpLocation, iniFile), "w") as fh:
+            fh.write("%s %d\n" % (delay, status))
+        
+        callback = finished.append if finished is not None else None
+        
+        return povrayQueue.PovrayJob(self.tmpLocation, iniFile, callback=callback, name=name, tempFiles=[iniFile])
+    
+    def iniExists(self, job):
+        """Return True if the INI file of the job exists."""
+        return os.path.exists(os.path.join(self.tmpLocation, job.iniFile))
+    
+    def maxRunning(self):
+        """Return the maximum number of fake POV-Ray processes that ran at once."""
+        with open(os.path.join(self.tmpLocation, "running.max")) as fh:
+            return max(int(line) for line in fh if line.strip())
+    
+    def test_povrayQueue(self):
+        """
+        POV-Ray render queue
+        
+        """
+        finished = []
+        with povrayQueue.PovrayRenderQueue(self.povray, numProcesses=2) as queue:
+            self.assertEqual(queue.maxPending, 4)
+            queue.submit(self.makeJob("slow", 0.6, finished=finished))
+            queue.submit(self.makeJob("fast", 0.1, finished=finished))
+            queue.submit(self.makeJob("last", 0.1, finished=finished))
+        
+        # jobs finish in the order they complete
+        self.assertEqual([job.name for job in finished], ["fast", "last", "slow"])
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.numCompleted, 3)
+        self.assertEqual(queue.numFailed, 0)
+        for job in finished:
+            self.assertEqual(job.status, 0)
+            self.assertEqual(job.output.strip(), "rendered %s.ini" % job.name)
+            self.assertFalse(os.path.exists(job.logFile))
+            self.assertFalse(self.iniExists(job))
+        
+        # no more than two processes at once
+        self.assertEqual(self.maxRunning(), 2)
+    
+    def test_povrayQueueBounded(self):
+        """
+        POV-Ray render queue bounded
+        
+        """
+        queue = povrayQueue.PovrayRenderQueue(self.povray, numProcesses=1, maxPending=2)
+        for i in range(4):
+            queue.submit(self.makeJob("job%d" % i, 0.05))
+            self.assertLessEqual(len(queue), 2)
+        
+        self.assertTrue(queue.wait())
+        self.assertEqual(queue.numCompleted, 4)
+        self.assertEqual(self.maxRunning(), 1)
+    
+    def test_povrayQueueFailed(self):
+        """
+        POV-Ray render queue failed jobs
+        
+        """
+        finished = []
+        with povrayQueue.PovrayRenderQueue(self.povray, numProcesses=2) as queue:
+            queue.submit(self.makeJob("ok", 0, finished=finished))
+            queue.submit(self.makeJob("bad", 0, status=3, finished=finished))
+        
+        statuses = dict((job.name, job.status) for job in finished)
+        self.assertEqual(statuses, {"ok": 0, "bad": 3})
+        self.assertEqual(queue.numFailed, 1)
+        
+        # the files of failed jobs are removed too
+        for job in finished:
+            self.assertFalse(self.iniExists(job))
+        
+        # POV-Ray not found
+        finished = []
+        with povrayQueue.PovrayRenderQueue(os.path.join(self.tmpLocation, "missing")) as queue:
+            queue.submit(self.makeJob("missing", 0, finished=finished))
+        
+        self.assertEqual(len(finished), 1)
+        self.assertIsNone(finished[0].status)
+        self.assertEqual(queue.numFailed, 1)
+        self.assertFalse(self.iniExists(finished[0]))
+    
+    def test_povrayQueueCancel(self):
+        """
+        POV-Ray render queue cancel
+        
+        """
+        finished = []
+        queue = povrayQueue.PovrayRenderQueue(self.povray, numProcesses=1)
+        jobs = [self.makeJob("job%d" % i, 5, finished=finished) for i in range(2)]
+        for job in jobs:
+            queue.submit(job)
+        
+        self.assertFalse(queue.wait(cancelled=lambda: True))
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(finished, [])
+        self.assertFalse(os.path.exists(jobs[0].logFile))
+        
+        # the files of the running and queued jobs are removed
+        for job in jobs:
+            self.assertFalse(self.iniExists(job))
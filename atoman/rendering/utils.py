@@ -49,6 +49,41 @@ class ActorObject(object):
         self.actor = actor
         self.visible = False
 
+
+################################################################################
+
+def useLOD(numPoints, lodSettings):
+    """
+    Return True if level of detail rendering should be used for an actor with
+    the given number of points. `lodSettings` (eg. the rendering preferences)
+    provides `lodEnabled`, `lodMinPoints` and `lodCloudPoints`; level of detail
+    is not used if it is None.
+    
+    """
+    return lodSettings is not None and bool(lodSettings.lodEnabled) and numPoints >= lodSettings.lodMinPoints
+
+
+################################################################################
+
+def makeLODActor(mapper, numPoints, lodSettings):
+    """
+    Return an actor for the given mapper.
+    
+    If level of detail rendering should be used (see `useLOD`) this is a
+    vtkLODActor, which draws a cloud of `lodCloudPoints` points (or any LOD
+    mappers added to it) while the scene is being manipulated and the full
+    quality mapper when it stops.
+    
+    """
+    if useLOD(numPoints, lodSettings):
+        actor = vtk.vtkLODActor()
+        actor.SetNumberOfCloudPoints(lodSettings.lodCloudPoints)
+    else:
+        actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    
+    return actor
+
 ################################################################################
 
 def getScalarsType(colouringOptions):
@@ -239,6 +274,30 @@ def setupLUT(specieList, specieRGB, colouringOptions):
     
     return lut
 
+
+################################################################################
+
+def lutSettings(specieList, specieRGB, colouringOptions):
+    """
+    Return the settings the colour look up table depends on. Two LUTs made
+    by `setupLUT` with equal settings are the same.
+    
+    """
+    colourBy = colouringOptions.colourBy
+    if colourBy == "Species":
+        settings = (tuple(specieList), tuple(tuple(rgb) for rgb in specieRGB))
+    elif colourBy == "Solid colour":
+        settings = (len(specieList), tuple(colouringOptions.solidColourRGB))
+    elif colourBy == "Height":
+        settings = (colouringOptions.minVal, colouringOptions.maxVal)
+    elif colourBy == "Charge":
+        settings = (colouringOptions.chargeMinSpin.value(), colouringOptions.chargeMaxSpin.value())
+    else:
+        settings = (colouringOptions.scalarMinSpins[colourBy].value(),
+                    colouringOptions.scalarMaxSpins[colourBy].value())
+    
+    return (colourBy,) + settings
+
 ################################################################################
 
 def setRes(num, displayOptions):
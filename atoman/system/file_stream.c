@@ -0,0 +1,746 @@
+
+/*******************************************************************************
+ ** Line based reading of plain or compressed files
+ *******************************************************************************/
+
+#define _FILE_OFFSET_BITS 64
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <errno.h>
+#include <sys/types.h>
+#include "system/file_stream.h"
+
+#ifdef HAVE_ZLIB
+#include <zlib.h>
+#endif
+#ifdef HAVE_BZIP2
+#include <bzlib.h>
+#endif
+#ifdef HAVE_LZMA
+#include <lzma.h>
+#endif
+#ifdef HAVE_ZSTD
+#include <zstd.h>
+#endif
+
+/* size of the compressed and decompressed buffers */
+#define IN_BUFFER_SIZE (256 * 1024)
+#define OUT_BUFFER_SIZE (1024 * 1024)
+#define ERROR_STRING_SIZE 256
+
+
+struct FileStream
+{
+    FILE *fp;
+    int compression;
+    int error;
+    char errorString[ERROR_STRING_SIZE];
+
+    /* compressed input */
+    unsigned char *in;
+    size_t inLen;
+    int inEof;
+
+    /* decompressed output */
+    char *out;
+    size_t outPos;
+    size_t outLen;
+    int streamEnd;
+
+    /* offset of the start of the output buffer in the decompressed data */
+    long long outStart;
+
+#ifdef HAVE_ZLIB
+    z_stream zs;
+#endif
+#ifdef HAVE_BZIP2
+    bz_stream bzs;
+#endif
+#ifdef HAVE_LZMA
+    lzma_stream xzs;
+#endif
+#ifdef HAVE_ZSTD
+    ZSTD_DStream *zstds;
+    ZSTD_inBuffer zstdIn;
+#endif
+};
+
+
+static int detectCompression(const unsigned char*, size_t);
+static int initDecompression(FileStream*);
+static void endDecompression(FileStream*);
+static int rewindStream(FileStream*);
+static long fillOutput(FileStream*);
+static size_t readInput(FileStream*);
+static void setError(FileStream*, const char*);
+
+
+/*******************************************************************************
+ ** Detect the compression format from the magic bytes
+ *******************************************************************************/
+static int
+detectCompression(const unsigned char *buf, size_t len)
+{
+    if (len >= 2 && buf[0] == 0x1f && buf[1] == 0x8b)
+        return FILE_STREAM_GZIP;
+
+    if (len >= 3 && buf[0] == 'B' && buf[1] == 'Z' && buf[2] == 'h')
+        return FILE_STREAM_BZIP2;
+
+    if (len >= 6 && buf[0] == 0xfd && buf[1] == '7' && buf[2] == 'z' && buf[3] == 'X' && buf[4] == 'Z' && buf[5] == 0x00)
+        return FILE_STREAM_XZ;
+
+    if (len >= 4 && buf[0] == 0x28 && buf[1] == 0xb5 && buf[2] == 0x2f && buf[3] == 0xfd)
+        return FILE_STREAM_ZSTD;
+
+    return FILE_STREAM_PLAIN;
+}
+
+/*******************************************************************************
+ ** Return non zero if the compression format is supported
+ *******************************************************************************/
+int
+fileStreamFormatSupported(int compression)
+{
+    switch (compression)
+    {
+        case FILE_STREAM_PLAIN:
+            return 1;
+#ifdef HAVE_ZLIB
+        case FILE_STREAM_GZIP:
+            return 1;
+#endif
+#ifdef HAVE_BZIP2
+        case FILE_STREAM_BZIP2:
+            return 1;
+#endif
+#ifdef HAVE_LZMA
+        case FILE_STREAM_XZ:
+            return 1;
+#endif
+#ifdef HAVE_ZSTD
+        case FILE_STREAM_ZSTD:
+            return 1;
+#endif
+        default:
+            return 0;
+    }
+}
+
+/*******************************************************************************
+ ** Return the name of the compression format
+ *******************************************************************************/
+const char*
+fileStreamFormatName(int compression)
+{
+    switch (compression)
+    {
+        case FILE_STREAM_PLAIN:
+            return "plain";
+        case FILE_STREAM_GZIP:
+            return "gzip";
+        case FILE_STREAM_BZIP2:
+            return "bzip2";
+        case FILE_STREAM_XZ:
+            return "xz";
+        case FILE_STREAM_ZSTD:
+            return "zstd";
+        default:
+            return "unknown";
+    }
+}
+
+/*******************************************************************************
+ ** Record an error
+ *******************************************************************************/
+static void
+setError(FileStream *stream, const char *msg)
+{
+    stream->error = 1;
+    snprintf(stream->errorString, ERROR_STRING_SIZE, "%s", msg);
+}
+
+/*******************************************************************************
+ ** Open the file for reading
+ *******************************************************************************/
+FileStream*
+fileStreamOpen(const char *filename, char *errmsg, int errlen)
+{
+    FileStream *stream;
+
+    /* allocate the stream */
+    stream = calloc(1, sizeof(FileStream));
+    if (stream == NULL)
+    {
+        snprintf(errmsg, errlen, "Could not allocate file stream: '%s'", filename);
+        return NULL;
+    }
+    stream->in = malloc(IN_BUFFER_SIZE * sizeof(unsigned char));
+    stream->out = malloc(OUT_BUFFER_SIZE * sizeof(char));
+    if (stream->in == NULL || stream->out == NULL)
+    {
+        snprintf(errmsg, errlen, "Could not allocate file stream buffers: '%s'", filename);
+        fileStreamClose(stream);
+        return NULL;
+    }
+
+    /* open the file */
+    stream->fp = fopen(filename, "rb");
+    if (stream->fp == NULL)
+    {
+        snprintf(errmsg, errlen, "%s: '%s'", strerror(errno), filename);
+        fileStreamClose(stream);
+        return NULL;
+    }
+
+    /* detect the compression from the first block */
+    readInput(stream);
+    if (stream->error)
+    {
+        snprintf(errmsg, errlen, "%s: '%s'", stream->errorString, filename);
+        fileStreamClose(stream);
+        return NULL;
+    }
+    stream->compression = detectCompression(stream->in, stream->inLen);
+
+    /* initialise the decompression */
+    if (!fileStreamFormatSupported(stream->compression))
+    {
+        snprintf(errmsg, errlen, "Compression format not supported (%s): '%s'",
+                fileStreamFormatName(stream->compression), filename);
+        fileStreamClose(stream);
+        return NULL;
+    }
+    if (initDecompression(stream))
+    {
+        snprintf(errmsg, errlen, "%s: '%s'", stream->errorString, filename);
+        fileStreamClose(stream);
+        return NULL;
+    }
+
+    return stream;
+}
+
+/*******************************************************************************
+ ** Read the next block of compressed input (replaces any unconsumed input)
+ *******************************************************************************/
+static size_t
+readInput(FileStream *stream)
+{
+    stream->inLen = fread(stream->in, 1, IN_BUFFER_SIZE, stream->fp);
+    if (stream->inLen == 0)
+    {
+        stream->inEof = 1;
+        if (ferror(stream->fp)) setError(stream, strerror(errno));
+    }
+
+    return stream->inLen;
+}
+
+/*******************************************************************************
+ ** Initialise the decompressor for the detected format
+ *******************************************************************************/
+static int
+initDecompression(FileStream *stream)
+{
+    switch (stream->compression)
+    {
+#ifdef HAVE_ZLIB
+        case FILE_STREAM_GZIP:
+            /* 16 + MAX_WBITS: gzip header */
+            if (inflateInit2(&stream->zs, 16 + MAX_WBITS) != Z_OK)
+            {
+                setError(stream, "Could not initialise gzip decompression");
+                return 1;
+            }
+            stream->zs.next_in = stream->in;
+            stream->zs.avail_in = (uInt) stream->inLen;
+            break;
+#endif
+#ifdef HAVE_BZIP2
+        case FILE_STREAM_BZIP2:
+            if (BZ2_bzDecompressInit(&stream->bzs, 0, 0) != BZ_OK)
+            {
+                setError(stream, "Could not initialise bzip2 decompression");
+                return 1;
+            }
+            stream->bzs.next_in = (char *) stream->in;
+            stream->bzs.avail_in = (unsigned int) stream->inLen;
+            break;
+#endif
+#ifdef HAVE_LZMA
+        case FILE_STREAM_XZ:
+        {
+            lzma_stream init = LZMA_STREAM_INIT;
+
+            stream->xzs = init;
+            if (lzma_stream_decoder(&stream->xzs, UINT64_MAX, LZMA_CONCATENATED) != LZMA_OK)
+            {
+                setError(stream, "Could not initialise xz decompression");
+                return 1;
+            }
+            stream->xzs.next_in = stream->in;
+            stream->xzs.avail_in = stream->inLen;
+            break;
+        }
+#endif
+#ifdef HAVE_ZSTD
+        case FILE_STREAM_ZSTD:
+            stream->zstds = ZSTD_createDStream();
+            if (stream->zstds == NULL || ZSTD_isError(ZSTD_initDStream(stream->zstds)))
+            {
+                setError(stream, "Could not initialise zstd decompression");
+                return 1;
+            }
+            stream->zstdIn.src = stream->in;
+            stream->zstdIn.size = stream->inLen;
+            stream->zstdIn.pos = 0;
+            break;
+#endif
+        default:
+            /* plain file: the first block is the first output */
+            memcpy(stream->out, stream->in, stream->inLen);
+            stream->outLen = stream->inLen;
+            stream->outPos = 0;
+            break;
+    }
+
+    return 0;
+}
+
+/*******************************************************************************
+ ** Fill the output buffer; returns the number of bytes (0 at the end of the
+ ** file, -1 on error)
+ *******************************************************************************/
+static long
+fillOutput(FileStream *stream)
+{
+    if (stream->error) return -1;
+
+    switch (stream->compression)
+    {
+#ifdef HAVE_ZLIB
+        case FILE_STREAM_GZIP:
+        {
+            z_stream *zs = &stream->zs;
+
+            zs->next_out = (Bytef *) stream->out;
+            zs->avail_out = OUT_BUFFER_SIZE;
+            while (zs->avail_out == OUT_BUFFER_SIZE)
+            {
+                int ret;
+
+                if (zs->avail_in == 0)
+                {
+                    if (!readInput(stream)) break;
+                    zs->next_in = stream->in;
+                    zs->avail_in = (uInt) stream->inLen;
+                }
+
+                /* start of another member after the end of a member (concatenated gzip files) */
+                if (stream->streamEnd)
+                {
+                    if (zs->next_in[0] != 0x1f) break; // trailing garbage is ignored, as by gzip
+                    inflateReset(zs);
+                    stream->streamEnd = 0;
+                }
+
+                ret = inflate(zs, Z_NO_FLUSH);
+                if (ret == Z_STREAM_END) stream->streamEnd = 1;
+                else if (ret != Z_OK && ret != Z_BUF_ERROR)
+                {
+                    setError(stream, zs->msg != NULL ? zs->msg : "gzip decompression failed");
+                    return -1;
+                }
+            }
+
+            if (stream->inEof && !stream->streamEnd && zs->avail_out == OUT_BUFFER_SIZE)
+            {
+                setError(stream, "Unexpected end of gzip file");
+                return -1;
+            }
+
+            return (long) (OUT_BUFFER_SIZE - zs->avail_out);
+        }
+#endif
+#ifdef HAVE_BZIP2
+        case FILE_STREAM_BZIP2:
+        {
+            bz_stream *bzs = &stream->bzs;
+
+            bzs->next_out = stream->out;
+            bzs->avail_out = OUT_BUFFER_SIZE;
+            while (bzs->avail_out == OUT_BUFFER_SIZE)
+            {
+                int ret;
+
+                if (bzs->avail_in == 0)
+                {
+                    if (!readInput(stream)) break;
+                    bzs->next_in = (char *) stream->in;
+                    bzs->avail_in = (unsigned int) stream->inLen;
+                }
+
+                /* start of another stream (eg. files compressed with pbzip2) */
+                if (stream->streamEnd)
+                {
+                    if (bzs->next_in[0] != 'B') break;
+                    BZ2_bzDecompressEnd(bzs);
+                    if (BZ2_bzDecompressInit(bzs, 0, 0) != BZ_OK)
+                    {
+                        setError(stream, "Could not initialise bzip2 decompression");
+                        return -1;
+                    }
+                    stream->streamEnd = 0;
+                }
+
+                ret = BZ2_bzDecompress(bzs);
+                if (ret == BZ_STREAM_END) stream->streamEnd = 1;
+                else if (ret != BZ_OK)
+                {
+                    setError(stream, "bzip2 decompression failed");
+                    return -1;
+                }
+            }
+
+            if (stream->inEof && !stream->streamEnd && bzs->avail_out == OUT_BUFFER_SIZE)
+            {
+                setError(stream, "Unexpected end of bzip2 file");
+                return -1;
+            }
+
+            return (long) (OUT_BUFFER_SIZE - bzs->avail_out);
+        }
+#endif
+#ifdef HAVE_LZMA
+        case FILE_STREAM_XZ:
+        {
+            lzma_stream *xzs = &stream->xzs;
+
+            xzs->next_out = (uint8_t *) stream->out;
+            xzs->avail_out = OUT_BUFFER_SIZE;
+            while (xzs->avail_out == OUT_BUFFER_SIZE && !stream->streamEnd)
+            {
+                lzma_ret ret;
+
+                if (xzs->avail_in == 0 && !stream->inEof)
+                {
+                    readInput(stream);
+                    if (stream->error) return -1;
+                    xzs->next_in = stream->in;
+                    xzs->avail_in = stream->inLen;
+                }
+
+                ret = lzma_code(xzs, stream->inEof ? LZMA_FINISH : LZMA_RUN);
+                if (ret == LZMA_STREAM_END) stream->streamEnd = 1;
+                else if (ret != LZMA_OK)
+                {
+                    setError(stream, ret == LZMA_BUF_ERROR ? "Unexpected end of xz file" : "xz decompression failed");
+                    return -1;
+                }
+            }
+
+            return (long) (OUT_BUFFER_SIZE - xzs->avail_out);
+        }
+#endif
+#ifdef HAVE_ZSTD
+        case FILE_STREAM_ZSTD:
+        {
+            ZSTD_outBuffer output;
+            size_t ret = 0;
+
+            output.dst = stream->out;
+            output.size = OUT_BUFFER_SIZE;
+            output.pos = 0;
+            while (output.pos == 0)
+            {
+                if (stream->zstdIn.pos == stream->zstdIn.size)
+                {
+                    if (!readInput(stream)) break;
+                    stream->zstdIn.src = stream->in;
+                    stream->zstdIn.size = stream->inLen;
+                    stream->zstdIn.pos = 0;
+                }
+
+                /* returns 0 at the end of a frame; another frame may follow */
+                ret = ZSTD_decompressStream(stream->zstds, &output, &stream->zstdIn);
+                if (ZSTD_isError(ret))
+                {
+                    setError(stream, ZSTD_getErrorName(ret));
+                    return -1;
+                }
+                stream->streamEnd = (ret == 0);
+            }
+
+            if (stream->inEof && !stream->streamEnd && output.pos == 0)
+            {
+                setError(stream, "Unexpected end of zstd file");
+                return -1;
+            }
+
+            return (long) output.pos;
+        }
+#endif
+        default:
+        {
+            size_t n = fread(stream->out, 1, OUT_BUFFER_SIZE, stream->fp);
+
+            if (n == 0 && ferror(stream->fp))
+            {
+                setError(stream, strerror(errno));
+                return -1;
+            }
+
+            return (long) n;
+        }
+    }
+}
+
+/*******************************************************************************
+ ** Read a line (same semantics as fgets)
+ *******************************************************************************/
+char*
+fileStreamGets(char *buf, int size, FileStream *stream)
+{
+    int n = 0;
+
+    if (size <= 0) return NULL;
+
+    while (n < size - 1)
+    {
+        size_t take;
+        char *start, *nl;
+
+        /* refill the output buffer */
+        if (stream->outPos == stream->outLen)
+        {
+            long got = fillOutput(stream);
+            if (got <= 0) break;
+            stream->outStart += (long long) stream->outLen;
+            stream->outPos = 0;
+            stream->outLen = (size_t) got;
+        }
+
+        /* copy up to and including the next new line */
+        start = stream->out + stream->outPos;
+        take = stream->outLen - stream->outPos;
+        if (take > (size_t) (size - 1 - n)) take = (size_t) (size - 1 - n);
+        nl = memchr(start, '\n', take);
+        if (nl != NULL) take = (size_t) (nl - start) + 1;
+        memcpy(buf + n, start, take);
+        n += (int) take;
+        stream->outPos += take;
+
+        if (nl != NULL) break;
+    }
+
+    if (n == 0 || stream->error) return NULL;
+    buf[n] = '\0';
+
+    return buf;
+}
+
+/*******************************************************************************
+ ** Skip the given number of lines; returns the number of lines skipped (less
+ ** than requested at the end of the file) or -1 on error
+ *******************************************************************************/
+long long
+fileStreamSkipLines(FileStream *stream, long long numLines)
+{
+    long long count = 0;
+    int partial = 0;
+
+    while (count < numLines)
+    {
+        char *start, *nl;
+
+        /* refill the output buffer */
+        if (stream->outPos == stream->outLen)
+        {
+            long got = fillOutput(stream);
+            if (got <= 0) break;
+            stream->outStart += (long long) stream->outLen;
+            stream->outPos = 0;
+            stream->outLen = (size_t) got;
+        }
+
+        /* move past the next new line */
+        start = stream->out + stream->outPos;
+        nl = memchr(start, '\n', stream->outLen - stream->outPos);
+        if (nl == NULL)
+        {
+            partial = 1;
+            stream->outPos = stream->outLen;
+        }
+        else
+        {
+            count++;
+            partial = 0;
+            stream->outPos += (size_t) (nl - start) + 1;
+        }
+    }
+
+    if (stream->error) return -1;
+
+    /* last line without a new line */
+    if (partial) count++;
+
+    return count;
+}
+
+/*******************************************************************************
+ ** Return the current offset in the (decompressed) data
+ *******************************************************************************/
+long long
+fileStreamTell(FileStream *stream)
+{
+    return stream->outStart + (long long) stream->outPos;
+}
+
+/*******************************************************************************
+ ** Restart decompression from the beginning of the file
+ *******************************************************************************/
+static int
+rewindStream(FileStream *stream)
+{
+    endDecompression(stream);
+    rewind(stream->fp);
+    stream->inLen = 0;
+    stream->inEof = 0;
+    stream->outPos = 0;
+    stream->outLen = 0;
+    stream->outStart = 0;
+    stream->streamEnd = 0;
+    readInput(stream);
+    if (stream->error) return 1;
+
+    return initDecompression(stream);
+}
+
+/*******************************************************************************
+ ** Move to the given offset in the (decompressed) data. Plain files seek
+ ** directly; compressed files are decompressed up to the offset (from the
+ ** beginning of the file if the offset is behind the current position).
+ ** Returns non zero on error or if the offset is beyond the end of the file.
+ *******************************************************************************/
+int
+fileStreamSeek(FileStream *stream, long long offset)
+{
+    if (stream->error) return 1;
+    if (offset < 0)
+    {
+        setError(stream, "Invalid file offset");
+        return 1;
+    }
+
+    /* within the current buffer */
+    if (offset >= stream->outStart && offset <= stream->outStart + (long long) stream->outLen)
+    {
+        stream->outPos = (size_t) (offset - stream->outStart);
+        return 0;
+    }
+
+    if (stream->compression == FILE_STREAM_PLAIN)
+    {
+        if (fseeko(stream->fp, (off_t) offset, SEEK_SET))
+        {
+            setError(stream, strerror(errno));
+            return 1;
+        }
+        stream->outStart = offset;
+        stream->outPos = 0;
+        stream->outLen = 0;
+        return 0;
+    }
+
+    /* decompress from the beginning */
+    if (offset < stream->outStart && rewindStream(stream)) return 1;
+
+    /* decompress up to the buffer containing the offset */
+    while (offset > stream->outStart + (long long) stream->outLen)
+    {
+        long got = fillOutput(stream);
+        if (got <= 0)
+        {
+            if (!stream->error) setError(stream, "File offset is beyond the end of the file");
+            return 1;
+        }
+        stream->outStart += (long long) stream->outLen;
+        stream->outLen = (size_t) got;
+    }
+    stream->outPos = (size_t) (offset - stream->outStart);
+
+    return 0;
+}
+
+/*******************************************************************************
+ ** Error status
+ *******************************************************************************/
+int
+fileStreamError(FileStream *stream)
+{
+    return stream->error;
+}
+
+const char*
+fileStreamErrorString(FileStream *stream)
+{
+    return stream->errorString;
+}
+
+int
+fileStreamCompression(FileStream *stream)
+{
+    return stream->compression;
+}
+
+/*******************************************************************************
+ ** Close the file and free the stream
+ *******************************************************************************/
+void
+fileStreamClose(FileStream *stream)
+{
+    if (stream == NULL) return;
+
+    endDecompression(stream);
+    if (stream->fp != NULL) fclose(stream->fp);
+    free(stream->in);
+    free(stream->out);
+    free(stream);
+}
+
+/*******************************************************************************
+ ** Free the decompressor
+ *******************************************************************************/
+static void
+endDecompression(FileStream *stream)
+{
+    switch (stream->compression)
+    {
+#ifdef HAVE_ZLIB
+        case FILE_STREAM_GZIP:
+            inflateEnd(&stream->zs);
+            break;
+#endif
+#ifdef HAVE_BZIP2
+        case FILE_STREAM_BZIP2:
+            BZ2_bzDecompressEnd(&stream->bzs);
+            break;
+#endif
+#ifdef HAVE_LZMA
+        case FILE_STREAM_XZ:
+            lzma_end(&stream->xzs);
+            break;
+#endif
+#ifdef HAVE_ZSTD
+        case FILE_STREAM_ZSTD:
+            if (stream->zstds != NULL) ZSTD_freeDStream(stream->zstds);
+            stream->zstds = NULL;
+            break;
+#endif
+        default:
+            break;
+    }
+}
@@ -0,0 +1,45 @@
+#ifndef FILE_STREAM_H
+#define FILE_STREAM_H
+
+/*******************************************************************************
+ ** Line based reading of plain or compressed files
+ **
+ ** The compression format is detected from the first bytes of the file and the
+ ** file is decompressed in memory as it is read (no temporary files). Support
+ ** for each format depends on the libraries that were available at build time
+ ** (HAVE_ZLIB, HAVE_BZIP2, HAVE_LZMA, HAVE_ZSTD).
+ *******************************************************************************/
+
+/* compression formats */
+#define FILE_STREAM_PLAIN 0
+#define FILE_STREAM_GZIP  1
+#define FILE_STREAM_BZIP2 2
+#define FILE_STREAM_XZ    3
+#define FILE_STREAM_ZSTD  4
+#define FILE_STREAM_NUM_FORMATS 5
+
+typedef struct FileStream FileStream;
+
+/* open the file for reading; on error NULL is returned and the reason written to errmsg */
+FileStream* fileStreamOpen(const char*, char*, int);
+/* read a line (same semantics as fgets) */
+char* fileStreamGets(char*, int, FileStream*);
+/* skip lines; returns the number skipped (fewer at the end of the file) or -1 on error */
+long long fileStreamSkipLines(FileStream*, long long);
+/* return the current offset in the (decompressed) data */
+long long fileStreamTell(FileStream*);
+/* move to the given offset in the (decompressed) data; returns non zero on error */
+int fileStreamSeek(FileStream*, long long);
+/* return non zero if an error occurred while reading (message in fileStreamErrorString) */
+int fileStreamError(FileStream*);
+const char* fileStreamErrorString(FileStream*);
+/* return the compression format of the stream */
+int fileStreamCompression(FileStream*);
+/* close the file and free the stream */
+void fileStreamClose(FileStream*);
+/* return non zero if the given compression format is supported */
+int fileStreamFormatSupported(int);
+/* return the name of the given compression format */
+const char* fileStreamFormatName(int);
+
+#endif
@@ -0,0 +1,208 @@
+"""
+Index of the frames in multi-frame (trajectory) files
+
+A multi-frame file contains repeated header/body blocks of the same file
+format (for example concatenated dumps). The first time such a file is read
+the C reader scans it once, recording the offset and number of atoms of each
+frame, so that any frame can then be read directly by seeking to its offset.
+Offsets are in the decompressed data for compressed files.
+
+The index is stored on disk (either next to the source file or in the data
+directory) so later sessions do not have to scan the file again. It is keyed
+like the lattice cache, by the path, size and modification time of the source
+file and the file format; if the source file has grown since it was indexed it
+is assumed to have been appended to (a trajectory that is still being written)
+and the index is extended from the end of the last complete frame.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import json
+import hashlib
+import logging
+import tempfile
+
+import numpy as np
+
+from . import _latticeReaderGeneric
+from . import latticeCache
+from ..visutils import utilities
+
+
+INDEX_EXTENSION = ".atomanframes"
+INDEX_DIRECTORY = "frame_index"
+
+
+class FrameIndex(object):
+    """
+    The offsets and number of atoms of the frames in a multi-frame file.
+    `endOffset` is the offset after the last complete frame.
+    
+    """
+    def __init__(self, offsets, NAtoms, endOffset, source=None):
+        self.offsets = offsets
+        self.NAtoms = NAtoms
+        self.endOffset = endOffset
+        self.source = source
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    def offset(self, frame):
+        """Return the offset of the given frame (negative frames count from the end)."""
+        return int(self.offsets[frame])
+
+
+def buildFrameIndex(filename, fileFormat, startOffset=0):
+    """
+    Scan the given file (from `startOffset`) and return the index of the
+    complete frames found.
+    
+    """
+    offsets, NAtoms, endOffset = _latticeReaderGeneric.indexFrames(filename, fileFormat.header, len(fileFormat.body),
+                                                                   fileFormat.getDelimiter(), startOffset)
+    
+    return FrameIndex(offsets, NAtoms, endOffset)
+
+
+class FrameIndexCache(object):
+    """
+    On-disk store of frame indexes.
+    
+    `location` is either "source" (the index file is stored next to the source
+    file) or "data" (the index files are stored in the data directory, or in
+    `directory` if given).
+    
+    """
+    def __init__(self, location="data", directory=None):
+        if location not in latticeCache.CACHE_LOCATIONS:
+            raise ValueError("Unrecognised frame index location: '%s'" % location)
+        
+        self.logger = logging.getLogger(__name__)
+        self.location = location
+        if directory is None and location == "data":
+            directory = utilities.dataPath(INDEX_DIRECTORY)
+        self.directory = directory
+        
+        # indexes used in this session
+        self._indexes = {}
+    
+    def indexPath(self, filename):
+        """Return the path of the index file for the given source file."""
+        if self.location == "source":
+            return filename + INDEX_EXTENSION
+        
+        digest = hashlib.sha1(os.path.realpath(filename).encode("utf-8")).hexdigest()
+        
+        return os.path.join(self.directory, digest + INDEX_EXTENSION)
+    
+    def getIndex(self, filename, fileFormat, scanPath=None):
+        """
+        Return the frame index of the given source file, loading it from the
+        store if it is up to date, extending it if the file has grown, or
+        building it otherwise. `scanPath` is the file to scan if it is not the
+        source file (for example a decompressed copy).
+        
+        """
+        if scanPath is None:
+            scanPath = filename
+        source = latticeCache.sourceKey(filename)
+        memoKey = (source["path"], latticeCache.formatKey(fileFormat))
+        
+        index = self._indexes.get(memoKey)
+        if index is not None and index.source == source:
+            return index
+        if index is None:
+            index = self.load(filename, fileFormat)
+        
+        if index is not None and index.source == source:
+            self._indexes[memoKey] = index
+            return index
+        
+        if index is not None and index.source["size"] < source["size"]:
+            self.logger.debug("Extending frame index from offset %d: '%s'", index.endOffset, filename)
+            try:
+                extra = buildFrameIndex(scanPath, fileFormat, startOffset=index.endOffset)
+            
+            except (IOError, ValueError) as error:
+                self.logger.debug("Could not extend frame index (%s); rebuilding", error)
+                index = None
+            
+            else:
+                index = FrameIndex(np.concatenate((index.offsets, extra.offsets)),
+                                   np.concatenate((index.NAtoms, extra.NAtoms)), extra.endOffset)
+        
+        else:
+            index = None
+        
+        if index is None:
+            self.logger.info("Indexing frames: '%s'", filename)
+            index = buildFrameIndex(scanPath, fileFormat)
+        
+        index.source = source
+        self._indexes[memoKey] = index
+        self.logger.info("Found %d frames in '%s'", len(index), filename)
+        self.save(filename, fileFormat, index)
+        
+        return index
+    
+    def load(self, filename, fileFormat):
+        """
+        Return the stored frame index for the given source file and file
+        format, or None. The index may be out of date (compare its source to
+        the current `latticeCache.sourceKey`).
+        
+        """
+        indexFile = self.indexPath(filename)
+        if not os.path.exists(indexFile):
+            return None
+        
+        try:
+            with np.load(indexFile) as data:
+                key = json.loads(str(data["key"]))
+                if key["format"] != latticeCache.formatKey(fileFormat):
+                    self.logger.debug("Frame index file is for a different format: '%s'", indexFile)
+                    return None
+                if key["source"]["path"] != os.path.realpath(filename):
+                    return None
+                index = FrameIndex(data["offsets"], data["NAtoms"], int(data["endOffset"]), source=key["source"])
+        
+        except (IOError, OSError, ValueError, KeyError) as error:
+            self.logger.warning("Could not load frame index file '%s': %s", indexFile, error)
+            return None
+        
+        return index
+    
+    def save(self, filename, fileFormat, index):
+        """Store the frame index of the given source file."""
+        indexFile = self.indexPath(filename)
+        key = json.dumps({"source": index.source, "format": latticeCache.formatKey(fileFormat)})
+        
+        # write to a temporary file and move into place
+        dirname = os.path.dirname(os.path.abspath(indexFile))
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname, 0o755)
+            
+            fd, tmpFile = tempfile.mkstemp(prefix=".tmp", suffix=INDEX_EXTENSION, dir=dirname)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(f, offsets=index.offsets, NAtoms=index.NAtoms, endOffset=index.endOffset, key=key)
+                
+                if os.path.exists(indexFile):
+                    os.unlink(indexFile)
+                os.rename(tmpFile, indexFile)
+            
+            except (IOError, OSError, MemoryError):
+                if os.path.exists(tmpFile):
+                    os.unlink(tmpFile)
+                raise
+        
+        except (IOError, OSError) as error:
+            self.logger.warning("Could not write frame index file '%s': %s", indexFile, error)
+            return False
+        
+        return True
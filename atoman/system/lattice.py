@@ -10,6 +10,8 @@ from __future__ import unicode_literals
 from __future__ import division
 import logging
 import copy
+import itertools
+import weakref
 
 import numpy as np
 
@@ -17,9 +19,19 @@ from .atoms import elements
 from ..algebra import vectors
 from . import _lattice
 from . import _output
+import six
 from six.moves import range
 
 
+# per atom arrays (shared between copy-on-write clones and stored as columns
+# in lattice stores, see latticeStore)
+ATOM_ARRAYS = ("atomID", "specie", "pos", "charge")
+
+# source of lattice versions (unique across all lattices, so a version also
+# identifies the lattice it belongs to)
+_versionCounter = itertools.count(1)
+
+
 class Lattice(object):
     """
     The Lattice object.
@@ -51,14 +63,59 @@ class Lattice(object):
         self.attributes = {}
         
         self.PBC = np.ones(3, np.int32)
+        
+        # buffers with spare capacity that the atom arrays are views onto (see addAtoms)
+        self._growthBuffers = {}
+        
+        # weak references to the views of the atom arrays held by copy-on-write clones (see clone)
+        self._cloneViews = []
+        
+        # changed whenever the atoms are modified (used to invalidate caches)
+        self.version = next(_versionCounter)
+    
+    def modified(self):
+        """
+        Mark the atoms as modified, invalidating any cached data derived from
+        them (for example shared neighbour lists).
+        
+        """
+        self.version = next(_versionCounter)
     
     def wrapAtoms(self):
         """
         Wrap atoms that have left the periodic cell.
         
         """
+        self.detach()
+        self.modified()
         return _lattice.wrapAtoms(self.NAtoms, self.pos, self.cellDims, self.PBC)
     
+    def detach(self):
+        """
+        Replace any atom arrays that are shared with another lattice (see
+        `clone`) with private copies. This must be called before modifying the
+        atom arrays in place, on both the clone and the lattice it was cloned
+        from.
+        
+        """
+        # views of this lattice's arrays that are still held by clones
+        views = [ref() for ref in self._cloneViews]
+        views = [view for view in views if view is not None]
+        self._cloneViews = [weakref.ref(view) for view in views]
+        
+        def isShared(array):
+            return not array.flags.writeable or any(np.may_share_memory(array, view) for view in views)
+        
+        for name in ATOM_ARRAYS:
+            array = getattr(self, name)
+            if isShared(array):
+                setattr(self, name, array.copy())
+        
+        for arrayDict in (self.scalarsDict, self.vectorsDict):
+            for name, array in list(arrayDict.items()):
+                if isShared(array):
+                    arrayDict[name] = array.copy()
+    
     def atomSeparation(self, index1, index2, pbc):
         """
         Calculate the separation between two atoms.
@@ -68,7 +125,7 @@ class Lattice(object):
         index1, index2 : integer
             Indexes of the atoms you want to calculate the separation
             between.
-
+        
         
         Returns
         -------
@@ -111,7 +168,7 @@ class Lattice(object):
         
         self.minPos = np.zeros(3, np.float64)
         self.maxPos = np.zeros(3, np.float64)
-         
+        
         self.cellDims = np.zeros(3, np.float64)
         
         self.scalarsDict = {}
@@ -121,6 +178,8 @@ class Lattice(object):
         self.attributes = {}
         
         self.PBC = np.ones(3, np.int32)
+        
+        self.modified()
     
     def calcTemperature(self, NMoving=None):
         """
@@ -200,59 +259,119 @@ class Lattice(object):
     
     def addAtom(self, sym, pos, charge, atomID=None, scalarVals={}, vectorVals={}):
         """
-        Add an atom to the lattice
+        Add an atom to the lattice (see `addAtoms` for adding many atoms)
         
         """
-        if sym not in self.specieList:
-            self.addSpecie(sym)
+        # vectors without three components are dropped
+        vectorVals = dict((name, [newval]) for name, newval in six.iteritems(vectorVals) if len(newval) == 3)
         
-        # atom ID
-        if atomID is None:
-            atomID = self.NAtoms
+        self.addAtoms([sym], [pos], [charge], atomID=None if atomID is None else [atomID], scalarVals=scalarVals,
+                      vectorVals=vectorVals)
+    
+    def addAtoms(self, symbols, pos, charge=None, atomID=None, scalarVals=None, vectorVals=None):
+        """
+        Add atoms to the lattice.
         
-        specInd = self.getSpecieIndex(sym)
+        `symbols` is either a sequence of symbols or an integer array of
+        indexes into the specie list, and `pos` the positions (N x 3 or flat).
+        Charges default to zero and atom IDs to consecutive values after the
+        current number of atoms. Scalars/vectors on the lattice that are not in
+        `scalarVals`/`vectorVals` are removed.
         
-        self.specieCount[specInd] += 1
+        The arrays grow geometrically (they are views onto larger buffers), so
+        adding atoms repeatedly takes amortised linear time.
         
-        pos = np.asarray(pos, dtype=np.float64)
+        """
+        logger = logging.getLogger(__name__)
         
-        self.atomID = np.append(self.atomID, np.int32(atomID))
-        self.specie = np.append(self.specie, np.int32(specInd))
-        self.pos = np.append(self.pos, pos)
-        self.charge = np.append(self.charge, np.float64(charge))
+        pos = np.asarray(pos, dtype=np.float64).reshape((-1, 3))
+        num = len(pos)
+        if num == 0:
+            return
         
-        # wrap positions
+        # specie indexes
+        symbols = np.asarray(symbols)
+        if symbols.dtype.kind in "iu":
+            specie = symbols.astype(np.int32, copy=False)
+            if specie.size and (specie.min() < 0 or specie.max() >= len(self.specieList)):
+                raise ValueError("Specie index out of range")
         
-        # min/max pos!!??
-        for i in range(3):
-            self.minPos[i] = min(self.minPos[i], pos[i])
-            self.maxPos[i] = max(self.maxPos[i], pos[i])
+        else:
+            uniqueSymbols, inverse = np.unique(symbols, return_inverse=True)
+            for sym in uniqueSymbols:
+                self.addSpecie(str(sym))
+            specieIndexes = np.asarray([self.getSpecieIndex(str(sym)) for sym in uniqueSymbols], dtype=np.int32)
+            specie = specieIndexes[inverse.reshape(-1)]
         
-        self.NAtoms += 1
+        if len(specie) != num:
+            raise ValueError("Number of species does not match number of positions (%d != %d)" % (len(specie), num))
         
-        logger = logging.getLogger(__name__)
+        self.specieCount += np.bincount(specie, minlength=len(self.specieList)).astype(np.int32)
+        
+        # atom IDs and charges
+        if atomID is None:
+            atomID = np.arange(self.NAtoms, self.NAtoms + num, dtype=np.int32)
+        if charge is None:
+            charge = 0.0
+        
+        self.atomID = self._appendValues("atomID", self.atomID, atomID, num)
+        self.specie = self._appendValues("specie", self.specie, specie, num)
+        self.pos = self._appendValues("pos", self.pos, pos, num)
+        self.charge = self._appendValues("charge", self.charge, charge, num)
+        
+        self.minPos = np.minimum(self.minPos, pos.min(axis=0))
+        self.maxPos = np.maximum(self.maxPos, pos.max(axis=0))
         
         for scalarName in list(self.scalarsDict.keys()):
-            if scalarName in scalarVals:
-                newval = scalarVals[scalarName]
-                self.scalarsDict[scalarName] = np.append(self.scalarsDict[scalarName], np.float64(newval))
+            if scalarVals is not None and scalarName in scalarVals:
+                self.scalarsDict[scalarName] = self._appendValues(("scalars", scalarName), self.scalarsDict[scalarName],
+                                                                  scalarVals[scalarName], num)
             
             else:
                 self.scalarsDict.pop(scalarName)
                 logger.warning("Removing '%s' scalars from Lattice (addAtom)", scalarName)
         
         for vectorName in list(self.vectorsDict.keys()):
-            newval = []
-            if vectorName in vectorVals:
-                newval = vectorVals[vectorName]
-            
-            if len(newval) == 3:
-                self.vectorsDict[vectorName] = np.append(self.vectorsDict[vectorName], np.asarray(newval,
-                                                         dtype=np.float64))
+            if vectorVals is not None and vectorName in vectorVals:
+                self.vectorsDict[vectorName] = self._appendValues(("vectors", vectorName), self.vectorsDict[vectorName],
+                                                                  vectorVals[vectorName], num)
             
             else:
                 self.vectorsDict.pop(vectorName)
                 logger.warning("Removing '%s' vectors from Lattice (addAtom)", vectorName)
+        
+        self.NAtoms += num
+        self.modified()
+    
+    def _appendValues(self, key, array, values, num):
+        """
+        Return `array` with the values for `num` new atoms appended. The
+        result is a view onto a buffer with spare capacity, which is reused by
+        later calls as long as the array has not been replaced since.
+        
+        """
+        # values per atom along the first axis (3 for the flat positions)
+        if key == "pos":
+            perAtom = 3
+        else:
+            perAtom = array.shape[0] // self.NAtoms if self.NAtoms else 1
+        shape = (num * perAtom,) + array.shape[1:]
+        values = np.broadcast_to(np.asarray(values).reshape((-1,) + array.shape[1:]), shape)
+        
+        length = len(array)
+        newLength = length + shape[0]
+        
+        buf, view = self._growthBuffers.get(key, (None, None))
+        if view is not array or array.base is not buf or not array.flags.writeable or len(buf) < newLength:
+            capacity = max(newLength, length + length // 2)
+            buf = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+            buf[:length] = array
+        
+        buf[length:newLength] = values
+        view = buf[:newLength]
+        self._growthBuffers[key] = (buf, view)
+        
+        return view
     
     def removeAtom(self, index):
         """
@@ -265,6 +384,7 @@ class Lattice(object):
         self.pos = np.delete(self.pos, [3 * index, 3 * index + 1, 3 * index + 2])
         self.charge = np.delete(self.charge, index)
         self.NAtoms -= 1
+        self.modified()
         
         # modify specie list / counter if required
         self.specieCount[specInd] -= 1
@@ -290,9 +410,8 @@ class Lattice(object):
 #         self.specieMassAMU = np.delete(self.specieMassAMU, index)
         self.specieRGB = np.delete(self.specieRGB, index, axis=0)
         
-        for i in range(self.NAtoms):
-            if self.specie[i] > index:
-                self.specie[i] -= 1
+        self.detach()
+        self.specie[self.specie > index] -= 1
     
     def calcForce(self, forceConfig):
         """
@@ -300,13 +419,13 @@ class Lattice(object):
         
         """
         pass
-    
+
 #         if type(forceConfig) is not forces.ForceConfig:
 #             print "FORCE CONFIG WRONG TYPE"
 #             return 113
 #
 #         return forces.calc_force(self, forceConfig)
-    
+
     def atomPos(self, index):
         """
         Return pointer to atom position within pos array: [xpos, ypos, zpos].
@@ -416,61 +535,56 @@ class Lattice(object):
         _output.writeLattice(filename, visibleAtoms, self.cellDims, self.specieList, self.specie, self.pos, self.charge,
                              writeFullLattice)
     
-    def clone(self, lattice):
+    def clone(self, lattice, copyOnWrite=False):
         """
-        Copy given lattice into this instance
+        Copy given lattice into this instance.
+        
+        With `copyOnWrite` the atom arrays (including scalars and vectors) are
+        not copied: this lattice gets read-only views of them, and the given
+        lattice keeps writable arrays but records the views. Either lattice
+        makes private copies when it modifies them (see `detach`).
         
         """
         if lattice.NAtoms != self.NAtoms:
             self.reset(lattice.NAtoms)
         
-        NAtoms = lattice.NAtoms
-        
         # copy dims
-        self.cellDims[0] = lattice.cellDims[0]
-        self.cellDims[1] = lattice.cellDims[1]
-        self.cellDims[2] = lattice.cellDims[2]
+        self.cellDims[:] = lattice.cellDims
         
         # specie stuff
-        NSpecies = len(lattice.specieList)
-        self.specieList = []
-        self.specieCount = np.zeros(NSpecies, np.int32)
-        self.specieMass = np.empty(NSpecies, np.float64)
-        self.specieCovalentRadius = np.empty(NSpecies, np.float64)
-        self.specieAtomicNumber = np.zeros(NSpecies, np.int32)
-        self.specieRGB = np.empty((NSpecies, 3), np.float64)
-        for i in range(NSpecies):
-            self.specieList.append(lattice.specieList[i])
-            self.specieCount[i] = lattice.specieCount[i]
-            self.specieMass[i] = lattice.specieMass[i]
-            self.specieCovalentRadius[i] = lattice.specieCovalentRadius[i]
-            self.specieAtomicNumber[i] = lattice.specieAtomicNumber[i]
-            for j in range(3):
-                self.specieRGB[i][j] = lattice.specieRGB[i][j]
+        self.specieList = list(lattice.specieList)
+        self.specieCount = np.array(lattice.specieCount, dtype=np.int32)
+        self.specieMass = np.array(lattice.specieMass, dtype=np.float64)
+        self.specieCovalentRadius = np.array(lattice.specieCovalentRadius, dtype=np.float64)
+        self.specieAtomicNumber = np.array(lattice.specieAtomicNumber, dtype=np.int32)
+        self.specieRGB = np.array(lattice.specieRGB, dtype=np.float64)
         
         # atom data
-        self.atomID = np.empty(NAtoms, np.int32)
-        self.specie = np.empty(NAtoms, np.int32)
-        self.pos = np.empty(3 * NAtoms, np.float64)
-        self.charge = np.empty(NAtoms, np.float64)
-        for i in range(NAtoms):
-            self.atomID[i] = lattice.atomID[i]
-            self.specie[i] = lattice.specie[i]
-            self.charge[i] = lattice.charge[i]
-            for j in range(3):
-                self.pos[3 * i + j] = lattice.pos[3 * i + j]
-        
-        self.minPos[0] = lattice.minPos[0]
-        self.minPos[1] = lattice.minPos[1]
-        self.minPos[2] = lattice.minPos[2]
-        self.maxPos[0] = lattice.maxPos[0]
-        self.maxPos[1] = lattice.maxPos[1]
-        self.maxPos[2] = lattice.maxPos[2]
-        
-        self.scalarsDict = copy.deepcopy(lattice.scalarsDict)
-        self.vectorsDict = copy.deepcopy(lattice.vectorsDict)
+        if copyOnWrite:
+            lattice._cloneViews = [ref for ref in lattice._cloneViews if ref() is not None]
+            
+            def copyArray(array):
+                view = array.view()
+                view.flags.writeable = False
+                lattice._cloneViews.append(weakref.ref(view))
+                return view
+        
+        else:
+            def copyArray(array):
+                return array.copy()
+        
+        for name in ATOM_ARRAYS:
+            setattr(self, name, copyArray(getattr(lattice, name)))
+        self.scalarsDict = dict((name, copyArray(array)) for name, array in six.iteritems(lattice.scalarsDict))
+        self.vectorsDict = dict((name, copyArray(array)) for name, array in six.iteritems(lattice.vectorsDict))
+        
+        self.minPos[:] = lattice.minPos
+        self.maxPos[:] = lattice.maxPos
+        
         self.scalarsFiles = copy.deepcopy(lattice.scalarsFiles)
         self.vectorsFiles = copy.deepcopy(lattice.vectorsFiles)
         self.attributes = copy.deepcopy(lattice.attributes)
         
         self.PBC = copy.deepcopy(lattice.PBC)
+        
+        self.modified()
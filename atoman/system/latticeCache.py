@@ -0,0 +1,230 @@
+"""
+On-disk cache of parsed lattice files
+
+The data parsed from a lattice file by the generic reader (the arrays and the
+header values) are stored in a binary sidecar file, either next to the source
+file or in the data directory. The cache file is keyed by the path, size and
+modification time of the source file, by the file format used to read it and
+by the body columns that were read (files read with only some of the columns
+are cached separately), so it is only used while the source file is unchanged.
+
+The cache file consists of a magic string, the version of the cache format,
+the length of a JSON header (describing the source file, the values and the
+arrays) and then the arrays themselves. The data start at the first aligned
+offset after the header and each array is aligned, so the arrays can be memory
+mapped directly when the cache is loaded.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import json
+import struct
+import hashlib
+import logging
+import tempfile
+
+import numpy as np
+import six
+
+from ..visutils import utilities
+
+
+CACHE_MAGIC = b"ATOMANLC"
+CACHE_VERSION = 1
+CACHE_EXTENSION = ".atomancache"
+CACHE_DIRECTORY = "lattice_cache"
+
+# alignment of the arrays in the cache file (bytes)
+ALIGNMENT = 64
+
+# struct format of the preamble: magic, version, header length
+PREAMBLE = struct.Struct("<8sIQ")
+
+# where the cache files can be stored
+CACHE_LOCATIONS = ("source", "data")
+
+
+def alignedOffset(offset):
+    """Return the first aligned offset at or after the given offset."""
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def sourceKey(filename):
+    """Return the key identifying the current state of the given source file."""
+    st = os.stat(filename)
+    mtime = getattr(st, "st_mtime_ns", None)
+    if mtime is None:
+        mtime = repr(st.st_mtime)
+    
+    return {"path": os.path.realpath(filename), "size": st.st_size, "mtime": mtime}
+
+
+def formatKey(fileFormat):
+    """Return the key identifying the given file format (as a string)."""
+    key = [fileFormat.name, fileFormat.header, fileFormat.body, fileFormat.delimiter, fileFormat.atomIndexOffset]
+    
+    return json.dumps(key, sort_keys=True)
+
+
+def columnsKey(columns):
+    """Return the key identifying the given body columns (None if all columns are read)."""
+    if columns is None:
+        return None
+    
+    return sorted(set(columns))
+
+
+class LatticeCache(object):
+    """
+    On-disk cache of the data parsed from lattice files.
+    
+    `location` is either "source" (the cache file is stored next to the source
+    file) or "data" (the cache files are stored in the data directory, or in
+    `directory` if given).
+    
+    """
+    def __init__(self, location="data", directory=None):
+        if location not in CACHE_LOCATIONS:
+            raise ValueError("Unrecognised lattice cache location: '%s'" % location)
+        
+        self.logger = logging.getLogger(__name__)
+        self.location = location
+        if directory is None and location == "data":
+            directory = utilities.dataPath(CACHE_DIRECTORY)
+        self.directory = directory
+    
+    def cachePath(self, filename, columns=None):
+        """
+        Return the path of the cache file for the given source file, read with
+        the given body columns (all of them if `columns` is None).
+        
+        """
+        extension = CACHE_EXTENSION
+        if columns is not None:
+            columnsDigest = hashlib.sha1(json.dumps(columnsKey(columns)).encode("utf-8")).hexdigest()
+            extension = "." + columnsDigest[:12] + extension
+        
+        if self.location == "source":
+            return filename + extension
+        
+        digest = hashlib.sha1(os.path.realpath(filename).encode("utf-8")).hexdigest()
+        
+        return os.path.join(self.directory, digest + extension)
+    
+    def load(self, filename, fileFormat, columns=None):
+        """
+        Return the data cached for the given source file, file format and body
+        columns, or None if there is no valid cache file. The arrays are memory
+        mapped (copy-on-write) from the cache file.
+        
+        """
+        cacheFile = self.cachePath(filename, columns)
+        if not os.path.exists(cacheFile):
+            return None
+        
+        try:
+            with open(cacheFile, "rb") as f:
+                magic, version, headerLength = PREAMBLE.unpack(f.read(PREAMBLE.size))
+                if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                    self.logger.debug("Ignoring lattice cache file with wrong version: '%s'", cacheFile)
+                    return None
+                header = json.loads(f.read(headerLength).decode("utf-8"))
+            dataStart = alignedOffset(PREAMBLE.size + headerLength)
+            
+            if (header["source"] != sourceKey(filename) or header["format"] != formatKey(fileFormat) or
+                    header.get("columns") != columnsKey(columns)):
+                self.logger.debug("Lattice cache file is out of date: '%s'", cacheFile)
+                return None
+            
+            resultDict = header["values"]
+            for name, dtype, shape, offset in header["arrays"]:
+                if np.prod(shape) == 0:
+                    array = np.empty(shape, dtype=dtype)
+                else:
+                    array = np.memmap(cacheFile, dtype=dtype, mode="c", offset=dataStart + offset, shape=tuple(shape))
+                    array = array.view(np.ndarray)
+                resultDict[name] = array
+        
+        except (IOError, OSError, ValueError, KeyError, struct.error) as error:
+            self.logger.warning("Could not load lattice cache file '%s': %s", cacheFile, error)
+            return None
+        
+        self.logger.info("Loaded lattice from cache: '%s'", cacheFile)
+        
+        return resultDict
+    
+    def save(self, filename, fileFormat, resultDict, source=None, columns=None):
+        """
+        Store the data parsed from the given source file. `source` is the key
+        of the source file when it was read (see `sourceKey`); it should be
+        taken before reading the file so that a file modified while being read
+        is not cached. `columns` are the body columns that were read (None if
+        all of them were read).
+        
+        """
+        cacheFile = self.cachePath(filename, columns)
+        if source is None:
+            source = sourceKey(filename)
+        
+        # split the data into values (stored in the header) and arrays
+        values = {}
+        arrays = []
+        for name, value in six.iteritems(resultDict):
+            if isinstance(value, np.ndarray):
+                arrays.append((name, np.ascontiguousarray(value)))
+            else:
+                values[name] = value
+        
+        # layout of the arrays (offsets relative to the start of the data)
+        layout = []
+        offset = 0
+        for name, array in arrays:
+            offset = alignedOffset(offset)
+            layout.append((name, array.dtype.str, array.shape, offset))
+            offset += array.nbytes
+        
+        header = {"source": source, "format": formatKey(fileFormat), "columns": columnsKey(columns), "values": values,
+                  "arrays": layout}
+        headerBytes = json.dumps(header).encode("utf-8")
+        dataStart = alignedOffset(PREAMBLE.size + len(headerBytes))
+        
+        # write to a temporary file and move into place
+        dirname = os.path.dirname(os.path.abspath(cacheFile))
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname, 0o755)
+            
+            fd, tmpFile = tempfile.mkstemp(prefix=".tmp", suffix=CACHE_EXTENSION, dir=dirname)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(PREAMBLE.pack(CACHE_MAGIC, CACHE_VERSION, len(headerBytes)))
+                    f.write(headerBytes)
+                    for (_, array), (_, _, _, arrayOffset) in zip(arrays, layout):
+                        f.write(b"\0" * (dataStart + arrayOffset - f.tell()))
+                        f.write(array.tobytes())
+                
+                if os.path.exists(cacheFile):
+                    os.unlink(cacheFile)
+                os.rename(tmpFile, cacheFile)
+            
+            except (IOError, OSError, MemoryError):
+                if os.path.exists(tmpFile):
+                    os.unlink(tmpFile)
+                raise
+        
+        except (IOError, OSError) as error:
+            self.logger.warning("Could not write lattice cache file '%s': %s", cacheFile, error)
+            return False
+        
+        self.logger.debug("Wrote lattice cache file: '%s'", cacheFile)
+        
+        return True
+    
+    def remove(self, filename, columns=None):
+        """Remove the cache file for the given source file and body columns (if any)."""
+        cacheFile = self.cachePath(filename, columns)
+        if os.path.exists(cacheFile):
+            os.unlink(cacheFile)
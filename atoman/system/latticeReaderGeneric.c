@@ -10,6 +10,7 @@
 #include <math.h>
 #include <locale.h>
 #include "visclibs/array_utils.h"
+#include "system/file_stream.h"
 
 #if PY_MAJOR_VERSION >= 3
     #define PyString_Size PyUnicode_GET_SIZE
@@ -32,12 +33,24 @@
 
 //#define DEBUG
 #define MAX_LINE_LENGTH 512
+/* number of atoms read (and parsed in parallel) at a time */
+#define PARALLEL_BLOCK_ATOMS 65536
+/* error types when parsing an atom */
+#define PARSE_TYPE_ERROR 1
+#define PARSE_IO_ERROR 2
+#define PARSE_RUNTIME_ERROR 3
+/* name of the capsules holding open file streams */
+#define FILE_STREAM_CAPSULE "atoman.system.FileStream"
 
 struct BodyLineItem
 {
     char *key;
     char *type;
     int dim;
+    /* array data (NULL if skipped) */
+    char *data;
+    int typenum;
+    int isSymbol;
 };
 
 struct BodyLine
@@ -52,9 +65,26 @@ struct Body
     struct BodyLine *lines;
 };
 
+/* lines of a block of atoms */
+struct LineBlock
+{
+    char *text;
+    size_t len;
+    size_t cap;
+    size_t *offsets;
+};
+
 static PyObject* readGenericLatticeFile(PyObject*, PyObject*);
 static PyObject* getMinMaxPos(PyObject*, PyObject*);
+static PyObject* supportedCompressionFormats(PyObject*, PyObject*);
+static PyObject* indexFrames(PyObject*, PyObject*);
+static PyObject* openFileStream(PyObject*, PyObject*);
+static PyObject* fileStreamOffset(PyObject*, PyObject*);
 static void freeBody(struct Body);
+static long readRecordBlock(FileStream*, struct LineBlock*, long, Py_ssize_t, int*);
+static int parseAtomRecord(char**, struct Body*, const char*, long, int, int, long, long*, unsigned short*, char*);
+static int readBody(FileStream*, struct Body*, const char*, long, int, int, PyObject*, PyObject*, PyObject*,
+        const char*, int);
 
 
 /*******************************************************************************
@@ -63,6 +93,10 @@ static void freeBody(struct Body);
 static struct PyMethodDef module_methods[] = {
     {"readGenericLatticeFile", readGenericLatticeFile, METH_VARARGS, "Read generic Lattice file"},
     {"getMinMaxPos", getMinMaxPos, METH_VARARGS, "Get the min/max pos"},
+    {"supportedCompressionFormats", supportedCompressionFormats, METH_NOARGS, "Return the supported compression formats"},
+    {"indexFrames", indexFrames, METH_VARARGS, "Index the frames in a multi-frame file"},
+    {"openFileStream", openFileStream, METH_VARARGS, "Open a (possibly compressed) file stream for reading frames"},
+    {"fileStreamOffset", fileStreamOffset, METH_VARARGS, "Return the current offset of a file stream"},
     {NULL, NULL, 0, NULL}
 };
 
@@ -96,6 +130,64 @@ freeBody(struct Body body)
     free(body.lines);
 }
 
+/*******************************************************************************
+ * Close the stream if it was opened by the reader (streams passed in from
+ * Python are left open so the next frame can be read from where this one ends)
+ *******************************************************************************/
+static void
+releaseStream(FileStream *stream, int owned)
+{
+    if (owned) fileStreamClose(stream);
+}
+
+/*******************************************************************************
+ * File stream capsules
+ *******************************************************************************/
+static void
+fileStreamCapsuleDestructor(PyObject *capsule)
+{
+    fileStreamClose((FileStream*) PyCapsule_GetPointer(capsule, FILE_STREAM_CAPSULE));
+}
+
+static PyObject*
+openFileStream(PyObject *self, PyObject *args)
+{
+    char *filename;
+    char errstring[512];
+    FileStream *stream;
+    PyObject *capsule;
+
+    if (!PyArg_ParseTuple(args, "s", &filename))
+        return NULL;
+
+    stream = fileStreamOpen(filename, errstring, sizeof(errstring));
+    if (stream == NULL)
+    {
+        PyErr_SetString(PyExc_IOError, errstring);
+        return NULL;
+    }
+
+    capsule = PyCapsule_New(stream, FILE_STREAM_CAPSULE, fileStreamCapsuleDestructor);
+    if (capsule == NULL) fileStreamClose(stream);
+
+    return capsule;
+}
+
+static PyObject*
+fileStreamOffset(PyObject *self, PyObject *args)
+{
+    PyObject *capsule;
+    FileStream *stream;
+
+    if (!PyArg_ParseTuple(args, "O", &capsule))
+        return NULL;
+
+    stream = (FileStream*) PyCapsule_GetPointer(capsule, FILE_STREAM_CAPSULE);
+    if (stream == NULL) return NULL;
+
+    return PyLong_FromLongLong(fileStreamTell(stream));
+}
+
 
 /*******************************************************************************
  * Read generic lattice file
@@ -105,19 +197,24 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 {
     int atomIndexOffset, linkedNAtoms;
     char *filename, *delimiter, *basename=NULL;
-    FILE *INFILE=NULL;
+    char errstring[512];
+    FileStream *INFILE=NULL;
     PyObject *headerList=NULL;
     PyObject *bodyList=NULL;
     PyObject *resultDict=NULL;
     PyObject *updateProgressCallback=NULL;
+    PyObject *streamCapsule=NULL;
+    int numThreads = 1;
+    int ownStream = 1;
+    long long offset = 0;
     
     
     /* force locale to use dots for decimal separator */
     setlocale(LC_NUMERIC, "C");
     
     /* parse and check arguments from Python */
-    if (!PyArg_ParseTuple(args, "sO!O!sii|Os", &filename, &PyList_Type, &headerList, &PyList_Type, &bodyList, &delimiter,
-            &atomIndexOffset, &linkedNAtoms, &updateProgressCallback, &basename))
+    if (!PyArg_ParseTuple(args, "sO!O!sii|OsiLO", &filename, &PyList_Type, &headerList, &PyList_Type, &bodyList, &delimiter,
+            &atomIndexOffset, &linkedNAtoms, &updateProgressCallback, &basename, &numThreads, &offset, &streamCapsule))
         return NULL;
 
 #ifdef DEBUG
@@ -126,6 +223,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 #endif
     
     /* check callback is callable */
+    if (updateProgressCallback == Py_None) updateProgressCallback = NULL;
     if (updateProgressCallback != NULL)
     {
         if (!PyCallable_Check(updateProgressCallback))
@@ -138,16 +236,31 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 #endif
     }
     
-    /* open the file for reading */
-    INFILE = fopen(filename, "r");
-
-    /* handle error */
-    if (INFILE == NULL)
+    /* open the file for reading (decompressing if required) or use the given stream */
+    if (streamCapsule != NULL && streamCapsule != Py_None)
+    {
+        INFILE = (FileStream*) PyCapsule_GetPointer(streamCapsule, FILE_STREAM_CAPSULE);
+        if (INFILE == NULL) return NULL;
+        ownStream = 0;
+    }
+    else
     {
-        char errstring[128];
+        INFILE = fileStreamOpen(filename, errstring, sizeof(errstring));
 
-        sprintf(errstring, "%s: '%s'", strerror(errno), filename);
-        PyErr_SetString(PyExc_IOError, errstring);
+        /* handle error */
+        if (INFILE == NULL)
+        {
+            PyErr_SetString(PyExc_IOError, errstring);
+            return NULL;
+        }
+    }
+
+    /* move to the start of the frame (multi-frame files); compressed streams
+     * only decompress forwards from their current position */
+    if (fileStreamTell(INFILE) != offset && fileStreamSeek(INFILE, offset))
+    {
+        PyErr_Format(PyExc_IOError, "Could not seek to offset %lld: %s", offset, fileStreamErrorString(INFILE));
+        releaseStream(INFILE, ownStream);
         return NULL;
     }
     /* continue to read */
@@ -155,7 +268,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
     {
         int atomIDFlag = 0;
         int haveSpecieOrSymbol = 0;
-        long i, numLines, callbackInterval = 0;
+        long i, numLines;
         long NAtoms = -1;
         PyObject *specieList=NULL;
         PyObject *specieCount=NULL;
@@ -166,7 +279,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         if (resultDict == NULL)
         {
             PyErr_SetString(PyExc_RuntimeError, "Could not allocate resultDict");
-            fclose(INFILE);
+            releaseStream(INFILE, ownStream);
             return NULL;
         }
 
@@ -188,11 +301,14 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
             lineLength = PyList_Size(headerLine);
 
             /* read line */
-            if (fgets(line, MAX_LINE_LENGTH, INFILE) == NULL)
+            if (fileStreamGets(line, MAX_LINE_LENGTH, INFILE) == NULL)
             {
-                PyErr_SetString(PyExc_IOError, "End of file reached while reading header");
+                if (fileStreamError(INFILE))
+                    PyErr_Format(PyExc_IOError, "Error reading header: %s", fileStreamErrorString(INFILE));
+                else
+                    PyErr_SetString(PyExc_IOError, "End of file reached while reading header");
                 Py_DECREF(resultDict);
-                fclose(INFILE);
+                releaseStream(INFILE, ownStream);
                 return NULL;
             }
 
@@ -210,7 +326,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                 itemTuple = PyList_GetItem(headerLine, count); // borrowed ref, no need to DECREF
                 if (!PyArg_ParseTuple(itemTuple, "ssi", &key, &type, &dim))
                 {
-                    fclose(INFILE);
+                    releaseStream(INFILE, ownStream);
                     Py_DECREF(resultDict);
                     return NULL;
                 }
@@ -231,7 +347,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 
                             sprintf(errstring, "Could not convert '%s' to integer (header line: %ld; key: '%s')", pch, i, key);
                             PyErr_SetString(PyExc_TypeError, errstring);
-                            fclose(INFILE);
+                            releaseStream(INFILE, ownStream);
                             Py_DECREF(resultDict);
                             return NULL;
                         }
@@ -252,7 +368,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 
                             sprintf(errstring, "Could not convert '%s' to double (header line: %ld; key: '%s')", pch, i, key);
                             PyErr_SetString(PyExc_TypeError, errstring);
-                            fclose(INFILE);
+                            releaseStream(INFILE, ownStream);
                             Py_DECREF(resultDict);
                             return NULL;
                         }
@@ -269,7 +385,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 
                         sprintf(errstring, "Unrecognised type string: '%s'", type);
                         PyErr_SetString(PyExc_RuntimeError, errstring);
-                        fclose(INFILE);
+                        releaseStream(INFILE, ownStream);
                         Py_DECREF(resultDict);
                         return NULL;
                     }
@@ -287,7 +403,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 
                         sprintf(errstring, "Could not set item in dictionary: '%s'", key);
                         PyErr_SetString(PyExc_RuntimeError, errstring);
-                        fclose(INFILE);
+                        releaseStream(INFILE, ownStream);
                         Py_DECREF(resultDict);
                         return NULL;
                     }
@@ -306,7 +422,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                 sprintf(errstring, "Wrong length for header line %ld: %ld != %ld", i, count, lineLength);
                 PyErr_SetString(PyExc_IOError, errstring);
                 Py_DECREF(resultDict);
-                fclose(INFILE);
+                releaseStream(INFILE, ownStream);
                 return NULL;
             }
         }
@@ -316,7 +432,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         {
             PyErr_SetString(PyExc_RuntimeError, "Cannot autodetect NAtoms at the moment...");
             Py_DECREF(resultDict);
-            fclose(INFILE);
+            releaseStream(INFILE, ownStream);
             return NULL;
         }
         // we could do a pass through whole file to get NAtoms, then seek back to where we were...
@@ -331,7 +447,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                 
                 sprintf(errstring, "Number of atoms does not match linked lattice (%ld != %d)", NAtoms, linkedNAtoms);
                 Py_DECREF(resultDict);
-                fclose(INFILE);
+                releaseStream(INFILE, ownStream);
                 PyErr_SetString(PyExc_ValueError, errstring);
                 return NULL;
             }
@@ -341,25 +457,6 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         printf("Preparing to read body; NAtoms = %ld\n", NAtoms);
 #endif
 
-        /* callback interval */
-        if (updateProgressCallback != NULL)
-        {
-            /* callback interval */
-            if (NAtoms < 500)
-                callbackInterval = NAtoms;
-            else
-            {
-                callbackInterval = (long) (NAtoms / 10);
-                if (callbackInterval < 500)
-                    callbackInterval = 500;
-                else if (callbackInterval > 20000)
-                    callbackInterval = 20000;
-            }
-#ifdef DEBUG
-            printf("Callback interval = %ld atoms\n", callbackInterval);
-#endif
-        }
-        
         /* body format (should be faster than parsing list/tuples) */
         /* number of body lines per atom */
         bodyFormat.numLines = PyList_Size(bodyList);
@@ -373,7 +470,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         {
             PyErr_SetString(PyExc_MemoryError, "Cannot allocate bodyFormat.lines");
             Py_DECREF(resultDict);
-            fclose(INFILE);
+            releaseStream(INFILE, ownStream);
             return NULL;
         }
 
@@ -393,7 +490,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
             {
                 PyErr_SetString(PyExc_MemoryError, "Cannot allocate bodyFormat.lines[].items");
                 Py_DECREF(resultDict);
-                fclose(INFILE);
+                releaseStream(INFILE, ownStream);
                 freeBody(bodyFormat);
                 return NULL;
             }
@@ -415,7 +512,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                 itemTuple = PyList_GetItem(lineList, j);
                 if (!PyArg_ParseTuple(itemTuple, "ssi", &key, &type, &dim))
                 {
-                    fclose(INFILE);
+                    releaseStream(INFILE, ownStream);
                     Py_DECREF(resultDict);
                     freeBody(bodyFormat);
                     return NULL;
@@ -425,6 +522,9 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                 bodyFormat.lines[i].items[j].key = key;
                 bodyFormat.lines[i].items[j].type = type;
                 bodyFormat.lines[i].items[j].dim = dim;
+                bodyFormat.lines[i].items[j].data = NULL;
+                bodyFormat.lines[i].items[j].typenum = -1;
+                bodyFormat.lines[i].items[j].isSymbol = !strcmp("Symbol", key);
 
                 /* check if we're supposed to ignore this value... */
                 if (strcmp("SKIP", key))
@@ -438,13 +538,15 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                         typenum = NPY_INT32;
                     else if (!strcmp("d", type))
                         typenum = NPY_FLOAT64;
+                    else if (!strcmp("f", type))
+                        typenum = NPY_FLOAT32;
                     else
                     {
                         char errstring[128];
 
                         sprintf(errstring, "Unrecognised type string (body prep): '%s'", type);
                         PyErr_SetString(PyExc_RuntimeError, errstring);
-                        fclose(INFILE);
+                        releaseStream(INFILE, ownStream);
                         Py_DECREF(resultDict);
                         freeBody(bodyFormat);
                         return NULL;
@@ -458,12 +560,16 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
 
                         sprintf(errstring, "Could not allocate ndarray: '%s'", key);
                         PyErr_SetString(PyExc_MemoryError, errstring);
-                        fclose(INFILE);
+                        releaseStream(INFILE, ownStream);
                         Py_DECREF(resultDict);
                         freeBody(bodyFormat);
                         return NULL;
                     }
 
+                    /* keep the data pointer for the body reader */
+                    bodyFormat.lines[i].items[j].data = PyArray_DATA(data);
+                    bodyFormat.lines[i].items[j].typenum = typenum;
+
                     /* store in dict */
                     stat = PyDict_SetItemString(resultDict, key, PyArray_Return(data));
 
@@ -481,7 +587,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
                         sprintf(errstring, "Could not set item in dictionary (body prep): '%s'", key);
                         PyErr_SetString(PyExc_RuntimeError, errstring);
                         // need to free arrays too...
-                        fclose(INFILE);
+                        releaseStream(INFILE, ownStream);
                         Py_DECREF(resultDict);
                         freeBody(bodyFormat);
                         return NULL;
@@ -505,7 +611,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
             if (atomID == NULL)
             {
                 PyErr_SetString(PyExc_MemoryError, "Could not allocate atomID array");
-                fclose(INFILE);
+                releaseStream(INFILE, ownStream);
                 Py_DECREF(resultDict);
                 freeBody(bodyFormat);
                 return NULL;
@@ -521,7 +627,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
             {
                 PyErr_SetString(PyExc_RuntimeError, "Could not set atomID in dictionary");
                 // need to free arrays too...
-                fclose(INFILE);
+                releaseStream(INFILE, ownStream);
                 Py_DECREF(resultDict);
                 freeBody(bodyFormat);
                 return NULL;
@@ -533,7 +639,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         if (specieList == NULL)
         {
             PyErr_SetString(PyExc_RuntimeError, "Could not create specieList\n");
-            fclose(INFILE);
+            releaseStream(INFILE, ownStream);
             Py_DECREF(resultDict);
             freeBody(bodyFormat);
             return NULL;
@@ -543,7 +649,7 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         if (specieCount == NULL)
         {
             PyErr_SetString(PyExc_RuntimeError, "Could not create specieCount\n");
-            fclose(INFILE);
+            releaseStream(INFILE, ownStream);
             Py_DECREF(resultDict);
             Py_DECREF(specieList);
             freeBody(bodyFormat);
@@ -555,506 +661,482 @@ readGenericLatticeFile(PyObject *self, PyObject *args)
         printf("Reading body...\n");
 #endif
 
-        /* loop over all atoms */
-        numLines = bodyFormat.numLines;
-        for (i = 0; i < NAtoms; i++)
+        /* read the body in blocks of atoms, without holding the GIL */
+        if (readBody(INFILE, &bodyFormat, delimiter, NAtoms, atomIDFlag, atomIndexOffset, specieList, specieCount,
+                updateProgressCallback, basename, numThreads))
         {
-            long atomIndex = -1;
-            Py_ssize_t j;
-            char *atomLines[numLines];
+            releaseStream(INFILE, ownStream);
+            Py_DECREF(resultDict);
+            Py_DECREF(specieList);
+            Py_DECREF(specieCount);
+            freeBody(bodyFormat);
+            return NULL;
+        }
 
-            /* read all of this atom's lines first... */
-            for (j = 0; j < numLines; j++)
-            {
-                atomLines[j] = malloc(MAX_LINE_LENGTH * sizeof(char));
-                if (atomLines[j] == NULL)
-                {
-                    long k;
+        /* store specieList/Count */
+        PyDict_SetItemString(resultDict, "specieList", specieList);
+        Py_DECREF(specieList);
+        PyDict_SetItemString(resultDict, "specieCount", specieCount);
+        Py_DECREF(specieCount);
 
-                    PyErr_SetString(PyExc_MemoryError, "Could not allocate atom line");
-                    Py_DECREF(resultDict);
-                    Py_DECREF(specieList);
-                    Py_DECREF(specieCount);
-                    fclose(INFILE);
-                    for (k = 0; k < j; k++) free(atomLines[k]);
-                    freeBody(bodyFormat);
-                    return NULL;
-                }
+        freeBody(bodyFormat);
+    }
 
-                if (fgets(atomLines[j], MAX_LINE_LENGTH, INFILE) == NULL)
-                {
-                    long k;
-                    char errstring[128];
+    releaseStream(INFILE, ownStream);
 
-                    sprintf(errstring, "End of file reached while reading body (atom %ld)", i);
-                    PyErr_SetString(PyExc_IOError, errstring);
-                    Py_DECREF(resultDict);
-                    Py_DECREF(specieList);
-                    Py_DECREF(specieCount);
-                    fclose(INFILE);
-                    for (k = 0; k < j; k++) free(atomLines[k]);
-                    freeBody(bodyFormat);
-                    return NULL;
+#ifdef DEBUG
+    printf("GENREADER: finished\n");
+#endif
+
+    return resultDict;
+}
+
+/*******************************************************************************
+ * Read the lines of up to maxRecords atoms into the block. Returns the number
+ * of complete atom records read; *readStatus is set to 1 if the end of the
+ * file was reached (or a read error occurred) before all records were read.
+ *******************************************************************************/
+static long
+readRecordBlock(FileStream *stream, struct LineBlock *block, long maxRecords, Py_ssize_t numLines, int *readStatus)
+{
+    long record;
+    
+    block->len = 0;
+    *readStatus = 0;
+    for (record = 0; record < maxRecords; record++)
+    {
+        Py_ssize_t j;
+        
+        for (j = 0; j < numLines; j++)
+        {
+            char *line;
+            long lineIndex = record * numLines + j;
+            
+            /* grow the text buffer */
+            if (block->len + MAX_LINE_LENGTH > block->cap)
+            {
+                size_t newCap = 2 * block->cap + MAX_LINE_LENGTH;
+                char *tmp = realloc(block->text, newCap * sizeof(char));
+                
+                if (tmp == NULL)
+                {
+                    *readStatus = -1;
+                    return record;
                 }
+                block->text = tmp;
+                block->cap = newCap;
             }
             
-            /* if atomID is in file, we should parse the line once and get the atom ID */
-            /* Check that the atomID is <= NAtoms (depending if starts from one)
-             * Make an input flag/option that says if atom ID starts from 1 or 0...
-             */
-            if (atomIDFlag)
+            /* read the line */
+            line = block->text + block->len;
+            if (fileStreamGets(line, MAX_LINE_LENGTH, stream) == NULL)
             {
-                int foundAtomID = 0;
+                *readStatus = 1;
+                return record;
+            }
+            block->offsets[lineIndex] = block->len;
+            block->len += strlen(line) + 1;
+        }
+    }
+    
+    return record;
+}
 
-                j = 0;
-                while(!foundAtomID && j < numLines)
+/*******************************************************************************
+ * Parse the lines of one atom (thread safe version of the body loop in
+ * readGenericLatticeFile). Values are written to the arrays of the body items
+ * and the symbol, if any, is returned in *symbolCode for merging into the
+ * specie list afterwards. Returns 0 on success, otherwise the type of error
+ * (with the message in errstring).
+ *******************************************************************************/
+static int
+parseAtomRecord(char **atomLines, struct Body *body, const char *delimiter, long i, int atomIDFlag,
+        int atomIndexOffset, long NAtoms, long *atomIndexOut, unsigned short *symbolCode, char *errstring)
+{
+    long atomIndex = -1;
+    Py_ssize_t j, numLines = body->numLines;
+    
+    *symbolCode = 0;
+    
+    /* get the atom ID */
+    if (atomIDFlag)
+    {
+        int foundAtomID = 0;
+        
+        j = 0;
+        while (!foundAtomID && j < numLines)
+        {
+            char *pch, *saveptr;
+            char line[MAX_LINE_LENGTH];
+            Py_ssize_t numItems, count;
+            
+            numItems = body->lines[j].numItems;
+            strcpy(line, atomLines[j]);
+            pch = strtok_r(line, delimiter, &saveptr);
+            count = 0;
+            while (!foundAtomID && pch != NULL && count < numItems)
+            {
+                char *key;
+                int dim, dimcount;
+                
+                key = body->lines[j].items[count].key;
+                dim = body->lines[j].items[count].dim;
+                
+                dimcount = 0;
+                while (!foundAtomID && pch != NULL && dimcount < dim)
                 {
-                    char *pch;
-                    char line[MAX_LINE_LENGTH];
-                    Py_ssize_t numItems, count;
-
-                    /* number of items in the line */
-                    numItems = bodyFormat.lines[j].numItems;
-
-                    /* parse for atomID */
-                    /* make a copy of line as strtok might(?) modify the original */
-                    strcpy(line, atomLines[j]);
-                    pch = strtok(line, delimiter);
-                    count = 0;
-                    while (!foundAtomID && pch != NULL && count < numItems)
+                    if (!strcmp("atomID", key))
                     {
-                        char *key;
-                        int dim, dimcount;
-
-                        /* unpack item */
-                        key = bodyFormat.lines[j].items[count].key;
-                        dim = bodyFormat.lines[j].items[count].dim;
+                        char *endp;
                         
-                        dimcount = 0;
-                        while (!foundAtomID && pch != NULL && dimcount < dim)
+                        atomIndex = strtol(pch, &endp, 10);
+                        if (pch == endp || *endp != '\0')
                         {
-                            if (!strcmp("atomID", key))
-                            {
-                                char *endp;
-                                
-                                atomIndex = strtol(pch, &endp, 10);
-                                if (pch == endp || *endp != '\0')
-                                {
-                                    char errstring[128];
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    sprintf(errstring, "Could not convert atomID '%s' to integer (body line %ld:%ld)", pch, i, j);
-                                    PyErr_SetString(PyExc_TypeError, errstring);
-                                    Py_DECREF(resultDict);
-                                    fclose(INFILE);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-                                
-                                foundAtomID = 1;
-                            }
-
-                            pch = strtok(NULL, delimiter);
-                            dimcount++;
+                            sprintf(errstring, "Could not convert atomID '%s' to integer (body line %ld:%ld)", pch, i, (long) j);
+                            return PARSE_TYPE_ERROR;
                         }
-
-                        if (!foundAtomID && dimcount != dim)
-                        {
-                            char errstring[128];
-                            long k;
-
-                            for (k = 0; k < numLines; k++) free(atomLines[k]);
-                            sprintf(errstring, "Error during body line read for atomID (%ld:%ld): dim %d != %d", i, j, dimcount, dim);
-                            PyErr_SetString(PyExc_IOError, errstring);
-                            Py_DECREF(resultDict);
-                            fclose(INFILE);
-                            Py_DECREF(specieList);
-                            Py_DECREF(specieCount);
-                            freeBody(bodyFormat);
-                            return NULL;
-                        }
-
-                        count++;
-                    }
-
-                    if (!foundAtomID && count != numItems)
-                    {
-                        char errstring[128];
-                        long k;
-
-                        for (k = 0; k < numLines; k++) free(atomLines[k]);
-                        sprintf(errstring, "Error during body line read for atomID (%ld:%ld): %ld != %ld", i, j, count, numItems);
-                        PyErr_SetString(PyExc_IOError, errstring);
-                        Py_DECREF(resultDict);
-                        fclose(INFILE);
-                        Py_DECREF(specieList);
-                        Py_DECREF(specieCount);
-                        freeBody(bodyFormat);
-                        return NULL;
+                        
+                        foundAtomID = 1;
                     }
                     
-                    j++;
+                    pch = strtok_r(NULL, delimiter, &saveptr);
+                    dimcount++;
                 }
-
-                /* check atomIndex in range */
-                if (foundAtomID)
-                    atomIndex -= (long) atomIndexOffset;
                 
-                if (!foundAtomID || (atomIndex < 0 || atomIndex >= NAtoms))
+                if (!foundAtomID && dimcount != dim)
                 {
-                    char errstring[128];
-                    long k;
-
-                    if (foundAtomID) sprintf(errstring, "Atom index error: %ld out of range (atom %ld)", atomIndex, i);
-                    else sprintf(errstring, "Atom index not in line (atom %ld)", i);
-                    PyErr_SetString(PyExc_RuntimeError, errstring);
-                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                    fclose(INFILE);
-                    Py_DECREF(resultDict);
-                    Py_DECREF(specieList);
-                    Py_DECREF(specieCount);
-                    freeBody(bodyFormat);
-                    return NULL;
+                    sprintf(errstring, "Error during body line read for atomID (%ld:%ld): dim %d != %d", i, (long) j, dimcount, dim);
+                    return PARSE_IO_ERROR;
                 }
+                
+                count++;
             }
-            else atomIndex = i;
-
-            /* now read the data for real */
-            for (j = 0; j < numLines; j++)
+            
+            if (!foundAtomID && count != numItems)
             {
-                char *line, *pch;
-                Py_ssize_t numItems, count;
-
-                /* number of items in the line */
-                numItems = bodyFormat.lines[j].numItems;
-
-                /* read line */
-                line = atomLines[j];
-
-                /* parse the line */
-                pch = strtok(line, delimiter);
-                count = 0;
-                while (pch != NULL && count < numItems)
+                sprintf(errstring, "Error during body line read for atomID (%ld:%ld): %ld != %ld", i, (long) j, (long) count, (long) numItems);
+                return PARSE_IO_ERROR;
+            }
+            
+            j++;
+        }
+        
+        /* check atomIndex in range */
+        if (foundAtomID)
+            atomIndex -= (long) atomIndexOffset;
+        
+        if (!foundAtomID || (atomIndex < 0 || atomIndex >= NAtoms))
+        {
+            if (foundAtomID) sprintf(errstring, "Atom index error: %ld out of range (atom %ld)", atomIndex, i);
+            else sprintf(errstring, "Atom index not in line (atom %ld)", i);
+            return PARSE_RUNTIME_ERROR;
+        }
+    }
+    else atomIndex = i;
+    *atomIndexOut = atomIndex;
+    
+    /* now read the data for real */
+    for (j = 0; j < numLines; j++)
+    {
+        char *pch, *saveptr;
+        Py_ssize_t numItems, count;
+        
+        numItems = body->lines[j].numItems;
+        pch = strtok_r(atomLines[j], delimiter, &saveptr);
+        count = 0;
+        while (pch != NULL && count < numItems)
+        {
+            struct BodyLineItem *item = &body->lines[j].items[count];
+            int dimcount;
+            
+            dimcount = 0;
+            while (pch != NULL && dimcount < item->dim)
+            {
+                if (item->data != NULL)
                 {
-                    char *key, *type;
-                    int dim, dimcount;
-                    PyArrayObject *array=NULL;
-
-                    /* unpack item */
-                    key = bodyFormat.lines[j].items[count].key;
-                    type = bodyFormat.lines[j].items[count].type;
-                    dim = bodyFormat.lines[j].items[count].dim;
-
-                    /* get the array from the dictionary */
-                    array = (PyArrayObject *) PyDict_GetItemString(resultDict, key);
-
-                    /* read one or three values */
-                    dimcount = 0;
-                    while (pch != NULL && dimcount < dim)
+                    long index = (item->dim == 1) ? atomIndex : 3 * atomIndex + dimcount;
+                    
+                    /* symbol is special... */
+                    if (item->isSymbol)
                     {
-                        if (strcmp("SKIP", key))
+                        size_t symlen = strlen(pch);
+                        
+                        if (symlen == 1)
+                            *symbolCode = (unsigned short) (((unsigned char) pch[0] << 8) | '_');
+                        else if (symlen == 2)
+                            *symbolCode = (unsigned short) (((unsigned char) pch[0] << 8) | (unsigned char) pch[1]);
+                        else
                         {
-                            /* symbol is special... */
-                            if (!strcmp("Symbol", key))
-                            {
-                                int check, stat;
-                                long value;
-                                Py_ssize_t symlen, index;
-                                PyObject *symin=NULL;
-                                PyObject *valueObj=NULL;
-
-                                /* get the symbol */
-                                symin = Py_BuildValue("s", pch);
-                                symlen = PyString_Size(symin);
-                                if (symlen == 1)
-                                {
-                                    Py_XDECREF(symin);
-                                    symin = NULL;
-                                    symin = PyString_FromFormat("%s_", pch);
-                                }
-                                else if (symlen != 2)
-                                {
-                                    char errstring[128];
-                                    long k;
-
-                                    sprintf(errstring, "Cannot handle symbol of length %d: '%s'", (int) symlen, PyString_AsString(symin));
-                                    PyErr_SetString(PyExc_RuntimeError, errstring);
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    Py_XDECREF(symin);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-
-//                                printf("Symbol: '%s'\n", PyString_AsString(symin));
-
-                                /* check if it already exists in the list */
-                                check = PySequence_Contains(specieList, symin);
-
-                                /* error */
-                                if (check == -1)
-                                {
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    PyErr_SetString(PyExc_RuntimeError, "Checking if symbol in specie list failed");
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    Py_XDECREF(symin);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-                                /* symbol not in specie list */
-                                else if (check == 0)
-                                {
-                                    PyObject *init=NULL;
-
-#ifdef DEBUG
-                                    printf("Add new specie\n");
-#endif
-
-                                    /* add to list */
-                                    stat = PyList_Append(specieList, symin);
-                                    if (stat == -1)
-                                    {
-                                        long k;
-
-                                        for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                        fclose(INFILE);
-                                        Py_DECREF(resultDict);
-                                        Py_DECREF(specieList);
-                                        Py_DECREF(specieCount);
-                                        Py_XDECREF(symin);
-                                        freeBody(bodyFormat);
-                                        return NULL;
-                                    }
-
-                                    init = PyLong_FromLong(0);
-                                    stat = PyList_Append(specieCount, init);
-                                    Py_XDECREF(init);
-                                    if (stat == -1)
-                                    {
-                                        long k;
-
-                                        for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                        fclose(INFILE);
-                                        Py_DECREF(resultDict);
-                                        Py_DECREF(specieList);
-                                        Py_DECREF(specieCount);
-                                        Py_XDECREF(symin);
-                                        freeBody(bodyFormat);
-                                        return NULL;
-                                    }
-                                }
-
-                                /* increment specie counter */
-                                index = PySequence_Index(specieList, symin);
-                                Py_XDECREF(symin);
-                                if (index == -1)
-                                {
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    PyErr_SetString(PyExc_RuntimeError, "Could not find symbol index in specieList");
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-
-                                valueObj = PyList_GetItem(specieCount, index);
-                                if (valueObj == NULL)
-                                {
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-
-                                value = PyLong_AsLong(valueObj);
-                                value++;
-
-                                stat = PyList_SetItem(specieCount, index, PyLong_FromLong(value));
-                                if (stat == -1)
-                                {
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    PyErr_SetString(PyExc_RuntimeError, "Could not set incremented specie count on list");
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-
-                                /* set specie value */
-                                IIND1(array, atomIndex) = (int) index;
-                            }
-                            else
-                            {
-                                if (!strcmp("i", type))
-                                {
-                                    char *endp;
-                                    int value;
-
-                                    /* convert to int */
-                                    value = (int) strtol(pch, &endp, 10);
-                                    if (pch == endp || *endp != '\0')
-                                    {
-                                        char errstring[256];
-                                        
-                                        sprintf(errstring, "Conversion to integer failed for '%s' (body line: %ld:%ld; key: '%s')", pch, i, j, key);
-                                        PyErr_SetString(PyExc_TypeError, errstring);
-                                        fclose(INFILE);
-                                        Py_DECREF(resultDict);
-                                        Py_DECREF(specieList);
-                                        Py_DECREF(specieCount);
-                                        freeBody(bodyFormat);
-                                        return NULL;
-                                    }
-                                    
-                                    if (dim == 1) IIND1(array, atomIndex) = value;
-                                    else IIND2(array, atomIndex, dimcount) = value;
-                                }
-                                else if (!strcmp("d", type))
-                                {
-                                    char *endp;
-                                    double value;
-
-                                    /* convert to double */
-                                    value = strtod(pch, &endp);
-                                    if (pch == endp || *endp != '\0')
-                                    {
-                                        char errstring[256];
-                                        
-                                        sprintf(errstring, "Conversion to double failed for '%s' (body line: %ld:%ld; key: '%s')", pch, i, j, key);
-                                        PyErr_SetString(PyExc_TypeError, errstring);
-                                        fclose(INFILE);
-                                        Py_DECREF(resultDict);
-                                        Py_DECREF(specieList);
-                                        Py_DECREF(specieCount);
-                                        freeBody(bodyFormat);
-                                        return NULL;
-                                    }
-                                    
-                                    if (dim == 1) DIND1(array, atomIndex) = value;
-                                    else DIND2(array, atomIndex, dimcount) = value;
-                                }
-                                else
-                                {
-                                    char errstring[128];
-                                    long k;
-
-                                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                                    sprintf(errstring, "Unrecognised type string (body): '%s'", type);
-                                    PyErr_SetString(PyExc_RuntimeError, errstring);
-                                    fclose(INFILE);
-                                    Py_DECREF(resultDict);
-                                    Py_DECREF(specieList);
-                                    Py_DECREF(specieCount);
-                                    freeBody(bodyFormat);
-                                    return NULL;
-                                }
-                            }
+                            sprintf(errstring, "Cannot handle symbol of length %d: '%s'", (int) symlen, pch);
+                            return PARSE_RUNTIME_ERROR;
                         }
-
-                        /* read next token */
-                        pch = strtok(NULL, delimiter);
-                        dimcount++;
                     }
-
-                    if (dimcount != dim)
+                    else if (item->typenum == NPY_INT32)
                     {
-                        char errstring[128];
-                        long k;
-
-                        for (k = 0; k < numLines; k++) free(atomLines[k]);
-                        sprintf(errstring, "Error during body line read (%ld:%ld): dim %d != %d", i, j, dimcount, dim);
-                        PyErr_SetString(PyExc_IOError, errstring);
-                        Py_DECREF(resultDict);
-                        fclose(INFILE);
-                        Py_DECREF(specieList);
-                        Py_DECREF(specieCount);
-                        freeBody(bodyFormat);
-                        return NULL;
+                        char *endp;
+                        int value;
+                        
+                        value = (int) strtol(pch, &endp, 10);
+                        if (pch == endp || *endp != '\0')
+                        {
+                            sprintf(errstring, "Conversion to integer failed for '%s' (body line: %ld:%ld; key: '%s')", pch, i, (long) j, item->key);
+                            return PARSE_TYPE_ERROR;
+                        }
+                        
+                        ((int *) item->data)[index] = value;
+                    }
+                    else if (item->typenum == NPY_FLOAT32)
+                    {
+                        char *endp;
+                        float value;
+                        
+                        value = strtof(pch, &endp);
+                        if (pch == endp || *endp != '\0')
+                        {
+                            sprintf(errstring, "Conversion to float failed for '%s' (body line: %ld:%ld; key: '%s')", pch, i, (long) j, item->key);
+                            return PARSE_TYPE_ERROR;
+                        }
+                        
+                        ((float *) item->data)[index] = value;
+                    }
+                    else
+                    {
+                        char *endp;
+                        double value;
+                        
+                        value = strtod(pch, &endp);
+                        if (pch == endp || *endp != '\0')
+                        {
+                            sprintf(errstring, "Conversion to double failed for '%s' (body line: %ld:%ld; key: '%s')", pch, i, (long) j, item->key);
+                            return PARSE_TYPE_ERROR;
+                        }
+                        
+                        ((double *) item->data)[index] = value;
                     }
-
-                    count++;
                 }
+                
+                /* read next token */
+                pch = strtok_r(NULL, delimiter, &saveptr);
+                dimcount++;
+            }
+            
+            if (dimcount != item->dim)
+            {
+                sprintf(errstring, "Error during body line read (%ld:%ld): dim %d != %d", i, (long) j, dimcount, item->dim);
+                return PARSE_IO_ERROR;
+            }
+            
+            count++;
+        }
+        
+        if (count != numItems)
+        {
+            sprintf(errstring, "Error during body line read (%ld:%ld): %ld != %ld", i, (long) j, (long) count, (long) numItems);
+            return PARSE_IO_ERROR;
+        }
+    }
+    
+    return 0;
+}
 
-                if (count != numItems)
+/*******************************************************************************
+ * Read the body in blocks of atoms, parsing the atoms of each block on the
+ * given number of threads. The GIL is released while reading and parsing each
+ * block, so other Python threads run while a file is read (eg. reading the
+ * next file in the background). The species are added to the specie list in
+ * the order in which they first appear in the file, so the result does not
+ * depend on the number of threads. Returns 0 on success (otherwise an
+ * exception is set).
+ *******************************************************************************/
+static int
+readBody(FileStream *stream, struct Body *body, const char *delimiter, long NAtoms, int atomIDFlag,
+        int atomIndexOffset, PyObject *specieList, PyObject *specieCount, PyObject *updateProgressCallback,
+        const char *basename, int numThreads)
+{
+    int status = 0;
+    int readStatus = 0;
+    int *specieArray = NULL;
+    int *specieIndex = NULL;
+    long *speciesCounts = NULL;
+    unsigned short *speciesCodes = NULL;
+    unsigned short *symbolCodes = NULL;
+    long *atomIndexes = NULL;
+    long blockStart, numSpecies = 0;
+    long maxRecords = (NAtoms < PARALLEL_BLOCK_ATOMS) ? NAtoms : PARALLEL_BLOCK_ATOMS;
+    Py_ssize_t j, k, numLines = body->numLines;
+    struct LineBlock block;
+    
+    /* the specie array (if symbols are in the file) */
+    for (j = 0; j < numLines; j++)
+        for (k = 0; k < body->lines[j].numItems; k++)
+            if (body->lines[j].items[k].isSymbol) specieArray = (int *) body->lines[j].items[k].data;
+    
+    /* allocate */
+    block.cap = (size_t) maxRecords * numLines * 128 + MAX_LINE_LENGTH;
+    block.len = 0;
+    block.text = malloc(block.cap * sizeof(char));
+    block.offsets = malloc((maxRecords * numLines + 1) * sizeof(size_t));
+    symbolCodes = malloc((maxRecords + 1) * sizeof(unsigned short));
+    atomIndexes = malloc((maxRecords + 1) * sizeof(long));
+    specieIndex = malloc(65536 * sizeof(int));
+    speciesCodes = malloc(65536 * sizeof(unsigned short));
+    speciesCounts = calloc(65536, sizeof(long));
+    if (block.text == NULL || block.offsets == NULL || symbolCodes == NULL || atomIndexes == NULL ||
+            specieIndex == NULL || speciesCodes == NULL || speciesCounts == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate memory for reading the body");
+        status = 1;
+        goto cleanup;
+    }
+    for (j = 0; j < 65536; j++) specieIndex[j] = -1;
+    
+    /* loop over blocks of atoms */
+    for (blockStart = 0; blockStart < NAtoms; blockStart += maxRecords)
+    {
+        long r, numRecords, errRecord;
+        int errType = 0;
+        char errMessage[1024];
+        long blockSize = (NAtoms - blockStart < maxRecords) ? NAtoms - blockStart : maxRecords;
+        
+        /* read the lines of this block (no Python objects are used, so other
+           threads can run while reading/decompressing) */
+        Py_BEGIN_ALLOW_THREADS
+        numRecords = readRecordBlock(stream, &block, blockSize, numLines, &readStatus);
+        Py_END_ALLOW_THREADS
+        if (readStatus == -1)
+        {
+            PyErr_SetString(PyExc_MemoryError, "Could not allocate memory for reading the body");
+            status = 1;
+            goto cleanup;
+        }
+        
+        /* parse the atoms in parallel */
+        errRecord = numRecords;
+        Py_BEGIN_ALLOW_THREADS
+        
+        #pragma omp parallel for schedule(static) num_threads(numThreads)
+        for (r = 0; r < numRecords; r++)
+        {
+            int stat;
+            long currentErr;
+            Py_ssize_t m;
+            char errstring[1024];
+            char *atomLines[numLines];
+            
+            /* no need to parse atoms after an error */
+            #pragma omp atomic read
+            currentErr = errRecord;
+            if (r > currentErr) continue;
+            
+            for (m = 0; m < numLines; m++) atomLines[m] = block.text + block.offsets[r * numLines + m];
+            
+            stat = parseAtomRecord(atomLines, body, delimiter, blockStart + r, atomIDFlag, atomIndexOffset, NAtoms,
+                    &atomIndexes[r], &symbolCodes[r], errstring);
+            
+            /* keep the error of the first atom, as the serial reader */
+            if (stat)
+            {
+                #pragma omp critical
                 {
-                    char errstring[128];
-                    long k;
-
-                    for (k = 0; k < numLines; k++) free(atomLines[k]);
-                    sprintf(errstring, "Error during body line read (%ld:%ld): %ld != %ld", i, j, count, numItems);
-                    PyErr_SetString(PyExc_IOError, errstring);
-                    Py_DECREF(resultDict);
-                    fclose(INFILE);
-                    Py_DECREF(specieList);
-                    Py_DECREF(specieCount);
-                    freeBody(bodyFormat);
-                    return NULL;
+                    if (r < errRecord)
+                    {
+                        #pragma omp atomic write
+                        errRecord = r;
+                        errType = stat;
+                        strcpy(errMessage, errstring);
+                    }
                 }
             }
+        }
+        
+        Py_END_ALLOW_THREADS
+        
+        /* merge the species of the atoms before any error, in file order */
+        for (r = 0; r < errRecord; r++)
+        {
+            unsigned short code = symbolCodes[r];
             
-            /* free lines */
-            for (j = 0; j < numLines; j++) free(atomLines[j]);
+            if (code && specieArray != NULL)
+            {
+                if (specieIndex[code] == -1)
+                {
+                    speciesCodes[numSpecies] = code;
+                    specieIndex[code] = (int) numSpecies++;
+                }
+                speciesCounts[specieIndex[code]]++;
+                specieArray[atomIndexes[r]] = specieIndex[code];
+            }
+        }
+        
+        /* handle errors */
+        if (errType)
+        {
+            if (errType == PARSE_TYPE_ERROR) PyErr_SetString(PyExc_TypeError, errMessage);
+            else if (errType == PARSE_IO_ERROR) PyErr_SetString(PyExc_IOError, errMessage);
+            else PyErr_SetString(PyExc_RuntimeError, errMessage);
+            status = 1;
+            goto cleanup;
+        }
+        if (readStatus)
+        {
+            if (fileStreamError(stream))
+                PyErr_Format(PyExc_IOError, "Error reading body (atom %ld): %s", blockStart + numRecords, fileStreamErrorString(stream));
+            else
+                PyErr_Format(PyExc_IOError, "End of file reached while reading body (atom %ld)", blockStart + numRecords);
+            status = 1;
+            goto cleanup;
+        }
+        
+        /* progress callback */
+        if (updateProgressCallback != NULL)
+        {
+            char message[512];
+            PyObject *arglist;
+            PyObject *cbres;
             
-            /* progress callback */
-            if (updateProgressCallback != NULL && (i % callbackInterval == 0 || i == NAtoms - 1))
+            sprintf(message, "Reading: '%s'", basename);
+            arglist = Py_BuildValue("(iis)", (int) (blockStart + numRecords - 1), (int) NAtoms, message);
+            cbres = PyObject_CallObject(updateProgressCallback, arglist);
+            Py_DECREF(arglist);
+            if (cbres == NULL)
             {
-                char message[512];
-                PyObject *arglist;
-                PyObject *cbres;
-                
-                /* callback */
-#ifdef DEBUG
-                printf("Progress callback at: %ld atoms\n", i + 1);
-#endif
-                sprintf(message, "Reading: '%s'", basename);
-                arglist = Py_BuildValue("(iis)", (int) i, (int) NAtoms, message);
-                cbres = PyObject_CallObject(updateProgressCallback, arglist);
-                Py_DECREF(arglist);
-                if (cbres == NULL) return NULL;
-                Py_DECREF(cbres);
+                status = 1;
+                goto cleanup;
             }
+            Py_DECREF(cbres);
         }
-
-        /* store specieList/Count */
-        PyDict_SetItemString(resultDict, "specieList", specieList);
-        Py_DECREF(specieList);
-        PyDict_SetItemString(resultDict, "specieCount", specieCount);
-        Py_DECREF(specieCount);
-
-        freeBody(bodyFormat);
     }
-
-    fclose(INFILE);
-
-#ifdef DEBUG
-    printf("GENREADER: finished\n");
-#endif
-
-    return resultDict;
+    
+    /* store the species */
+    for (j = 0; j < numSpecies; j++)
+    {
+        int stat;
+        PyObject *symbol=NULL;
+        PyObject *count=NULL;
+        
+        symbol = PyString_FromFormat("%c%c", (int) (speciesCodes[j] >> 8), (int) (speciesCodes[j] & 0xff));
+        count = PyLong_FromLong(speciesCounts[j]);
+        stat = (symbol == NULL || count == NULL);
+        if (!stat) stat = PyList_Append(specieList, symbol) || PyList_Append(specieCount, count);
+        Py_XDECREF(symbol);
+        Py_XDECREF(count);
+        if (stat)
+        {
+            status = 1;
+            goto cleanup;
+        }
+    }
+    
+cleanup:
+    free(block.text);
+    free(block.offsets);
+    free(symbolCodes);
+    free(atomIndexes);
+    free(specieIndex);
+    free(speciesCodes);
+    free(speciesCounts);
+    
+    return status;
 }
 
 /*******************************************************************************
@@ -1126,3 +1208,238 @@ getMinMaxPos(PyObject *self, PyObject *args)
     
     return tuple;
 }
+
+/*******************************************************************************
+ * Index the frames of a multi-frame file (repeated header/body blocks).
+ * Returns the offset (in the decompressed data) and number of atoms of each
+ * complete frame and the offset after the last complete frame, from which the
+ * index can be extended if the file grows.
+ *******************************************************************************/
+static PyObject*
+indexFrames(PyObject *self, PyObject *args)
+{
+    char *filename, *delimiter;
+    char errstring[512];
+    int status = 0;
+    long long startOffset = 0, endOffset;
+    long numFrames = 0, maxFrames = 1024;
+    long long *offsets=NULL, *natoms=NULL;
+    Py_ssize_t i, numHeaderLines, numBodyLines, natomsLine = -1, natomsItem = -1;
+    FileStream *INFILE=NULL;
+    PyObject *headerList=NULL;
+    PyObject *result=NULL;
+    PyArrayObject *offsetsArray=NULL;
+    PyArrayObject *natomsArray=NULL;
+    npy_intp np_dims[1];
+    
+    
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "sO!ns|L", &filename, &PyList_Type, &headerList, &numBodyLines, &delimiter, &startOffset))
+        return NULL;
+    
+    /* position of NAtoms in the header */
+    numHeaderLines = PyList_Size(headerList);
+    for (i = 0; i < numHeaderLines && natomsLine == -1; i++)
+    {
+        Py_ssize_t j;
+        PyObject *headerLine = PyList_GetItem(headerList, i);
+        
+        for (j = 0; j < PyList_Size(headerLine); j++)
+        {
+            char *key, *type;
+            int dim;
+            
+            if (!PyArg_ParseTuple(PyList_GetItem(headerLine, j), "ssi", &key, &type, &dim)) return NULL;
+            if (!strcmp("NAtoms", key))
+            {
+                natomsLine = i;
+                natomsItem = j;
+                break;
+            }
+        }
+    }
+    if (natomsLine == -1)
+    {
+        PyErr_SetString(PyExc_ValueError, "NAtoms must be in the header to index frames");
+        return NULL;
+    }
+    
+    /* open the file and move to the start offset */
+    INFILE = fileStreamOpen(filename, errstring, sizeof(errstring));
+    if (INFILE == NULL)
+    {
+        PyErr_SetString(PyExc_IOError, errstring);
+        return NULL;
+    }
+    if (startOffset > 0 && fileStreamSeek(INFILE, startOffset))
+    {
+        PyErr_Format(PyExc_IOError, "Could not seek to offset %lld: %s", startOffset, fileStreamErrorString(INFILE));
+        fileStreamClose(INFILE);
+        return NULL;
+    }
+    
+    offsets = malloc(maxFrames * sizeof(long long));
+    natoms = malloc(maxFrames * sizeof(long long));
+    if (offsets == NULL || natoms == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate frame index");
+        free(offsets);
+        free(natoms);
+        fileStreamClose(INFILE);
+        return NULL;
+    }
+    endOffset = fileStreamTell(INFILE);
+    
+    /* scan the file */
+    Py_BEGIN_ALLOW_THREADS
+    
+    while (!status)
+    {
+        char line[MAX_LINE_LENGTH];
+        long long frameOffset = fileStreamTell(INFILE);
+        long long frameNAtoms = -1, numSkipped;
+        
+        /* header */
+        for (i = 0; i < numHeaderLines; i++)
+        {
+            if (fileStreamGets(line, MAX_LINE_LENGTH, INFILE) == NULL)
+            {
+                /* end of file (an incomplete frame at the end is not indexed) */
+                status = 1;
+                break;
+            }
+            
+            /* blank lines between frames */
+            if (i == 0 && strspn(line, " \t\r\n") == strlen(line))
+            {
+                frameOffset = fileStreamTell(INFILE);
+                i--;
+                continue;
+            }
+            
+            if (i == natomsLine)
+            {
+                char *pch, *endp, *saveptr;
+                Py_ssize_t count = 0;
+                
+                pch = strtok_r(line, delimiter, &saveptr);
+                while (pch != NULL && count < natomsItem)
+                {
+                    pch = strtok_r(NULL, delimiter, &saveptr);
+                    count++;
+                }
+                if (pch != NULL) frameNAtoms = strtol(pch, &endp, 10);
+                if (pch == NULL || pch == endp || *endp != '\0' || frameNAtoms < 0)
+                {
+                    snprintf(errstring, sizeof(errstring), "Could not read the number of atoms of frame %ld (offset %lld)",
+                            numFrames, frameOffset);
+                    status = 2;
+                    break;
+                }
+            }
+        }
+        if (status) break;
+        
+        /* skip the body */
+        numSkipped = fileStreamSkipLines(INFILE, frameNAtoms * numBodyLines);
+        if (numSkipped != frameNAtoms * numBodyLines)
+        {
+            status = 1;
+            break;
+        }
+        
+        /* store the frame */
+        if (numFrames == maxFrames)
+        {
+            long long *tmp;
+            
+            maxFrames *= 2;
+            tmp = realloc(offsets, maxFrames * sizeof(long long));
+            if (tmp != NULL) offsets = tmp;
+            tmp = (tmp == NULL) ? NULL : realloc(natoms, maxFrames * sizeof(long long));
+            if (tmp == NULL)
+            {
+                snprintf(errstring, sizeof(errstring), "Could not reallocate frame index");
+                status = 3;
+                break;
+            }
+            natoms = tmp;
+        }
+        offsets[numFrames] = frameOffset;
+        natoms[numFrames] = frameNAtoms;
+        numFrames++;
+        endOffset = fileStreamTell(INFILE);
+    }
+    
+    Py_END_ALLOW_THREADS
+    
+    /* errors */
+    if (fileStreamError(INFILE))
+    {
+        PyErr_Format(PyExc_IOError, "Error indexing frames: %s", fileStreamErrorString(INFILE));
+        status = -1;
+    }
+    else if (status == 2) PyErr_SetString(PyExc_IOError, errstring);
+    else if (status == 3) PyErr_SetString(PyExc_MemoryError, errstring);
+    fileStreamClose(INFILE);
+    if (status != 1)
+    {
+        free(offsets);
+        free(natoms);
+        return NULL;
+    }
+    
+    /* result arrays */
+    np_dims[0] = (npy_intp) numFrames;
+    offsetsArray = (PyArrayObject *) PyArray_SimpleNew(1, np_dims, NPY_INT64);
+    natomsArray = (PyArrayObject *) PyArray_SimpleNew(1, np_dims, NPY_INT64);
+    if (offsetsArray != NULL && natomsArray != NULL)
+    {
+        for (i = 0; i < numFrames; i++)
+        {
+            *((npy_int64 *) PyArray_GETPTR1(offsetsArray, i)) = (npy_int64) offsets[i];
+            *((npy_int64 *) PyArray_GETPTR1(natomsArray, i)) = (npy_int64) natoms[i];
+        }
+        result = Py_BuildValue("(NNL)", offsetsArray, natomsArray, endOffset);
+    }
+    else
+    {
+        Py_XDECREF(offsetsArray);
+        Py_XDECREF(natomsArray);
+    }
+    free(offsets);
+    free(natoms);
+    
+    return result;
+}
+
+/*******************************************************************************
+ * Return the compression formats supported by the reader
+ *******************************************************************************/
+static PyObject*
+supportedCompressionFormats(PyObject *self, PyObject *args)
+{
+    int i;
+    PyObject *formats=NULL;
+    
+    formats = PyList_New(0);
+    if (formats == NULL) return NULL;
+    
+    for (i = 1; i < FILE_STREAM_NUM_FORMATS; i++)
+    {
+        if (fileStreamFormatSupported(i))
+        {
+            PyObject *name = PyUnicode_FromString(fileStreamFormatName(i));
+            
+            if (name == NULL || PyList_Append(formats, name))
+            {
+                Py_XDECREF(name);
+                Py_DECREF(formats);
+                return NULL;
+            }
+            Py_DECREF(name);
+        }
+    }
+    
+    return formats;
+}
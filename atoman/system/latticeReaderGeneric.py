@@ -6,11 +6,15 @@ Read user-specified format Lattice FILES_PER_THREAD
 from __future__ import absolute_import
 from __future__ import unicode_literals
 import os
+import io
 import copy
 import re
+import gzip
+import bz2
 import logging
 import tempfile
 import shutil
+import threading
 
 import numpy as np
 
@@ -18,10 +22,72 @@ from . import _latticeReaderGeneric
 from .atoms import elements
 from ..visutils import utilities
 from .lattice import Lattice
+from . import latticeCache
+from . import latticeStore
+from . import frameIndex
+from ..gui import _preferences
 import six
 from six.moves import range
 
 
+# compressed file extensions and their formats
+COMPRESSED_EXTENSIONS = {
+    ".gz": "gzip",
+    ".bz2": "bzip2",
+    ".xz": "xz",
+    ".zst": "zstd",
+}
+
+# commands for decompressing to a temporary file, if the C reader cannot stream the format
+UNZIP_COMMANDS = {
+    "gzip": 'gzip -dc "%s" > "%s"',
+    "bzip2": 'bzcat -k "%s" > "%s"',
+    "xz": 'xz -dc "%s" > "%s"',
+    "zstd": 'zstd -dc "%s" > "%s"',
+}
+
+# body keys that are always read (see FileFormat.projectColumns)
+REQUIRED_BODY_KEYS = ("Position", "Symbol", "atomID")
+
+# maximum number of open streams kept by a reader for reading the frames of compressed files
+MAX_FRAME_STREAMS = 2
+
+
+def streamedCompressionFormats():
+    """Return the compression formats the C reader can decompress while reading."""
+    return _latticeReaderGeneric.supportedCompressionFormats()
+
+
+def openFile(filename):
+    """
+    Open the given (possibly compressed) file for reading text.
+    
+    """
+    ext = os.path.splitext(filename)[1]
+    compression = COMPRESSED_EXTENSIONS.get(ext)
+    if compression == "gzip":
+        f = gzip.open(filename, "rb")
+    
+    elif compression == "bzip2":
+        f = bz2.BZ2File(filename, "rb")
+    
+    elif compression == "xz":
+        import lzma
+        f = lzma.open(filename, "rb")
+    
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise IOError("The 'zstandard' package is required to read zstd compressed files")
+        f = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), closefd=True))
+    
+    else:
+        return open(filename)
+    
+    return io.TextIOWrapper(f)
+
+
 class FileFormats(object):
     """
     Object containing file formats
@@ -209,14 +275,31 @@ class FileFormat(object):
         if not len(self.body):
             raise RuntimeError("You must add a body line before adding a body value")
         
-        if typecode != 'i' and typecode != 'd':
-            raise ValueError("Invalid value for body typecode ('i', 'd'): '%s'", typecode)
+        if typecode != 'i' and typecode != 'd' and typecode != 'f':
+            raise ValueError("Invalid value for body typecode ('i', 'd', 'f'): '%s'", typecode)
         
         if dim != 1 and dim != 3:
             raise ValueError("Invalid value for dim (1 or 3): %d", dim)
         
         self.body[-1].append((key, typecode, dim))
     
+    def projectColumns(self, columns):
+        """
+        Return a copy of the format that only reads the given body keys (and
+        the keys in REQUIRED_BODY_KEYS); the other body items are skipped when
+        parsing, so no arrays are allocated for them.
+        
+        """
+        keep = set(columns).union(REQUIRED_BODY_KEYS)
+        body = [[(key if key in keep else "SKIP", typecode, dim) for key, typecode, dim in line] for line in self.body]
+        if body == self.body:
+            return self
+        
+        fileFormat = copy.copy(self)
+        fileFormat.body = body
+        
+        return fileFormat
+    
     def getDelimiter(self):
         """
         Return the delimiter
@@ -285,10 +368,14 @@ class FileFormat(object):
                 # must have pos
                 if key == "Position":
                     havePos = True
+                    if typecode != "d":
+                        errors.append("Format body 'Position' must have type 'd'")
                 elif key == "Symbol":
                     haveSymbol = True
                 elif key == "atomID":
                     haveAtomId = True
+                    if typecode != "i":
+                        errors.append("Format body 'atomID' must have type 'i'")
         
         if not havePos:
             errors.append("Format body must contain 'Position'")
@@ -445,12 +532,38 @@ class FileFormat(object):
         return identifier
 
 
+# format of lattice store files (these are recognised by the reader, so the
+# format has no header or body)
+LATTICE_STORE_FORMAT = FileFormat("Lattice store")
+
+
 class LatticeReaderGeneric(object):
     """
     Generic format Lattice reader
     
+    If `parallel` is set the atoms are parsed in parallel (in blocks), using
+    `numThreads` threads (by default the number set in the preferences when
+    the file is read). The GIL is released while the body is read, so files
+    can be read on background threads while the main thread runs.
+    
+    If `cacheLocation` is set ("source" or "data") the parsed data are stored
+    in an on-disk cache (see latticeCache) and read from there while the file
+    is unchanged.
+    
+    Lattice store files (see latticeStore) are recognised whatever format is
+    passed and are opened with their arrays memory mapped rather than parsed.
+    
+    Files containing multiple frames (repeated header/body blocks) are indexed
+    on first use (see frameIndex) and any frame can be read with `readFrame`.
+    The frame indexes are stored in the cache location, or the data directory
+    if the cache is disabled. Compressed files cannot be seeked, so the reader
+    keeps the streams used to read frames open (up to MAX_FRAME_STREAMS) and
+    reads the next frame from where the last one ended, rather than
+    decompressing the file from the beginning for every frame.
+    
     """
-    def __init__(self, tmpLocation=None, updateProgress=None, hideProgress=None):
+    def __init__(self, tmpLocation=None, updateProgress=None, hideProgress=None, parallel=True, cacheLocation=None,
+                 numThreads=None):
         self.logger = logging.getLogger(__name__ + ".LatticeReaderGeneric")
         
         # create tmp dir if one isn't passed
@@ -464,7 +577,14 @@ class LatticeReaderGeneric(object):
         
         self.updateProgress = updateProgress
         self.hideProgress = hideProgress
+        self.parallel = parallel
+        self.numThreads = numThreads
         self.intRegex = re.compile(r'[0-9]+')
+        self.cache = None
+        self.frameIndexCache = None
+        self.setCacheLocation(cacheLocation)
+        self._frameStreams = []
+        self._frameStreamsLock = threading.Lock()
     
     def __del__(self):
         # remove the temporary directory if we created it
@@ -474,6 +594,17 @@ class LatticeReaderGeneric(object):
             except:
                 pass
     
+    def setCacheLocation(self, location):
+        """Set the location of the lattice cache ("source", "data" or None to disable the cache)."""
+        if location is None:
+            self.cache = None
+        elif self.cache is None or self.cache.location != location:
+            self.cache = latticeCache.LatticeCache(location)
+        
+        indexLocation = "data" if location is None else location
+        if self.frameIndexCache is None or self.frameIndexCache.location != indexLocation:
+            self.frameIndexCache = frameIndex.FrameIndexCache(indexLocation)
+    
     def unzipFile(self, filename):
         """
         Unzip command
@@ -482,14 +613,11 @@ class LatticeReaderGeneric(object):
         bn = os.path.basename(filename)
         root, ext = os.path.splitext(bn)
         filepath = os.path.join(self.tmpLocation, root)
-        if ext == ".bz2":
-            command = 'bzcat -k "%s" > "%s"' % (filename, filepath)
-        
-        elif ext == ".gz":
-            command = 'gzip -dc "%s" > "%s"' % (filename, filepath)
+        if ext in COMPRESSED_EXTENSIONS:
+            command = UNZIP_COMMANDS[COMPRESSED_EXTENSIONS[ext]] % (filename, filepath)
         
         else:
-            raise RuntimeError("File '%s' is not a zip file", filename)
+            raise RuntimeError("File '%s' is not a zip file" % filename)
         
         self.logger.debug("Running: '%s'", command)
         
@@ -510,38 +638,39 @@ class LatticeReaderGeneric(object):
         
         return filepath
     
-    def checkForZipped(self, filename):
+    def locateFile(self, filename):
         """
-        Check if file exists (unzip if required)
+        Return the path of the file, which may have a compressed extension
+        appended.
         
         """
-        zip_exts = ('.bz2', '.gz')
-        ext = os.path.splitext(filename)[1]
-        filepath = None
-        zipFlag = False
-        if os.path.exists(filename) and ext in zip_exts:
-            # unzip
-            zipFlag = True
-            filepath = self.unzipFile(filename)
+        if os.path.exists(filename):
+            return filename
         
-        elif os.path.exists(filename):
-            filepath = filename
+        for ext in ('.bz2', '.gz', '.xz', '.zst'):
+            if os.path.exists(filename + ext):
+                return filename + ext
         
-        else:
-            if os.path.exists(filename + '.bz2'):
-                filename = filename + '.bz2'
-                zipFlag = True
-                filepath = self.unzipFile(filename)
-            
-            elif os.path.exists(filename + '.gz'):
-                filename = filename + '.gz'
-                zipFlag = True
-                filepath = self.unzipFile(filename)
+        raise IOError("Could not locate file: '%s'" % filename)
+    
+    def checkForZipped(self, filename):
+        """
+        Check if file exists (unzip if required).
         
-        if filepath is None:
-            raise IOError("Could not locate file: '%s'" % filename)
+        Compressed files are only unzipped to the temporary directory if the
+        C reader cannot decompress them while reading.
         
-        return filepath, zipFlag
+        """
+        filename = self.locateFile(filename)
+        compression = COMPRESSED_EXTENSIONS.get(os.path.splitext(filename)[1])
+        if compression is None or compression in streamedCompressionFormats():
+            return filename, False
+        
+        # unzip
+        self.logger.debug("Cannot stream '%s' compressed files; unzipping", compression)
+        filepath = self.unzipFile(filename)
+        
+        return filepath, True
     
     def cleanUnzipped(self, filepath, zipFlag):
         """
@@ -551,30 +680,181 @@ class LatticeReaderGeneric(object):
         if zipFlag:
             os.unlink(filepath)
     
-    def readFile(self, filename, fileFormat, rouletteIndex=None, linkedLattice=None):
+    def readFile(self, filename, fileFormat, rouletteIndex=None, linkedLattice=None, columns=None):
         """
         Read file.
         
+        If `columns` is given only those body keys (and the required keys:
+        positions, symbols and atom IDs) are read; see FileFormat.projectColumns.
+        
         """
         self.logger.info("Reading file: '%s'", filename)
+        sourcePath = self.locateFile(filename)
+        if latticeStore.isLatticeStore(sourcePath):
+            return self.openLatticeStore(sourcePath, linkedLattice)
+        
+        # body columns that are read (None if all of them are read)
+        readColumns = None
+        if columns is not None:
+            projected = fileFormat.projectColumns(columns)
+            if projected is not fileFormat:
+                readColumns = [item[0] for line in projected.body for item in line if item[0] != "SKIP"]
+            fileFormat = projected
+        
+        # parsed data from the cache
+        resultDict = None
+        if self.cache is not None:
+            resultDict = self.cache.load(sourcePath, fileFormat, columns=readColumns)
+            if resultDict is not None and linkedLattice is not None and resultDict["NAtoms"] != linkedLattice.NAtoms:
+                raise ValueError("Number of atoms does not match linked lattice (%d != %d)" % (resultDict["NAtoms"],
+                                                                                             linkedLattice.NAtoms))
+        
+        if resultDict is None:
+            # state of the source before reading it
+            source = latticeCache.sourceKey(sourcePath) if self.cache is not None else None
+            
+            # check if zipped
+            filepath, zipFlag = self.checkForZipped(sourcePath)
+            
+            try:
+                resultDict = self.parseFile(filepath, fileFormat, linkedLattice)
+            
+            finally:
+                self.cleanUnzipped(filepath, zipFlag)
+            
+            if self.cache is not None:
+                self.cache.save(sourcePath, fileFormat, resultDict, source=source, columns=readColumns)
+        
+        status, state = self.readFileMain(sourcePath, fileFormat, rouletteIndex, linkedLattice, resultDict)
+        
+        if status:
+            self.logger.error("Generic Lattice reader failed with error code: %d", status)
+        
+        return status, state
+    
+    def openLatticeStore(self, filename, linkedLattice=None):
+        """
+        Open a lattice store file (see latticeStore); the arrays are mapped
+        copy-on-write, so the file is not modified.
+        
+        """
+        self.logger.debug("Opening lattice store: '%s'", filename)
+        state = latticeStore.openLattice(filename)
+        if linkedLattice is not None and state.NAtoms != linkedLattice.NAtoms:
+            raise ValueError("Number of atoms does not match linked lattice (%d != %d)" %
+                             (state.NAtoms, linkedLattice.NAtoms))
+        
+        return 0, state
+    
+    def getFrameIndex(self, filename, fileFormat):
+        """
+        Return the index of the frames in the given file (see frameIndex).
+        
+        """
+        sourcePath = self.locateFile(filename)
+        filepath, zipFlag = self.checkForZipped(sourcePath)
+        try:
+            index = self.frameIndexCache.getIndex(sourcePath, fileFormat, scanPath=filepath)
         
-        # check if zipped
-        filepath, zipFlag = self.checkForZipped(filename)
+        finally:
+            self.cleanUnzipped(filepath, zipFlag)
         
+        return index
+    
+    def numFrames(self, filename, fileFormat):
+        """
+        Return the number of frames in the given file.
+        
+        """
+        return len(self.getFrameIndex(filename, fileFormat))
+    
+    def readFrame(self, filename, fileFormat, frame, rouletteIndex=None, linkedLattice=None, columns=None):
+        """
+        Read the given frame (negative frames count from the end) of a
+        multi-frame file. The "Frame" attribute is set on the Lattice.
+        `columns` is as for `readFile`.
+        
+        """
+        index = self.getFrameIndex(filename, fileFormat)
+        if columns is not None:
+            fileFormat = fileFormat.projectColumns(columns)
+        if not -len(index) <= frame < len(index):
+            raise IndexError("Frame %d out of range (%d frames): '%s'" % (frame, len(index), filename))
+        if frame < 0:
+            frame += len(index)
+        self.logger.info("Reading frame %d of %d: '%s'", frame, len(index), filename)
+        
+        sourcePath = self.locateFile(filename)
+        filepath, zipFlag = self.checkForZipped(sourcePath)
+        offset = index.offset(frame)
+        stream = None
         try:
-            status, state = self.readFileMain(filepath, fileFormat, rouletteIndex, linkedLattice)
+            # continue from the end of a previous frame in compressed files
+            if not zipFlag and os.path.splitext(sourcePath)[1] in COMPRESSED_EXTENSIONS:
+                source, stream = self.takeFrameStream(sourcePath, offset)
+            
+            resultDict = self.parseFile(filepath, fileFormat, linkedLattice, offset=offset, stream=stream)
+            
+            # the stream is discarded if the read failed
+            if stream is not None:
+                self.returnFrameStream(source, stream)
         
         finally:
             self.cleanUnzipped(filepath, zipFlag)
         
+        status, state = self.readFileMain(sourcePath, fileFormat, rouletteIndex, linkedLattice, resultDict)
+        
         if status:
             self.logger.error("Generic Lattice reader failed with error code: %d", status)
+        else:
+            state.attributes["Frame"] = frame
         
         return status, state
     
-    def readFileMain(self, filename, fileFormat, rouletteIndex, linkedLattice):
+    def takeFrameStream(self, filename, offset):
         """
-        Main read
+        Return the state of the given file and an open stream from which the
+        frame at `offset` can be read without decompressing from the beginning
+        of the file (a new stream if there is none). The stream must not be used
+        by another thread until it is returned with `returnFrameStream`.
+        
+        """
+        source = latticeCache.sourceKey(filename)
+        with self._frameStreamsLock:
+            # streams of files that have changed cannot be used
+            self._frameStreams = [(key, stream) for key, stream in self._frameStreams
+                                  if key == source or key["path"] != source["path"]]
+            
+            # the stream that is closest before the offset
+            best = None
+            bestOffset = -1
+            for i, (key, stream) in enumerate(self._frameStreams):
+                streamOffset = _latticeReaderGeneric.fileStreamOffset(stream)
+                if key == source and bestOffset < streamOffset <= offset:
+                    best = i
+                    bestOffset = streamOffset
+            
+            if best is not None:
+                return self._frameStreams.pop(best)
+        
+        return source, _latticeReaderGeneric.openFileStream(filename)
+    
+    def returnFrameStream(self, source, stream):
+        """Keep the stream open for reading the following frames (see takeFrameStream)."""
+        with self._frameStreamsLock:
+            self._frameStreams.append((source, stream))
+            del self._frameStreams[:-MAX_FRAME_STREAMS]
+    
+    def closeFrameStreams(self):
+        """Close the streams kept open for reading frames."""
+        with self._frameStreamsLock:
+            self._frameStreams = []
+    
+    def parseFile(self, filename, fileFormat, linkedLattice, offset=0, stream=None):
+        """
+        Parse the file with the C reader, returning the dictionary of data. The
+        file is read from the given offset (the start of a frame), using the
+        given open stream if any (see takeFrameStream).
         
         """
         # if linked then must have same NAtoms!
@@ -585,21 +865,36 @@ class LatticeReaderGeneric(object):
         # delimiter
         delim = fileFormat.getDelimiter()
         
+        # number of threads for parsing the body (passed explicitly as the
+        # file may be read on a background thread)
+        numThreads = 1
+        if self.parallel:
+            numThreads = _preferences.getNumThreads() if self.numThreads is None else self.numThreads
+        
         # call C lib
         if self.updateProgress is None:
             resultDict = _latticeReaderGeneric.readGenericLatticeFile(filename, fileFormat.header, fileFormat.body,
-                                                                      delim, fileFormat.atomIndexOffset, linkedNAtoms)
+                                                                      delim, fileFormat.atomIndexOffset, linkedNAtoms,
+                                                                      None, "", numThreads, offset, stream)
         
         else:
             try:
                 bn = os.path.basename(filename)
                 resultDict = _latticeReaderGeneric.readGenericLatticeFile(filename, fileFormat.header, fileFormat.body,
                                                                           delim, fileFormat.atomIndexOffset,
-                                                                          linkedNAtoms, self.updateProgress, bn)
+                                                                          linkedNAtoms, self.updateProgress, bn,
+                                                                          numThreads, offset, stream)
             
             finally:
                 self.hideProgress()
         
+        return resultDict
+    
+    def readFileMain(self, filename, fileFormat, rouletteIndex, linkedLattice, resultDict):
+        """
+        Main read: create the Lattice from the parsed data
+        
+        """
         self.logger.debug("Keys: %r", list(resultDict.keys()))
         
         # create Lattice object
@@ -617,7 +912,7 @@ class LatticeReaderGeneric(object):
         # charge
         needCharge = True
         if "Charge" in resultDict:
-            lattice.charge = resultDict.pop("Charge")
+            lattice.charge = np.asarray(resultDict.pop("Charge"), dtype=np.float64)
             needCharge = False
         elif linkedLattice is None:
             lattice.charge = np.zeros(lattice.NAtoms, np.float64)
@@ -706,23 +1001,16 @@ class LatticeReaderGeneric(object):
                 self.logger.debug("Saving '%s' attribute to Lattice (%r)", key, data)
                 lattice.attributes[key] = data
             
-            # now take scalars
+            # now take scalars (stored with the type they were read with; the
+            # filterer converts to float64 when passing them to C)
             elif len(data.shape) == 1 and data.shape[0] == lattice.NAtoms:
-                self.logger.debug("Saving '%s' scalar data to Lattice", key)
-                # for now we require all scalar data to be stored as float (will change this if I have time)
-                if data.dtype != np.float64:
-                    lattice.scalarsDict[key] = data.astype(np.float64)
-                else:
-                    lattice.scalarsDict[key] = data
+                self.logger.debug("Saving '%s' scalar data to Lattice (%s)", key, data.dtype)
+                lattice.scalarsDict[key] = data
             
             # now take vectors
             elif len(data.shape) == 2 and data.shape[0] == lattice.NAtoms and data.shape[1] == 3:
-                self.logger.debug("Saving '%s' vector data to Lattice", key)
-                # for now we require all vector data to be stored as float (will change this if I have time)
-                if data.dtype != np.float64:
-                    lattice.vectorsDict[key] = data.astype(np.float64)
-                else:
-                    lattice.vectorsDict[key] = data
+                self.logger.debug("Saving '%s' vector data to Lattice (%s)", key, data.dtype)
+                lattice.vectorsDict[key] = data
             
             else:
                 raise RuntimeError("Unrecognised shape data extracted from lattice: %s (%r)" % (key, data.shape))
@@ -788,7 +1076,7 @@ class LatticeReaderGeneric(object):
 # the default file formats file
 _defaultFileFormatsFile = """8
 LBOMD Lattice
- 
+
 0
 
 2
@@ -814,7 +1102,7 @@ Charge
 d
 1
 LBOMD REF
- 
+
 1
 
 2
@@ -852,7 +1140,7 @@ Charge
 d
 1
 LBOMD XYZ
- 
+
 1
 LBOMD REF
 2
@@ -877,7 +1165,7 @@ Potential energy
 d
 1
 LBOMD XYZ (Velocity)
- 
+
 1
 LBOMD REF
 2
@@ -905,7 +1193,7 @@ Velocity
 d
 3
 LBOMD XYZ (Charge)
- 
+
 1
 LBOMD REF
 2
@@ -933,7 +1221,7 @@ Charge
 d
 1
 Indenter
- 
+
 0
 
 2
@@ -953,7 +1241,7 @@ SKIP
 i
 1
 FAILSAFE
- 
+
 1
 
 5
@@ -1010,7 +1298,7 @@ Velocity
 d
 3
 CASTEP XYZ
- 
+
 0
 
 2
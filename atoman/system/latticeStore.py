@@ -0,0 +1,208 @@
+"""
+Memory mapped, columnar storage of Lattices
+
+A Lattice is stored as one binary file containing each of its per atom arrays
+(atom IDs, species, positions, charges and every scalars/vectors array) as a
+separate, aligned column. When the file is opened the columns are memory mapped
+rather than read, so the data are only paged in when they are used (for example
+by the C filters) and systems larger than the available memory can be analysed
+as long as the columns that are used fit.
+
+The file layout is the same as the lattice cache (see `latticeCache`): a magic
+string, the version of the format, the length of a JSON header (describing the
+lattice and the columns) and then the columns.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import json
+import struct
+import logging
+import tempfile
+
+import numpy as np
+import six
+from six.moves import range
+
+from .lattice import Lattice, ATOM_ARRAYS
+from .latticeCache import PREAMBLE, alignedOffset
+
+
+STORE_MAGIC = b"ATOMANLS"
+STORE_VERSION = 1
+STORE_EXTENSION = ".atomanls"
+
+# modes the columns can be mapped with: copy-on-write or write-through
+# (read only mappings are not allowed as the C functions write to the arrays)
+STORE_MODES = ("c", "r+")
+
+# per specie arrays stored in the header
+_SPECIE_ARRAYS = ("specieCount", "specieMass", "specieCovalentRadius", "specieRGB", "specieAtomicNumber")
+
+# number of bytes written at a time
+_WRITE_CHUNK = 64 * 1024 * 1024
+
+
+def _jsonValue(value):
+    """Convert NumPy values for storing in the JSON header."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("Cannot store value of type %s" % type(value).__name__)
+
+
+def _writeArray(f, array):
+    """Write the array to the file in chunks (avoids copying large or mapped arrays)."""
+    flat = array.reshape(-1)
+    step = max(1, _WRITE_CHUNK // max(1, flat.itemsize))
+    for start in range(0, flat.size, step):
+        f.write(flat[start:start + step].tobytes())
+
+
+def isLatticeStore(filename):
+    """Return True if the given file is a lattice store file."""
+    try:
+        with open(filename, "rb") as f:
+            magic = f.read(len(STORE_MAGIC))
+    except (IOError, OSError):
+        return False
+    
+    return magic == STORE_MAGIC
+
+
+def saveLattice(lattice, filename):
+    """
+    Write the Lattice to the given store file. The file is written to a
+    temporary file first and moved into place, so a Lattice that is mapped
+    from `filename` can be saved back to it.
+    
+    """
+    logger = logging.getLogger(__name__)
+    NAtoms = lattice.NAtoms
+    
+    # columns: (kind, name, array)
+    columns = []
+    for name in ATOM_ARRAYS:
+        columns.append(("atom", name, np.ascontiguousarray(getattr(lattice, name))))
+    for name, scalars in six.iteritems(lattice.scalarsDict):
+        columns.append(("scalars", name, np.ascontiguousarray(scalars)))
+    for name, vectors in six.iteritems(lattice.vectorsDict):
+        columns.append(("vectors", name, np.ascontiguousarray(vectors)))
+    attributes = {}
+    for name, value in six.iteritems(lattice.attributes):
+        if isinstance(value, np.ndarray):
+            columns.append(("attribute", name, np.ascontiguousarray(value)))
+        else:
+            attributes[name] = value
+    
+    # layout of the columns (offsets relative to the start of the data)
+    layout = []
+    offset = 0
+    for kind, name, array in columns:
+        offset = alignedOffset(offset)
+        layout.append((kind, name, array.dtype.str, array.shape, offset))
+        offset += array.nbytes
+    
+    header = {
+        "NAtoms": NAtoms,
+        "cellDims": lattice.cellDims,
+        "PBC": lattice.PBC,
+        "minPos": lattice.minPos,
+        "maxPos": lattice.maxPos,
+        "specieList": lattice.specieList,
+        "scalarsFiles": lattice.scalarsFiles,
+        "vectorsFiles": lattice.vectorsFiles,
+        "attributes": attributes,
+        "columns": layout,
+    }
+    for name in _SPECIE_ARRAYS:
+        header[name] = getattr(lattice, name)
+    headerBytes = json.dumps(header, default=_jsonValue).encode("utf-8")
+    dataStart = alignedOffset(PREAMBLE.size + len(headerBytes))
+    
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmpFile = tempfile.mkstemp(prefix=".tmp", suffix=STORE_EXTENSION, dir=dirname)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(PREAMBLE.pack(STORE_MAGIC, STORE_VERSION, len(headerBytes)))
+            f.write(headerBytes)
+            for (_, _, array), (_, _, _, _, columnOffset) in zip(columns, layout):
+                f.write(b"\0" * (dataStart + columnOffset - f.tell()))
+                _writeArray(f, array)
+        
+        os.rename(tmpFile, filename)
+    
+    except (IOError, OSError, MemoryError):
+        if os.path.exists(tmpFile):
+            os.unlink(tmpFile)
+        raise
+    
+    logger.debug("Wrote lattice store (%d atoms, %d columns): '%s'", NAtoms, len(columns), filename)
+
+
+def openLattice(filename, mode="c"):
+    """
+    Return a Lattice whose per atom arrays are memory mapped from the given
+    store file. With mode "c" (the default) modifications to the arrays are
+    kept in memory and the file is unchanged; with mode "r+" they are written
+    back to the file.
+    
+    Raises IOError if the file is not a lattice store file.
+    
+    """
+    if mode not in STORE_MODES:
+        raise ValueError("Unrecognised lattice store mode: '%s'" % mode)
+    
+    logger = logging.getLogger(__name__)
+    
+    with open(filename, "rb") as f:
+        try:
+            magic, version, headerLength = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        except struct.error:
+            magic = version = None
+        if magic != STORE_MAGIC:
+            raise IOError("Not a lattice store file: '%s'" % filename)
+        if version != STORE_VERSION:
+            raise IOError("Unsupported lattice store version (%d): '%s'" % (version, filename))
+        header = json.loads(f.read(headerLength).decode("utf-8"))
+    dataStart = alignedOffset(PREAMBLE.size + headerLength)
+    
+    lattice = Lattice()
+    lattice.NAtoms = header["NAtoms"]
+    lattice.cellDims = np.array(header["cellDims"], dtype=np.float64)
+    lattice.PBC = np.array(header["PBC"], dtype=np.int32)
+    lattice.minPos = np.array(header["minPos"], dtype=np.float64)
+    lattice.maxPos = np.array(header["maxPos"], dtype=np.float64)
+    lattice.specieList = header["specieList"]
+    lattice.specieCount = np.array(header["specieCount"], dtype=np.int32)
+    lattice.specieMass = np.array(header["specieMass"], dtype=np.float64)
+    lattice.specieCovalentRadius = np.array(header["specieCovalentRadius"], dtype=np.float64)
+    lattice.specieRGB = np.array(header["specieRGB"], dtype=np.float64).reshape((-1, 3))
+    lattice.specieAtomicNumber = np.array(header["specieAtomicNumber"], dtype=np.int32)
+    lattice.scalarsFiles = header["scalarsFiles"]
+    lattice.vectorsFiles = header["vectorsFiles"]
+    lattice.attributes = header["attributes"]
+    
+    for kind, name, dtype, shape, offset in header["columns"]:
+        if np.prod(shape) == 0:
+            array = np.empty(shape, dtype=dtype)
+        else:
+            array = np.memmap(filename, dtype=dtype, mode=mode, offset=dataStart + offset, shape=tuple(shape))
+            array = array.view(np.ndarray)
+        
+        if kind == "atom":
+            setattr(lattice, name, array)
+        elif kind == "scalars":
+            lattice.scalarsDict[name] = array
+        elif kind == "vectors":
+            lattice.vectorsDict[name] = array
+        else:
+            lattice.attributes[name] = array
+    
+    logger.debug("Opened lattice store (%d atoms): '%s'", lattice.NAtoms, filename)
+    
+    return lattice
@@ -0,0 +1,143 @@
+"""
+Read ahead of a sequence of lattices on worker threads
+
+The image sequencer reads a file, runs the filters, renders and saves an image
+and then moves on to the next file. The Prefetcher loads the next files while
+the current one is being filtered and rendered, so the time spent copying,
+decompressing and parsing overlaps with the time spent filtering and rendering
+(the C reader releases the GIL while reading and parsing in parallel).
+
+At most `depth` items are loaded ahead of the one returned last, so memory use
+is bounded. Items are returned in order and an exception raised while loading
+an item is raised again when that item is reached.
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import sys
+import logging
+import threading
+import collections
+
+import six
+from six.moves import queue
+from six.moves import range
+
+
+class _Job(object):
+    """An item being loaded."""
+    def __init__(self, item):
+        self.item = item
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class Prefetcher(object):
+    """
+    Iterate over `(item, load(item))` for the given items, loading up to
+    `depth` items ahead on `numWorkers` background threads. With `depth` 0
+    the items are loaded when they are reached (no threads are used).
+    
+    `load` is called on the worker threads, so it must not touch the GUI.
+    
+    """
+    def __init__(self, items, load, depth=2, numWorkers=1):
+        self.logger = logging.getLogger(__name__)
+        self._items = list(items)
+        self._load = load
+        self._depth = max(0, int(depth))
+        self._next = 0
+        self._jobs = collections.deque()
+        self._tasks = queue.Queue()
+        self._cancelled = threading.Event()
+        self._workers = []
+        
+        if self._depth > 0:
+            numWorkers = max(1, min(int(numWorkers), self._depth))
+            for i in range(numWorkers):
+                worker = threading.Thread(target=self._work, name="Prefetcher-%d" % i)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+            self._fill()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def __iter__(self):
+        return self
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def __next__(self):
+        if self._cancelled.is_set():
+            raise StopIteration
+        
+        # load in this thread
+        if self._depth == 0:
+            if self._next == len(self._items):
+                raise StopIteration
+            item = self._items[self._next]
+            self._next += 1
+            return item, self._load(item)
+        
+        if not len(self._jobs):
+            raise StopIteration
+        
+        job = self._jobs.popleft()
+        job.done.wait()
+        self._fill()
+        
+        if job.error is not None:
+            six.reraise(*job.error)
+        
+        return job.item, job.result
+    
+    next = __next__
+    
+    def _fill(self):
+        """Queue items until `depth` are loading or loaded."""
+        while len(self._jobs) < self._depth and self._next < len(self._items) and not self._cancelled.is_set():
+            job = _Job(self._items[self._next])
+            self._next += 1
+            self._jobs.append(job)
+            self._tasks.put(job)
+    
+    def _work(self):
+        """Worker thread: load the queued items until told to stop."""
+        while True:
+            job = self._tasks.get()
+            if job is None:
+                break
+            
+            if not self._cancelled.is_set():
+                try:
+                    job.result = self._load(job.item)
+                except Exception:
+                    self.logger.debug("Prefetching %r failed", job.item)
+                    job.error = sys.exc_info()
+            job.done.set()
+    
+    def cancel(self):
+        """Stop loading items (items already being loaded are finished)."""
+        self._cancelled.set()
+    
+    def pending(self):
+        """Return the results that were loaded but not returned (after cancelling or closing)."""
+        return [job.result for job in self._jobs if job.done.is_set() and job.result is not None]
+    
+    def close(self):
+        """Cancel and wait for the worker threads to finish."""
+        self.cancel()
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
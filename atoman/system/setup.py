@@ -3,6 +3,42 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import os
+import shutil
+import tempfile
+
+
+# optional compression libraries for the generic lattice reader:
+# (macro, header, library, test code)
+COMPRESSION_LIBRARIES = [
+    ("HAVE_ZLIB", "zlib.h", "z", "return zlibVersion() == 0;"),
+    ("HAVE_BZIP2", "bzlib.h", "bz2", "return BZ2_bzlibVersion() == 0;"),
+    ("HAVE_LZMA", "lzma.h", "lzma", "return lzma_version_number() == 0;"),
+    ("HAVE_ZSTD", "zstd.h", "zstd", "return ZSTD_versionNumber() == 0;"),
+]
+
+
+def checkLibrary(header, library, code):
+    """Return True if a program using the given header and library can be compiled and linked."""
+    from distutils.ccompiler import new_compiler, CompileError, LinkError
+    from distutils.sysconfig import customize_compiler
+    
+    compiler = new_compiler()
+    customize_compiler(compiler)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmpdir, "check.c")
+        with open(src, "w") as f:
+            f.write("#include <%s>\nint main(void) { %s }\n" % (header, code))
+        objects = compiler.compile([src], output_dir=tmpdir)
+        compiler.link_executable(objects, os.path.join(tmpdir, "check"), libraries=[library])
+    
+    except (CompileError, LinkError):
+        return False
+    
+    finally:
+        shutil.rmtree(tmpdir)
+    
+    return True
 
 
 def configuration(parent_package='', top_path=None):
@@ -32,11 +68,22 @@ def configuration(parent_package='', top_path=None):
                          depends=arraydeps + utildeps,
                          libraries=["array_utils", "utilities"])
     
+    # compression libraries that are available
+    macros = []
+    compressionLibs = []
+    for macro, header, library, code in COMPRESSION_LIBRARIES:
+        if checkLibrary(header, library, code):
+            macros.append((macro, None))
+            compressionLibs.append(library)
+        else:
+            print("%s not found: generic lattice reader will not stream '%s' compressed files" % (header, library))
+    
     config.add_extension("_latticeReaderGeneric",
-                         ["latticeReaderGeneric.c"],
+                         ["latticeReaderGeneric.c", "file_stream.c"],
                          include_dirs=[incdir],
-                         depends=arraydeps,
-                         libraries=["array_utils"])
+                         depends=arraydeps + ["file_stream.h"],
+                         define_macros=macros,
+                         libraries=["array_utils"] + compressionLibs)
     
     config.add_extension("_lattice",
                          ["lattice.c"],
@@ -0,0 +1,103 @@
+"""
+Benchmark of the generic lattice reader
+
+Writes a synthetic LBOMD lattice file and reads it with the serial reader and
+with the parallel reader using different numbers of threads, checking the
+results are identical.
+
+Run with:
+
+    python -m atoman.system.tests.benchmark_latticeReaderGeneric [NAtoms [threads...]]
+
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+from .. import latticeReaderGeneric
+from ...gui import _preferences
+
+
+def writeLattice(filename, NAtoms):
+    """Write a synthetic LBOMD lattice file with the given number of atoms."""
+    np.random.seed(42)
+    cellDims = 100.0
+    symbols = np.asarray(["Si", "O_", "B_", "H"])
+    with open(filename, "w") as f:
+        f.write("%12d\n" % NAtoms)
+        f.write("%20.10f %20.10f %20.10f\n" % (cellDims, cellDims, cellDims))
+        blockSize = 1000000
+        for start in range(0, NAtoms, blockSize):
+            n = min(blockSize, NAtoms - start)
+            pos = np.random.uniform(0, cellDims, size=(n, 3))
+            charge = np.random.uniform(-2, 2, size=n)
+            sym = symbols[np.random.randint(len(symbols), size=n)]
+            lines = ["%-2s %14.6f %14.6f %14.6f %10.6f" % (s, p[0], p[1], p[2], q)
+                     for s, p, q in zip(sym, pos, charge)]
+            f.write("\n".join(lines))
+            f.write("\n")
+
+
+def checkSame(state, ref):
+    """Raise an error if the two lattices differ."""
+    if state.NAtoms != ref.NAtoms or state.specieList != ref.specieList:
+        raise RuntimeError("Lattices differ (NAtoms/species)")
+    for name in ("specieCount", "specie", "pos", "charge"):
+        if not np.array_equal(getattr(state, name), getattr(ref, name)):
+            raise RuntimeError("Lattices differ (%s)" % name)
+
+
+def main(NAtoms, threadCounts):
+    tmpdir = tempfile.mkdtemp(prefix="atomanBench")
+    try:
+        fffn = os.path.join(tmpdir, "file_formats.IN")
+        with open(fffn, "w") as f:
+            f.write(latticeReaderGeneric._defaultFileFormatsFile)
+        ffs = latticeReaderGeneric.FileFormats()
+        ffs.read(fffn)
+        fmt = ffs.getFormat("LBOMD Lattice")
+        
+        filename = os.path.join(tmpdir, "lattice.dat")
+        writeLattice(filename, NAtoms)
+        size = os.path.getsize(filename) / (1024.0 * 1024.0)
+        print("%d atoms (%.1f MB)" % (NAtoms, size))
+        
+        # serial
+        reader = latticeReaderGeneric.LatticeReaderGeneric(tmpdir, parallel=False)
+        t0 = time.time()
+        status, ref = reader.readFile(filename, fmt)
+        serialTime = time.time() - t0
+        if status:
+            raise RuntimeError("Read failed (%d)" % status)
+        
+        print("%12s  %10s  %10s  %10s" % ("reader", "time (s)", "MB/s", "speed-up"))
+        print("%12s  %10.3f  %10.1f  %10.2f" % ("serial", serialTime, size / serialTime, 1.0))
+        
+        # parallel
+        reader = latticeReaderGeneric.LatticeReaderGeneric(tmpdir, parallel=True)
+        for numThreads in threadCounts:
+            _preferences.setNumThreads(numThreads)
+            t0 = time.time()
+            status, state = reader.readFile(filename, fmt)
+            elapsed = time.time() - t0
+            if status:
+                raise RuntimeError("Read failed (%d)" % status)
+            checkSame(state, ref)
+            print("%12s  %10.3f  %10.1f  %10.2f" % ("%d threads" % numThreads, elapsed, size / elapsed,
+                                                    serialTime / elapsed))
+    
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(args[0] if len(args) else 5000000, args[1:] if len(args) > 1 else [2, 4, 8])
@@ -9,6 +9,7 @@ import os
 import unittest
 import tempfile
 import shutil
+import threading
 
 import numpy as np
 
@@ -168,3 +169,354 @@ class TestReadLatticeGeneric(unittest.TestCase):
         self.assertEqual(state.specieCount[indx], 15565)
         indx = state.specieList.index("H_")
         self.assertEqual(state.specieCount[indx], 8)
+    
+    def test_readGenericCompressed(self):
+        """
+        Generic reader: streamed compressed files
+        
+        """
+        import gzip
+        import bz2
+        
+        fn = path_to_file("kenny_lattice.dat")
+        fmt = self.ffs.getFormat("LBOMD Lattice")
+        status, ref = self.reader.readFile(fn, fmt)
+        self.assertEqual(status, 0)
+        with open(fn, "rb") as f:
+            data = f.read()
+        
+        # compressed copies (including a gzip file with two members)
+        compressors = {".gz": gzip.compress, ".bz2": bz2.compress}
+        try:
+            import lzma
+            compressors[".xz"] = lzma.compress
+        except ImportError:
+            pass
+        files = []
+        for ext, compress in compressors.items():
+            files.append((os.path.join(self.tmpLocation, "lattice.dat" + ext), compress(data)))
+        split = len(data) // 3
+        files.append((os.path.join(self.tmpLocation, "lattice2.dat.gz"),
+                      gzip.compress(data[:split]) + gzip.compress(data[split:])))
+        for filename, compressed in files:
+            with open(filename, "wb") as f:
+                f.write(compressed)
+        
+        streamed = latticeReaderGeneric.streamedCompressionFormats()
+        for filename, _ in files:
+            compression = latticeReaderGeneric.COMPRESSED_EXTENSIONS[os.path.splitext(filename)[1]]
+            
+            # no temporary file if the format is streamed
+            filepath, zipFlag = self.reader.checkForZipped(filename)
+            self.assertEqual(zipFlag, compression not in streamed)
+            self.reader.cleanUnzipped(filepath, zipFlag)
+            
+            status, state = self.reader.readFile(filename, fmt)
+            self.assertEqual(status, 0)
+            self.assertEqual(state.NAtoms, ref.NAtoms)
+            self.assertTrue(np.array_equal(state.pos, ref.pos))
+            self.assertTrue(np.array_equal(state.specie, ref.specie))
+            self.assertEqual(state.specieList, ref.specieList)
+            
+            # first lines for detecting the format
+            with latticeReaderGeneric.openFile(filename) as f:
+                self.assertEqual(f.readline(), data.decode("utf-8").splitlines()[0] + "\n")
+        
+        # the tmp dir only contains the files we wrote
+        self.assertEqual(sorted(os.listdir(self.tmpLocation)),
+                         sorted(["file_formats.IN"] + [os.path.basename(fn) for fn, _ in files]))
+        
+        # truncated file
+        if "gzip" in streamed:
+            filename = os.path.join(self.tmpLocation, "truncated.dat.gz")
+            with open(filename, "wb") as f:
+                f.write(gzip.compress(data)[:len(data) // 10])
+            with self.assertRaises(IOError):
+                self.reader.readFile(filename, fmt)
+    
+    def test_readGenericParallel(self):
+        """
+        Generic reader: parallel read same as serial
+        
+        """
+        from ...gui import _preferences
+        
+        serialReader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, parallel=False)
+        parallelReader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, parallel=True)
+        threadReader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, parallel=True, numThreads=3)
+        
+        # file with a bad value in the middle of the body
+        with open(path_to_file("kenny_lattice.dat")) as f:
+            lines = f.readlines()
+        lines[500] = lines[500].replace(".", "x", 1)
+        badfn = os.path.join(self.tmpLocation, "bad.dat")
+        with open(badfn, "w") as f:
+            f.write("".join(lines))
+        
+        try:
+            _preferences.setNumThreads(4)
+            for fn, fmtName in (("kenny_lattice.dat", "LBOMD Lattice"), ("anim-ref-Hdiff.xyz.gz", "LBOMD REF")):
+                fmt = self.ffs.getFormat(fmtName)
+                status, ref = serialReader.readFile(path_to_file(fn), fmt)
+                self.assertEqual(status, 0)
+                status, state = parallelReader.readFile(path_to_file(fn), fmt)
+                self.assertEqual(status, 0)
+                
+                # explicit number of threads, read on a background thread
+                result = []
+                thread = threading.Thread(target=lambda: result.append(threadReader.readFile(path_to_file(fn), fmt)))
+                thread.start()
+                thread.join()
+                self.assertEqual(result[0][0], 0)
+                
+                for state in (state, result[0][1]):
+                    self.assertEqual(state.NAtoms, ref.NAtoms)
+                    self.assertEqual(state.specieList, ref.specieList)
+                    self.assertTrue(np.array_equal(state.specieCount, ref.specieCount))
+                    for name in ("atomID", "specie", "pos", "charge"):
+                        self.assertTrue(np.array_equal(getattr(state, name), getattr(ref, name)), name)
+                    self.assertEqual(sorted(state.scalarsDict.keys()), sorted(ref.scalarsDict.keys()))
+                    for key in ref.scalarsDict:
+                        self.assertTrue(np.array_equal(state.scalarsDict[key], ref.scalarsDict[key]), key)
+            
+            # same error
+            fmt = self.ffs.getFormat("LBOMD Lattice")
+            with self.assertRaises(TypeError) as serialError:
+                serialReader.readFile(badfn, fmt)
+            with self.assertRaises(TypeError) as parallelError:
+                parallelReader.readFile(badfn, fmt)
+            self.assertEqual(str(parallelError.exception), str(serialError.exception))
+        
+        finally:
+            _preferences.setNumThreads(1)
+    
+    def test_readGenericCache(self):
+        """
+        Generic reader: lattice cache
+        
+        """
+        import mmap
+        
+        def isMapped(array):
+            base = array
+            while base is not None and not isinstance(base, mmap.mmap):
+                base = getattr(base, "base", None)
+            return base is not None
+        
+        fn = os.path.join(self.tmpLocation, "ref.xyz.gz")
+        shutil.copy(path_to_file("anim-ref-Hdiff.xyz.gz"), fn)
+        fmt = self.ffs.getFormat("LBOMD REF")
+        status, ref = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation).readFile(fn, fmt)
+        self.assertEqual(status, 0)
+        
+        reader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, cacheLocation="source")
+        cacheFile = reader.cache.cachePath(fn)
+        self.assertEqual(cacheFile, fn + ".atomancache")
+        for _ in range(2):
+            status, state = reader.readFile(fn, fmt)
+            self.assertEqual(status, 0)
+            self.assertTrue(os.path.exists(cacheFile))
+            self.assertEqual(state.NAtoms, ref.NAtoms)
+            self.assertEqual(state.specieList, ref.specieList)
+            self.assertTrue(np.array_equal(state.specieCount, ref.specieCount))
+            self.assertTrue(np.allclose(state.cellDims, ref.cellDims))
+            for name in ("atomID", "specie", "pos", "charge"):
+                self.assertTrue(np.array_equal(getattr(state, name), getattr(ref, name)), name)
+                self.assertEqual(getattr(state, name).dtype, getattr(ref, name).dtype)
+            self.assertEqual(sorted(state.scalarsDict.keys()), sorted(ref.scalarsDict.keys()))
+        
+        # arrays are mapped from the cache file (copy-on-write)
+        self.assertTrue(isMapped(state.pos))
+        state.pos[0] += 1.0
+        status, state2 = reader.readFile(fn, fmt)
+        self.assertEqual(state2.pos[0], ref.pos[0])
+        
+        # not used if the file changes
+        with open(cacheFile, "rb") as f:
+            cached = f.read()
+        st = os.stat(fn)
+        os.utime(fn, (st.st_atime, st.st_mtime + 10))
+        self.assertIsNone(reader.cache.load(fn, fmt))
+        status, state = reader.readFile(fn, fmt)
+        self.assertFalse(isMapped(state.pos))
+        self.assertIsNotNone(reader.cache.load(fn, fmt))
+        
+        # or if read with a different format
+        self.assertIsNone(reader.cache.load(fn, self.ffs.getFormat("LBOMD XYZ")))
+        
+        # invalid cache files are ignored
+        with open(cacheFile, "wb") as f:
+            f.write(cached[:100])
+        self.assertIsNone(reader.cache.load(fn, fmt))
+        
+        # cache in a separate directory
+        cacheDir = os.path.join(self.tmpLocation, "cache")
+        reader.cache = latticeReaderGeneric.latticeCache.LatticeCache("data", directory=cacheDir)
+        reader.readFile(fn, fmt)
+        self.assertEqual(len(os.listdir(cacheDir)), 1)
+        status, state = reader.readFile(fn, fmt)
+        self.assertTrue(isMapped(state.pos))
+        self.assertTrue(np.array_equal(state.pos, ref.pos))
+        
+        # files read with only some of the columns are cached separately
+        for _ in range(2):
+            status, state = reader.readFile(fn, fmt, columns=["Kinetic energy"])
+            self.assertEqual(status, 0)
+            self.assertEqual(len(os.listdir(cacheDir)), 2)
+            self.assertEqual(list(state.scalarsDict.keys()), ["Kinetic energy"])
+        self.assertTrue(isMapped(state.pos))
+        status, state = reader.readFile(fn, fmt)
+        self.assertEqual(sorted(state.scalarsDict.keys()), sorted(ref.scalarsDict.keys()))
+        self.assertNotEqual(reader.cache.cachePath(fn, ["Kinetic energy"]), reader.cache.cachePath(fn))
+    
+    def test_readGenericFrames(self):
+        """
+        Generic reader: multi-frame files
+        
+        """
+        import gzip
+        
+        fmt = self.ffs.getFormat("LBOMD Lattice")
+        files = [path_to_file("lattice.dat"), path_to_file("kenny_lattice.dat"), path_to_file("lattice.dat")]
+        refs = [self.reader.readFile(fn, fmt)[1] for fn in files]
+        texts = []
+        for fn in files:
+            with open(fn, "rb") as f:
+                texts.append(f.read())
+        
+        # the last frame is incomplete (still being written)
+        fn = os.path.join(self.tmpLocation, "traj.dat")
+        lastFrame = texts[2].splitlines(True)
+        with open(fn, "wb") as f:
+            f.write(texts[0] + b"\n" + texts[1])
+            f.writelines(lastFrame[:100])
+        
+        reader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, cacheLocation="source")
+        self.assertEqual(reader.numFrames(fn, fmt), 2)
+        self.assertTrue(os.path.exists(fn + ".atomanframes"))
+        self.assertEqual(list(reader.getFrameIndex(fn, fmt).NAtoms), [6912, 1140])
+        
+        # the index is extended when the file grows
+        with open(fn, "ab") as f:
+            f.writelines(lastFrame[100:])
+        st = os.stat(fn)
+        os.utime(fn, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(reader.numFrames(fn, fmt), 3)
+        
+        # and loaded from the index file
+        reader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, cacheLocation="source")
+        index = reader.frameIndexCache.load(fn, fmt)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.source, latticeReaderGeneric.latticeCache.sourceKey(fn))
+        
+        # random access, also on a compressed file (seeking backwards)
+        gzfn = fn + ".gz"
+        with open(fn, "rb") as fin, gzip.open(gzfn, "wb") as fout:
+            fout.write(fin.read())
+        for filename in (fn, gzfn):
+            for frame in (2, 0, 1, -1):
+                status, state = reader.readFrame(filename, fmt, frame)
+                self.assertEqual(status, 0)
+                ref = refs[frame]
+                self.assertEqual(state.NAtoms, ref.NAtoms)
+                self.assertEqual(state.attributes["Frame"], frame % 3)
+                self.assertEqual(state.specieList, ref.specieList)
+                self.assertTrue(np.allclose(state.cellDims, ref.cellDims))
+                self.assertTrue(np.array_equal(state.pos, ref.pos))
+                self.assertTrue(np.array_equal(state.specie, ref.specie))
+        
+        with self.assertRaises(IndexError):
+            reader.readFrame(fn, fmt, 3)
+        
+        # reading forwards continues with the stream of the previous frame
+        reader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, cacheLocation="source")
+        index = reader.getFrameIndex(gzfn, fmt)
+        reader.readFrame(gzfn, fmt, 0)
+        self.assertEqual(len(reader._frameStreams), 1)
+        stream = reader._frameStreams[0][1]
+        for frame in (1, 2):
+            self.assertLessEqual(latticeReaderGeneric._latticeReaderGeneric.fileStreamOffset(stream), index.offset(frame))
+            status, state = reader.readFrame(gzfn, fmt, frame)
+            self.assertTrue(np.array_equal(state.pos, refs[frame].pos))
+            self.assertEqual(len(reader._frameStreams), 1)
+            self.assertIs(reader._frameStreams[0][1], stream)
+        
+        # going backwards opens a new stream
+        status, state = reader.readFrame(gzfn, fmt, 1)
+        self.assertTrue(np.array_equal(state.pos, refs[1].pos))
+        self.assertEqual(len(reader._frameStreams), 2)
+        
+        # streams of a file that has changed are not used
+        st = os.stat(gzfn)
+        os.utime(gzfn, (st.st_atime, st.st_mtime + 10))
+        status, state = reader.readFrame(gzfn, fmt, 2)
+        self.assertTrue(np.array_equal(state.pos, refs[2].pos))
+        self.assertEqual(len(reader._frameStreams), 1)
+        self.assertIsNot(reader._frameStreams[0][1], stream)
+        reader.closeFrameStreams()
+        self.assertEqual(len(reader._frameStreams), 0)
+    
+    def test_readGenericColumns(self):
+        """
+        Generic reader: column projection and native types
+        
+        """
+        fn = path_to_file("anim-ref-Hdiff.xyz.gz")
+        fmt = self.ffs.getFormat("LBOMD REF")
+        status, ref = self.reader.readFile(fn, fmt)
+        self.assertEqual(status, 0)
+        
+        # only the requested columns are read
+        status, state = self.reader.readFile(fn, fmt, columns=["Kinetic energy"])
+        self.assertEqual(status, 0)
+        self.assertEqual(list(state.scalarsDict.keys()), ["Kinetic energy"])
+        self.assertEqual(len(state.vectorsDict), 0)
+        self.assertTrue(np.array_equal(state.scalarsDict["Kinetic energy"], ref.scalarsDict["Kinetic energy"]))
+        self.assertTrue(np.array_equal(state.pos, ref.pos))
+        self.assertTrue(np.array_equal(state.atomID, ref.atomID))
+        self.assertTrue(np.array_equal(state.specie, ref.specie))
+        self.assertFalse(np.any(state.charge))
+        self.assertIs(fmt.projectColumns(["Kinetic energy", "Potential energy", "Force", "Charge"]), fmt)
+        
+        # the format is not modified
+        self.assertTrue(any(item[0] == "Force" for item in fmt.body[0]))
+        
+        # float32 and integer columns keep their type
+        fmt32 = latticeReaderGeneric.FileFormat("LBOMD REF (float)")
+        fmt32.header = fmt.header
+        fmt32.newBodyLine()
+        for key, typecode, dim in fmt.body[0]:
+            if key in ("Kinetic energy", "Force"):
+                typecode = "f"
+            fmt32.addBodyValue(key, typecode, dim)
+        self.assertEqual(fmt32.verify(), [])
+        for parallel in (False, True):
+            reader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation, parallel=parallel)
+            status, state = reader.readFile(fn, fmt32)
+            self.assertEqual(status, 0)
+            self.assertEqual(state.scalarsDict["Kinetic energy"].dtype, np.float32)
+            self.assertEqual(state.vectorsDict["Force"].dtype, np.float32)
+            self.assertEqual(state.scalarsDict["Potential energy"].dtype, np.float64)
+            self.assertTrue(np.allclose(state.scalarsDict["Kinetic energy"], ref.scalarsDict["Kinetic energy"], rtol=1e-6))
+            self.assertTrue(np.allclose(state.vectorsDict["Force"], ref.vectorsDict["Force"], rtol=1e-6, atol=1e-6))
+        
+        fn = os.path.join(self.tmpLocation, "types.dat")
+        with open(fn, "w") as f:
+            f.write("2\n10.0 10.0 10.0\nFe 1.0 1.0 1.0 3\nCr 2.0 2.0 2.0 7\n")
+        fmti = latticeReaderGeneric.FileFormat("Typed")
+        fmti.newHeaderLine()
+        fmti.addHeaderValue("NAtoms", "i")
+        fmti.newHeaderLine()
+        for key in ("xdim", "ydim", "zdim"):
+            fmti.addHeaderValue(key, "d")
+        fmti.newBodyLine()
+        fmti.addBodyValue("Symbol", "i", 1)
+        fmti.addBodyValue("Position", "f", 3)
+        self.assertEqual(len(fmti.verify()), 1)
+        fmti.body[-1].pop()
+        fmti.addBodyValue("Position", "d", 3)
+        fmti.addBodyValue("Type", "i", 1)
+        status, state = self.reader.readFile(fn, fmti)
+        self.assertEqual(status, 0)
+        self.assertEqual(state.scalarsDict["Type"].dtype, np.int32)
+        self.assertEqual(list(state.scalarsDict["Type"]), [3, 7])
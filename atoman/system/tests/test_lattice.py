@@ -186,3 +186,169 @@ class TestLattice(unittest.TestCase):
 
         with self.assertRaises(ValueError):
             self.lattic2.getSpecieIndex("Zn")
+
+    def test_addAtoms(self):
+        """
+        Lattice addAtoms
+
+        """
+        lattice = self.lattic3
+        lattice.scalarsDict["KE"] = np.asarray([1, 2, 3], dtype=np.float64)
+        lattice.vectorsDict["Force"] = np.zeros((3, 3), dtype=np.float64)
+        lattice.scalarsDict["Other"] = np.zeros(3, dtype=np.float64)
+
+        pos = np.asarray([[1, 1, 1], [2, 2, 2], [-1, 5, 0], [4, 4, 4]], dtype=np.float64)
+        lattice.addAtoms(["Ga", "H_", "Pu", "H_"], pos, charge=[0.5, 0, 0, 1], scalarVals={"KE": 7},
+                         vectorVals={"Force": np.ones((4, 3))})
+
+        self.assertEqual(lattice.NAtoms, 7)
+        self.assertEqual(lattice.specieList, ["Pu", "Ga", "H_"])
+        self.assertEqual(list(lattice.specieCount), [3, 2, 2])
+        self.assertEqual(list(lattice.specie), [0, 0, 1, 1, 2, 0, 2])
+        self.assertEqual(list(lattice.atomID), list(range(7)))
+        self.assertTrue(np.array_equal(lattice.pos[9:], pos.reshape(-1)))
+        self.assertEqual(list(lattice.charge), [0, 0, 0, 0.5, 0, 0, 1])
+        self.assertEqual(list(lattice.minPos), [-1, 0, 0])
+        self.assertEqual(list(lattice.maxPos), [4, 5, 4])
+        self.assertEqual(list(lattice.scalarsDict["KE"]), [1, 2, 3, 7, 7, 7, 7])
+        self.assertEqual(lattice.vectorsDict["Force"].shape, (7, 3))
+        self.assertEqual(lattice.vectorsDict["Force"].sum(), 12)
+        self.assertNotIn("Other", lattice.scalarsDict)
+
+        # specie indexes (the spare capacity is reused)
+        lattice.addAtoms(np.asarray([1], dtype=np.int32), [[0, 0, 0]], atomID=[99],
+                         scalarVals={"KE": 8}, vectorVals={"Force": [[2, 2, 2]]})
+        pos = lattice.pos
+        lattice.addAtoms(np.asarray([0], dtype=np.int32), [[0, 0, 0]], scalarVals={"KE": 9},
+                         vectorVals={"Force": [[2, 2, 2]]})
+        self.assertIs(lattice.pos.base, pos.base)
+        self.assertEqual(lattice.atomSym(7), "Ga")
+        self.assertEqual(lattice.atomID[7], 99)
+        self.assertEqual(lattice.atomID[8], 8)
+        self.assertEqual(list(lattice.scalarsDict["KE"][7:]), [8, 9])
+        with self.assertRaises(ValueError):
+            lattice.addAtoms(np.asarray([3], dtype=np.int32), [[0, 0, 0]])
+
+        # arrays that were replaced are not overwritten
+        lattice.pos = lattice.pos.copy()
+        pos = lattice.pos
+        lattice.addAtom("Pu", (1, 2, 3), 0)
+        self.assertEqual(lattice.NAtoms, 10)
+        self.assertEqual(len(pos), 27)
+        self.assertEqual(list(lattice.atomPos(9)), [1, 2, 3])
+        self.assertNotIn("KE", lattice.scalarsDict)
+
+    def test_addAtomsMany(self):
+        """
+        Lattice addAtom grows in amortised linear time
+
+        """
+        lattice = Lattice()
+        for i in range(2000):
+            lattice.addAtom("Fe", (i, 0, 0), 0)
+        self.assertEqual(lattice.NAtoms, 2000)
+        self.assertEqual(lattice.specieCount[0], 2000)
+        self.assertTrue(np.array_equal(lattice.pos[::3], np.arange(2000)))
+        self.assertTrue(np.array_equal(lattice.atomID, np.arange(2000)))
+        self.assertLess(len(lattice.pos.base), 2 * 3 * 2000)
+
+    def test_clone(self):
+        """
+        Lattice clone
+
+        """
+        lattice = self.lattic3
+        lattice.scalarsDict["KE"] = np.asarray([1, 2, 3], dtype=np.float64)
+
+        clone = Lattice()
+        clone.clone(lattice)
+        self.assertEqual(clone.NAtoms, 3)
+        self.assertEqual(clone.specieList, lattice.specieList)
+        self.assertTrue(np.array_equal(clone.specieCount, lattice.specieCount))
+        self.assertTrue(np.array_equal(clone.specie, lattice.specie))
+        self.assertTrue(np.array_equal(clone.pos, lattice.pos))
+        self.assertTrue(np.array_equal(clone.scalarsDict["KE"], lattice.scalarsDict["KE"]))
+        self.assertFalse(np.shares_memory(clone.pos, lattice.pos))
+        self.assertTrue(clone.pos.flags.writeable)
+        self.assertTrue(lattice.pos.flags.writeable)
+
+    def test_cloneCopyOnWrite(self):
+        """
+        Lattice copy-on-write clone
+
+        """
+        lattice = self.lattic3
+        lattice.scalarsDict["KE"] = np.asarray([1, 2, 3], dtype=np.float64)
+        lattice.vectorsDict["Force"] = np.zeros((3, 3), dtype=np.float64)
+
+        clone = Lattice()
+        clone.clone(lattice, copyOnWrite=True)
+        self.assertTrue(np.shares_memory(clone.pos, lattice.pos))
+        self.assertTrue(np.shares_memory(clone.scalarsDict["KE"], lattice.scalarsDict["KE"]))
+
+        # the clone's shared arrays cannot be modified in place; the original's can
+        with self.assertRaises(ValueError):
+            clone.pos[0] = 1
+        self.assertTrue(lattice.pos.flags.writeable)
+        self.assertTrue(lattice.scalarsDict["KE"].flags.writeable)
+
+        # modifying the clone copies the arrays first
+        clone.cellDims[:] = 2
+        clone.wrapAtoms()
+        self.assertEqual(list(clone.pos), [0, 0, 0, 0, 0, 0, 1, 1, 1])
+        self.assertEqual(list(lattice.pos), [0, 0, 0, 0, 2, 0, 3, 1, 3])
+        clone.detach()
+        clone.scalarsDict["KE"][0] = 5
+        self.assertEqual(list(lattice.scalarsDict["KE"]), [1, 2, 3])
+
+        # modifying the original
+        lattice.removeSpecie(0)
+        lattice.addAtom("Ga", (7, 7, 7), 0, scalarVals={"KE": 9}, vectorVals={"Force": (1, 1, 1)})
+        self.assertEqual(list(lattice.specie), [0, 0, 0, 0])
+        self.assertEqual(list(clone.specie), [0, 0, 1])
+        self.assertEqual(list(clone.scalarsDict["KE"]), [5, 2, 3])
+        self.assertEqual(list(lattice.scalarsDict["KE"]), [1, 2, 3, 9])
+        self.assertEqual(clone.vectorsDict["Force"].shape, (3, 3))
+        self.assertTrue(lattice.pos.flags.writeable)
+
+    def test_cloneCopyOnWriteSource(self):
+        """
+        Lattice copy-on-write clone: writing to the original
+
+        """
+        lattice = self.lattic3
+        lattice.scalarsDict["KE"] = np.asarray([1, 2, 3], dtype=np.float64)
+
+        clone = Lattice()
+        clone.clone(lattice, copyOnWrite=True)
+
+        # the original is detached before writing in place, so the clone keeps the old values
+        lattice.detach()
+        lattice.charge[0] = 5
+        lattice.pos[0] += 1
+        lattice.scalarsDict["KE"][1] = 7
+        self.assertEqual(list(lattice.charge), [5, 0, 0])
+        self.assertEqual(list(clone.charge), [0, 0, 0])
+        self.assertEqual(list(clone.pos), [0, 0, 0, 0, 2, 0, 3, 1, 3])
+        self.assertEqual(list(clone.scalarsDict["KE"]), [1, 2, 3])
+        self.assertFalse(np.shares_memory(clone.pos, lattice.pos))
+        self.assertTrue(lattice.pos.flags.writeable)
+
+        # nothing left to copy once the arrays are no longer shared
+        pos = lattice.pos
+        lattice.detach()
+        self.assertIs(lattice.pos, pos)
+
+        # methods that modify the original in place also detach it
+        clone2 = Lattice()
+        clone2.clone(lattice, copyOnWrite=True)
+        lattice.cellDims[:] = 2
+        lattice.wrapAtoms()
+        self.assertEqual(list(clone2.pos), [1, 0, 0, 0, 2, 0, 3, 1, 3])
+        self.assertEqual(list(lattice.pos), [1, 0, 0, 0, 0, 0, 1, 1, 1])
+
+        # the arrays of a clone that has gone are not copied
+        del clone2
+        pos = lattice.pos
+        lattice.detach()
+        self.assertIs(lattice.pos, pos)
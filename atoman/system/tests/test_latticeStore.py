@@ -0,0 +1,144 @@
+"""
+Unit tests for the memory mapped lattice store
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import os
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from ..latticeReaders import LbomdDatReader, basic_displayError, basic_displayWarning, basic_log
+from .. import latticeStore
+from .. import latticeReaderGeneric
+
+
+def path_to_file(path):
+    return os.path.join(os.path.dirname(__file__), "..", "..", "..", "testing", path)
+
+
+def isMapped(array):
+    """Return True if the array is a view onto a memory map."""
+    base = array.base
+    while base is not None:
+        if isinstance(base, np.memmap):
+            return True
+        base = getattr(base, "base", None)
+    
+    return False
+
+
+class TestLatticeStore(unittest.TestCase):
+    """
+    Test the lattice store
+    
+    """
+    def setUp(self):
+        self.tmpLocation = tempfile.mkdtemp(prefix="atomanTest")
+        
+        reader = LbomdDatReader(self.tmpLocation, basic_log, basic_displayWarning, basic_displayError)
+        status, self.lattice = reader.readFile(path_to_file("kenny_lattice.dat"))
+        if status:
+            self.fail("Error reading in kenny_lattice.dat")
+        
+        NAtoms = self.lattice.NAtoms
+        self.lattice.scalarsDict["Test"] = np.arange(NAtoms, dtype=np.float64)
+        self.lattice.vectorsDict["Force"] = np.arange(3 * NAtoms, dtype=np.float64).reshape((NAtoms, 3))
+        self.lattice.attributes["Time"] = 1.5
+        
+        self.filename = os.path.join(self.tmpLocation, "lattice" + latticeStore.STORE_EXTENSION)
+        latticeStore.saveLattice(self.lattice, self.filename)
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmpLocation)
+        self.lattice = None
+    
+    def test_openLattice(self):
+        """
+        Lattice store open
+        
+        """
+        self.assertTrue(latticeStore.isLatticeStore(self.filename))
+        self.assertFalse(latticeStore.isLatticeStore(path_to_file("kenny_lattice.dat")))
+        
+        lattice = latticeStore.openLattice(self.filename)
+        
+        self.assertEqual(lattice.NAtoms, self.lattice.NAtoms)
+        self.assertEqual(lattice.specieList, self.lattice.specieList)
+        self.assertTrue(np.array_equal(lattice.specieCount, self.lattice.specieCount))
+        self.assertTrue(np.array_equal(lattice.specieRGB, self.lattice.specieRGB))
+        self.assertTrue(np.array_equal(lattice.cellDims, self.lattice.cellDims))
+        self.assertTrue(np.array_equal(lattice.PBC, self.lattice.PBC))
+        self.assertEqual(lattice.attributes, {"Time": 1.5})
+        for name in ("atomID", "specie", "pos", "charge"):
+            array = getattr(lattice, name)
+            self.assertEqual(array.dtype, getattr(self.lattice, name).dtype)
+            self.assertTrue(np.array_equal(array, getattr(self.lattice, name)))
+            self.assertTrue(isMapped(array))
+        self.assertTrue(np.array_equal(lattice.scalarsDict["Test"], self.lattice.scalarsDict["Test"]))
+        self.assertEqual(lattice.vectorsDict["Force"].shape, (self.lattice.NAtoms, 3))
+        self.assertTrue(np.array_equal(lattice.vectorsDict["Force"], self.lattice.vectorsDict["Force"]))
+        self.assertTrue(isMapped(lattice.scalarsDict["Test"]))
+        
+        # not a store file
+        with self.assertRaises(IOError):
+            latticeStore.openLattice(path_to_file("kenny_lattice.dat"))
+        with self.assertRaises(ValueError):
+            latticeStore.openLattice(self.filename, mode="r")
+    
+    def test_modify(self):
+        """
+        Lattice store modify
+        
+        """
+        # copy-on-write: the file is unchanged
+        lattice = latticeStore.openLattice(self.filename)
+        cellDims = np.tile(lattice.cellDims, lattice.NAtoms)
+        lattice.pos[:] += 2.0 * cellDims
+        lattice.wrapAtoms()
+        self.assertTrue(np.allclose(lattice.pos, self.lattice.pos - np.floor(self.lattice.pos / cellDims) * cellDims))
+        lattice.charge[:] = 1.0
+        del lattice
+        
+        lattice = latticeStore.openLattice(self.filename)
+        self.assertTrue(np.array_equal(lattice.charge, self.lattice.charge))
+        del lattice
+        
+        # write-through
+        lattice = latticeStore.openLattice(self.filename, mode="r+")
+        lattice.charge[:] = 1.0
+        del lattice
+        
+        lattice = latticeStore.openLattice(self.filename)
+        self.assertTrue(np.all(lattice.charge == 1.0))
+        
+        # save a mapped lattice back to its own file
+        lattice.scalarsDict["Other"] = np.ones(lattice.NAtoms, np.float64)
+        latticeStore.saveLattice(lattice, self.filename)
+        lattice = latticeStore.openLattice(self.filename)
+        self.assertEqual(sorted(lattice.scalarsDict.keys()), ["Other", "Test"])
+        self.assertTrue(np.array_equal(lattice.pos, self.lattice.pos))
+    
+    def test_readGeneric(self):
+        """
+        Lattice store read by the generic reader
+        
+        """
+        reader = latticeReaderGeneric.LatticeReaderGeneric(self.tmpLocation)
+        status, lattice = reader.readFile(self.filename, latticeReaderGeneric.LATTICE_STORE_FORMAT)
+        self.assertEqual(status, 0)
+        self.assertEqual(lattice.NAtoms, self.lattice.NAtoms)
+        self.assertTrue(np.array_equal(lattice.pos, self.lattice.pos))
+        self.assertTrue(isMapped(lattice.pos))
+        self.assertTrue(np.array_equal(lattice.scalarsDict["Test"], self.lattice.scalarsDict["Test"]))
+        
+        # linked lattices must have the same number of atoms
+        storeFormat = latticeReaderGeneric.LATTICE_STORE_FORMAT
+        status, linked = reader.readFile(self.filename, storeFormat, linkedLattice=lattice)
+        self.assertEqual(status, 0)
+        lattice.NAtoms += 1
+        with self.assertRaises(ValueError):
+            reader.readFile(self.filename, storeFormat, linkedLattice=lattice)
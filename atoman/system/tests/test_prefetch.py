@@ -0,0 +1,98 @@
+"""
+Unit tests for the read ahead prefetcher
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import threading
+import unittest
+
+from .. import prefetch
+
+
+class TestPrefetcher(unittest.TestCase):
+    """
+    Test the prefetcher
+    
+    """
+    def test_order(self):
+        """
+        Prefetcher returns items in order
+        
+        """
+        for depth in (0, 1, 3):
+            for numWorkers in (1, 2):
+                with prefetch.Prefetcher(range(10), lambda i: i * i, depth=depth, numWorkers=numWorkers) as prefetcher:
+                    results = list(prefetcher)
+                self.assertEqual(results, [(i, i * i) for i in range(10)])
+    
+    def test_bounded(self):
+        """
+        Prefetcher loads at most depth items ahead
+        
+        """
+        lock = threading.Lock()
+        loaded = []
+        
+        def load(item):
+            with lock:
+                loaded.append(item)
+            return item
+        
+        depth = 2
+        prefetcher = prefetch.Prefetcher(range(20), load, depth=depth)
+        try:
+            for item, result in prefetcher:
+                self.assertEqual(item, result)
+                # only items up to the current one plus depth are queued
+                self.assertLessEqual(max(loaded), item + depth)
+        
+        finally:
+            prefetcher.close()
+        
+        self.assertEqual(sorted(loaded), list(range(20)))
+    
+    def test_error(self):
+        """
+        Prefetcher raises load errors when the item is reached
+        
+        """
+        def load(item):
+            if item == 3:
+                raise IOError("missing %d" % item)
+            return item
+        
+        for depth in (0, 2):
+            results = []
+            with prefetch.Prefetcher(range(6), load, depth=depth) as prefetcher:
+                with self.assertRaises(IOError):
+                    for item, result in prefetcher:
+                        results.append(result)
+            self.assertEqual(results, [0, 1, 2])
+    
+    def test_cancel(self):
+        """
+        Prefetcher stops loading when closed
+        
+        """
+        started = threading.Event()
+        release = threading.Event()
+        loaded = []
+        
+        def load(item):
+            if item == 0:
+                started.set()
+                release.wait()
+            loaded.append(item)
+            return "file%d" % item
+        
+        prefetcher = prefetch.Prefetcher(range(100), load, depth=4)
+        started.wait()
+        prefetcher.cancel()
+        release.set()
+        prefetcher.close()
+        
+        # only the item being loaded when cancelled was finished
+        self.assertEqual(loaded, [0])
+        self.assertEqual(prefetcher.pending(), ["file0"])
+        self.assertEqual(list(prefetcher), [])
@@ -4,6 +4,7 @@
 #include <Python.h> // includes stdio.h, string.h, errno.h, stdlib.h
 #include <numpy/arrayobject.h>
 #include "visclibs/array_utils.h"
+#include "gui/preferences.h"
 
 
 static double **ptrvector_double(long);
@@ -79,3 +80,162 @@ void free_Cptrs_double(double **v)
 {
     free((char *) v);
 }
+
+/*******************************************************************************
+ ** Return pointers to the columns of per visible atom data (the full scalars
+ ** or vectors) that are passed to the filters. The columns can be passed as a
+ ** list of arrays (one per column) that are compacted in place, or as a single
+ ** array with the columns stored one after the other (e.g. 2D, one row per
+ ** column). Each column must be a contiguous float64 array with at least
+ ** length elements. Returns NULL (with an exception set) on error.
+ *******************************************************************************/
+double **getColumnPointers(PyObject *columns, int NColumns, int length)
+{
+    int i;
+    double **ptrs;
+    
+    
+    /* the numpy C API is initialised separately for each source file */
+    if (PyArray_API == NULL && _import_array() < 0) return NULL;
+    
+    ptrs = malloc((NColumns > 0 ? NColumns : 1) * sizeof(double *));
+    if (ptrs == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate column pointers");
+        return NULL;
+    }
+    
+    if (PyList_Check(columns))
+    {
+        if (PyList_GET_SIZE(columns) != NColumns)
+        {
+            PyErr_SetString(PyExc_ValueError, "Number of columns does not match the length of the list");
+            free(ptrs);
+            return NULL;
+        }
+        
+        for (i = 0; i < NColumns; i++)
+        {
+            PyObject *column = PyList_GET_ITEM(columns, i);
+            
+            if (!PyArray_Check(column) || PyArray_TYPE((PyArrayObject *) column) != NPY_FLOAT64 ||
+                    !PyArray_IS_C_CONTIGUOUS((PyArrayObject *) column) ||
+                    PyArray_SIZE((PyArrayObject *) column) < length)
+            {
+                PyErr_SetString(PyExc_ValueError, "Columns must be contiguous float64 arrays of the right length");
+                free(ptrs);
+                return NULL;
+            }
+            ptrs[i] = (double *) PyArray_DATA((PyArrayObject *) column);
+        }
+    }
+    else if (PyArray_Check(columns))
+    {
+        PyArrayObject *array = (PyArrayObject *) columns;
+        
+        if (PyArray_TYPE(array) != NPY_FLOAT64 || !PyArray_IS_C_CONTIGUOUS(array) ||
+                PyArray_SIZE(array) < (npy_intp) NColumns * length)
+        {
+            PyErr_SetString(PyExc_ValueError, "Columns must be a contiguous float64 array of the right size");
+            free(ptrs);
+            return NULL;
+        }
+        
+        for (i = 0; i < NColumns; i++)
+            ptrs[i] = (double *) PyArray_DATA(array) + (npy_intp) i * length;
+    }
+    else
+    {
+        PyErr_SetString(PyExc_TypeError, "Columns must be a list of arrays or an array");
+        free(ptrs);
+        return NULL;
+    }
+    
+    return ptrs;
+}
+
+/*******************************************************************************
+ ** Stream compaction of the visible atoms array (and the full scalars and
+ ** vectors that go with it, see getColumnPointers), keeping the atoms where
+ ** keep[i] is set. Each array is compacted in order, so the result is the same
+ ** as the serial loops the filters used to do, but the arrays are compacted in
+ ** parallel. Returns the new number of visible atoms, or -1 (with an exception
+ ** set) on error.
+ *******************************************************************************/
+int compactVisibleAtoms(int NVisibleIn, int *visibleAtoms, char *keep, int NScalars, PyObject *fullScalars,
+        int NVectors, PyObject *fullVectors)
+{
+    int i, col, NVisible;
+    double **scalarCols, **vectorCols;
+    
+    
+    /* columns of the full scalars and vectors (checked even if nothing is removed) */
+    scalarCols = getColumnPointers(fullScalars, NScalars, NVisibleIn);
+    if (scalarCols == NULL) return -1;
+    vectorCols = getColumnPointers(fullVectors, NVectors, 3 * NVisibleIn);
+    if (vectorCols == NULL)
+    {
+        free(scalarCols);
+        return -1;
+    }
+    
+    /* number of atoms that are kept */
+    NVisible = 0;
+    for (i = 0; i < NVisibleIn; i++)
+        if (keep[i]) NVisible++;
+    
+    /* each array (visible atoms, then scalars, then vectors) is a separate task */
+    if (NVisible != NVisibleIn)
+    {
+        #pragma omp parallel for schedule(dynamic) num_threads(prefs_numThreads)
+        for (col = 0; col < 1 + NScalars + NVectors; col++)
+        {
+            int j, n = 0;
+            
+            if (col == 0)
+            {
+                for (j = 0; j < NVisibleIn; j++)
+                    if (keep[j]) visibleAtoms[n++] = visibleAtoms[j];
+            }
+            else if (col <= NScalars)
+            {
+                compactDoubleVector(NVisibleIn, scalarCols[col - 1], keep);
+            }
+            else
+            {
+                double *vectors = vectorCols[col - 1 - NScalars];
+                
+                for (j = 0; j < NVisibleIn; j++)
+                {
+                    if (keep[j])
+                    {
+                        vectors[3 * n    ] = vectors[3 * j    ];
+                        vectors[3 * n + 1] = vectors[3 * j + 1];
+                        vectors[3 * n + 2] = vectors[3 * j + 2];
+                        n++;
+                    }
+                }
+            }
+        }
+    }
+    
+    free(scalarCols);
+    free(vectorCols);
+    
+    return NVisible;
+}
+
+/*******************************************************************************
+ ** Compact (in order) the given array, keeping the elements where keep[i] is
+ ** set. Returns the number of elements kept.
+ *******************************************************************************/
+int compactDoubleVector(int n, double *array, char *keep)
+{
+    int i, count;
+    
+    count = 0;
+    for (i = 0; i < n; i++)
+        if (keep[i]) array[count++] = array[i];
+    
+    return count;
+}
@@ -13,10 +13,17 @@ int **pymatrix_to_Cptrs_int(PyArrayObject*);
 void free_Cptrs_double(double**);
 int not_doubleMatrix(PyArrayObject*);
 
+double **getColumnPointers(PyObject*, int, int);
+int compactVisibleAtoms(int, int*, char*, int, PyObject*, int, PyObject*);
+int compactDoubleVector(int, double*, char*);
+
 #define DIND1(a, i) *((double *) PyArray_GETPTR1(a, i))
 #define DIND2(a, i, j) *((double *) PyArray_GETPTR2(a, i, j))
 #define DIND3(a, i, j, k) *((double *) Py_Array_GETPTR3(a, i, j, k))
 
+#define FIND1(a, i) *((float *) PyArray_GETPTR1(a, i))
+#define FIND2(a, i, j) *((float *) PyArray_GETPTR2(a, i, j))
+
 #define IIND1(a, i) *((int *) PyArray_GETPTR1(a, i))
 #define IIND2(a, i, j) *((int *) PyArray_GETPTR2(a, i, j))
 #define IIND3(a, i, j, k) *((int *) Py_Array_GETPTR3(a, i, j, k))
@@ -8,7 +8,10 @@
  ** 
  ** Call setupBoxes() to return the Boxes structure
  ** 
- ** Call putAtomInBoxes() to add atoms to the boxes
+ ** Call putAtomsInBoxes() to add atoms to the boxes (once only)
+ ** 
+ ** The atoms in box i are boxes->boxAtoms[boxes->boxStart[i]] to
+ ** boxes->boxAtoms[boxes->boxStart[i+1]-1], in order of atom index
  ** 
  ** The Boxes structure must be freed by calling freeBoxes()
  ** 
@@ -73,79 +76,74 @@ struct Boxes * setupBoxes(double approxBoxWidth, int *PBC, double *cellDims)
     /* total number of boxes */
     boxes->totNBoxes = boxes->NBoxes[0] * boxes->NBoxes[1] * boxes->NBoxes[2];
     
-    /* amount of memory to allocate at a time */
-    boxes->allocChunk = 16;
-    
-    /* allocate arrays for storing counters and atoms */
-    boxes->boxNAtoms = calloc(boxes->totNBoxes, sizeof(int));
-    if (boxes->boxNAtoms == NULL)
-    {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate boxNAtoms");
-        free(boxes);
-        return NULL;
-    }
-    boxes->boxAtoms = malloc(boxes->totNBoxes * sizeof(int *));
-    if (boxes->boxAtoms == NULL)
+    /* allocate box offsets (boxes are empty until atoms are added) */
+    boxes->boxStart = calloc(boxes->totNBoxes + 1, sizeof(int));
+    if (boxes->boxStart == NULL)
     {
-        PyErr_SetString(PyExc_MemoryError, "Could not allocate boxAtoms");
-        free(boxes->boxNAtoms);
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate boxStart");
         free(boxes);
         return NULL;
     }
+    boxes->boxAtoms = NULL;
     
     return boxes;
 }
 
 /*******************************************************************************
- ** put atoms into boxes
+ ** put atoms into boxes (counting sort into a single array of atom indexes)
  *******************************************************************************/
 int putAtomsInBoxes(int NAtoms, double *pos, struct Boxes *boxes)
 {
-    int i, boxIndex, newsize;
-    int status = 0;
+    int i, *atomBox, *boxFill;
     
     
-    /* loop over all atoms */
-    for (i=0; i<NAtoms; i++)
+    /* box index of each atom */
+    atomBox = malloc(NAtoms * sizeof(int));
+    if (atomBox == NULL && NAtoms > 0)
     {
-        /* find which box this atom belongs to */
-        boxIndex = boxIndexOfAtom(pos[3*i], pos[3*i+1], pos[3*i+2], boxes);
-        
-        /* check if this box is empty or full and alloc/realloc as required */
-        if (boxes->boxNAtoms[boxIndex] == 0)
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate atomBox");
+        freeBoxes(boxes);
+        return 1;
+    }
+    for (i = 0; i < NAtoms; i++)
+    {
+        atomBox[i] = boxIndexOfAtom(pos[3*i], pos[3*i+1], pos[3*i+2], boxes);
+        if (atomBox[i] < 0)
         {
-            /* allocate this box */
-            boxes->boxAtoms[boxIndex] = malloc(boxes->allocChunk * sizeof(int));
-            if (boxes->boxAtoms[boxIndex] == NULL)
-            {
-                char errstring[128];
-                sprintf(errstring, "Could not allocate boxAtoms[%d]", boxIndex);
-                PyErr_SetString(PyExc_MemoryError, errstring);
-                freeBoxes(boxes);
-                return 1;
-            }
+            free(atomBox);
+            freeBoxes(boxes);
+            return 1;
         }
         
-        else if (boxes->boxNAtoms[boxIndex] % boxes->allocChunk == 0)
-        {
-            /* realloc more space */
-            newsize = boxes->boxNAtoms[boxIndex] + boxes->allocChunk;
-            boxes->boxAtoms[boxIndex] = realloc(boxes->boxAtoms[boxIndex], newsize * sizeof(int));
-            if (boxes->boxAtoms[boxIndex] == NULL)
-            {
-                char errstring[128];
-                sprintf(errstring, "Could not reallocate boxAtoms[%d]: %d", boxIndex, newsize);
-                PyErr_SetString(PyExc_MemoryError, errstring);
-                freeBoxes(boxes);
-                return 1;
-            }
-        }
-        
-        /* add atom to box */
-        boxes->boxAtoms[boxIndex][boxes->boxNAtoms[boxIndex]++] = i;
+        /* count atoms in each box */
+        boxes->boxStart[atomBox[i] + 1]++;
+    }
+    
+    /* convert counts to offsets */
+    for (i = 0; i < boxes->totNBoxes; i++)
+        boxes->boxStart[i + 1] += boxes->boxStart[i];
+    
+    /* allocate atoms array */
+    boxes->boxAtoms = malloc(NAtoms * sizeof(int));
+    boxFill = malloc(boxes->totNBoxes * sizeof(int));
+    if ((boxes->boxAtoms == NULL && NAtoms > 0) || boxFill == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate boxAtoms");
+        free(boxFill);
+        free(atomBox);
+        freeBoxes(boxes);
+        return 1;
     }
     
-    return status;
+    /* add atoms to boxes (in order of atom index) */
+    memcpy(boxFill, boxes->boxStart, boxes->totNBoxes * sizeof(int));
+    for (i = 0; i < NAtoms; i++)
+        boxes->boxAtoms[boxFill[atomBox[i]]++] = i;
+    
+    free(boxFill);
+    free(atomBox);
+    
+    return 0;
 }
 
 /*******************************************************************************
@@ -402,14 +400,7 @@ int getBoxNeighbourhood(int mainBox, int* boxNeighbourList, struct Boxes *boxes)
  *******************************************************************************/
 void freeBoxes(struct Boxes *boxes)
 {
-    int i;
-    
-    
-    for (i = 0; i < boxes->totNBoxes; i++)
-    {
-        if (boxes->boxNAtoms[i]) free(boxes->boxAtoms[i]);
-    }
     free(boxes->boxAtoms);
-    free(boxes->boxNAtoms);
+    free(boxes->boxStart);
     free(boxes);
 }
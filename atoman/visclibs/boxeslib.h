@@ -14,14 +14,13 @@ struct Boxes
     int PBC[3];
     double cellDims[3];
     
-    int *boxNAtoms;
-    int **boxAtoms;
+    /* atoms in box i are boxAtoms[boxStart[i]] to boxAtoms[boxStart[i+1]-1] */
+    int *boxStart;
+    int *boxAtoms;
     
     int totNBoxes;
     int NBoxes[3];
     double boxWidth[3];
-    
-    int allocChunk;
 };
 
 /* available functions */
@@ -4,16 +4,20 @@
 #include "visclibs/boxeslib.h"
 #include "visclibs/utilities.h"
 #include "visclibs/neb_list.h"
+#include "gui/preferences.h"
 
 
 static int addAtomToNebList(int, int, double, struct NeighbourList2 *);
 
 
+/*******************************************************************************
+ ** Construct the neighbour list of the given atoms, which must have been put
+ ** into the boxes already. The atoms are processed in parallel; each atom only
+ ** writes to its own list.
+ *******************************************************************************/
 struct NeighbourList * constructNeighbourList(int NAtoms, double *pos, struct Boxes *boxes, double *cellDims, int *PBC, double maxSep2)
 {
-    int i, j, k, boxIndex, indexb, newsize;
-    int boxNebList[27];
-    double rxa, rya, rza, rxb, ryb, rzb, sep2;
+    int i, errorFlag;
     struct NeighbourList *nebList;
     
     
@@ -33,22 +37,23 @@ struct NeighbourList * constructNeighbourList(int NAtoms, double *pos, struct Bo
     }
     
     /* loop over atoms */
+    errorFlag = 0;
+    #pragma omp parallel for schedule(guided) reduction(|:errorFlag) num_threads(prefs_numThreads)
     for (i = 0; i < NAtoms; i++)
     {
-        int boxNebListSize;
+        int j, boxIndex, boxNebListSize, boxNebList[27];
+        double rxa, rya, rza;
+        
+        /* stop adding neighbours if there was an error in this thread */
+        if (errorFlag) continue;
         
         /* atom position */
         rxa = pos[3*i];
         rya = pos[3*i+1];
         rza = pos[3*i+2];
         
-        /* get box index of this atom */
+        /* get box index of this atom (cannot fail, the same positions were boxed by the caller) */
         boxIndex = boxIndexOfAtom(rxa, rya, rza, boxes);
-        if (boxIndex < 0)
-        {
-            freeNeighbourList(nebList, NAtoms);
-            return NULL;
-        }
         
         /* find neighbouring boxes */
         boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
@@ -56,83 +61,67 @@ struct NeighbourList * constructNeighbourList(int NAtoms, double *pos, struct Bo
         /* loop over box neighbourhood */
         for (j = 0; j < boxNebListSize; j++)
         {
+            int k;
+            
             boxIndex = boxNebList[j];
             
             /* loop over atoms in box */
-            for (k = 0; k < boxes->boxNAtoms[boxIndex]; k++)
+            for (k = boxes->boxStart[boxIndex]; k < boxes->boxStart[boxIndex + 1]; k++)
             {
-                indexb = boxes->boxAtoms[boxIndex][k];
+                int indexb = boxes->boxAtoms[k];
+                double sep2;
                 
                 if (indexb == i) continue;
                 
-                /* atom position */
-                rxb = pos[3*indexb];
-                ryb = pos[3*indexb+1];
-                rzb = pos[3*indexb+2];
-                
                 /* separation */
-                sep2 = atomicSeparation2(rxa, rya, rza, rxb, ryb, rzb, cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+                sep2 = atomicSeparation2(rxa, rya, rza, pos[3*indexb], pos[3*indexb+1], pos[3*indexb+2],
+                                         cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
                 
                 /* check if neighbour */
                 if (sep2 < maxSep2)
                 {
                     /* check if need to resize neighbour pointers */
-                    if (nebList[i].neighbourCount == 0)
-                    {
-                        nebList[i].neighbour = malloc(nebList[i].chunk * sizeof(int));
-                        if (nebList[i].neighbour == NULL)
-                        {
-                            char errstring[128];
-                            sprintf(errstring, "Could not allocate nebList[%d].neighbour\n", i);
-                            PyErr_SetString(PyExc_MemoryError, errstring);
-                            freeNeighbourList(nebList, NAtoms);
-                            return NULL;
-                        }
-                        nebList[i].neighbourSep = malloc(nebList[i].chunk * sizeof(double));
-                        if (nebList[i].neighbourSep == NULL)
-                        {
-                            char errstring[128];
-                            sprintf(errstring, "Could not allocate nebList[%d].neighbourSep\n", i);
-                            PyErr_SetString(PyExc_MemoryError, errstring);
-                            freeNeighbourList(nebList, NAtoms);
-                            return NULL;
-                        }
-                    }
-                    else if (nebList[i].neighbourCount % nebList[i].chunk == 0)
+                    if (nebList[i].neighbourCount % nebList[i].chunk == 0)
                     {
-                        newsize = nebList[i].neighbourCount + nebList[i].chunk;
-                        nebList[i].neighbour = realloc(nebList[i].neighbour, newsize * sizeof(int));
-                        if (nebList[i].neighbour == NULL)
+                        int newsize = nebList[i].neighbourCount + nebList[i].chunk;
+                        int *newNeighbour;
+                        double *newNeighbourSep;
+                        
+                        newNeighbour = realloc((nebList[i].neighbourCount) ? nebList[i].neighbour : NULL, newsize * sizeof(int));
+                        if (newNeighbour == NULL)
                         {
-                            char errstring[128];
-                            sprintf(errstring, "Could not reallocate nebList[%d].neighbour\n", i);
-                            PyErr_SetString(PyExc_MemoryError, errstring);
-                            freeNeighbourList(nebList, NAtoms);
-                            return NULL;
+                            errorFlag = 1;
+                            break;
                         }
-                        nebList[i].neighbourSep = realloc(nebList[i].neighbourSep, newsize * sizeof(double));
-                        if (nebList[i].neighbourSep == NULL)
+                        nebList[i].neighbour = newNeighbour;
+                        
+                        newNeighbourSep = realloc((nebList[i].neighbourCount) ? nebList[i].neighbourSep : NULL, newsize * sizeof(double));
+                        if (newNeighbourSep == NULL)
                         {
-                            char errstring[128];
-                            sprintf(errstring, "Could not reallocate nebList[%d].neighbourSep\n", i);
-                            PyErr_SetString(PyExc_MemoryError, errstring);
-                            freeNeighbourList(nebList, NAtoms);
-                            return NULL;
+                            /* make sure this entry gets freed */
+                            if (nebList[i].neighbourCount == 0) free(nebList[i].neighbour);
+                            errorFlag = 1;
+                            break;
                         }
+                        nebList[i].neighbourSep = newNeighbourSep;
                     }
                     
                     /* add neighbour */
                     nebList[i].neighbour[nebList[i].neighbourCount] = indexb;
                     nebList[i].neighbourSep[nebList[i].neighbourCount] = sqrt(sep2);
                     nebList[i].neighbourCount++;
-                    
-//                    if (i < 1)
-//                        printf("NEB OF %d: %d; sep %lf\n", i, indexb, sqrt(sep2));
                 }
             }
+            if (errorFlag) break;
         }
-//        if (i < 1)
-//            printf("NUM NEBS FOR %d: %d\n", i, nebList[i].neighbourCount);
+    }
+    
+    /* errors can only be raised once we are back in one thread */
+    if (errorFlag)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate neighbour list");
+        freeNeighbourList(nebList, NAtoms);
+        return NULL;
     }
     
     return nebList;
@@ -155,34 +144,21 @@ void freeNeighbourList(struct NeighbourList *nebList, int size)
 
 /*************************************************/
 
+/*******************************************************************************
+ ** Add an atom to the neighbour list of another. The Python error is not set
+ ** here as this is called from parallel regions; returns non-zero on error.
+ *******************************************************************************/
 static int addAtomToNebList(int mainIndex, int nebIndex, double sep, struct NeighbourList2 *nebList)
 {
-    int newsize;
-    
-    
     /* check if need to resize neighbour pointers */
-    if (nebList[mainIndex].neighbourCount == 0)
-    {
-        nebList[mainIndex].neighbour = malloc(nebList[mainIndex].chunk * sizeof(struct Neighbour));
-        if (nebList[mainIndex].neighbour == NULL)
-        {
-            char errstring[128];
-            sprintf(errstring, "Could not allocate nebList[%d].neighbour\n", mainIndex);
-            PyErr_SetString(PyExc_MemoryError, errstring);
-            return 1;
-        }
-    }
-    else if (nebList[mainIndex].neighbourCount % nebList[mainIndex].chunk == 0)
+    if (nebList[mainIndex].neighbourCount % nebList[mainIndex].chunk == 0)
     {
-        newsize = nebList[mainIndex].neighbourCount + nebList[mainIndex].chunk;
-        nebList[mainIndex].neighbour = realloc(nebList[mainIndex].neighbour, newsize * sizeof(struct Neighbour));
-        if (nebList[mainIndex].neighbour == NULL)
-        {
-            char errstring[128];
-            sprintf(errstring, "Could not reallocate nebList[%d].neighbour\n", mainIndex);
-            PyErr_SetString(PyExc_MemoryError, errstring);
-            return 2;
-        }
+        int newsize = nebList[mainIndex].neighbourCount + nebList[mainIndex].chunk;
+        struct Neighbour *newNeighbour;
+        
+        newNeighbour = realloc(nebList[mainIndex].neighbour, newsize * sizeof(struct Neighbour));
+        if (newNeighbour == NULL) return 1;
+        nebList[mainIndex].neighbour = newNeighbour;
     }
     
     /* add neighbour */
@@ -193,11 +169,14 @@ static int addAtomToNebList(int mainIndex, int nebIndex, double sep, struct Neig
     return 0;
 }
 
+/*******************************************************************************
+ ** Construct the neighbour list of the given atoms, which must have been put
+ ** into the boxes already. The atoms are processed in parallel; each atom only
+ ** writes to its own list (so each pair is found twice, once from each atom).
+ *******************************************************************************/
 struct NeighbourList2 * constructNeighbourList2(int NAtoms, double *pos, struct Boxes *boxes, double *cellDims, int *PBC, double maxSep2)
 {
-    int i, j, k, boxIndex, indexb;
-    int boxNebList[27];
-    double rxa, rya, rza, rxb, ryb, rzb, sep2;
+    int i, errorFlag;
     struct NeighbourList2 *nebList;
     
     
@@ -218,69 +197,67 @@ struct NeighbourList2 * constructNeighbourList2(int NAtoms, double *pos, struct
     }
     
     /* loop over atoms */
+    errorFlag = 0;
+    #pragma omp parallel for schedule(guided) reduction(|:errorFlag) num_threads(prefs_numThreads)
     for (i = 0; i < NAtoms; i++)
     {
-        int boxNebListSize;
+        int j, boxIndex, boxNebListSize, boxNebList[27];
+        double rxa, rya, rza;
+        
+        /* stop adding neighbours if there was an error in this thread */
+        if (errorFlag) continue;
         
         /* atom position */
         rxa = pos[3*i];
         rya = pos[3*i+1];
         rza = pos[3*i+2];
         
-        /* get box index of this atom */
+        /* get box index of this atom (cannot fail, the same positions were boxed by the caller) */
         boxIndex = boxIndexOfAtom(rxa, rya, rza, boxes);
-        if (boxIndex < 0)
-        {
-            freeNeighbourList2(nebList, NAtoms);
-            return NULL;
-        }
         
         /* find neighbouring boxes */
         boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
         
         /* loop over box neighbourhood */
-        for (j = 0; j < boxNebListSize; j++)
+        for (j = 0; j < boxNebListSize && !errorFlag; j++)
         {
+            int k;
+            
             boxIndex = boxNebList[j];
             
             /* loop over atoms in box */
-            for (k=0; k<boxes->boxNAtoms[boxIndex]; k++)
+            for (k = boxes->boxStart[boxIndex]; k < boxes->boxStart[boxIndex + 1]; k++)
             {
-                indexb = boxes->boxAtoms[boxIndex][k];
-                
-                if (indexb <= i) continue;
+                int indexb = boxes->boxAtoms[k];
+                double sep2;
                 
-                /* atom position */
-                rxb = pos[3*indexb];
-                ryb = pos[3*indexb+1];
-                rzb = pos[3*indexb+2];
+                if (indexb == i) continue;
                 
                 /* separation */
-                sep2 = atomicSeparation2(rxa, rya, rza, rxb, ryb, rzb, cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+                sep2 = atomicSeparation2(rxa, rya, rza, pos[3*indexb], pos[3*indexb+1], pos[3*indexb+2],
+                                         cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
                 
                 /* check if neighbour */
                 if (sep2 < maxSep2)
                 {
-                    int addstat;
-                    double sep = sqrt(sep2);
-                    
-                    addstat = addAtomToNebList(i, indexb, sep, nebList);
-                    if (addstat)
+                    if (addAtomToNebList(i, indexb, sqrt(sep2), nebList))
                     {
-                        freeNeighbourList2(nebList, NAtoms);
-                        return NULL;
-                    }
-                    addstat = addAtomToNebList(indexb, i, sep, nebList);
-                    if (addstat)
-                    {
-                        freeNeighbourList2(nebList, NAtoms);
-                        return NULL;
+                        errorFlag = 1;
+                        break;
                     }
                 }
             }
         }
     }
     
+    /* errors can only be raised once we are back in one thread */
+    if (errorFlag)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate neighbour list");
+        freeNeighbourList2(nebList, NAtoms);
+        return NULL;
+    }
+    
     return nebList;
 }
 
@@ -290,11 +267,10 @@ struct NeighbourList2 * constructNeighbourList2(int NAtoms, double *pos, struct
  *******************************************************************************/
 struct NeighbourList2 * constructNeighbourList2DiffPos(int NAtomsRef, double *refPos, int NAtomsInp, double *inpPos, double *cellDims, int *PBC, double maxSep)
 {
-    int i;
-    int boxstat;
+    int i, errorFlag;
+    int boxstat, *refBox;
     double approxBoxWidth;
     double maxSep2 = maxSep * maxSep;
-    double rxb, ryb, rzb, sep2;
     struct Boxes *boxes;
     struct NeighbourList2 *nebList;
     
@@ -306,11 +282,31 @@ struct NeighbourList2 * constructNeighbourList2DiffPos(int NAtomsRef, double *re
     boxstat = putAtomsInBoxes(NAtomsInp, inpPos, boxes);
     if (boxstat) return NULL;
     
+    /* box index of each ref atom (in serial, as this can raise an error) */
+    refBox = malloc((NAtomsRef > 0 ? NAtomsRef : 1) * sizeof(int));
+    if (refBox == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate refBox");
+        freeBoxes(boxes);
+        return NULL;
+    }
+    for (i = 0; i < NAtomsRef; i++)
+    {
+        refBox[i] = boxIndexOfAtom(refPos[3*i], refPos[3*i+1], refPos[3*i+2], boxes);
+        if (refBox[i] < 0)
+        {
+            free(refBox);
+            freeBoxes(boxes);
+            return NULL;
+        }
+    }
+    
     /* allocate neb list */
     nebList = malloc(NAtomsRef * sizeof(struct NeighbourList2));
     if (nebList == NULL)
     {
         PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList");
+        free(refBox);
         freeBoxes(boxes);
         return NULL;
     }
@@ -324,73 +320,65 @@ struct NeighbourList2 * constructNeighbourList2DiffPos(int NAtomsRef, double *re
     }
     
     /* loop over ref atoms */
+    errorFlag = 0;
+    #pragma omp parallel for schedule(guided) reduction(|:errorFlag) num_threads(prefs_numThreads)
     for (i = 0; i < NAtomsRef; i++)
     {
         int i3 = 3 * i;
-        int j, boxNebListSize, boxIndex, boxNebList[27];
+        int j, boxNebListSize, boxNebList[27];
         double rxa, rya, rza;
         
+        /* stop adding neighbours if there was an error in this thread */
+        if (errorFlag) continue;
+        
         /* atom position */
         rxa = refPos[i3    ];
         rya = refPos[i3 + 1];
         rza = refPos[i3 + 2];
         
-        /* get box index of this atom */
-        boxIndex = boxIndexOfAtom(rxa, rya, rza, boxes);
-        if (boxIndex < 0)
-        {
-            freeNeighbourList2(nebList, NAtomsRef);
-            freeBoxes(boxes);
-            return NULL;
-        }
-        
         /* find neighbouring boxes */
-        boxNebListSize = getBoxNeighbourhood(boxIndex, boxNebList, boxes);
+        boxNebListSize = getBoxNeighbourhood(refBox[i], boxNebList, boxes);
         
         /* loop over box neighbourhood */
-        for (j = 0; j < boxNebListSize; j++)
+        for (j = 0; j < boxNebListSize && !errorFlag; j++)
         {
-            int k;
-            
-            boxIndex = boxNebList[j];
+            int k, boxIndex = boxNebList[j];
             
             /* loop over atoms in box */
-            for (k = 0; k < boxes->boxNAtoms[boxIndex]; k++)
+            for (k = boxes->boxStart[boxIndex]; k < boxes->boxStart[boxIndex + 1]; k++)
             {
-                int indexb = boxes->boxAtoms[boxIndex][k];
+                int indexb = boxes->boxAtoms[k];
                 int indb3 = indexb * 3;
-                
-                /* atom position */
-                rxb = inpPos[indb3    ];
-                ryb = inpPos[indb3 + 1];
-                rzb = inpPos[indb3 + 2];
+                double sep2;
                 
                 /* separation */
-                sep2 = atomicSeparation2(rxa, rya, rza, rxb, ryb, rzb, cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+                sep2 = atomicSeparation2(rxa, rya, rza, inpPos[indb3], inpPos[indb3 + 1], inpPos[indb3 + 2],
+                                         cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
                 
                 /* check if neighbour */
-                if (sep2 < maxSep2)
+                if (sep2 < maxSep2 && fabs(sep2 - 0.0) > 1e-6)
                 {
-                    if (fabs(sep2 - 0.0) > 1e-6)
+                    if (addAtomToNebList(i, indexb, sqrt(sep2), nebList))
                     {
-                        int addstat;
-                        double sep = sqrt(sep2);
-                        
-                        addstat = addAtomToNebList(i, indexb, sep, nebList);
-                        if (addstat)
-                        {
-                            freeNeighbourList2(nebList, NAtomsRef);
-                            freeBoxes(boxes);
-                            return NULL;
-                        }
+                        errorFlag = 1;
+                        break;
                     }
                 }
             }
         }
     }
     
+    free(refBox);
     freeBoxes(boxes);
     
+    /* errors can only be raised once we are back in one thread */
+    if (errorFlag)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate neighbour list");
+        freeNeighbourList2(nebList, NAtomsRef);
+        return NULL;
+    }
+    
     return nebList;
 }
 
@@ -424,3 +412,342 @@ int compare_nebs_separation(const void * a, const void * b)
     else if (n1->separation > n2->separation) return 1;
     else return 0;
 }
+
+/*******************************************************************************
+ ** Make array of positions of the visible atoms. Must be freed by the caller.
+ *******************************************************************************/
+static double * makeVisiblePos(int NVisible, int *visibleAtoms, double *pos)
+{
+    int i;
+    double *visiblePos;
+    
+    
+    visiblePos = malloc(3 * NVisible * sizeof(double));
+    if (visiblePos == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate visiblePos");
+        return NULL;
+    }
+    
+    for (i = 0; i < NVisible; i++)
+    {
+        int index = visibleAtoms[i];
+        int ind3 = 3 * index;
+        int i3 = 3 * i;
+        visiblePos[i3    ] = pos[ind3    ];
+        visiblePos[i3 + 1] = pos[ind3 + 1];
+        visiblePos[i3 + 2] = pos[ind3 + 2];
+    }
+    
+    return visiblePos;
+}
+
+/*******************************************************************************
+ ** Box the visible atoms and construct their neighbour list (NeighbourList)
+ *******************************************************************************/
+struct NeighbourList * constructVisibleNeighbourList(int NVisible, int *visibleAtoms, double *pos, double *cellDims, int *PBC,
+        double maxSep)
+{
+    int boxstat;
+    double *visiblePos;
+    struct Boxes *boxes;
+    struct NeighbourList *nebList;
+    
+    
+    /* construct array of positions of visible atoms */
+    visiblePos = makeVisiblePos(NVisible, visibleAtoms, pos);
+    if (visiblePos == NULL) return NULL;
+    
+    /* box visible atoms */
+    boxes = setupBoxes(maxSep, PBC, cellDims);
+    if (boxes == NULL)
+    {
+        free(visiblePos);
+        return NULL;
+    }
+    boxstat = putAtomsInBoxes(NVisible, visiblePos, boxes);
+    if (boxstat)
+    {
+        free(visiblePos);
+        return NULL;
+    }
+    
+    /* build neighbour list */
+    nebList = constructNeighbourList(NVisible, visiblePos, boxes, cellDims, PBC, maxSep * maxSep);
+    
+    /* only required for building neb list */
+    free(visiblePos);
+    freeBoxes(boxes);
+    
+    return nebList;
+}
+
+/*******************************************************************************
+ ** Box the visible atoms and construct their neighbour list (NeighbourList2)
+ *******************************************************************************/
+struct NeighbourList2 * constructVisibleNeighbourList2(int NVisible, int *visibleAtoms, double *pos, double *cellDims, int *PBC,
+        double maxSep)
+{
+    int boxstat;
+    double *visiblePos;
+    struct Boxes *boxes;
+    struct NeighbourList2 *nebList;
+    
+    
+    /* construct array of positions of visible atoms */
+    visiblePos = makeVisiblePos(NVisible, visibleAtoms, pos);
+    if (visiblePos == NULL) return NULL;
+    
+    /* box visible atoms */
+    boxes = setupBoxes(maxSep, PBC, cellDims);
+    if (boxes == NULL)
+    {
+        free(visiblePos);
+        return NULL;
+    }
+    boxstat = putAtomsInBoxes(NVisible, visiblePos, boxes);
+    if (boxstat)
+    {
+        free(visiblePos);
+        return NULL;
+    }
+    
+    /* build neighbour list */
+    nebList = constructNeighbourList2(NVisible, visiblePos, boxes, cellDims, PBC, maxSep * maxSep);
+    
+    /* only required for building neb list */
+    free(visiblePos);
+    freeBoxes(boxes);
+    
+    return nebList;
+}
+
+/*******************************************************************************
+ ** Map lattice indices to positions in the visible atoms array. Atoms that are
+ ** not visible are mapped to -1. Returned array must be freed by the caller.
+ *******************************************************************************/
+int * makeVisibleIndexMap(int NAtoms, int NVisible, int *visibleAtoms)
+{
+    int i;
+    int *visibleIndexMap;
+    
+    
+    visibleIndexMap = malloc(NAtoms * sizeof(int));
+    if (visibleIndexMap == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate visibleIndexMap");
+        return NULL;
+    }
+    
+    for (i = 0; i < NAtoms; i++) visibleIndexMap[i] = -1;
+    for (i = 0; i < NVisible; i++) visibleIndexMap[visibleAtoms[i]] = i;
+    
+    return visibleIndexMap;
+}
+
+/*******************************************************************************
+ ** Construct a neighbour list for the visible atoms from a precomputed
+ ** neighbour list of the full lattice (stored in compressed form: the
+ ** neighbours of atom i are nebIndex[nebStart[i]] to nebIndex[nebStart[i+1]-1]).
+ ** Only visible neighbours with separation less than sqrt(maxSep2) are added
+ ** and the neighbour indexes refer to positions in the visible atoms array, so
+ ** the result is the same as calling constructNeighbourList on the visible
+ ** atoms.
+ *******************************************************************************/
+struct NeighbourList * constructNeighbourListFromCSR(int NVisible, int *visibleAtoms, int NAtoms, int *nebStart, int *nebIndex,
+        double *pos, double *cellDims, int *PBC, double maxSep2)
+{
+    int i, errorFlag, *visibleIndexMap;
+    struct NeighbourList *nebList;
+    
+    
+    /* map from lattice index to visible index */
+    visibleIndexMap = makeVisibleIndexMap(NAtoms, NVisible, visibleAtoms);
+    if (visibleIndexMap == NULL) return NULL;
+    
+    /* allocate neb list */
+    nebList = malloc(NVisible * sizeof(struct NeighbourList));
+    if (nebList == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList");
+        free(visibleIndexMap);
+        return NULL;
+    }
+    
+    /* initialise */
+    for (i = 0; i < NVisible; i++)
+    {
+        nebList[i].chunk = 16;
+        nebList[i].neighbourCount = 0;
+    }
+    
+    /* loop over visible atoms (in parallel, each atom writes to its own list) */
+    errorFlag = 0;
+    #pragma omp parallel for schedule(guided) reduction(|:errorFlag) num_threads(prefs_numThreads)
+    for (i = 0; i < NVisible; i++)
+    {
+        int j, maxNebs, index = visibleAtoms[i];
+        double rxa, rya, rza;
+        
+        /* number of neighbours in the full list is an upper bound */
+        maxNebs = nebStart[index + 1] - nebStart[index];
+        if (maxNebs == 0 || errorFlag) continue;
+        
+        nebList[i].neighbour = malloc(maxNebs * sizeof(int));
+        nebList[i].neighbourSep = malloc(maxNebs * sizeof(double));
+        if (nebList[i].neighbour == NULL || nebList[i].neighbourSep == NULL)
+        {
+            /* this entry is empty so must be freed here */
+            free(nebList[i].neighbour);
+            free(nebList[i].neighbourSep);
+            errorFlag = 1;
+            continue;
+        }
+        
+        /* atom position */
+        rxa = pos[3*index];
+        rya = pos[3*index+1];
+        rza = pos[3*index+2];
+        
+        /* loop over neighbours in the full list */
+        for (j = nebStart[index]; j < nebStart[index + 1]; j++)
+        {
+            int indexb = nebIndex[j];
+            int visIndexb = visibleIndexMap[indexb];
+            double sep2;
+            
+            /* skip if not visible */
+            if (visIndexb < 0) continue;
+            
+            /* separation */
+            sep2 = atomicSeparation2(rxa, rya, rza, pos[3*indexb], pos[3*indexb+1], pos[3*indexb+2], 
+                                     cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+            
+            /* check if neighbour */
+            if (sep2 < maxSep2)
+            {
+                nebList[i].neighbour[nebList[i].neighbourCount] = visIndexb;
+                nebList[i].neighbourSep[nebList[i].neighbourCount] = sqrt(sep2);
+                nebList[i].neighbourCount++;
+            }
+        }
+        
+        /* nothing added; release now as freeNeighbourList only frees non-empty entries */
+        if (nebList[i].neighbourCount == 0)
+        {
+            free(nebList[i].neighbour);
+            free(nebList[i].neighbourSep);
+        }
+    }
+    
+    free(visibleIndexMap);
+    
+    /* errors can only be raised once we are back in one thread */
+    if (errorFlag)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate neighbour list");
+        freeNeighbourList(nebList, NVisible);
+        return NULL;
+    }
+    
+    return nebList;
+}
+
+/*******************************************************************************
+ ** Same as constructNeighbourListFromCSR but creates a NeighbourList2
+ *******************************************************************************/
+struct NeighbourList2 * constructNeighbourList2FromCSR(int NVisible, int *visibleAtoms, int NAtoms, int *nebStart, int *nebIndex,
+        double *pos, double *cellDims, int *PBC, double maxSep2)
+{
+    int i, errorFlag, *visibleIndexMap;
+    struct NeighbourList2 *nebList;
+    
+    
+    /* map from lattice index to visible index */
+    visibleIndexMap = makeVisibleIndexMap(NAtoms, NVisible, visibleAtoms);
+    if (visibleIndexMap == NULL) return NULL;
+    
+    /* allocate neb list */
+    nebList = malloc(NVisible * sizeof(struct NeighbourList2));
+    if (nebList == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate nebList");
+        free(visibleIndexMap);
+        return NULL;
+    }
+    
+    /* initialise */
+    for (i = 0; i < NVisible; i++)
+    {
+        nebList[i].chunk = 16;
+        nebList[i].neighbourCount = 0;
+        nebList[i].neighbour = NULL;
+    }
+    
+    /* loop over visible atoms (in parallel, each atom writes to its own list) */
+    errorFlag = 0;
+    #pragma omp parallel for schedule(guided) reduction(|:errorFlag) num_threads(prefs_numThreads)
+    for (i = 0; i < NVisible; i++)
+    {
+        int j, maxNebs, index = visibleAtoms[i];
+        double rxa, rya, rza;
+        
+        /* number of neighbours in the full list is an upper bound */
+        maxNebs = nebStart[index + 1] - nebStart[index];
+        if (maxNebs == 0 || errorFlag) continue;
+        
+        nebList[i].neighbour = malloc(maxNebs * sizeof(struct Neighbour));
+        if (nebList[i].neighbour == NULL)
+        {
+            errorFlag = 1;
+            continue;
+        }
+        
+        /* atom position */
+        rxa = pos[3*index];
+        rya = pos[3*index+1];
+        rza = pos[3*index+2];
+        
+        /* loop over neighbours in the full list */
+        for (j = nebStart[index]; j < nebStart[index + 1]; j++)
+        {
+            int indexb = nebIndex[j];
+            int visIndexb = visibleIndexMap[indexb];
+            double sep2;
+            
+            /* skip if not visible */
+            if (visIndexb < 0) continue;
+            
+            /* separation */
+            sep2 = atomicSeparation2(rxa, rya, rza, pos[3*indexb], pos[3*indexb+1], pos[3*indexb+2], 
+                                     cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+            
+            /* check if neighbour */
+            if (sep2 < maxSep2)
+            {
+                nebList[i].neighbour[nebList[i].neighbourCount].index = visIndexb;
+                nebList[i].neighbour[nebList[i].neighbourCount].separation = sqrt(sep2);
+                nebList[i].neighbourCount++;
+            }
+        }
+        
+        /* nothing added; release now as freeNeighbourList2 only frees non-empty entries */
+        if (nebList[i].neighbourCount == 0)
+        {
+            free(nebList[i].neighbour);
+            nebList[i].neighbour = NULL;
+        }
+    }
+    
+    free(visibleIndexMap);
+    
+    /* errors can only be raised once we are back in one thread */
+    if (errorFlag)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate neighbour list");
+        freeNeighbourList2(nebList, NVisible);
+        return NULL;
+    }
+    
+    return nebList;
+}
@@ -34,4 +34,12 @@ struct NeighbourList2 * constructNeighbourList2DiffPos(int, double *, int, doubl
 void freeNeighbourList2(struct NeighbourList2 *, int);
 int compare_nebs_separation(const void *, const void *);
 
+/* neighbour lists of visible atoms: built from scratch or as views of a
+ * precomputed (compressed) neighbour list of the full lattice */
+struct NeighbourList * constructVisibleNeighbourList(int, int *, double *, double *, int *, double);
+struct NeighbourList2 * constructVisibleNeighbourList2(int, int *, double *, double *, int *, double);
+int * makeVisibleIndexMap(int, int, int *);
+struct NeighbourList * constructNeighbourListFromCSR(int, int *, int, int *, int *, double *, double *, int *, double);
+struct NeighbourList2 * constructNeighbourList2FromCSR(int, int *, int, int *, int *, double *, double *, int *, double);
+
 #endif
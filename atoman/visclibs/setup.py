@@ -29,6 +29,12 @@ def configuration(parent_package='', top_path=None):
                          libraries=["boxeslib", "array_utils"],
                          include_dirs=[incdirs],
                          depends=["boxeslib.h", "boxeslib.c", "array_utils.h", "array_utils.c"])
+    config.add_extension("tests._bench_boxeslib",
+                         ["tests/bench_boxeslib.c"],
+                         libraries=["boxeslib", "utilities", "array_utils"],
+                         include_dirs=[incdirs],
+                         depends=["boxeslib.h", "boxeslib.c", "utilities.h", "utilities.c", "array_utils.h",
+                                  "array_utils.c"])
     
     return config
 
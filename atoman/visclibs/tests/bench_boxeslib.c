@@ -0,0 +1,301 @@
+/*******************************************************************************
+ ** Micro-benchmark for boxeslib.c
+ **
+ ** Compares the flat (counting sort) box layout in boxeslib.c with the old
+ ** layout, where each box was allocated separately and grown in chunks as it
+ ** filled. The old layout is reproduced here for comparison only.
+ *******************************************************************************/
+
+#define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
+
+#include <Python.h> // includes stdio.h, string.h, errno.h, stdlib.h
+#include <numpy/arrayobject.h>
+#include <math.h>
+#include "visclibs/boxeslib.h"
+#include "visclibs/utilities.h"
+#include "visclibs/array_utils.h"
+
+#if PY_MAJOR_VERSION >= 3
+    #define MOD_ERROR_VAL NULL
+    #define MOD_SUCCESS_VAL(val) val
+    #define MOD_INIT(name) PyMODINIT_FUNC PyInit_##name(void)
+    #define MOD_DEF(ob, name, doc, methods) \
+        static struct PyModuleDef moduledef = { \
+            PyModuleDef_HEAD_INIT, name, doc, -1, methods, }; \
+        ob = PyModule_Create(&moduledef);
+#else
+    #define MOD_ERROR_VAL
+    #define MOD_SUCCESS_VAL(val)
+    #define MOD_INIT(name) void init##name(void)
+    #define MOD_DEF(ob, name, doc, methods) \
+        ob = Py_InitModule3(name, methods, doc);
+#endif
+
+/* the old layout of the boxes */
+struct ChunkedBoxes
+{
+    int *boxNAtoms;
+    int **boxAtoms;
+    int allocChunk;
+};
+
+static PyObject* boxAtoms(PyObject*, PyObject*);
+static PyObject* countPairs(PyObject*, PyObject*);
+static struct ChunkedBoxes * putAtomsInChunkedBoxes(int, double *, struct Boxes *);
+static void freeChunkedBoxes(struct ChunkedBoxes *, int);
+
+
+/*******************************************************************************
+ ** List of python methods available in this module
+ *******************************************************************************/
+static struct PyMethodDef module_methods[] = {
+    {"boxAtoms", boxAtoms, METH_VARARGS, "Put atoms in boxes (repeatedly)"},
+    {"countPairs", countPairs, METH_VARARGS, "Count pairs of atoms within a cut-off using the boxes (repeatedly)"},
+    {NULL, NULL, 0, NULL}
+};
+
+/*******************************************************************************
+ ** Module initialisation function
+ *******************************************************************************/
+MOD_INIT(_bench_boxeslib)
+{
+    PyObject *mod;
+
+    MOD_DEF(mod, "_bench_boxeslib", "Boxeslib benchmarks", module_methods)
+    if (mod == NULL)
+        return MOD_ERROR_VAL;
+
+    import_array();
+
+    return MOD_SUCCESS_VAL(mod);
+}
+
+/*******************************************************************************
+ ** Put atoms into boxes using the old layout (one allocation per box)
+ *******************************************************************************/
+static struct ChunkedBoxes * putAtomsInChunkedBoxes(int NAtoms, double *pos, struct Boxes *boxes)
+{
+    int i;
+    struct ChunkedBoxes *chunked;
+
+
+    chunked = malloc(sizeof(struct ChunkedBoxes));
+    if (chunked == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate chunked boxes");
+        return NULL;
+    }
+    chunked->allocChunk = 16;
+    chunked->boxNAtoms = calloc(boxes->totNBoxes, sizeof(int));
+    chunked->boxAtoms = malloc(boxes->totNBoxes * sizeof(int *));
+    if (chunked->boxNAtoms == NULL || chunked->boxAtoms == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate chunked boxes");
+        free(chunked->boxNAtoms);
+        free(chunked->boxAtoms);
+        free(chunked);
+        return NULL;
+    }
+
+    for (i = 0; i < NAtoms; i++)
+    {
+        int boxIndex = boxIndexOfAtom(pos[3*i], pos[3*i+1], pos[3*i+2], boxes);
+        int n = chunked->boxNAtoms[boxIndex];
+
+        if (n == 0)
+            chunked->boxAtoms[boxIndex] = malloc(chunked->allocChunk * sizeof(int));
+        else if (n % chunked->allocChunk == 0)
+            chunked->boxAtoms[boxIndex] = realloc(chunked->boxAtoms[boxIndex], (n + chunked->allocChunk) * sizeof(int));
+        if (chunked->boxAtoms[boxIndex] == NULL)
+        {
+            PyErr_SetString(PyExc_MemoryError, "Could not allocate chunked box");
+            chunked->boxNAtoms[boxIndex] = 0;
+            freeChunkedBoxes(chunked, boxes->totNBoxes);
+            return NULL;
+        }
+
+        chunked->boxAtoms[boxIndex][chunked->boxNAtoms[boxIndex]++] = i;
+    }
+
+    return chunked;
+}
+
+/*******************************************************************************
+ ** Free the old layout
+ *******************************************************************************/
+static void freeChunkedBoxes(struct ChunkedBoxes *chunked, int totNBoxes)
+{
+    int i;
+
+
+    for (i = 0; i < totNBoxes; i++)
+        if (chunked->boxNAtoms[i]) free(chunked->boxAtoms[i]);
+    free(chunked->boxAtoms);
+    free(chunked->boxNAtoms);
+    free(chunked);
+}
+
+/*******************************************************************************
+ ** Put atoms in boxes the given number of times
+ *******************************************************************************/
+static PyObject*
+boxAtoms(PyObject *self, PyObject *args)
+{
+    int i, NAtoms, *PBC, repeats, chunkedLayout;
+    double *pos, *cellDims, approxWidth;
+    PyArrayObject *posIn=NULL;
+    PyArrayObject *cellDimsIn=NULL;
+    PyArrayObject *PBCIn=NULL;
+
+
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "O!O!O!dii", &PyArray_Type, &posIn, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn,
+            &approxWidth, &repeats, &chunkedLayout))
+        return NULL;
+
+    if (not_doubleVector(posIn)) return NULL;
+    pos = pyvector_to_Cptr_double(posIn);
+    NAtoms = ((int) PyArray_DIM(posIn, 0)) / 3;
+
+    if (not_doubleVector(cellDimsIn)) return NULL;
+    cellDims = pyvector_to_Cptr_double(cellDimsIn);
+
+    if (not_intVector(PBCIn)) return NULL;
+    PBC = pyvector_to_Cptr_int(PBCIn);
+
+    for (i = 0; i < repeats; i++)
+    {
+        struct Boxes *boxes;
+
+        boxes = setupBoxes(approxWidth, PBC, cellDims);
+        if (boxes == NULL) return NULL;
+
+        if (chunkedLayout)
+        {
+            struct ChunkedBoxes *chunked = putAtomsInChunkedBoxes(NAtoms, pos, boxes);
+            if (chunked == NULL)
+            {
+                freeBoxes(boxes);
+                return NULL;
+            }
+            freeChunkedBoxes(chunked, boxes->totNBoxes);
+        }
+        else if (putAtomsInBoxes(NAtoms, pos, boxes)) return NULL;
+
+        freeBoxes(boxes);
+    }
+
+    Py_RETURN_NONE;
+}
+
+/*******************************************************************************
+ ** Count the pairs of atoms within the cut-off the given number of times,
+ ** looping over the neighbouring boxes of each atom. Returns the number of
+ ** pairs found by the last repeat.
+ *******************************************************************************/
+static PyObject*
+countPairs(PyObject *self, PyObject *args)
+{
+    int i, NAtoms, *PBC, repeats, chunkedLayout, *atomBox;
+    long count;
+    double *pos, *cellDims, cutoff, cutoff2;
+    PyArrayObject *posIn=NULL;
+    PyArrayObject *cellDimsIn=NULL;
+    PyArrayObject *PBCIn=NULL;
+    struct Boxes *boxes;
+    struct ChunkedBoxes *chunked = NULL;
+
+
+    /* parse and check arguments from Python */
+    if (!PyArg_ParseTuple(args, "O!O!O!dii", &PyArray_Type, &posIn, &PyArray_Type, &cellDimsIn, &PyArray_Type, &PBCIn,
+            &cutoff, &repeats, &chunkedLayout))
+        return NULL;
+
+    if (not_doubleVector(posIn)) return NULL;
+    pos = pyvector_to_Cptr_double(posIn);
+    NAtoms = ((int) PyArray_DIM(posIn, 0)) / 3;
+
+    if (not_doubleVector(cellDimsIn)) return NULL;
+    cellDims = pyvector_to_Cptr_double(cellDimsIn);
+
+    if (not_intVector(PBCIn)) return NULL;
+    PBC = pyvector_to_Cptr_int(PBCIn);
+
+    cutoff2 = cutoff * cutoff;
+
+    /* box the atoms using the selected layout (not timed separately) */
+    boxes = setupBoxes(cutoff, PBC, cellDims);
+    if (boxes == NULL) return NULL;
+    if (chunkedLayout)
+    {
+        chunked = putAtomsInChunkedBoxes(NAtoms, pos, boxes);
+        if (chunked == NULL)
+        {
+            freeBoxes(boxes);
+            return NULL;
+        }
+    }
+    else if (putAtomsInBoxes(NAtoms, pos, boxes)) return NULL;
+
+    /* box of each atom */
+    atomBox = malloc(NAtoms * sizeof(int));
+    if (atomBox == NULL)
+    {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate atomBox");
+        if (chunked != NULL) freeChunkedBoxes(chunked, boxes->totNBoxes);
+        freeBoxes(boxes);
+        return NULL;
+    }
+    for (i = 0; i < NAtoms; i++)
+        atomBox[i] = boxIndexOfAtom(pos[3*i], pos[3*i+1], pos[3*i+2], boxes);
+
+    /* query */
+    count = 0;
+    for (i = 0; i < repeats; i++)
+    {
+        int j;
+
+        count = 0;
+        for (j = 0; j < NAtoms; j++)
+        {
+            int m, boxNebList[27], boxNebListSize;
+
+            boxNebListSize = getBoxNeighbourhood(atomBox[j], boxNebList, boxes);
+            for (m = 0; m < boxNebListSize; m++)
+            {
+                int k, kstart, kend, *atoms, boxIndex = boxNebList[m];
+
+                if (chunked != NULL)
+                {
+                    atoms = chunked->boxAtoms[boxIndex];
+                    kstart = 0;
+                    kend = chunked->boxNAtoms[boxIndex];
+                }
+                else
+                {
+                    atoms = boxes->boxAtoms;
+                    kstart = boxes->boxStart[boxIndex];
+                    kend = boxes->boxStart[boxIndex + 1];
+                }
+
+                for (k = kstart; k < kend; k++)
+                {
+                    int index = atoms[k];
+                    double sep2;
+
+                    if (index <= j) continue;
+
+                    sep2 = atomicSeparation2(pos[3*j], pos[3*j+1], pos[3*j+2], pos[3*index], pos[3*index+1], pos[3*index+2],
+                                             cellDims[0], cellDims[1], cellDims[2], PBC[0], PBC[1], PBC[2]);
+                    if (sep2 < cutoff2) count++;
+                }
+            }
+        }
+    }
+
+    free(atomBox);
+    if (chunked != NULL) freeChunkedBoxes(chunked, boxes->totNBoxes);
+    freeBoxes(boxes);
+
+    return Py_BuildValue("l", count);
+}
@@ -0,0 +1,49 @@
+"""
+Micro-benchmark for boxeslib
+
+Compares the time to put atoms into boxes, and the throughput of neighbour
+queries using the boxes, between the flat box layout and the old layout
+(one allocation per box). Run with:
+
+    python -m atoman.visclibs.tests.benchmark_boxeslib [NCells ...]
+
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+import sys
+
+import numpy as np
+
+from . import _bench_boxeslib
+from ...visutils.benchmarks import makeLattice, timeit
+
+
+def main(sizes):
+    PBC = np.ones(3, np.int32)
+    cutoff = 3.5
+    print("%10s  %8s  %12s  %12s  %14s  %14s" % ("atoms", "layout", "build (ms)", "speed-up", "queries/s", "speed-up"))
+    for NCells in sizes:
+        pos, _, cellDims = makeLattice(NCells, sigma=0.05)
+        NAtoms = len(pos) // 3
+        repeats = max(1, 2000000 // NAtoms)
+        
+        results = {}
+        for chunked, name in ((1, "chunked"), (0, "flat")):
+            buildTime, _ = timeit(_bench_boxeslib.boxAtoms, pos, cellDims, PBC, cutoff, repeats, chunked)
+            queryTime, count = timeit(_bench_boxeslib.countPairs, pos, cellDims, PBC, cutoff, 1, chunked)
+            results[name] = (buildTime / repeats, NAtoms / queryTime, count)
+        
+        if results["flat"][2] != results["chunked"][2]:
+            raise RuntimeError("Number of pairs differs between layouts")
+        
+        for name in ("chunked", "flat"):
+            build, rate, _ = results[name]
+            print("%10d  %8s  %12.3f  %12.2f  %14.0f  %14.2f" % (NAtoms, name, build * 1000.0,
+                                                                 results["chunked"][0] / build, rate,
+                                                                 rate / results["chunked"][1]))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 30, 60])
@@ -28,6 +28,7 @@
 #endif
 
 static PyObject* test_boxes(PyObject*, PyObject*);
+static PyObject* test_boxAtoms(PyObject*, PyObject*);
 
 
 /*******************************************************************************
@@ -35,6 +36,7 @@ static PyObject* test_boxes(PyObject*, PyObject*);
  *******************************************************************************/
 static struct PyMethodDef module_methods[] = {
     {"test_boxes", test_boxes, METH_VARARGS, "The boxes functionality"},
+    {"test_boxAtoms", test_boxAtoms, METH_VARARGS, "Putting atoms in boxes"},
     {NULL, NULL, 0, NULL}
 };
 
@@ -104,6 +106,83 @@ test_boxes(PyObject *self, PyObject *args)
         
         
         
+        /* free boxes memory */
+        freeBoxes(boxes);
+        
+        /* build success result */
+        result = Py_BuildValue("i", 0);
+    }
+    
+    return result;
+}
+
+/*******************************************************************************
+ ** Test putting atoms in boxes: for each atom store the box it was put in and
+ ** its position within that box, along with the box it should be in
+ *******************************************************************************/
+static PyObject*
+test_boxAtoms(PyObject *self, PyObject *args)
+{
+    double approxWidth;
+    PyObject *result=NULL;
+    PyArrayObject *posIn=NULL;
+    PyArrayObject *cellDimsIn=NULL;
+    PyArrayObject *pbcIn=NULL;
+    PyArrayObject *atomBox=NULL;
+    PyArrayObject *expectedBox=NULL;
+    PyArrayObject *boxOrder=NULL;
+    
+    
+    /* parse and check arguments from Python */
+    if (PyArg_ParseTuple(args, "O!O!O!dO!O!O!", &PyArray_Type, &posIn, &PyArray_Type, &cellDimsIn, &PyArray_Type, &pbcIn,
+            &approxWidth, &PyArray_Type, &atomBox, &PyArray_Type, &expectedBox, &PyArray_Type, &boxOrder))
+    {
+        int i, numAtoms, *pbc, status;
+        double *pos, *cellDims;
+        struct Boxes *boxes;
+        
+        /* convert numpy arrays to C pointers */
+        if (not_doubleVector(posIn)) return NULL;
+        pos = pyvector_to_Cptr_double(posIn);
+        numAtoms = ((int) PyArray_DIM(posIn, 0)) / 3;
+        
+        if (not_doubleVector(cellDimsIn)) return NULL;
+        cellDims = pyvector_to_Cptr_double(cellDimsIn);
+        
+        if (not_intVector(pbcIn)) return NULL;
+        pbc = pyvector_to_Cptr_int(pbcIn);
+        
+        if (not_intVector(atomBox)) return NULL;
+        if (not_intVector(expectedBox)) return NULL;
+        if (not_intVector(boxOrder)) return NULL;
+        
+        /* setup boxes */
+        boxes = setupBoxes(approxWidth, pbc, cellDims);
+        if (boxes == NULL) return Py_BuildValue("i", 1);
+        
+        /* put atoms in boxes */
+        status = putAtomsInBoxes(numAtoms, pos, boxes);
+        if (status) return Py_BuildValue("i", 2);
+        
+        /* box that each atom was put in */
+        for (i = 0; i < numAtoms; i++)
+        {
+            IIND1(atomBox, i) = -1;
+            IIND1(expectedBox, i) = boxIndexOfAtom(pos[3*i], pos[3*i+1], pos[3*i+2], boxes);
+        }
+        for (i = 0; i < boxes->totNBoxes; i++)
+        {
+            int k;
+            
+            for (k = boxes->boxStart[i]; k < boxes->boxStart[i + 1]; k++)
+            {
+                int index = boxes->boxAtoms[k];
+                
+                IIND1(atomBox, index) = i;
+                IIND1(boxOrder, index) = k - boxes->boxStart[i];
+            }
+        }
+        
         /* free boxes memory */
         freeBoxes(boxes);
         
@@ -76,6 +76,34 @@ class TestBoxeslib(unittest.TestCase):
         self.assertAlmostEqual(cellLengths[0], 5.568)
         self.assertAlmostEqual(cellLengths[1], 5.104)
         self.assertAlmostEqual(cellLengths[2], 5.302857143)
+    
+    def test_boxAtoms(self):
+        """
+        Boxeslib put atoms in boxes
+        
+        """
+        pbc = np.ones(3, np.int32)
+        pos = self.lattice2.pos.copy()
+        NAtoms = self.lattice2.NAtoms
+        
+        # move some atoms outside the cell
+        pos[0] -= self.lattice2.cellDims[0]
+        pos[4] += self.lattice2.cellDims[1]
+        
+        # call C lib
+        atomBox = np.empty(NAtoms, np.int32)
+        expectedBox = np.empty(NAtoms, np.int32)
+        boxOrder = np.empty(NAtoms, np.int32)
+        status = _test_boxeslib.test_boxAtoms(pos, self.lattice2.cellDims, pbc, 5.0, atomBox, expectedBox, boxOrder)
+        self.assertEqual(status, 0)
+        
+        # every atom is in the correct box
+        self.assertTrue(np.array_equal(atomBox, expectedBox))
+        
+        # atoms are stored in order of index within each box
+        for box in np.unique(atomBox):
+            indexes = np.nonzero(atomBox == box)[0]
+            self.assertTrue(np.array_equal(boxOrder[indexes], np.arange(len(indexes))))
         
         
         
@@ -0,0 +1,55 @@
+"""
+Helpers shared by the benchmark scripts (the benchmark_*.py modules in the
+tests directories)
+
+@author: Chris Scott
+
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+import time
+
+import numpy as np
+
+
+class DummyVoroOpts(object):
+    """Voronoi options."""
+    def __init__(self):
+        self.dispersion = 10.0
+        self.displayVoronoi = False
+        self.useRadii = False
+        self.opacity = 0.8
+        self.outputToFile = False
+        self.outputFilename = "voronoi.csv"
+        self.faceAreaThreshold = 0.1
+
+
+def makeLattice(NCells, a0=4.078, sigma=0.15, seed=42):
+    """
+    Return the positions, reference (perfect) positions and cell dimensions of
+    an FCC lattice, with the atoms displaced randomly by `sigma`.
+    
+    """
+    unitCell = np.asarray([[0.0, 0.0, 0.0], [0.5, 0.5, 0.0], [0.5, 0.0, 0.5], [0.0, 0.5, 0.5]])
+    cells = np.indices((NCells, NCells, NCells)).reshape(3, -1).T
+    refPos = ((cells[:, np.newaxis, :] + unitCell[np.newaxis, :, :]) * a0).reshape(-1)
+    cellDims = np.asarray([NCells * a0] * 3, dtype=np.float64)
+    
+    np.random.seed(seed)
+    pos = refPos + np.random.normal(0.0, sigma, len(refPos))
+    pos = np.mod(pos, np.tile(cellDims, len(pos) // 3))
+    
+    return np.ascontiguousarray(pos, dtype=np.float64), np.ascontiguousarray(refPos, dtype=np.float64), cellDims
+
+
+def timeit(func, *args):
+    """Return the best of three timings of the given function, and its result."""
+    best = None
+    for _ in range(3):
+        t0 = time.time()
+        result = func(*args)
+        elapsed = time.time() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    
+    return best, result